@@ -0,0 +1,14 @@
+"""
+`bi_py` -- helper code shared by the `BI_PY` pipeline notebooks.
+
+The notebooks in `Code/notebooks` remain the pipeline.  This package only holds the
+code that would otherwise be copied from notebook to notebook, or which has to run
+outside a Jupyter kernel (e.g. the headless pipeline runner).
+
+In subsequent versions some of this code may be integrated with the established TRE Tools package.
+
+Notebooks import it with:
+
+    import sys
+    sys.path.append(f"{ROOT_LOCATION}/{VERSION}/Code")
+"""
@@ -0,0 +1,695 @@
+"""
+An end-to-end benchmark of the pipeline on synthetic extracts (see `bi_py.synthetic`).
+
+`run_benchmark()` generates (or reuses) the extracts of a cohort at a scale of the current one,
+then runs the logic of NB#1 to NB#8 on them, each step in a profiled stage (see
+`bi_py.profiling`) of a run of its own:
+
+    runs/benchmark_<scale>_<timestamp>/run_log.jsonl     # the events of every stage
+    runs/benchmark_<scale>_<timestamp>/metrics.parquet   # one row per stage
+    runs/benchmark_<scale>_<timestamp>/budget_report.csv # against the earlier runs of the scale
+
+The stages which the notebooks profile keep their names (e.g. "NB2: merge the discovery cuts",
+"NB7: write the 3-digit individual trait files"), so that a benchmark and a run of the notebooks
+can be compared stage by stage; the `benchmark` stage, parent of all the others, records the
+scale, fraction, people and seed.  The steps call the same `bi_py` functions as the notebooks
+(`run_manifest()`, `process_and_clean()`, `merge_files()`, `write_partition()`, `clean_icd10()`,
+...) and reproduce their own queries (the RDE union of NB#3, the first events of NB#7 and NB#8, the
+regenie files), on the files the synthetic tree has: every Discovery cut of the manifest, the
+Sep 2024 RDE files of Barts, the Feb 2021 workbooks of Bradford and the 2023_07 NHS Digital
+extracts.  Only the 3 character traits of NB#7 and the 55k ExWAS regenie files are written, not
+the 4 character traits nor the 51k GWAS ones, which repeat the same queries.
+
+Each step records its own peak memory (see `bi_py.run_log`).  The outputs of the run are removed at the end, unless `keep`.  From the `Code` directory:
+
+    python -m bi_py.benchmark --scale 1x
+    python -m bi_py.benchmark --scale 5x --fraction 0.1 --keep
+    python -m bi_py.profiling ../runs --stage process_and_clean
+"""
+
+import argparse
+import itertools
+import shutil
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import polars as pl
+
+from bi_py import budgets, run_log, synthetic
+from bi_py.event_store import PRODUCTS, scan_product, write_partition
+from bi_py.excel import convert_xlsx
+from bi_py.icd10 import clean_icd10, generate_icd10_codes
+from bi_py.manifest import active_cuts, load_manifest, run_manifest
+from bi_py.megadata import DEDUPLICATION_OPTIONS
+from bi_py.person import PERSON_DICTIONARY_FILE, build_person_dictionary, decode, encode, read_person_dictionary
+from bi_py.pipeline import RUN_LOG_FILE, RUNS_LOCATION
+from bi_py.processing import process_and_clean, process_dataset
+from bi_py.profiling import profile, write_metrics
+from bi_py.schema_registry import scan_with_schema
+from bi_py.snomed import snomed_codes, tretools_snomed_codes
+from bi_py.sorted_merge import merge_files
+from bi_py.tre_logging import TRETools  # noqa: F401, the polars .TRE namespace
+
+WORK_LOCATION = Path(tempfile.gettempdir()) / "bi_py_benchmark"
+DATE_START = datetime(1910, 1, 1)
+REGENIE_BATCH_SIZE = 48  # as NB#7
+
+DEMOGRAPHICS_COLUMN_MAPS = {
+    "mapping": {"OrageneID": "study_id", "pseudonhs_2024-07-10": "nhs_number"},
+    "demographics": {"S1QST_Oragene_ID": "study_id", "S1QST_MM-YYYY_ofBirth": "dob", "S1QST_Gender": "gender"},
+}
+MEGA_LINKAGE_COLUMNS = [
+    "OrageneID",
+    "Number of OrageneIDs with this NHS number (i.e. taken part twice or more)",
+    "s1qst_gender",
+    "HasValidNHS",
+    "pseudo_nhs_number",
+    "gsa_id",
+    "44028exomes_release_2023-JUL-07",
+    "exome_id",
+]
+GENDER_MAP = {1: "M", 2: "F"}
+AGE_BREAKS = [16, 25, 35, 45, 55, 65, 75, 85]
+AGE_LABELS = ["<16", "16-24", "25-34", "35-44", "45-54", "55-64", "65-74", "75-84", "85+"]
+
+
+def _codeset(column: str) -> pl.Expr:
+    return pl.col(column).str.replace("ICD10WHO", "ICD10").str.replace("SNOMED CT", "SNOMED").str.replace("OPCS4", "OPCS")
+
+
+# the RDE families of NB#3: (date, code, term, codeset, filters)
+RDE_FAMILIES = {
+    "RDE_MSDS_Diagnosis": ("DiagDate", pl.col("Diagnosis"), pl.col("DiagDesc"), pl.lit("SNOMED"), []),
+    "RDE_PC_DIAGNOSIS": ("DiagDt", pl.col("DiagCode"), pl.col("Diagnosis"), pl.lit("SNOMED"), [pl.col("Confirmation").eq("Confirmed")]),
+    "RDE_OP_DIAGNOSIS": ("Activity_date", pl.col("ICD_Diagnosis_Cd"), pl.col("ICD_Diag_Desc"), pl.lit("ICD10"), []),
+    "RDE_PC_PROBLEMS": (
+        "OnsetDate", pl.col("ProbCode").str.strip_chars(), pl.col("Problem"), pl.lit("SNOMED"),
+        [pl.col("Confirmation").eq("Confirmed"), pl.col("Vocab").eq("SNOMED CT")],
+    ),
+    "RDE_PC_PROCEDURES": ("ProcDt", pl.col("ProcCD"), pl.col("ProcDetails"), _codeset("ProcType"), []),
+    "RDE_OPA_OPCS": ("OPCS_Proc_Dt", pl.col("OPCS_Proc_Cd"), pl.col("Proc_Desc"), pl.lit("OPCS"), []),
+    "RDE_APC_OPCS": ("OPCS_Proc_Dt", pl.col("OPCS_Proc_Cd"), pl.col("Proc_Desc"), pl.lit("OPCS"), []),
+    "RDE_APC_DIAGNOSIS": ("Activity_date", pl.col("ICD_Diagnosis_Cd"), pl.col("ICD_Diag_Desc"), pl.lit("ICD10"), []),
+    "RDE_ALL_PROCEDURES": (
+        "Procedure_date", pl.col("Procedure_Code"), pl.col("Code_text").str.replace_all('"+', ''), _codeset("Catalogue"),
+        [pl.col("Procedure_date").is_not_null()],
+    ),
+}
+RDE_CUT = "2024_09"
+
+BRADFORD_WORKBOOKS = {
+    # coding system: (workbook, code column, term column)
+    "ICD10": ("icd10_bfs_1578_2021-02-02_deident.xlsx", "icd10_code", "icd10_name"),
+    "OPCS": ("opcs_bfd_1578_2021-02-02_deident.xlsx", "opcs_code", "opcs_procedure_description"),
+}
+NHS_DIGITAL_SUBTYPES = {"CIV_REG": "civ_reg", "APC": "apc", "OP": "op"}
+
+
+def _demographics_dataset(location: str):
+    from tretools.datasets.demographic_dataset import DemographicDataset
+
+    return DemographicDataset(path=location)
+
+
+def clean_demographics(data_location: Path, demographics_location: Path) -> str:
+    """NB#1: the clean demographics, keyed on person ids, and the person dictionary."""
+    from tretools.datasets.demographic_dataset import DemographicDataset
+
+    demographics_location.mkdir(parents=True, exist_ok=True)
+    with profile("NB1: clean the demographics") as event:
+        demographics = DemographicDataset(
+            path_to_mapping_file=str(data_location / "demographics" / synthetic.MEGA_LINKAGE_FILE),
+            path_to_demographic_file=str(data_location / "demographics" / synthetic.S1QST_FILE),
+        )
+        demographics.demographics = (
+            demographics.demographics
+            .lazy()
+            .select(pl.col("S1QST_Oragene_ID"), pl.col("S1QST_Gender"), pl.col("S1QST_MM-YYYY_ofBirth"))
+            .TRE.filter_with_logging(pl.col("S1QST_MM-YYYY_ofBirth").ne("NA"), label="EXCLUDING `NA` DATE")
+            .TRE.unique_with_logging(subset=["S1QST_Oragene_ID"], label="Check for repeated rows of matching `S1QST_Oragene_ID`")
+            .collect()
+        )
+        demographics.mapped_data = (
+            demographics.mapped_data
+            .lazy()
+            .TRE.filter_with_logging(
+                pl.col("55273exomes_release_2024-OCT-08").is_not_null(),
+                pl.col("pseudonhs_2024-07-10").is_not_null(),
+                label="Only include NON-NULL exome_id and NON-NULL pseudo_nhs_number for 55k Regenie",
+            )
+            .collect()
+        )
+        demographics.process_dataset(column_maps=DEMOGRAPHICS_COLUMN_MAPS, round_to_day_in_month=1)
+        person_dictionary = build_person_dictionary(demographics.data["nhs_number"])
+        demographics.data = encode(demographics.data, person_dictionary)
+        demographics.write_to_feather(str(demographics_location / "clean_demographics.arrow"))
+        person_dictionary.write_ipc(demographics_location / PERSON_DICTIONARY_FILE)
+        demographics.write_to_log(str(demographics_location / "clean_demographics_log.txt"))
+        event["rows_out"] = demographics.data.height
+    return str(demographics_location / "clean_demographics.arrow")
+
+
+def map_snomed_to_icd(notebook: str, location: str, log_location: str, dataset_type: str, mapping_location: str, output_location: str) -> str:
+    """The SNOMED to ICD-10 mapping of the merged SNOMED megadata of a source, as NB#2 to NB#5 do."""
+    from tretools.codelists.codelist_types import CodelistType
+    from tretools.datasets.processed_dataset import ProcessedDataset
+
+    with profile(f"{notebook}: map SNOMED to ICD-10"):
+        dataset = ProcessedDataset(path=location, dataset_type=dataset_type, coding_system=CodelistType.SNOMED.value, log_path=log_location)
+        # the codes are UInt64 (see bi_py/snomed.py) but tretools reads the mapping file as Int64
+        dataset.data = tretools_snomed_codes(dataset.data)
+        mapped_data = dataset.map_snomed_to_icd(mapping_file=mapping_location, snomed_col="conceptId", icd_col="mapTarget")
+    with profile(f"{notebook}: deduplicate the mapped data"):
+        dedup = mapped_data.deduplicate()
+    with profile(f"{notebook}: write the mapped data"):
+        dedup.write_to_feather(output_location)
+        dedup.write_to_log(output_location.replace(".arrow", "_log.txt"))
+    return output_location
+
+
+def primary_care(metadata: dict, locations: Dict[str, Path], demographics_location: str, date_end: datetime, max_workers: int) -> Dict[str, str]:
+    """NB#2: every cut of the Discovery manifest, merged, and their SNOMED codes mapped to ICD-10."""
+    from tretools.datasets.dataset_enums.dataset_types import DatasetType
+
+    megadata_location = locations["megadata"] / "primary_care"
+    manifest = load_manifest(metadata["manifest"])
+    with profile("NB2: process the discovery manifest"):
+        run_manifest(
+            manifest,
+            processed_location=str(locations["processed"] / "primary_care"),
+            megadata_location=str(megadata_location),
+            demographics_location=demographics_location,
+            date_start=DATE_START,
+            date_end=date_end,
+            max_workers=max_workers,
+        )
+    with profile("NB2: merge the discovery cuts"):
+        cuts = active_cuts(manifest)
+        merge_files(
+            [f"{megadata_location}/{cut['megadata']}" for cut in cuts],
+            f"{megadata_location}/final_merged_data.arrow",
+            log_locations=[f"{megadata_location}/{cut['megadata_log']}" for cut in cuts],
+            output_log_location=f"{megadata_location}/final_log.txt",
+            dedup_on=manifest["deduplication_options"],
+            max_workers=max_workers,
+        )
+
+    with profile("NB2: read the SNOMED to ICD-10 mapping"):
+        mapping_data = pl.read_csv(
+            Path(metadata["root"]) / "mapping" / synthetic.MAPPING_FILE,
+            separator="\t",
+            schema={"conceptId": pl.Float64, "mapTarget": pl.Utf8, "ICD10_3digit": pl.Utf8},
+        )
+        mapping_data = snomed_codes(mapping_data, column="conceptId")
+        mapping_data.write_csv(locations["mapping"] / "processed_mapping_file.csv")
+
+    return {
+        "SNOMED": f"{megadata_location}/final_merged_data.arrow",
+        "ICD10_MAPPED": map_snomed_to_icd(
+            "NB2",
+            f"{megadata_location}/final_merged_data.arrow",
+            f"{megadata_location}/final_log.txt",
+            DatasetType.PRIMARY_CARE.value,
+            str(locations["mapping"] / "processed_mapping_file.csv"),
+            f"{megadata_location}/final_mapped_data.arrow",
+        ),
+    }
+
+
+def _merge(files: List[str], megadata_location: Path, name: str) -> str:
+    # the clean files of a coding system merged into its megadata file, as the notebooks merge their cuts
+    merge_files(
+        files,
+        str(megadata_location / f"{name}.arrow"),
+        log_locations=[file.replace(".arrow", "_log.txt") for file in files],
+        output_log_location=str(megadata_location / f"{name}_log.txt"),
+        dedup_on=DEDUPLICATION_OPTIONS,
+    )
+    return str(megadata_location / f"{name}.arrow")
+
+
+def barts_health(metadata: dict, locations: Dict[str, Path], demographics_location: str, date_end: datetime) -> Dict[str, str]:
+    """NB#3: the RDE files of the Sep 2024 cut, deduplicated, split by codeset and processed."""
+    from tretools.codelists.codelist_types import CodelistType
+    from tretools.datasets.dataset_enums.dataset_types import DatasetType
+
+    input_location = Path(metadata["root"]) / synthetic.BARTS_LOCATION
+    codesets_enum = pl.Enum(CodelistType)
+    provenance_enum = pl.Enum(list(RDE_FAMILIES))
+    hash_column = pl.struct(["pseudo_nhs_number", "date", "codeset", "original_code", "original_term"]).hash().alias("hash")
+    rde_all_all = pl.concat(
+        [
+            scan_with_schema(input_location / f"{family}.ascii.redacted.tab", source="barts_health", family=family, cut=RDE_CUT)
+            .filter(*filters if filters else [pl.lit(True)])
+            .select(
+                pl.col("PseudoNHS_2024-07-10").alias("pseudo_nhs_number"),
+                pl.col(date).alias("date"),
+                codeset.cast(codesets_enum).alias("codeset"),
+                code.alias("original_code"),
+                term.alias("original_term"),
+                pl.lit(family).cast(provenance_enum).alias("provenance"),
+            )
+            .with_columns(hash_column)
+            for family, (date, code, term, codeset, filters) in RDE_FAMILIES.items()
+        ],
+        parallel=True,
+    )
+    with profile("NB3: deduplicate rde_all_all") as event:
+        height_before, rde_all_all = pl.collect_all([rde_all_all.select(pl.len()), rde_all_all.unique("hash")])
+        event["rows_in"], event["rows_out"] = height_before.item(), rde_all_all.height
+
+    preprocessed_location = locations["preprocessed"]
+    cut_location = locations["processed"] / "barts_health" / "sep_2024"
+    col_map = {"pseudo_nhs_number": "nhs_number", "original_code": "code", "original_term": "term", "date": "date"}
+    clean_files = {}
+    for codeset, name in (("ICD10", "merged_ICD"), ("OPCS", "merged_OPCS"), ("SNOMED", "merged_SNOMED")):
+        rde_codeset = rde_all_all.filter(pl.col("codeset").eq(codeset), pl.col("date").is_not_null())
+        if codeset == "SNOMED":
+            rde_codeset = snomed_codes(rde_codeset, column="original_code", strict=False)
+        rde_codeset.write_ipc(preprocessed_location / f"2024_09_Barts_RDE_{codeset}.arrow")
+        clean_files[codeset] = process_and_clean(
+            str(preprocessed_location / f"2024_09_Barts_RDE_{codeset}.arrow"),
+            str(cut_location),
+            name,
+            DatasetType.BARTS_HEALTH.value,
+            CodelistType[codeset].value,
+            col_map,
+            DEDUPLICATION_OPTIONS,
+            lambda: _demographics_dataset(demographics_location),
+            demographics_location,
+            DATE_START,
+            date_end,
+        ).clean_location
+
+    megadata_location = locations["megadata"] / "barts_health"
+    with profile("NB3: merge the Barts cuts"):
+        merged = {codeset: _merge([file], megadata_location, name) for (codeset, file), name in zip(clean_files.items(), ("merged_ICD", "merged_OPCS", "merged_SNOMED"))}
+    return {
+        "ICD10": merged["ICD10"],
+        "OPCS4": merged["OPCS"],
+        "SNOMED": merged["SNOMED"],
+        "ICD10_MAPPED": map_snomed_to_icd(
+            "NB3",
+            merged["SNOMED"],
+            str(megadata_location / "merged_SNOMED_log.txt"),
+            DatasetType.BARTS_HEALTH.value,
+            str(locations["mapping"] / "processed_mapping_file.csv"),
+            str(megadata_location / "final_mapped_snomed_to_icd.arrow"),
+        ),
+    }
+
+
+def bradford(metadata: dict, locations: Dict[str, Path], demographics_location: str, date_end: datetime) -> Dict[str, str]:
+    """NB#4: the Feb 2021 workbooks, converted and processed."""
+    from tretools.codelists.codelist_types import CodelistType
+    from tretools.datasets.dataset_enums.dataset_types import DatasetType
+
+    input_location = Path(metadata["root"]) / synthetic.BRADFORD_LOCATION
+    megadata_location = locations["megadata"] / "bradford"
+    megadata_files = {}
+    for coding_system, (workbook, code_column, term_column) in BRADFORD_WORKBOOKS.items():
+        with profile(f"NB4: convert the Feb 2021 {'ICD-10' if coding_system == 'ICD10' else coding_system} workbook"):
+            converted_location = convert_xlsx(
+                str(input_location / workbook),
+                str(locations["preprocessed"] / "excel_cache"),
+                schema={"pseudonhs": pl.Utf8, code_column: pl.Utf8, term_column: pl.Utf8, "episode_start_date": pl.Date},
+            )
+        clean_file = process_and_clean(
+            converted_location,
+            str(locations["processed"] / "bradford" / "feb_2021"),
+            coding_system.lower(),
+            DatasetType.BRADFORD.value,
+            CodelistType[coding_system].value,
+            {"pseudonhs": "nhs_number", code_column: "code", term_column: "term", "episode_start_date": "date"},
+            DEDUPLICATION_OPTIONS,
+            lambda: _demographics_dataset(demographics_location),
+            demographics_location,
+            DATE_START,
+            date_end,
+        ).clean_location
+        with profile("NB4: merge the Bradford cuts", coding_system=coding_system):
+            megadata_files["OPCS4" if coding_system == "OPCS" else coding_system] = _merge([clean_file], megadata_location, coding_system.lower())
+    return megadata_files
+
+
+def nhs_digital(metadata: dict, locations: Dict[str, Path], demographics_location: str, date_end: datetime) -> Dict[str, str]:
+    """NB#5: the 2023_07 HES APC and OP, civil registration and ECDS extracts."""
+    from tretools.codelists.codelist_types import CodelistType
+    from tretools.datasets.dataset_enums.dataset_types import DatasetType
+
+    from bi_py.multifile import raw_dataset_from_files
+    from bi_py.nhs_digital import ECDS_COLUMNS, install_ecds
+
+    install_ecds()
+    input_location = Path(metadata["root"]) / synthetic.NHS_DIGITAL_LOCATION
+    cut_location = locations["processed"] / "nhs_digital" / "july_2023"
+    clean_files = []
+    for subtype, name in NHS_DIGITAL_SUBTYPES.items():
+        file = synthetic.NHS_DIGITAL_FILES[subtype][0]
+        clean_files.append(
+            process_and_clean(
+                str(input_location / file),
+                str(cut_location),
+                name,
+                DatasetType.NHS_DIGITAL.value,
+                CodelistType.ICD10.value,
+                {"nhs_number": "nhs_number", "code": "code", "date": "date"},
+                DEDUPLICATION_OPTIONS,
+                lambda: _demographics_dataset(demographics_location),
+                demographics_location,
+                DATE_START,
+                date_end,
+                nhs_digital_subtype=subtype,
+            ).clean_location
+        )
+
+    # as NB#5: the ECDS extracts are several files, read with raw_dataset_from_files()
+    (cut_location / "clean_processed_data").mkdir(parents=True, exist_ok=True)
+    with profile("NB5: process the ECDS extracts", cut=cut_location.name) as event:
+        ecds_data = raw_dataset_from_files(
+            str(input_location / "ECDS" / "*ECDS*.txt"),
+            dataset_type=DatasetType.NHS_DIGITAL.value,
+            coding_system=CodelistType.SNOMED.value,
+            separator="|",
+            columns=ECDS_COLUMNS,
+        )
+        event["rows_in"] = ecds_data.data.height
+        cleaned_dataset = (
+            process_dataset(
+                ecds_data,
+                deduplication_options=DEDUPLICATION_OPTIONS,
+                column_maps={"ARRIVAL_DATE": "date", "STUDY_ID": "nhs_number"},
+                person_dictionary=read_person_dictionary(demographics_location),
+                nhs_digital_subtype="ECDS",
+            )
+            .remove_unrealistic_dates(date_start=DATE_START, date_end=date_end, before_born=True, demographic_dataset=_demographics_dataset(demographics_location))
+        )
+        cleaned_dataset.write_to_feather(str(cut_location / "clean_processed_data" / "ecds.arrow"))
+        cleaned_dataset.write_to_log(str(cut_location / "clean_processed_data" / "ecds_log.txt"))
+        event["rows_out"] = cleaned_dataset.data.height
+
+    megadata_location = locations["megadata"] / "nhs_digital"
+    with profile("NB5: merge the NHS Digital datasets"):
+        megadata_files = {
+            "ICD10": _merge(clean_files, megadata_location, "nhs_d_merged_ICD10"),
+            "SNOMED": _merge([str(cut_location / "clean_processed_data" / "ecds.arrow")], megadata_location, "nhs_d_merged_SNOMED"),
+        }
+    megadata_files["ICD10_MAPPED"] = map_snomed_to_icd(
+        "NB5",
+        megadata_files["SNOMED"],
+        str(megadata_location / "nhs_d_merged_SNOMED_log.txt"),
+        DatasetType.NHS_DIGITAL.value,
+        str(locations["mapping"] / "processed_mapping_file.csv"),
+        str(megadata_location / "final_mapped_snomed_to_icd.arrow"),
+    )
+    return megadata_files
+
+
+def event_store(megadata_files: Dict[str, Dict[str, str]], store_location: Path) -> None:
+    """NB#6: every per-source megadata file written to the event store; the rows of every product."""
+    with profile("NB6: write the event store"):
+        for source, files in megadata_files.items():
+            for coding_system, location in files.items():
+                data = pl.scan_ipc(location)
+                if coding_system == "SNOMED":
+                    data = snomed_codes(data, strict=False)
+                write_partition(data, str(store_location), coding_system, source)
+    with profile("NB6: count the products"):
+        for name in PRODUCTS:
+            print(f"{name}: {scan_product(str(store_location), name).select(pl.len()).collect().item()} rows")
+
+
+def _with_demographics(lf: pl.LazyFrame, demographics_location: str) -> pl.LazyFrame:
+    # the first events with the age and gender of the person, as `_calculate_demographics_standalone()` of NB#7 and NB#8
+    return (
+        lf
+        .join(pl.scan_ipc(demographics_location), on="nhs_number", how="inner")
+        .pipe(decode, read_person_dictionary(demographics_location))
+        .with_columns(((pl.col("date") - pl.col("dob")).dt.total_days() / 365.25).round(1).alias("age_at_event"))
+        .with_columns(
+            pl.col("age_at_event").cut(AGE_BREAKS, labels=AGE_LABELS).alias("age_range"),
+            pl.col("gender").replace_strict(GENDER_MAP),
+        )
+    )
+
+
+def valid_regenie_55k(data_location: Path) -> pl.LazyFrame:
+    """The people of the 55k ExWAS in the linkage file, as NB#7 and NB#8 select them."""
+    return (
+        pl.scan_csv(data_location / "demographics" / synthetic.MEGA_LINKAGE_FILE, infer_schema=False, new_columns=MEGA_LINKAGE_COLUMNS)
+        .TRE.filter_with_logging(
+            pl.col("exome_id").is_not_null(),
+            pl.col("pseudo_nhs_number").is_not_null(),
+            label="Only include NON-NULL exome_id and NON-NULL pseudo_nhs_number for 55k Regenie",
+        )
+        .TRE.filter_with_logging(pl.col("OrageneID").is_not_null(), label="Sanity check to ensure no NULL OrageneID")
+        .TRE.unique_with_logging(["pseudo_nhs_number"], label="Sanity check: unique pseudo_nhs_number")
+        .TRE.unique_with_logging(["OrageneID"], label="Sanity check: unique OrageneID")
+    )
+
+
+def _write_trait_files(traits: Dict[tuple, pl.DataFrame], location: Path) -> None:
+    location.mkdir(parents=True, exist_ok=True)
+    for (trait, ), df in sorted(traits.items()):
+        df.lazy().sink_csv(location / f"{trait}_summary_report.csv")
+
+
+def icd10_traits(data_location: Path, locations: Dict[str, Path], demographics_location: str) -> None:
+    """NB#7: the 3 character ICD-10 traits, their individual trait files and the 55k ExWAS regenie file."""
+    outputs_location = locations["outputs"] / "icd10"
+    with profile("NB7: clean the ICD-10 codes") as event:
+        (
+            scan_product(str(locations["event_store"]), "icd_and_mapped_snomed")
+            .pipe(clean_icd10)
+            .sink_parquet(locations["preprocessed"] / "clean_icd10.parquet")
+        )
+        event["rows_out"] = pl.scan_parquet(locations["preprocessed"] / "clean_icd10.parquet").select(pl.len()).collect().item()
+
+    combo_icd10_3d = (
+        pl.scan_parquet(locations["preprocessed"] / "clean_icd10.parquet")
+        .join(pl.LazyFrame({"code": generate_icd10_codes(icd_length=3)}), left_on="code_new_3d", right_on="code", how="semi")
+        .group_by(pl.col("nhs_number"), pl.col("code_new_3d").alias("code"))
+        .agg(pl.col("date").min())
+        .pipe(_with_demographics, demographics_location)
+        .select(
+            "nhs_number", "date", "code", "age_at_event",
+            pl.lit("merged").alias("dataset_type"), pl.lit("ICD10").alias("codelist_type"), "gender", "age_range",
+        )
+    )
+    with profile("NB7: partition the 3-digit traits"):
+        phenotypes_3d_dict = combo_icd10_3d.collect().partition_by("code", as_dict=True)
+    with profile("NB7: write the 3-digit individual trait files", rows_in=sum(df.height for df in phenotypes_3d_dict.values())):
+        _write_trait_files(phenotypes_3d_dict, outputs_location / "individual_trait_files" / "3_digit_icd")
+
+    with profile("NB7: join the 3-digit traits to the 55k ExWAS"):
+        traits_55k = (
+            combo_icd10_3d
+            .TRE.join_with_logging(
+                valid_regenie_55k(data_location).select("pseudo_nhs_number", "exome_id"),
+                left_on="nhs_number", right_on="pseudo_nhs_number", how="inner", label="restrict to pseudo_NHS_numbers with ExWAS",
+            )
+            .select(
+                pl.lit("1").alias("FID"),
+                pl.col("exome_id").alias("IID"),
+                pl.col("code"),
+                pl.col("age_at_event").round(1).alias("AgeAtFirstDiagnosis"),
+                pl.col("age_at_event").pow(2).round(1).alias("AgeAtFirstDiagnosis_Squared"),
+            )
+            .sort(by="IID")
+            .set_sorted("IID")
+            .collect()
+            .partition_by("code", as_dict=True)
+        )
+    regenie_location = outputs_location / "regenie"
+    (regenie_location / "temp").mkdir(parents=True, exist_ok=True)
+    with profile("NB7: write the 55k 3-digit regenie batches", traits=len(traits_55k)):
+        batches = []
+        traits = sorted(traits_55k.items())
+        for batch_idx in range(0, len(traits), REGENIE_BATCH_SIZE):
+            batch_location = regenie_location / "temp" / f"icd10_3d_regenie_55k_batch{batch_idx // REGENIE_BATCH_SIZE + 1}.parquet"
+            pl.concat(
+                [
+                    df.lazy().with_columns(pl.lit("1").cast(pl.Enum(["0", "1"])).alias(trait)).select("FID", "IID", trait)
+                    for (trait, ), df in itertools.islice(traits, batch_idx, batch_idx + REGENIE_BATCH_SIZE)
+                ],
+                how="align",
+            ).sink_parquet(batch_location)
+            batches.append(batch_location)
+    with profile("NB7: write the 55k 3-digit regenie file"):
+        if batches:
+            concatenated_parquets_55k = pl.concat([pl.scan_parquet(batch) for batch in batches], how="align")
+            concatenated_parquets_55k.sink_parquet(regenie_location / "icd10_3d_regenie_55k.parquet")
+            concatenated_parquets_55k.collect().write_csv(regenie_location / "icd10_3d_regenie_55k.tsv", separator="\t", null_value="0")
+
+
+def custom_phenotypes(data_location: Path, locations: Dict[str, Path], demographics_location: str) -> None:
+    """NB#8: the custom phenotypes of the synthetic codelist, their trait files and the 55k ExWAS regenie file."""
+    store_location = str(locations["event_store"])
+    outputs_location = locations["outputs"] / "custom_phenotypes"
+    coding_system_enum = pl.Enum(["ICD10", "OPCS4", "SNOMED_ConceptID"])
+    custom_phenotype_mapping = (
+        pl.scan_csv(data_location / "codelists" / synthetic.CUSTOM_CODELIST_FILE, schema_overrides={"code": pl.Utf8})
+        .rename({"term": "coding_system"})
+        .select(pl.col("code"), pl.col("coding_system").cast(coding_system_enum), pl.col("phenotype"), pl.col("name").alias("term"))
+    )
+    custom_phenotype_mapping_snomed = snomed_codes(custom_phenotype_mapping.filter(pl.col("coding_system").eq("SNOMED_ConceptID")), strict=False)
+    codelist_codes = custom_phenotype_mapping.group_by(pl.col("coding_system").cast(pl.Utf8)).agg(pl.col("code").unique()).collect()
+    codelist_codes = dict(zip(codelist_codes["coding_system"], codelist_codes["code"]))
+    codelist_codes["SNOMED_ConceptID"] = custom_phenotype_mapping_snomed.select(pl.col("code").unique()).collect()["code"]
+
+    def events(product: str, coding_system: str, mapping: pl.LazyFrame) -> pl.LazyFrame:
+        return (
+            scan_product(store_location, product, codes=codelist_codes[coding_system])
+            .with_columns(pl.lit(coding_system).cast(coding_system_enum).alias("coding_system"))
+            .join(mapping, on=["code", "coding_system"], how="inner")
+            .with_columns(pl.col("code").cast(pl.Utf8))
+        )
+
+    custom_mapped_combo = (
+        pl.concat([
+            events("icd_only", "ICD10", custom_phenotype_mapping),
+            events("opcs_only", "OPCS4", custom_phenotype_mapping),
+            events("snomed_only", "SNOMED_ConceptID", custom_phenotype_mapping_snomed),
+        ])
+        .group_by(["nhs_number", "phenotype"])
+        .agg(
+            pl.col("date").min(),
+            pl.col("code").unique().alias("all_codes"),
+            pl.col("coding_system").unique().alias("all_coding_systems"),
+            pl.col("code").filter(pl.col("date") == pl.col("date").min()).first().alias("code"),
+            pl.col("term").filter(pl.col("date") == pl.col("date").min()).first().alias("term"),
+        )
+        .with_columns(pl.col("all_codes").list.join(" | "), pl.col("all_coding_systems").cast(pl.List(pl.Utf8)).list.join(" | "))
+        .sort(["nhs_number", "date", "code"])
+        .pipe(_with_demographics, demographics_location)
+        .select("nhs_number", "phenotype", "date", "code", "term", "all_codes", "all_coding_systems", "gender", "dob", "age_at_event", "age_range")
+    )
+    with profile("NB8: partition the custom phenotypes"):
+        custom_mapped_combo_phenotype_dict = custom_mapped_combo.collect().partition_by("phenotype", as_dict=True)
+    with profile("NB8: write the custom phenotype trait files", rows_in=sum(df.height for df in custom_mapped_combo_phenotype_dict.values())):
+        _write_trait_files(custom_mapped_combo_phenotype_dict, outputs_location / "individual_trait_files")
+
+    regenie_55k = valid_regenie_55k(data_location).select("pseudo_nhs_number", pl.col("exome_id").alias("IID")).sort(by="IID")
+    with profile("NB8: join the custom phenotypes to the 55k ExWAS"):
+        combo_custom_phenotypes_55k_dict = (
+            custom_mapped_combo
+            .TRE.join_with_logging(
+                regenie_55k, left_on="nhs_number", right_on="pseudo_nhs_number", how="inner", label="restrict to pseudo_NHS_numbers with ExWAS",
+            )
+            .select(
+                pl.lit("1").alias("FID"),
+                pl.col("IID"),
+                pl.col("phenotype"),
+                pl.col("age_at_event").round(1).alias("AgeAtFirstDiagnosis"),
+                pl.col("age_at_event").pow(2).round(1).alias("AgeAtFirstDiagnosis_Squared"),
+            )
+            .sort(by="IID")
+            .set_sorted("IID")
+            .collect()
+            .partition_by("phenotype", as_dict=True)
+        )
+    (outputs_location / "regenie").mkdir(parents=True, exist_ok=True)
+    with profile("NB8: write the 55k custom phenotypes regenie file", traits=len(combo_custom_phenotypes_55k_dict)):
+        (
+            pl.concat(
+                [
+                    regenie_55k.select(pl.lit("1").alias("FID"), pl.col("IID")),
+                    *[
+                        regenie_55k
+                        .select(pl.col("IID"))
+                        .join(lf.lazy(), on="IID", how="left")
+                        .select(pl.col("IID"), pl.col("phenotype").is_not_null().cast(pl.Int8).cast(pl.Utf8).alias(phenotype))
+                        for (phenotype, ), lf in sorted(combo_custom_phenotypes_55k_dict.items())
+                    ],
+                ],
+                how="align",
+            )
+            .filter(pl.sum_horizontal(pl.all().exclude(["FID", "IID"]).cast(pl.Int8, strict=False)) > 0)
+            .sort("IID")
+            .collect()
+            .write_csv(outputs_location / "regenie" / "custom_phenotypes_regenie_55k.tsv", separator="\t", null_value="0")
+        )
+
+
+def run_name(scale: str, fraction: float = 1.0) -> str:
+    """`benchmark_<scale>[_<fraction>]_<timestamp>`, the directory of a benchmark run."""
+    return f"benchmark_{scale}{'' if fraction == 1 else f'_{fraction:g}'}_{datetime.now():%Y-%m-%d_%H%M%S}"
+
+
+def run_benchmark(
+    scale: str = "1x",
+    fraction: float = 1.0,
+    seed: int = 0,
+    work_location: Path = WORK_LOCATION,
+    runs_location: Path = RUNS_LOCATION,
+    max_workers: int = 4,
+    keep: bool = False,
+) -> str:
+    """
+    Runs NB#1 to NB#8 on the synthetic extracts at `scale` (a `fraction` of it for a quick run),
+    generated in `work_location` unless already there; the outputs are written there too, and
+    removed afterwards unless `keep`.
+
+    Returns:
+        str: the metrics of the run, `<runs_location>/<run_name()>/metrics.parquet`
+    """
+    work_location = Path(work_location)
+    data_location = work_location / f"data_{scale}{'' if fraction == 1 else f'_{fraction:g}'}_seed{seed}"
+    metadata = {**synthetic.generate(str(data_location), scale, fraction, seed), "root": str(data_location)}
+
+    run = run_name(scale, fraction)
+    run_log_location = run_log.start_run(str(Path(runs_location) / run / RUN_LOG_FILE))
+    output_location = work_location / run
+    locations = {
+        name: output_location / name
+        for name in ("demographics", "processed", "megadata", "mapping", "preprocessed", "outputs")
+    }
+    locations["event_store"] = locations["megadata"] / "event_store"
+    for location in locations.values():
+        location.mkdir(parents=True, exist_ok=True)
+    date_end = datetime.today()
+
+    try:
+        with profile("benchmark", scale=scale, fraction=fraction, people=metadata["people"], seed=seed, rows_in=sum(metadata["rows"].values())):
+            demographics_location = clean_demographics(data_location, locations["demographics"])
+            megadata_files = {
+                "primary_care": primary_care(metadata, locations, demographics_location, date_end, max_workers),
+                "barts_health": barts_health(metadata, locations, demographics_location, date_end),
+                "bradford": bradford(metadata, locations, demographics_location, date_end),
+                "nhs_digital": nhs_digital(metadata, locations, demographics_location, date_end),
+            }
+            event_store(megadata_files, locations["event_store"])
+            icd10_traits(data_location, locations, demographics_location)
+            custom_phenotypes(data_location, locations, demographics_location)
+    finally:
+        metrics_location = write_metrics(run_log_location)
+        if not keep:
+            shutil.rmtree(output_location, ignore_errors=True)
+
+    pl.Config.set_tbl_rows(-1)
+    print(run_log.stage_summary(run_log.read_run_log(run_log_location)))
+    budgets.check_run(str(Path(run_log_location).parent))
+    print(f"{datetime.now()}: run log, metrics and budget report of the {scale} benchmark saved to {Path(run_log_location).parent}")
+    return metrics_location
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark NB#1 to NB#8 on synthetic Genes & Health shaped extracts.")
+    parser.add_argument("--scale", choices=list(synthetic.SCALES), default="1x", help="the size of the cohort, in multiples of the current one")
+    parser.add_argument("--fraction", type=float, default=1.0, help="only this fraction of the cohort, for a quick run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-location", default=str(WORK_LOCATION), help="where the extracts and outputs are written (default: %(default)s)")
+    parser.add_argument("--runs", default=str(RUNS_LOCATION), help="where the run log and metrics are saved (default: %(default)s)")
+    parser.add_argument("--max-workers", type=int, default=4, help="worker processes of the Discovery manifest")
+    parser.add_argument("--keep", action="store_true", help="keep the outputs of the run")
+    args = parser.parse_args(argv)
+
+    run_benchmark(args.scale, args.fraction, args.seed, Path(args.work_location), Path(args.runs), args.max_workers, args.keep)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+"""
+Time and memory budgets of the stages of the pipeline, and a report of the stages which regressed.
+
+The metrics of a run (see `bi_py.profiling`) say how long each stage took; nothing said whether that
+is more than it should, or than it used to.  `Code/budgets.json` groups the stages (the ingestion
+of each cut, the merges, the deduplications, the SNOMED to ICD-10 mapping, `clean_icd10()`, the
+trait files, the regenie files, ...) and gives each group a time and memory budget per data scale:
+
+    {
+        "regression_threshold": 0.25,     # a stage 25% slower (or bigger) than its history is flagged
+        "history": 5,                     # compared with the median of the last 5 runs of the scale
+        "min_duration_s": 30,             # shorter stages are not flagged as slower
+        "groups": {
+            "ingest": {
+                "stages": ["process_and_clean", "NB5: process the ECDS extracts"],  # fnmatch patterns
+                "per_cut": true,          # each cut of the stage on its own
+                "duration_s": {"release": 3600, "1x": 900},   # budget per scale, optional
+                "peak_rss_mb": {"release": 200000},
+                "regression_threshold": 0.5                   # optional, instead of the default
+            },
+            ...
+        }
+    }
+
+A stage belongs to the first group with a pattern matching its name; per run, the events of a
+stage (and cut) are added up, their peak memory is the highest.  A run is only compared with the
+earlier runs of the same scale which completed: the `scale` of a benchmark (e.g. `5x`, or `20x_0.05` for a
+fraction of the cohort, see `bi_py.benchmark`), or that of `python -m bi_py.pipeline --scale`,
+`release` by default.  `budget_report()` flags the stages:
+
+    over time budget      the stage took longer than the `duration_s` of its group for the scale
+    over memory budget    its peak memory is over the `peak_rss_mb` of its group
+    time regression       it took more than `regression_threshold` longer than its history
+    memory regression     its peak memory is more than `regression_threshold` above its history
+
+The peak memory of a stage is that of its process during the stage (see `bi_py.run_log`); that of
+a notebook of `bi_py.pipeline` is the highest of the stages its kernel records.
+
+`bi_py.pipeline` and `bi_py.benchmark` write the report of each run as
+`runs/<run>/budget_report.csv` and print the flagged stages.  From the `Code` directory, e.g.
+before a release:
+
+    python -m bi_py.budgets ../runs/<run>                    # the flagged stages
+    python -m bi_py.budgets ../runs/<run> --threshold 0.1 --all
+    python -m bi_py.budgets ../runs/<run> --fail             # exit status 1 if any stage is flagged
+"""
+
+import argparse
+import fnmatch
+import json
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+import polars as pl
+
+from bi_py.profiling import scan_metrics
+
+BUDGETS_LOCATION = Path(__file__).resolve().parents[1] / "budgets.json"
+REPORT_FILE = "budget_report.csv"
+DEFAULT_SCALE = "release"
+KEYS = ["group", "stage", "cut"]
+
+
+def load_budgets(location: str = str(BUDGETS_LOCATION)) -> dict:
+    """The budgets at `location` (see the module docstring)."""
+    return json.loads(Path(location).read_text())
+
+
+def stage_group(stage: str, groups: dict) -> Optional[str]:
+    """The first group of `groups` with a pattern matching `stage`, if any."""
+    for group, budget in groups.items():
+        if any(fnmatch.fnmatchcase(stage, pattern) for pattern in budget["stages"]):
+            return group
+    return None
+
+
+def _scale(details: str) -> Optional[str]:
+    # the scale recorded by bi_py.benchmark (with its fraction) or bi_py.pipeline
+    details = json.loads(details)
+    if details.get("scale") is None:
+        return None
+    fraction = details.get("fraction", 1)
+    return details["scale"] if fraction in (None, 1) else f"{details['scale']}_{fraction:g}"
+
+
+def run_scales(metrics: pl.LazyFrame) -> pl.DataFrame:
+    """
+    Per run: its scale, when it started and whether it completed, i.e. its top stages (e.g.
+    `pipeline`, which fails if one of its notebooks did) were recorded and none failed.
+    """
+    top = pl.col("parent_id").is_null()
+    return (
+        metrics
+        .select("run", "started", "parent_id", "status", pl.col("details").map_elements(_scale, return_dtype=pl.Utf8).alias("scale"))
+        .group_by("run")
+        .agg(
+            pl.col("scale").drop_nulls().first(),
+            pl.col("started").min(),
+            (top & (pl.col("status") == "ok")).any().and_(~(top & (pl.col("status") != "ok")).any()).alias("completed"),
+        )
+        .with_columns(pl.col("scale").fill_null(DEFAULT_SCALE))
+        .collect()
+    )
+
+
+def stage_totals(metrics: pl.LazyFrame, groups: dict) -> pl.DataFrame:
+    """Per run, group, stage and (for the groups `per_cut`) cut: events, total duration, peak memory."""
+    metrics = metrics.filter(pl.col("status") == "ok").collect()
+    stages = metrics["stage"].unique().to_list()
+    stage_groups = pl.DataFrame(
+        {"stage": stages, "group": [stage_group(stage, groups) for stage in stages]},
+        schema={"stage": pl.Utf8, "group": pl.Utf8},
+    )
+    per_cut = [group for group, budget in groups.items() if budget.get("per_cut")]
+    return (
+        metrics
+        .join(stage_groups.drop_nulls(), on="stage", how="inner")
+        # "" rather than null, so that the stages without a cut can be joined on it
+        .with_columns(pl.when(pl.col("group").is_in(per_cut)).then(pl.col("cut")).otherwise(pl.lit("")).fill_null("").alias("cut"))
+        .group_by(["run", *KEYS])
+        .agg(pl.len().alias("events"), pl.col("duration_s").sum(), pl.col("peak_rss_mb").max())
+    )
+
+
+def budget_report(
+    metrics: pl.LazyFrame,
+    run: str,
+    budgets: dict,
+    threshold: Optional[float] = None,
+    history: Optional[int] = None,
+) -> pl.DataFrame:
+    """
+    The stages of `run` against their budgets and the earlier runs of the same scale in `metrics`
+    (see `scan_metrics()`), flagged stages first.  `threshold` (e.g. 0.2 for 20%) and `history`
+    override those of `budgets` for every group.
+    """
+    groups = budgets["groups"]
+    history = history or budgets.get("history", 5)
+    scales = run_scales(metrics)
+    if run not in scales["run"]:
+        raise ValueError(f"No metrics of the run {run}")
+    scale, started = scales.filter(pl.col("run") == run).row(0)[1:3]
+    # a run which failed part way is not a baseline: its stages may have stopped early
+    previous_runs = scales.filter(pl.col("scale") == scale, pl.col("started") < started, pl.col("completed")).sort("started").tail(history)["run"]
+
+    totals = stage_totals(metrics, groups)
+    baseline = (
+        totals
+        .filter(pl.col("run").is_in(previous_runs.implode()))
+        .group_by(KEYS)
+        .agg(
+            pl.len().alias("history_runs"),
+            pl.col("duration_s").median().alias("baseline_duration_s"),
+            pl.col("peak_rss_mb").median().alias("baseline_peak_rss_mb"),
+        )
+    )
+    group_budgets = pl.DataFrame(
+        [
+            {
+                "group": group,
+                "duration_budget_s": budget.get("duration_s", {}).get(scale),
+                "peak_rss_budget_mb": budget.get("peak_rss_mb", {}).get(scale),
+                "threshold": threshold if threshold is not None else budget.get("regression_threshold", budgets["regression_threshold"]),
+            }
+            for group, budget in groups.items()
+        ],
+        schema={"group": pl.Utf8, "duration_budget_s": pl.Float64, "peak_rss_budget_mb": pl.Float64, "threshold": pl.Float64},
+    )
+    return (
+        totals
+        .filter(pl.col("run") == run)
+        .join(baseline, on=KEYS, how="left")
+        .join(group_budgets, on="group", how="left")
+        .with_columns(
+            pl.lit(scale).alias("scale"),
+            pl.col("history_runs").fill_null(0),
+            (pl.col("duration_s") / pl.col("baseline_duration_s") - 1).alias("duration_change"),
+            (pl.col("peak_rss_mb") / pl.col("baseline_peak_rss_mb") - 1).alias("peak_rss_change"),
+        )
+        .with_columns(
+            pl.concat_list(
+                pl.when(pl.col("duration_s") > pl.col("duration_budget_s")).then(pl.lit("over time budget")),
+                pl.when(pl.col("peak_rss_mb") > pl.col("peak_rss_budget_mb")).then(pl.lit("over memory budget")),
+                pl.when(
+                    (pl.col("duration_change") > pl.col("threshold"))
+                    & (pl.col("duration_s") >= budgets.get("min_duration_s", 0))
+                ).then(pl.lit("time regression")),
+                pl.when(pl.col("peak_rss_change") > pl.col("threshold")).then(pl.lit("memory regression")),
+            )
+            .list.drop_nulls()
+            .list.join(", ")
+            .alias("flags"),
+            pl.when(pl.col("cut") != "").then(pl.col("cut")).alias("cut"),
+        )
+        .sort([pl.col("flags") == "", "group", "duration_s"], descending=[False, False, True])
+        .select(
+            "run", "scale", *KEYS, "events", "flags",
+            "duration_s", "baseline_duration_s", "duration_change", "duration_budget_s",
+            "peak_rss_mb", "baseline_peak_rss_mb", "peak_rss_change", "peak_rss_budget_mb",
+            "threshold", "history_runs",
+        )
+    )
+
+
+def check_run(
+    run_location: str,
+    runs_location: Optional[str] = None,
+    budgets_location: str = str(BUDGETS_LOCATION),
+    threshold: Optional[float] = None,
+    history: Optional[int] = None,
+    show_all: bool = False,
+) -> pl.DataFrame:
+    """
+    Writes the `budget_report()` of the run in `run_location` to `<run_location>/budget_report.csv`,
+    against the runs in `runs_location` (by default, its parent), and prints its flagged stages.
+    """
+    run_location = Path(run_location)
+    report = budget_report(
+        scan_metrics(str(runs_location or run_location.parent)),
+        run_location.name,
+        load_budgets(budgets_location),
+        threshold=threshold,
+        history=history,
+    )
+    report.write_csv(run_location / REPORT_FILE)
+
+    flagged = report.filter(pl.col("flags") != "")
+    history_runs = report["history_runs"].max() if not report.is_empty() else 0
+    print(
+        f"{flagged.height} of {report.height} stages of {run_location.name} over budget or regressed, "
+        f"against {history_runs} earlier {report['scale'][0] if not report.is_empty() else ''} runs (see {run_location / REPORT_FILE})"
+    )
+    shown = report if show_all else flagged
+    if not shown.is_empty():
+        with pl.Config(tbl_rows=-1, tbl_cols=-1, fmt_str_lengths=60):
+            print(shown.select(KEYS + ["flags", "duration_s", "duration_change", "peak_rss_mb", "peak_rss_change"]))
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Stage budgets and regressions of a BI_PY run.")
+    parser.add_argument("run", help="the run directory, with its metrics.parquet")
+    parser.add_argument("--runs", help="the runs to compare it with (default: the parent of the run directory)")
+    parser.add_argument("--budgets", default=str(BUDGETS_LOCATION), help="default: %(default)s")
+    parser.add_argument("--threshold", type=float, help="flag the stages which regressed by more than this fraction, e.g. 0.2")
+    parser.add_argument("--history", type=int, help="compare with the median of this many earlier runs of the same scale")
+    parser.add_argument("--all", action="store_true", help="show every stage, not only the flagged ones")
+    parser.add_argument("--fail", action="store_true", help="exit status 1 if any stage is flagged")
+    args = parser.parse_args(argv)
+
+    report = check_run(args.run, args.runs, args.budgets, args.threshold, args.history, show_all=args.all)
+    return 1 if args.fail and (report["flags"] != "").any() else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+Event dates as `pl.Date` from the raw files to the megadata.
+
+tretools' `RawDataset.process_dataset()` expects the raw date column as text, which it parses
+itself, so the datasets whose dates were already parsed (the Barts RDE scans typed by the schema
+registry, the Bradford workbooks, the cancer registry dates built in NB#5) used to be cast back to
+`YYYY-MM-DD` strings, written out as such, and parsed a second time.
+
+`bi_py.processing.process_dataset()` instead processes a dataset whose date column is already
+`pl.Date` with `process_native_dates()`, i.e. `bi_py.ingestion.process_frame()` (select and rename
+the mapped columns, deduplicate - what `process_dataset()` does for the datasets with one event per
+row), without going through text; any other dataset, and the NHS Digital datasets whose columns are
+expanded into rows, go through tretools as before.  Either way the `ProcessedDataset` holds
+`pl.Date` dates (4 bytes per event rather than a 10-character string), which is what
+`remove_unrealistic_dates()`, the megadata files and the age calculations of NB#7 and NB#8 use.
+"""
+
+from datetime import datetime
+from typing import Optional, Union
+
+import polars as pl
+
+DATE_DTYPE = pl.Date
+
+
+def has_native_dates(data: Union[pl.DataFrame, pl.LazyFrame], column: str = "date") -> bool:
+    return data.collect_schema()[column] == DATE_DTYPE
+
+
+def processed_dataset_from_frame(data: pl.DataFrame, path: str, dataset_type: str, coding_system: str, log: list):
+    """
+    A tretools `ProcessedDataset` holding `data`, built (like `quarantine.raw_dataset_from_frame()`)
+    without `__init__`, which always reads its file.
+    """
+    from tretools.datasets.processed_dataset import ProcessedDataset
+
+    processed_dataset = ProcessedDataset.__new__(ProcessedDataset)
+    processed_dataset.path = path
+    processed_dataset.dataset_type = dataset_type
+    processed_dataset.coding_system = coding_system
+    processed_dataset.data = data
+    processed_dataset.log = log
+    return processed_dataset
+
+
+def native_date_column(data: Union[pl.DataFrame, pl.LazyFrame], column_maps: dict) -> Optional[str]:
+    """The raw column mapped to `date` if there is exactly one and it is already `pl.Date`, None otherwise."""
+    date_columns = [raw_name for raw_name, name in column_maps.items() if name == "date"]
+    if len(date_columns) != 1 or not has_native_dates(data, date_columns[0]):
+        return None
+    return date_columns[0]
+
+
+def process_native_dates(raw_dataset, deduplication_options: list, column_maps: dict):
+    """
+    The `ProcessedDataset` of the tretools `RawDataset` `raw_dataset`, whose date column is already
+    `pl.Date`, as `raw_dataset.process_dataset(deduplication_options, column_maps)` without
+    formatting and parsing the dates.
+    """
+    from bi_py.ingestion import process_frame
+
+    data = process_frame(raw_dataset.data, column_maps, deduplication_options, date_format=None, source=raw_dataset.path)
+    log = raw_dataset.log + [
+        f"{datetime.now()}: Columns {list(column_maps)} renamed to {list(column_maps.values())}, dates kept as {DATE_DTYPE}",
+        f"{datetime.now()}: Deduplicated on {deduplication_options}, shape {data.shape}",
+    ]
+    return processed_dataset_from_frame(data, raw_dataset.path, raw_dataset.dataset_type, raw_dataset.coding_system, log)
@@ -0,0 +1,262 @@
+"""
+A single store of all the (clean, deduplicated) events, partitioned on disk by coding system and
+source, and optionally by cut:
+
+    <store_location>/coding_system=SNOMED/source=primary_care/part.parquet
+    <store_location>/coding_system=ICD10_MAPPED/source=barts_health/part.parquet
+    <store_location>/coding_system=ICD10/source=nhs_digital/cut=2025_03/part.parquet
+    ...
+
+NB#6 used to load the per-source megadata of NB#2 to NB#5 and merge them, again and again, into
+`icd_only`, `opcs_only`, `snomed_only`, `icd_and_mapped_snomed` (and, for the partners without an
+NHS Digital licence, `*_no_nhs_d`) copies.  Now each per-source megadata file is written to the
+store once, with `write_partition()`, and every product is a lazy view of it (`scan_product()`):
+the partitions of the product's coding systems and sources are scanned, the others are never
+opened, and the events are deduplicated within the query.  The partitions are zstd-compressed
+Parquet files, sorted by (code, nhs_number, date) in row groups of `PARQUET_ROW_GROUP_SIZE` rows,
+whose min/max statistics let a view filtered on codes (NB#8's codelists) skip the row groups
+without any of them.  `benchmark_formats()` compares a partition with the per-source Arrow
+megadata file it was written from: size on disk, and the time of a full and of a codelist scan.
+
+`ICD10_MAPPED` holds the ICD-10 codes mapped from SNOMED (`final_mapped*.arrow`), kept apart from
+the "native" `ICD10` so that `icd_only` does not include them.  A product may only take some
+sources of a coding system: `icd_with_mapped_snomed_no_nhs_d` only has the mapped codes of primary
+care, as when it was first produced.
+"""
+
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+import polars as pl
+
+from bi_py import run_log
+from bi_py.megadata import DEDUPLICATION_OPTIONS
+
+PARTITION_KEYS = ("coding_system", "source", "cut")
+PARTITION_FILE = "part.parquet"
+PARTITION_LOG_FILE = "log.txt"
+PARQUET_SORT_ORDER = ["code", "nhs_number", "date"]
+PARQUET_COMPRESSION = "zstd"
+PARQUET_ROW_GROUP_SIZE = 256_000
+
+
+class Product(NamedTuple):
+    coding_systems: Sequence[str]
+    exclude_sources: Sequence[str] = ()
+    # per coding system, the only sources of the product (all but `exclude_sources` otherwise)
+    sources: Optional[Dict[str, Sequence[str]]] = None
+    # codes truncated to their first `code_length` characters (as tretools' `truncate_icd_to_3_digits()`)
+    code_length: Optional[int] = None
+
+
+PRODUCTS: Dict[str, Product] = {
+    "icd_only": Product(["ICD10"]),
+    "opcs_only": Product(["OPCS4"]),
+    "snomed_only": Product(["SNOMED"]),
+    "icd_and_mapped_snomed": Product(["ICD10", "ICD10_MAPPED"]),
+    "icd_and_mapped_snomed_3_digit": Product(["ICD10", "ICD10_MAPPED"], code_length=3),
+    # for the industry partners without a current NHS Digital licence
+    "icd_only_no_nhs_d": Product(["ICD10"], exclude_sources=["nhs_digital"]),
+    # as first produced (26th March 2024): only the primary care SNOMED codes are mapped
+    "icd_with_mapped_snomed_no_nhs_d": Product(["ICD10", "ICD10_MAPPED"], exclude_sources=["nhs_digital"], sources={"ICD10_MAPPED": ["primary_care"]}),
+}
+
+
+class Partition(NamedTuple):
+    coding_system: str
+    source: str
+    cut: Optional[str]
+    location: str
+
+
+def partition_location(store_location: str, coding_system: str, source: str, cut: Optional[str] = None) -> Path:
+    location = Path(store_location) / f"coding_system={coding_system}" / f"source={source}"
+    return location / f"cut={cut}" if cut is not None else location
+
+
+def write_partition(
+    data,
+    store_location: str,
+    coding_system: str,
+    source: str,
+    cut: Optional[str] = None,
+    log: Optional[List[str]] = None,
+) -> str:
+    """
+    Writes (or replaces) the partition `coding_system`/`source`[/`cut`] of the store with `data`
+    (a DataFrame, LazyFrame or tretools dataset), and its log.
+
+    Returns:
+        str: the partition's Parquet file
+    """
+    log = log if log is not None else getattr(data, "log", [])
+    data = getattr(data, "data", data).lazy()
+    location = partition_location(store_location, coding_system, source, cut)
+    location.mkdir(parents=True, exist_ok=True)
+
+    temp_location = location / f".{PARTITION_FILE}.{os.getpid()}.tmp"
+    with run_log.stage("write_partition", outputs=[location / PARTITION_FILE], coding_system=coding_system, source=source, cut=cut) as event:
+        (
+            data
+            .sort(PARQUET_SORT_ORDER)
+            .sink_parquet(temp_location, compression=PARQUET_COMPRESSION, statistics=True, row_group_size=PARQUET_ROW_GROUP_SIZE)
+        )
+        os.replace(temp_location, location / PARTITION_FILE)
+        event["rows_out"] = pl.scan_parquet(location / PARTITION_FILE).select(pl.len()).collect().item()
+    (location / PARTITION_LOG_FILE).write_text("\n".join(log) + "\n")
+    return str(location / PARTITION_FILE)
+
+
+def partitions(store_location: str) -> List[Partition]:
+    """The partitions of the store, from its directory names alone."""
+    found = []
+    for file in sorted(Path(store_location).glob(f"**/{PARTITION_FILE}")):
+        keys = dict(part.split("=", 1) for part in file.relative_to(store_location).parent.parts)
+        if set(keys) - set(PARTITION_KEYS) or not {"coding_system", "source"} <= set(keys):
+            raise ValueError(f"{file} is not in a coding_system=.../source=...[/cut=...] directory")
+        found.append(Partition(keys["coding_system"], keys["source"], keys.get("cut"), str(file)))
+    return found
+
+
+def _select(
+    store_location: str,
+    coding_systems: Optional[Iterable[str]] = None,
+    sources: Optional[Iterable[str]] = None,
+    exclude_sources: Iterable[str] = (),
+    cuts: Optional[Iterable[str]] = None,
+) -> List[Partition]:
+    coding_systems = set(coding_systems) if coding_systems is not None else None
+    sources = set(sources) if sources is not None else None
+    cuts = set(cuts) if cuts is not None else None
+    return [
+        partition for partition in partitions(store_location)
+        if (coding_systems is None or partition.coding_system in coding_systems)
+        and (sources is None or partition.source in sources)
+        and partition.source not in set(exclude_sources)
+        and (cuts is None or partition.cut in cuts)
+    ]
+
+
+def codes_as(codes: Iterable, dtype: pl.DataType) -> pl.Series:
+    # the codes of a codelist (text) as the dtype of the store's codes; those which cannot be are dropped
+    codes = codes if isinstance(codes, pl.Series) else pl.Series(list(codes), strict=False)
+    return codes.cast(dtype, strict=False).drop_nulls().unique()
+
+
+def _product_partitions(store_location: str, product: Product) -> List[Partition]:
+    return [
+        partition for partition in _select(store_location, product.coding_systems, exclude_sources=product.exclude_sources)
+        if product.sources is None
+        or partition.coding_system not in product.sources
+        or partition.source in product.sources[partition.coding_system]
+    ]
+
+
+def _scan(selected: Sequence[Partition], codes: Optional[Iterable] = None) -> pl.LazyFrame:
+    frames = []
+    for partition in selected:
+        frame = pl.scan_parquet(partition.location)
+        if codes is not None:
+            frame = frame.filter(pl.col("code").is_in(codes_as(codes, frame.collect_schema()["code"]).implode()))
+        frames.append(
+            frame.with_columns(
+                pl.lit(partition.coding_system).alias("coding_system"),
+                pl.lit(partition.source).alias("source"),
+            )
+        )
+    return pl.concat(frames, how="diagonal_relaxed")
+
+
+def scan_store(
+    store_location: str,
+    coding_systems: Optional[Iterable[str]] = None,
+    sources: Optional[Iterable[str]] = None,
+    exclude_sources: Iterable[str] = (),
+    cuts: Optional[Iterable[str]] = None,
+    codes: Optional[Iterable] = None,
+) -> pl.LazyFrame:
+    """
+    The events of the selected partitions (all by default), with their `coding_system` and
+    `source`; only those partitions are scanned.  With `codes`, only the events with one of them,
+    so that the row groups without any of them are skipped.
+    """
+    selected = _select(store_location, coding_systems, sources, exclude_sources, cuts)
+    if not selected:
+        raise ValueError(f"No partition of {store_location} matches coding systems {coding_systems}, sources {sources}, cuts {cuts}")
+    return _scan(selected, codes)
+
+
+def scan_product(store_location: str, name: str, codes: Optional[Iterable] = None, dedup_on: Sequence[str] = DEDUPLICATION_OPTIONS) -> pl.LazyFrame:
+    """
+    The NB#6 product `name` (see `PRODUCTS`) as a lazy view of the store: its partitions,
+    deduplicated on `dedup_on`, without the partition columns.  `codes` are those of the
+    partitions, i.e. before any truncation.
+    """
+    if name not in PRODUCTS:
+        raise ValueError(f"Unknown product {name}, known products: {sorted(PRODUCTS)}")
+    product = PRODUCTS[name]
+    selected = _product_partitions(store_location, product)
+    if not selected:
+        raise ValueError(f"No partition of {store_location} is in the product {name}")
+    data = _scan(selected, codes).drop("coding_system", "source")
+    if product.code_length is not None:
+        data = data.with_columns(pl.col("code").str.slice(0, product.code_length))
+    return data.unique(subset=list(dedup_on), maintain_order=False)
+
+
+def product_log(store_location: str, name: str) -> List[str]:
+    """The logs of the partitions of the product `name`, merged and sorted (as NB#6 did with the merged logs)."""
+    product = PRODUCTS[name]
+    log = []
+    for partition in _product_partitions(store_location, product):
+        log_location = Path(partition.location).with_name(PARTITION_LOG_FILE)
+        if log_location.exists():
+            log.extend(line for line in log_location.read_text().splitlines() if line)
+    return sorted(log)
+
+
+def benchmark_formats(
+    store_location: str,
+    coding_system: str,
+    source: str,
+    megadata_location: str,
+    codes: Iterable,
+    cut: Optional[str] = None,
+    repeat: int = 3,
+) -> pl.DataFrame:
+    """
+    Size on disk and best-of-`repeat` wall time of a full scan and of a scan filtered on `codes`,
+    of the partition `coding_system`/`source`[/`cut`] and of the Arrow megadata file
+    `megadata_location` it was written from.
+    """
+    codes = list(codes)
+    files = {
+        "arrow": Path(megadata_location),
+        "parquet": partition_location(store_location, coding_system, source, cut) / PARTITION_FILE,
+    }
+    scans = {"arrow": lambda: pl.scan_ipc(files["arrow"]), "parquet": lambda: pl.scan_parquet(files["parquet"])}
+    rows = []
+    for file_format, scan in scans.items():
+        selected = codes_as(codes, scan().collect_schema()["code"]).implode()
+        # the people and first event dates are aggregated so that the columns are actually read
+        summary = [pl.len(), pl.col("nhs_number").n_unique(), pl.col("date").min()]
+        queries = {
+            "full scan": lambda: scan().select(summary).collect(),
+            "codes": lambda: scan().filter(pl.col("code").is_in(selected)).select(summary).collect(),
+        }
+        for query_name, query in queries.items():
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                rows_found = query().item(0, 0)
+                timings.append(time.perf_counter() - start)
+            rows.append({
+                "format": file_format,
+                "query": query_name,
+                "rows": rows_found,
+                "seconds": min(timings),
+                "size_mb": files[file_format].stat().st_size / 2**20,
+            })
+    return pl.DataFrame(rows)
@@ -0,0 +1,127 @@
+"""
+Excel (.xlsx) workbooks to Arrow, without pandas.
+
+The Feb 2021 Bradford cut is delivered as two workbooks which NB#4 used to read with
+`pd.read_excel()`, write back out with `to_csv()` (including the pandas index column) and then
+parse again through `RawDataset`.  Excel parsing is the slowest step of NB#4 and the workbooks
+never change, so:
+
+- `read_xlsx()` streams the rows of a sheet (openpyxl in read-only mode, which is what pandas
+  uses underneath; polars' own `read_excel` needs `fastexcel`, which is not installed in the TRE)
+  straight into polars with an explicit schema
+- `convert_xlsx()` writes the result to an Arrow file named after the sha256 of the workbook, and
+  reuses it as long as the workbook is unchanged, so each workbook is parsed once in the lifetime
+  of a cut
+
+The Arrow file can be given to `RawDataset(path=...)` in place of the CSV.
+"""
+
+import hashlib
+import json
+from datetime import date, datetime, time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import polars as pl
+
+from bi_py.stage_cache import StageCache
+
+BATCH_SIZE = 100_000
+# part of the hash of the Arrow files; bumped whenever read_xlsx() writes them differently
+# 2: dates as pl.Date rather than text
+FORMAT_VERSION = 2
+
+
+def _as_text(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d") if value.time() == time(0) else value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, date):
+        return value.strftime("%Y-%m-%d")
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))  # e.g. codes stored as numbers
+    return str(value)
+
+
+def read_xlsx(
+    xlsx_location: str,
+    schema: Optional[Dict[str, pl.DataType]] = None,
+    sheet_name: Optional[str] = None,
+    batch_size: int = BATCH_SIZE,
+) -> pl.DataFrame:
+    """
+    Reads a sheet (the first one by default) whose first row is the header.
+
+    Every column is read as text (dates as `YYYY-MM-DD`, with the time if not midnight) and then
+    cast to its type in `schema`; columns not in `schema` remain `pl.Utf8`.  `pl.Date` columns are
+    parsed from their first 10 characters (see `bi_py.dates` for how `process_dataset()` keeps them).
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(xlsx_location, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name is not None else workbook.worksheets[0]
+        rows = sheet.iter_rows(values_only=True)
+        header = [str(name) for name in next(rows)]
+        text_schema = {name: pl.Utf8 for name in header}
+
+        batches: List[pl.DataFrame] = []
+        batch = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue  # trailing formatted but empty rows
+            row = list(row[:len(header)]) + [None] * (len(header) - len(row))
+            batch.append([_as_text(value) for value in row])
+            if len(batch) == batch_size:
+                batches.append(pl.DataFrame(batch, schema=text_schema, orient="row"))
+                batch = []
+        batches.append(pl.DataFrame(batch, schema=text_schema, orient="row"))
+    finally:
+        workbook.close()
+
+    data = pl.concat(batches)
+    casts = []
+    for name, dtype in (schema or {}).items():
+        if name not in text_schema:
+            raise ValueError(f"{xlsx_location}: column {name} of the schema is not in the sheet {header}")
+        if dtype == pl.Date:
+            casts.append(pl.col(name).str.slice(0, 10).str.to_date("%Y-%m-%d"))
+        elif dtype != pl.Utf8:
+            casts.append(pl.col(name).cast(dtype))
+    return data.with_columns(casts) if casts else data
+
+
+def convert_xlsx(
+    xlsx_location: str,
+    cache_location: str,
+    schema: Optional[Dict[str, pl.DataType]] = None,
+    sheet_name: Optional[str] = None,
+) -> str:
+    """
+    `read_xlsx()` written to `<cache_location>/<workbook name>.<hash>.arrow`, unless already there.
+    The hash covers the content of the workbook, the sheet, the schema and `FORMAT_VERSION`.
+
+    Returns:
+        str: the Arrow file
+    """
+    digest = hashlib.sha256(
+        json.dumps(
+            [
+                StageCache(Path(cache_location) / "stage_cache").file_digest(xlsx_location),
+                sheet_name,
+                {name: str(dtype) for name, dtype in (schema or {}).items()},
+                FORMAT_VERSION,
+            ]
+        ).encode()
+    ).hexdigest()
+    arrow_path = Path(cache_location) / f"{Path(xlsx_location).stem}.{digest[:16]}.arrow"
+    if arrow_path.exists():
+        print(f"{datetime.now()}: {Path(xlsx_location).name} unchanged, reusing {arrow_path}")
+        return str(arrow_path)
+
+    arrow_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = arrow_path.with_name(f".{arrow_path.name}.tmp")
+    read_xlsx(xlsx_location, schema=schema, sheet_name=sheet_name).write_ipc(temp_path)
+    temp_path.replace(arrow_path)
+    return str(arrow_path)
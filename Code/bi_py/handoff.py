@@ -0,0 +1,134 @@
+"""
+In-memory hand-off of processed datasets between the cells of a notebook.
+
+The notebooks write every clean dataset to file and then reload it from file before merging it
+"so that we can be assured that the correct dataset is loaded as sometimes the cells can be run
+manually in the wrong order".  That costs one full Arrow read per dataset per merge.
+
+`HandOff` keeps the same guarantee without the reload:
+
+    hand_off = HandOff()
+    hand_off.write(cleaned_dataset, f"{OUTPUT_CLEAN_PATH}/apc.arrow", f"{OUTPUT_CLEAN_PATH}/apc_log.txt")
+    ...
+    apc_data = hand_off.load(
+        path=f"{OUTPUT_CLEAN_PATH}/apc.arrow",
+        dataset_type=DatasetType.NHS_DIGITAL.value,
+        coding_system=CodelistType.ICD10.value,
+        log_path=f"{OUTPUT_CLEAN_PATH}/apc_log.txt",
+    )
+
+`write()` saves the dataset as before and records its fingerprint (schema, row count and a hash
+of the key columns) in the dataset's log and in the run log (`details.fingerprint` of its
+`hand_off_write` event, see `bi_py.run_log`).  `load()` takes the same arguments as
+`ProcessedDataset` and returns the dataset which was written to `path`, from memory, if it is
+verifiably unchanged: same fingerprint, same coding system and dataset type, and the file on disk
+not rewritten since.  Otherwise, e.g. the dataset was written in another kernel or a cell re-run
+since, it reads the file exactly as `ProcessedDataset` would; if the file was not rewritten since
+`write()`, the data read must have the fingerprint recorded then, or `load()` raises.  Each
+written dataset is handed off once, so that it is not kept in memory for the rest of the
+notebook; loading it again reads the file.  Loads are recorded in the run log too (`hand_off_load`).
+"""
+
+import copy
+import os
+from datetime import datetime
+from typing import Dict, Sequence, Tuple
+
+import polars as pl
+
+from bi_py import run_log
+
+KEY_COLUMNS = ("nhs_number", "code", "date")
+
+
+def fingerprint(data: pl.DataFrame, key_columns: Sequence[str] = KEY_COLUMNS) -> dict:
+    """
+    Schema, row count and an (order independent) hash of the key columns of `data`.
+
+    The hash is only meant to be compared within a run: polars' row hashes may change between
+    polars versions.
+    """
+    keys = [column for column in key_columns if column in data.columns]
+    key_hash = data.select(pl.struct(keys).hash(seed=0).bitwise_xor()).item() if keys and data.height else 0
+    return {
+        "schema": {name: str(dtype) for name, dtype in data.schema.items()},
+        "rows": data.height,
+        "key_hash": f"{key_hash:016x}",
+    }
+
+
+def describe(fingerprint: dict) -> str:
+    schema = ", ".join(f"{name}: {dtype}" for name, dtype in fingerprint["schema"].items())
+    return f"{fingerprint['rows']} rows, key hash {fingerprint['key_hash']}, schema {{{schema}}}"
+
+
+def _file_state(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _read(path: str, dataset_type: str, coding_system: str, log_path: str):
+    from tretools.datasets.processed_dataset import ProcessedDataset
+
+    return ProcessedDataset(path=path, dataset_type=dataset_type, coding_system=coding_system, log_path=log_path)
+
+
+class HandOff:
+    def __init__(self) -> None:
+        # absolute path of the written file -> (dataset, log path, fingerprint, file state)
+        self._written: Dict[str, tuple] = {}
+
+    def write(self, dataset, path: str, log_path: str) -> dict:
+        """`dataset.write_to_feather(path)` and `dataset.write_to_log(log_path)`, recording the dataset's fingerprint."""
+        with run_log.stage("hand_off_write", outputs=[path, log_path], rows_in=dataset.data.height) as event:
+            dataset_fingerprint = fingerprint(dataset.data)
+            event["details"]["fingerprint"] = dataset_fingerprint
+            dataset.log.append(f"{datetime.now()}: Fingerprint of {os.path.basename(path)}: {describe(dataset_fingerprint)}")
+            dataset.write_to_feather(path)
+            dataset.write_to_log(log_path)
+            event["rows_out"] = dataset.data.height
+        self._written[os.path.abspath(path)] = (dataset, os.path.abspath(log_path), dataset_fingerprint, _file_state(path))
+        return dataset_fingerprint
+
+    def load(self, path: str, dataset_type: str, coding_system: str, log_path: str):
+        """Same as `ProcessedDataset(path, dataset_type, coding_system, log_path)`, from memory where verifiably safe."""
+        with run_log.stage("hand_off_load", inputs=[path]) as event:
+            dataset = self._load(path, dataset_type, coding_system, log_path, event)
+            event["rows_out"] = dataset.data.height
+        return dataset
+
+    def _load(self, path: str, dataset_type: str, coding_system: str, log_path: str, event: dict):
+        written = self._written.pop(os.path.abspath(path), None)
+        if written is not None:
+            dataset, written_log_path, written_fingerprint, written_file_state = written
+            reason = None
+            if written_log_path != os.path.abspath(log_path):
+                reason = f"written with log {written_log_path}"
+            elif (getattr(dataset, "dataset_type", dataset_type), getattr(dataset, "coding_system", coding_system)) != (dataset_type, coding_system):
+                reason = "written with another dataset type or coding system"
+            elif not os.path.exists(path) or _file_state(path) != written_file_state:
+                reason = "file rewritten since"
+            elif fingerprint(dataset.data) != written_fingerprint:
+                reason = "dataset modified in memory since it was written"
+
+            if reason is None:
+                event["details"].update(source="memory", fingerprint=written_fingerprint)
+                # a shallow copy so that merging into the handed-off dataset does not modify the written one
+                handed_off = copy.copy(dataset)
+                handed_off.log = list(dataset.log)
+                handed_off.log.append(f"{datetime.now()}: Handed off in memory from {os.path.basename(path)}, fingerprint verified")
+                return handed_off
+            print(f"{datetime.now()}: {path}: {reason}, reloading from file")
+            event["details"]["reason"] = reason
+
+        dataset = _read(path, dataset_type, coding_system, log_path)
+        event["details"]["source"] = "file"
+        if written is not None and os.path.exists(path) and _file_state(path) == written_file_state:
+            # the file written by write() and not rewritten since: it must hold what was written
+            event["details"]["fingerprint"] = fingerprint(dataset.data)
+            if event["details"]["fingerprint"] != written_fingerprint:
+                raise ValueError(
+                    f"{path} does not hold the dataset written to it: {describe(event['details']['fingerprint'])}, "
+                    f"written {describe(written_fingerprint)}"
+                )
+        return dataset
@@ -0,0 +1,97 @@
+"""
+The cleaning of ICD-10 codes of NB#7, and the codes of its 3 and 4 character traits.
+
+`clean_icd10()` and `generate_icd10_codes()` used to be defined in NB#7 itself; they are here so
+that `bi_py.benchmark` runs the same cleaning on the synthetic data (see `bi_py.synthetic`) as NB#7
+does on the real one.  See NB#7 for the suffixes of the codes they handle.
+"""
+
+from itertools import product
+from typing import List
+
+import polars as pl
+
+
+def clean_icd10(lf: pl.LazyFrame, icd10_column: str = "code") -> pl.LazyFrame:
+    """
+    Cleans an ICD-10 column by:
+    - Removing all spaces
+    - Excluding icd10 = "NA" rows
+    - Excluding icd10 code <3 char length (minimum valid icd10 is 3 chars)
+    - Excluding icd10 codes not starting with a letter
+    - Excluding icd10 ending with an "A" rows; "A" suffixes represent "Excluded diagnosis"
+    - Removing B-Z characters at end of icd10 code
+    - Removing "X" and "." and "-"
+    - Keeping up to 4 meaningful characters
+
+    Args:
+        lf (pl.LazyFrame): The input LazyFrame containing the ICD-10 column to clean
+        icd10_column (str): Name of the column containing ICD-10 codes
+
+    Returns:
+        pl.LazyFrame: the modified LazyFrame with cleaned ICD-10 codes, as `<icd10_column>_new`,
+        its first 3 characters (`_new_3d`) and its first 4 characters, dotted (`_new_4d`) and
+        undotted (`_new_4d_undotted`)
+    """
+    return (
+        lf
+        .with_columns(
+            pl.col(icd10_column)
+            .str.replace_all(" ","")
+        )
+        .filter( # eliminiate rows with inappropriate codes
+            pl.col(icd10_column).ne("NA"),
+            pl.col(icd10_column).ne("-1"),
+            pl.col(icd10_column).str.len_chars() >= 3,
+            pl.col(icd10_column).str.contains("^[A-Z]"),
+            ~pl.col(icd10_column).str.contains("A$"),
+        )
+        .with_columns( # create icd_10_new (invalid character processed code)
+            pl.col(icd10_column)
+            .str.replace(r"[B-Z]$", "")
+            .str.replace_all(r"[\.-]","")  # Remove any `.` and `-`
+            .str.replace(r"^(.+)X(.*)","$1$2") # Remove `X` somewhere other than in the first position
+            .alias(f"{icd10_column}_new")
+        )
+        .with_columns( # create 3-digit version of icd10_new
+            pl.col(f"{icd10_column}_new")
+            .str.slice(0,3)
+            .alias(f"{icd10_column}_new_3d")
+        )
+        .with_columns( # create both dotted and undotted version of icd10_new
+            pl.when(pl.col(f"{icd10_column}_new").str.slice(3, 1).ne("")) #  4 or more characters
+            .then(
+                pl.concat_str(
+                    pl.col(f"{icd10_column}_new").str.slice(0, 3),
+                    pl.lit("."),
+                    pl.col(f"{icd10_column}_new").str.slice(3, 1)
+                ).alias(f"{icd10_column}_new_4d")
+            ),
+            pl.when(pl.col(f"{icd10_column}_new").str.slice(3, 1).ne("")) #  4 or more characters
+            .then(
+                pl.col(f"{icd10_column}_new").str.slice(0, 4),
+            ).alias(f"{icd10_column}_new_4d_undotted")
+        )
+        .unique()
+    )
+
+
+def generate_icd10_codes(icd_length: int, with_dot=True) -> List[str]:
+    """Every code from A01 to Q99 (`icd_length` 3), or from A01.0 to Q99.9 (4, undotted without `with_dot`)."""
+    # Avoids the need for nested loops
+
+    if icd_length == 3:
+        # 17 letter x 99 numbers (01-99) = 1683 codes
+        letters = [chr(c) for c in range(ord("A"), ord("Q") + 1)]
+        numbers = [f"{i:02d}" for i in range(1, 100)]
+
+        return [f"{l}{n}" for l, n in product(letters, numbers)]
+    elif icd_length == 4:
+        # 17 letter x 99 numbers (01-99) x 10 sub-digits (0-9) = 16830 codes
+        letters = [chr(c) for c in range(ord("A"), ord("Q") + 1)]
+        numbers = [f"{i:02d}" for i in range(1, 100)]
+        decimals = [*[f".{i}" for i in range(10)]] if with_dot else [""]
+
+        return [f"{l}{n}{d}" for l, n, d in product(letters, numbers, decimals)]
+    else:
+        raise ValueError(f"generate_combo_icd10: `icd_length` of {icd_length} not recognised.  Try 3 or 4.")
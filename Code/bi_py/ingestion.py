@@ -0,0 +1,348 @@
+"""
+Lazy, column-projected ingestion of raw CSV extracts.
+
+`RawDataset(path=...)` reads the whole CSV into memory before `process_dataset()` keeps the four
+mapped columns.  The Discovery observation extracts have ~66M rows and dozens of columns, so the
+peak memory of NB#2 is dominated by columns which are thrown away.
+
+`ingest_csv()` does the same work as `RawDataset(...).process_dataset(...)` for the datasets with
+one event per row (primary care, Barts, Bradford) as a single lazy plan:
+
+    scan_csv -> select the mapped columns only -> rename -> parse dates -> unique -> sink_ipc
+
+so only the mapped columns are ever parsed, the plan runs in the streaming engine, and the result
+is written straight to an Arrow file which `ProcessedDataset(path=..., log_path=...)` can load.
+Memory is bounded by the distinct (deduplicated) rows rather than by the size of the extract.
+Every column is read as text, as tretools reads them, rather than with the dtypes polars would
+infer from the first rows of the extract.
+
+`ingest_and_clean_csv()` goes one step further and fuses `remove_unrealistic_dates()` into the same
+plan (date bounds, then an inner join on the demographics to drop events before birth), written
+to `clean_processed_data/`, sorted by (nhs_number, code, date) and marked as such (see
+`bi_py.sorted_merge`).  The intermediate `processed_data/` copy is only written if asked for.
+
+A date which does not parse with `date_format` would become null, and the event would then be
+dropped with those outside the date bounds without being counted.  Such rows are instead counted
+and quarantined, as the ragged rows of `bi_py.quarantine`, to a rejects sidecar CSV next to the
+output (`<name>_date_rejects.csv`, the mapped columns with the raw date), and their number is in the
+log of the file and in the run log (`date_rejects`), with the rows read and those without a date.
+With `snomed_code`, the rows without a SNOMED code (e.g. a Read code in a column of SNOMED codes)
+are dropped, as they are in NB#6 and in the ECDS extracts, rather than failing the whole file;
+their number is logged in the same way (`code_rejects`).
+
+The output files, the rejects, the counts and the latest event date (for `bi_py.stage_cache`) are
+all outputs of one query (`pl.collect_all()`), in which the scan of the raw file is shared: each
+raw file is read once.
+
+The NHS Digital datasets (one row per episode, codes spread over several columns) still go through
+`RawDataset`, which expands the columns into rows.
+"""
+
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, TypeVar
+
+import polars as pl
+
+from bi_py import person
+from bi_py.snomed import snomed_code as as_snomed_code, snomed_codes
+from bi_py.sorted_merge import SORT_KEY, mark_sorted
+
+DATE_FORMAT = "%Y-%m-%d"
+DATE_REJECTS_SUFFIX = "_date_rejects.csv"
+
+Frame = TypeVar("Frame", pl.DataFrame, pl.LazyFrame)
+
+
+def _count(data: pl.LazyFrame) -> int:
+    return data.select(pl.len()).collect().item()
+
+
+class RawCheck(NamedTuple):
+    rows_in: int
+    without_date: int
+    date_rejects: int
+    code_rejects: int
+    max_event_date: Optional[object]
+
+
+class Ingested(NamedTuple):
+    log: List[str]
+    rows_in: int
+    rows_out: int
+    date_rejects: int
+    max_event_date: Optional[object]
+    code_rejects: int = 0
+
+
+def _parse_date(date: pl.Expr, date_format: str) -> pl.Expr:
+    # only the first 10 characters, so that datetimes (`2019-01-01 00:00:00`) keep their date
+    return date.str.slice(0, 10).str.to_date(date_format, strict=False)
+
+
+def date_rejects_location(location: str) -> str:
+    """The rejects sidecar of the output file `location`, e.g. `<cut>/clean_processed_data/<name>_date_rejects.csv`."""
+    return str(Path(location).with_suffix("")) + DATE_REJECTS_SUFFIX
+
+
+def scan_raw(raw_location: str, separator: str = ",") -> pl.LazyFrame:
+    """The raw CSV, every column as text."""
+    return pl.scan_csv(raw_location, separator=separator, infer_schema=False)
+
+
+def raw_checks(
+    raw: pl.LazyFrame,
+    column_maps: dict,
+    date_format: Optional[str] = DATE_FORMAT,
+    snomed_code: bool = False,
+) -> Tuple[pl.LazyFrame, pl.LazyFrame]:
+    """
+    The checks of `raw` (see `scan_raw()`), as two queries: the rows, those without a date, those
+    whose date does not parse with `date_format`, those without a SNOMED code (if `snomed_code`)
+    and the latest date (one row, see `RawCheck`); and the rows whose date does not parse (mapped
+    columns, the date as read).
+    """
+    date_column = next(raw_name for raw_name, name in column_maps.items() if name == "date")
+    date = pl.col(date_column)
+    parsed = _parse_date(date, date_format) if date_format is not None else date
+    unparseable = date.is_not_null() & parsed.is_null() if date_format is not None else pl.lit(False)
+    code_column = next((raw_name for raw_name, name in column_maps.items() if name == "code"), None)
+    not_snomed = pl.lit(False)
+    if snomed_code and code_column is not None:
+        not_snomed = as_snomed_code(code_column, raw.collect_schema()[code_column]).is_null()
+    counts = raw.select(
+        pl.len().alias("rows_in"),
+        date.is_null().sum().alias("without_date"),
+        unparseable.sum().alias("date_rejects"),
+        not_snomed.sum().alias("code_rejects"),
+        parsed.max().alias("max_event_date"),
+    )
+    rejects = raw.filter(unparseable).select([pl.col(raw_name).alias(name) for raw_name, name in column_maps.items()])
+    return counts, rejects
+
+
+def _check_log(check: RawCheck, date_format: Optional[str], rejects_location: str) -> List[str]:
+    log = [f"{datetime.now()}: {check.rows_in} rows read, {check.without_date} without a date"]
+    if check.date_rejects:
+        log.append(f"{datetime.now()}: {check.date_rejects} rows with a date which is not {date_format} quarantined to {rejects_location}")
+    if check.code_rejects:
+        log.append(f"{datetime.now()}: {check.code_rejects} rows without a SNOMED code dropped")
+    return log
+
+
+def scan_raw_csv(
+    raw_location: str,
+    column_maps: dict,
+    deduplication_options: Optional[Sequence[str]],
+    separator: str = ",",
+    date_format: Optional[str] = DATE_FORMAT,
+    snomed_code: bool = False,
+) -> pl.LazyFrame:
+    """
+    The lazy equivalent of `RawDataset(path=raw_location).process_dataset(deduplication_options, column_maps)`.
+
+    Args:
+        raw_location: the raw CSV
+        column_maps: raw column -> standard column (`nhs_number`, `code`, `date`, optionally `term`)
+        deduplication_options: the standard columns to deduplicate on (none: no deduplication)
+        separator: the CSV separator
+        date_format: format of the raw date column; only its first 10 characters are parsed so that
+            datetimes (`2019-01-01 00:00:00`) keep their date, and dates which do not parse are
+            null (see `raw_checks()`).  `None` leaves the column as read.
+        snomed_code: whether `code` is converted to the canonical SNOMED dtype (see `bi_py.snomed`),
+            the rows without a SNOMED code being dropped
+    """
+    raw = scan_raw(raw_location, separator)
+    return process_frame(raw, column_maps, deduplication_options, date_format=date_format, snomed_code=snomed_code, source=raw_location)
+
+
+def process_frame(
+    raw: Frame,
+    column_maps: dict,
+    deduplication_options: Optional[Sequence[str]],
+    date_format: Optional[str] = DATE_FORMAT,
+    snomed_code: bool = False,
+    source: str = "data",
+) -> Frame:
+    """
+    The steps of `scan_raw_csv()` after the scan, on a frame already loaded: select and rename the
+    mapped columns, parse `date` if it is text, convert `code` if `snomed_code`, deduplicate.  `source` names the frame in errors.
+    """
+    missing = set(column_maps) - set(raw.collect_schema().names())
+    if missing:
+        raise ValueError(f"{source}: columns {sorted(missing)} of the column maps are not in the file")
+
+    data = raw.select([pl.col(raw_name).alias(name) for raw_name, name in column_maps.items()])
+    if date_format is not None and data.collect_schema()["date"] == pl.Utf8:
+        data = data.with_columns(_parse_date(pl.col("date"), date_format))
+    if snomed_code and "code" in column_maps.values():
+        data = snomed_codes(data, strict=False)
+    if not deduplication_options:
+        return data
+    return data.unique(subset=list(deduplication_options), maintain_order=False)
+
+
+def _sink_together(sinks: Dict[str, pl.LazyFrame], query: pl.LazyFrame) -> pl.DataFrame:
+    # the sinks (Arrow, or CSV for the .csv files) and the query run as one, so that the raw file
+    # they all scan is read once; each file is written to a temporary file first, as sink_sorted() does
+    temp_locations = {location: f"{location}.{os.getpid()}.tmp" for location in sinks}
+    plans = [
+        data.sink_csv(temp_locations[location], lazy=True) if location.endswith(".csv") else data.sink_ipc(temp_locations[location], lazy=True)
+        for location, data in sinks.items()
+    ]
+    result = pl.collect_all([*plans, query], engine="streaming")[-1]
+    for location, temp_location in temp_locations.items():
+        os.replace(temp_location, location)
+    return result
+
+
+def _ingest(
+    raw_location: str,
+    column_maps: dict,
+    deduplication_options: Sequence[str],
+    separator: str,
+    date_format: Optional[str],
+    snomed_code: bool,
+    rejects_location: str,
+    sinks,
+) -> RawCheck:
+    # runs the sinks which `sinks(processed)` returns for the processed plan, with the date checks
+    raw = scan_raw(raw_location, separator)
+    processed = process_frame(raw, column_maps, deduplication_options, date_format=date_format, snomed_code=snomed_code, source=raw_location)
+    counts, rejects = raw_checks(raw, column_maps, date_format, snomed_code)
+    check = RawCheck(*_sink_together({**sinks(processed), rejects_location: rejects}, counts).row(0))
+    if check.date_rejects:
+        print(f"{datetime.now()}: {Path(raw_location).name}: {check.date_rejects} row(s) with a date which is not {date_format} quarantined to {rejects_location}")
+    else:
+        Path(rejects_location).unlink()
+    if check.code_rejects:
+        print(f"{datetime.now()}: {Path(raw_location).name}: {check.code_rejects} row(s) without a SNOMED code dropped")
+    return check
+
+
+def _processed_log(raw_location: str, column_maps: dict) -> List[str]:
+    return [f"{datetime.now()}: Lazily ingesting {raw_location}, keeping columns {list(column_maps)}"]
+
+
+def _deduplicated_log(check: RawCheck, column_maps: dict, deduplication_options: Sequence[str], rows_out: int) -> List[str]:
+    return [
+        f"{datetime.now()}: Columns renamed to {list(column_maps.values())}",
+        f"{datetime.now()}: Deduplicated on {list(deduplication_options)}: "
+        f"{check.rows_in} rows before, {rows_out} rows after ({check.rows_in - rows_out} removed)",
+    ]
+
+
+def ingest_csv(
+    raw_location: str,
+    processed_location: str,
+    log_location: str,
+    column_maps: dict,
+    deduplication_options: Sequence[str],
+    separator: str = ",",
+    date_format: Optional[str] = DATE_FORMAT,
+    snomed_code: bool = False,
+) -> List[str]:
+    """
+    Runs `scan_raw_csv()` and sinks the result to `processed_location` (Arrow IPC), with a log in
+    the same "<timestamp>: <message>" format as tretools at `log_location`; the rows whose date
+    does not parse are quarantined (see `raw_checks()`).
+
+    Returns:
+        list: the log
+    """
+    Path(processed_location).parent.mkdir(parents=True, exist_ok=True)
+    rejects_location = date_rejects_location(processed_location)
+    check = _ingest(
+        raw_location, column_maps, deduplication_options, separator, date_format, snomed_code, rejects_location,
+        lambda processed: {processed_location: processed},
+    )
+    log = _processed_log(raw_location, column_maps) + _check_log(check, date_format, rejects_location)
+    log += _deduplicated_log(check, column_maps, deduplication_options, _count(pl.scan_ipc(processed_location)))
+    Path(log_location).write_text("\n".join(log) + "\n")
+    return log
+
+
+def remove_unrealistic_dates(data: pl.LazyFrame, date_start: datetime, date_end: datetime, demographics_location: str) -> pl.LazyFrame:
+    """
+    The lazy equivalent of `ProcessedDataset.remove_unrealistic_dates(before_born=True)`: keeps the
+    events between `date_start` and `date_end` (inclusive) of people in the clean demographics whose
+    (month of) birth is not after the event.
+
+    If the clean demographics are keyed on person ids (see `bi_py.person`), so is the result.
+    """
+    demographics = pl.scan_ipc(demographics_location)
+    if person.is_encoded(demographics):
+        data = person.encode(data, pl.scan_ipc(person.person_dictionary_location(demographics_location)))
+    nhs_number_dtype = data.collect_schema()["nhs_number"]
+    dobs = (
+        demographics
+        .select(pl.col("nhs_number").cast(nhs_number_dtype), pl.col("dob"))
+        .unique(subset=["nhs_number"])
+    )
+    return (
+        data
+        .filter(pl.col("date").is_between(date_start.date(), date_end.date(), closed="both"))
+        .join(dobs, on="nhs_number", how="inner")
+        .filter(pl.col("date") >= pl.col("dob"))
+        .drop("dob")
+    )
+
+
+def ingest_and_clean_csv(
+    raw_location: str,
+    clean_location: str,
+    clean_log_location: str,
+    column_maps: dict,
+    deduplication_options: Sequence[str],
+    demographics_location: str,
+    date_start: datetime,
+    date_end: datetime,
+    processed_location: Optional[str] = None,
+    processed_log_location: Optional[str] = None,
+    separator: str = ",",
+    date_format: Optional[str] = DATE_FORMAT,
+    snomed_code: bool = False,
+) -> Ingested:
+    """
+    `ingest_csv()` followed by `remove_unrealistic_dates()` as a single plan sunk to `clean_location`.
+
+    If `processed_location` is given the deduplicated (not yet cleaned) data is also written there,
+    as the notebooks used to do, by the same plan.  Either way the rows whose date does not parse
+    are quarantined next to the clean file (see `raw_checks()`).
+
+    Returns:
+        Ingested: the log of the clean file, the rows read and written, the dates quarantined, the
+        latest event date of the raw file and the rows without a SNOMED code
+    """
+    for location in (clean_location, processed_location):
+        if location is not None:
+            Path(location).parent.mkdir(parents=True, exist_ok=True)
+
+    def sinks(processed: pl.LazyFrame) -> Dict[str, pl.LazyFrame]:
+        # sorted, so that the merge of the cut can deduplicate by sort-merge (see `bi_py.sorted_merge`)
+        clean = remove_unrealistic_dates(processed, date_start, date_end, demographics_location).sort(SORT_KEY)
+        return {clean_location: clean, **({processed_location: processed} if processed_location is not None else {})}
+
+    rejects_location = date_rejects_location(clean_location)
+    check = _ingest(raw_location, column_maps, deduplication_options, separator, date_format, snomed_code, rejects_location, sinks)
+    mark_sorted(clean_location, SORT_KEY)
+
+    rows_out = _count(pl.scan_ipc(clean_location))
+    log = _processed_log(raw_location, column_maps) + _check_log(check, date_format, rejects_location)
+    if processed_location is not None:
+        rows_before = _count(pl.scan_ipc(processed_location))
+        log += _deduplicated_log(check, column_maps, deduplication_options, rows_before)
+        Path(processed_log_location).write_text("\n".join(log) + "\n")
+        log.append(
+            f"{datetime.now()}: Removed events without a date, before {date_start.date()}, after {date_end.date()} or before birth: "
+            f"{rows_before} rows before, {rows_out} rows after ({rows_before - rows_out} removed)"
+        )
+    else:
+        log.append(f"{datetime.now()}: Columns renamed to {list(column_maps.values())} and deduplicated on {list(deduplication_options)}")
+        log.append(
+            f"{datetime.now()}: Removed duplicates, events without a date, before {date_start.date()}, after {date_end.date()} "
+            f"or before birth: {check.rows_in} rows before, {rows_out} rows after ({check.rows_in - rows_out} removed)"
+        )
+    Path(clean_log_location).write_text("\n".join(log) + "\n")
+    return Ingested(log, check.rows_in, rows_out, check.date_rejects, check.max_event_date, check.code_rejects)
@@ -0,0 +1,247 @@
+"""
+Declarative per-source cut manifests and the executor which processes them.
+
+A manifest (see `Code/manifests/*.json`) lists, for one source, every cut and every raw file of
+each cut with its coding system, column map and (NHS Digital only) subtype:
+
+    {
+        "source": "primary_care",
+        "dataset_type": "PRIMARY_CARE",                 # tretools DatasetType member
+        "input_location": "/genesandhealth/library-red/...",
+        "deduplication_options": ["nhs_number", "code", "date"],
+        "column_maps": {"discovery": {"original_code": "code", ...}},
+        "ingestion": {"date_format": "%Y-%m-%d", "snomed_code": true},  # optional, see bi_py.ingestion
+        "write_processed_data": false,                  # optional, with "ingestion" only
+        "cuts": [
+            {
+                "cut": "april_2022",
+                "megadata": "april_22.arrow",           # merged + deduplicated cut, in the megadata location
+                "megadata_log": "log_apr_2022.txt",
+                "files": [
+                    {
+                        "name": "GNH_thwfnech_observations",   # stem of the processed files
+                        "path": "2022_04_Discovery/...csv",    # relative to input_location
+                        "coding_system": "SNOMED",             # tretools CodelistType member
+                        "column_maps": "discovery",            # key of "column_maps"
+                        "nhs_digital_subtype": "APC"           # optional
+                    }
+                ]
+            },
+            {"cut": "jan_2023", "skip": true, "comment": "corrupted", "files": []}
+        ]
+    }
+
+The files are independent of one another so `run_manifest()` processes them in a bounded pool of
+worker processes (`bi_py.processing.process_and_clean`), each file being written to
+`<processed_location>/<cut>/[clean_]processed_data/<name>.arrow`.  As soon as all the files of a
+cut are done, the cut is merged and deduplicated into `<megadata_location>/<megadata>`.  The
+stages of the workers are recorded in the run log (see `bi_py.run_log`) as part of the
+`run_manifest` event, whose peak memory is the highest of theirs.
+"""
+
+import json
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from bi_py import run_log
+from bi_py.processing import StageOutput, process_and_clean
+from bi_py.sorted_merge import merge_files
+from bi_py.stage_cache import StageCache
+
+REQUIRED_FILE_KEYS = ("name", "path", "coding_system", "column_maps")
+
+# set in each worker process by _init_worker()
+_WORKER = {}
+
+
+def load_manifest(manifest_location: str) -> dict:
+    """Loads and validates a manifest."""
+    with open(manifest_location) as f:
+        manifest = json.load(f)
+
+    for key in ("source", "dataset_type", "input_location", "deduplication_options", "column_maps", "cuts"):
+        if key not in manifest:
+            raise ValueError(f"{manifest_location}: missing `{key}`")
+
+    cut_names = [cut["cut"] for cut in manifest["cuts"]]
+    if len(cut_names) != len(set(cut_names)):
+        raise ValueError(f"{manifest_location}: duplicated cut names {cut_names}")
+
+    for cut in active_cuts(manifest):
+        for key in ("megadata", "megadata_log", "files"):
+            if key not in cut:
+                raise ValueError(f"{manifest_location}: cut {cut['cut']} is missing `{key}`")
+        names = [file["name"] for file in cut["files"]]
+        if len(names) != len(set(names)):
+            raise ValueError(f"{manifest_location}: cut {cut['cut']} has duplicated file names {names}")
+        if len({file["coding_system"] for file in cut["files"]}) > 1:
+            raise ValueError(f"{manifest_location}: cut {cut['cut']} mixes coding systems, split it into one cut per coding system")
+        for file in cut["files"]:
+            missing = [key for key in REQUIRED_FILE_KEYS if key not in file]
+            if missing:
+                raise ValueError(f"{manifest_location}: cut {cut['cut']} file {file.get('name')} is missing {missing}")
+            if file["column_maps"] not in manifest["column_maps"]:
+                raise ValueError(f"{manifest_location}: unknown column map `{file['column_maps']}` in cut {cut['cut']}")
+    return manifest
+
+
+def active_cuts(manifest: dict, cuts: Optional[Iterable[str]] = None) -> List[dict]:
+    """The cuts to process: all those not marked `"skip": true`, or only `cuts` if given."""
+    selected = [cut for cut in manifest["cuts"] if not cut.get("skip", False)]
+    if cuts is not None:
+        cuts = list(cuts)
+        unknown = set(cuts) - {cut["cut"] for cut in selected}
+        if unknown:
+            raise ValueError(f"Unknown (or skipped) cut(s) {sorted(unknown)}")
+        selected = [cut for cut in selected if cut["cut"] in cuts]
+    return selected
+
+
+@contextmanager
+def _polars_max_threads(threads: int) -> Iterator[None]:
+    # POLARS_MAX_THREADS is only read when polars is first imported, which a spawned worker does
+    # while unpickling its initializer (bi_py imports polars): it is set in this process's
+    # environment, which the workers inherit as they start, while the pool is open
+    previous = os.environ.get("POLARS_MAX_THREADS")
+    os.environ["POLARS_MAX_THREADS"] = str(threads)
+    try:
+        yield
+    finally:
+        if previous is None:
+            del os.environ["POLARS_MAX_THREADS"]
+        else:
+            os.environ["POLARS_MAX_THREADS"] = previous
+
+
+def _init_worker(demographics_location: str, stage_cache_location: Optional[str], run_log_parent: str) -> None:
+    # the stages of the worker are recorded as part of the run_manifest() which started it
+    run_log.set_parent(run_log_parent)
+    _WORKER["demographics_location"] = demographics_location
+    _WORKER["stage_cache"] = StageCache(stage_cache_location) if stage_cache_location else None
+
+
+def _demographics():
+    # loaded at most once per worker, and only by the stages which go through RawDataset
+    if "demographics" not in _WORKER:
+        from tretools.datasets.demographic_dataset import DemographicDataset
+
+        _WORKER["demographics"] = DemographicDataset(path=_WORKER["demographics_location"])
+    return _WORKER["demographics"]
+
+
+def _process_file(manifest: dict, cut: dict, file: dict, processed_location: str, demographics_location: str, date_start, date_end) -> StageOutput:
+    from tretools.codelists.codelist_types import CodelistType
+    from tretools.datasets.dataset_enums.dataset_types import DatasetType
+
+    return process_and_clean(
+        raw_location=f"{manifest['input_location']}/{file['path']}",
+        output_location=f"{processed_location}/{cut['cut']}",
+        name=file["name"],
+        dataset_type=DatasetType[manifest["dataset_type"]].value,
+        coding_system=CodelistType[file["coding_system"]].value,
+        column_maps=manifest["column_maps"][file["column_maps"]],
+        deduplication_options=manifest["deduplication_options"],
+        demographics=_demographics,
+        demographics_location=demographics_location,
+        date_start=date_start,
+        date_end=date_end,
+        nhs_digital_subtype=file.get("nhs_digital_subtype"),
+        stage_cache=_WORKER["stage_cache"],
+        ingestion=manifest.get("ingestion"),
+        write_processed=manifest.get("write_processed_data", True),
+    )
+
+
+def merge_cut(manifest: dict, cut: dict, outputs: List[StageOutput], megadata_location: str) -> str:
+    """
+    Merges the clean files of a cut, deduplicates them and writes the cut's megadata file and log
+    (by sort-merge if the clean files are sorted, see `bi_py.sorted_merge.merge_files()`).
+    """
+    merge_files(
+        [output.clean_location for output in outputs],
+        f"{megadata_location}/{cut['megadata']}",
+        log_locations=[output.clean_log_location for output in outputs],
+        output_log_location=f"{megadata_location}/{cut['megadata_log']}",
+        dedup_on=manifest["deduplication_options"],
+    )
+    return f"{megadata_location}/{cut['megadata']}"
+
+
+def run_manifest(
+    manifest: dict,
+    processed_location: str,
+    megadata_location: str,
+    demographics_location: str,
+    date_start: datetime,
+    date_end: datetime,
+    max_workers: int = 4,
+    stage_cache_location: Optional[str] = None,
+    cuts: Optional[Iterable[str]] = None,
+) -> Dict[str, str]:
+    """
+    Processes every file of the manifest (or of the selected `cuts`) in at most `max_workers`
+    worker processes, then merges each cut into its megadata file.
+
+    Each worker uses `cpu_count // max_workers` polars threads so that the pool does not
+    oversubscribe the VM.  Raises if any file or cut fails, once all the others have completed.
+
+    Returns:
+        dict: cut name -> megadata file
+    """
+    selected_cuts = active_cuts(manifest, cuts)
+    polars_max_threads = max(1, (os.cpu_count() or 1) // max_workers)
+    os.makedirs(megadata_location, exist_ok=True)
+
+    megadata_files, failures = {}, []
+    file_outputs = {cut["cut"]: {} for cut in selected_cuts}
+    cuts_by_name = {cut["cut"]: cut for cut in selected_cuts}
+
+    with run_log.stage("run_manifest", source=manifest["source"], cuts=[cut["cut"] for cut in selected_cuts]) as event:
+        # "spawn" as the notebook kernel has already started polars' thread pool, which does not survive fork()
+        with _polars_max_threads(polars_max_threads), ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(demographics_location, stage_cache_location, event["event_id"]),
+        ) as pool:
+            running = {}
+            for cut in selected_cuts:
+                for file in cut["files"]:
+                    future = pool.submit(_process_file, manifest, cut, file, processed_location, demographics_location, date_start, date_end)
+                    running[future] = ("file", cut["cut"], file["name"])
+
+            while running:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    kind, cut_name, name = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        failures.append(f"{cut_name}/{name}: {type(e).__name__}: {e}")
+                        print(f"{datetime.now()}: {cut_name}/{name} FAILED: {type(e).__name__}: {e}")
+                        continue
+
+                    if kind == "merge":
+                        megadata_files[cut_name] = result
+                        print(f"{datetime.now()}: {cut_name} merged into {result}")
+                        continue
+
+                    print(f"{datetime.now()}: {cut_name}/{name} done{' (cached)' if result.cache_hit else ''}")
+                    file_outputs[cut_name][name] = result
+                    cut = cuts_by_name[cut_name]
+                    if len(file_outputs[cut_name]) == len(cut["files"]):
+                        # keep the manifest's file order, the first file is the base of the merge
+                        outputs = [file_outputs[cut_name][file["name"]] for file in cut["files"]]
+                        future = pool.submit(merge_cut, manifest, cut, outputs, megadata_location)
+                        running[future] = ("merge", cut_name, cut["megadata"])
+
+        event["outputs"] = list(megadata_files.values())
+        # the memory of the manifest is that of its workers, not of this process
+        event["peak_rss_mb"] = run_log.descendants_peak_rss_mb(event["event_id"])
+        if failures:
+            raise RuntimeError(f"{len(failures)} stage(s) of the {manifest['source']} manifest failed:\n" + "\n".join(failures))
+    return megadata_files
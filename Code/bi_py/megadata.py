@@ -0,0 +1,166 @@
+"""
+Helpers to build and update the per-source megadata files (`megadata/primary_care/final_merged_data.arrow`,
+`megadata/barts_health/merged_*.arrow`, `megadata/bradford/*.arrow`, `megadata/nhs_digital/*.arrow`).
+
+`append_cut()` adds a new cut to a megadata file as a file of its own, next to it:
+
+    megadata/primary_care/final_merged_data.arrow                     # the merge of the earlier cuts
+    megadata/primary_care/final_merged_data.arrow.appended/dec_2024.arrow  # the rows dec_2024 added
+    megadata/primary_care/final_merged_data.arrow.keys/                # the key index of both
+
+so the readers of a megadata file read `megadata_files()` rather than the file alone.
+NB#2 appends the Discovery cuts to `final_merged_data.arrow`, then maps only their rows to ICD-10
+and appends the mapped rows to `final_mapped_data.arrow` in the same way.
+
+`merge_many()` merges several processed datasets (the cuts of NB#2, the NHS Digital datasets of
+NB#5) in one pass, rather than with one `merge_with_dataset()` per dataset, each of which copies
+the whole accumulated data, followed by `deduplicate()`.
+"""
+
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import polars as pl
+
+from bi_py import run_log
+
+DEDUPLICATION_OPTIONS = ["nhs_number", "code", "date"]
+
+
+APPENDED_SUFFIX = ".appended"
+KEYS_SUFFIX = ".keys"
+BASE_KEYS_FILE = "base.arrow"
+
+
+def appended_location(megadata_location: str) -> Path:
+    return Path(f"{megadata_location}{APPENDED_SUFFIX}")
+
+
+def keys_location(megadata_location: str) -> Path:
+    return Path(f"{megadata_location}{KEYS_SUFFIX}")
+
+
+def megadata_files(megadata_location: str) -> List[str]:
+    """The megadata file and the files of the cuts appended to it since (see `append_cut()`), in the order they were appended."""
+    appended = sorted(appended_location(megadata_location).glob("*.arrow"), key=lambda file: file.stat().st_mtime_ns)
+    return [megadata_location] + [str(file) for file in appended]
+
+
+def clear_appended(megadata_location: str) -> None:
+    """Removes the cuts appended to the megadata and its key index, e.g. once it has been merged again with every cut."""
+    shutil.rmtree(appended_location(megadata_location), ignore_errors=True)
+    shutil.rmtree(keys_location(megadata_location), ignore_errors=True)
+
+
+def append_cut(
+    megadata_location: str,
+    cut_location: str,
+    cut: str,
+    megadata_log_location: Optional[str] = None,
+    cut_log_location: Optional[str] = None,
+    dedup_on: Sequence[str] = DEDUPLICATION_OPTIONS,
+) -> int:
+    """
+    Adds a new cut to an existing, already deduplicated, megadata file without re-merging and
+    re-deduplicating the whole history, and without reading or rewriting the megadata file.
+
+    The rows of the cut whose `dedup_on` are not yet in the megadata (nor in the cuts appended to
+    it before) are written, sorted, to a file of their own, `<megadata>.appended/<cut>.arrow`;
+    `megadata_files()` lists the megadata file and the appended ones, which together have the same
+    rows as re-merging all the cuts and deduplicating them.  They are found with the key index of
+    the megadata, `<megadata>.keys/`: only the `dedup_on` columns, built from the megadata on the
+    first append (`base.arrow`), then one file of the new keys per appended cut.  The hash table is
+    built on the keys of the cut, the index being streamed past it.
+
+    Appending a cut again (e.g. on re-running the cell) replaces its rows.  The append is recorded
+    in the run log, and a line referring to the cut's log appended to `megadata_log_location`.
+
+    Args:
+        megadata_location: e.g. `.../megadata/primary_care/final_merged_data.arrow`, left unchanged
+        cut_location: the new cut, e.g. `.../megadata/primary_care/dec_24.arrow`
+        cut: the name of the cut, e.g. `dec_2024`
+        megadata_log_location, cut_log_location: the logs of the megadata and of the cut
+        dedup_on: the deduplication columns of the megadata
+
+    Returns:
+        int: the number of rows appended
+    """
+    # imported here, as bi_py.sorted_merge imports DEDUPLICATION_OPTIONS from this module
+    from bi_py.sorted_merge import sink_sorted
+
+    dedup_on = list(dedup_on)
+    schema = pl.scan_ipc(megadata_location).collect_schema()
+    appended, keys = appended_location(megadata_location), keys_location(megadata_location)
+    appended.mkdir(exist_ok=True)
+    keys.mkdir(exist_ok=True)
+
+    with run_log.stage("append_cut", inputs=[cut_location], outputs=[str(appended / f"{cut}.arrow")], cut=cut, dedup_on=dedup_on) as event:
+        if not (keys / BASE_KEYS_FILE).exists():
+            sink_sorted(pl.scan_ipc(megadata_location).select(dedup_on), str(keys / BASE_KEYS_FILE), dedup_on)
+
+        cut_data = pl.scan_ipc(cut_location).select([pl.col(name).cast(dtype) for name, dtype in schema.items()])
+        event["rows_in"] = cut_data.select(pl.len()).collect().item()
+        # the keys of the megadata and of the other appended cuts (those of this cut, if it was appended before, are replaced)
+        known_keys = [str(file) for file in sorted(keys.glob("*.arrow")) if file.name != f"{cut}.arrow"]
+        new_rows = (
+            cut_data
+            .unique(subset=dedup_on, maintain_order=False)
+            .join(pl.scan_ipc(known_keys), on=dedup_on, how="anti")
+        )
+        sink_sorted(new_rows, str(appended / f"{cut}.arrow"), dedup_on)
+        sink_sorted(pl.scan_ipc(str(appended / f"{cut}.arrow")).select(dedup_on), str(keys / f"{cut}.arrow"), dedup_on)
+        event["rows_out"] = pl.scan_ipc(str(appended / f"{cut}.arrow")).select(pl.len()).collect().item()
+
+    if megadata_log_location is not None:
+        with open(megadata_log_location, "a") as f:
+            f.write(
+                f"{datetime.now()}: Appended {event['rows_out']} new rows of {cut} ({event['rows_in']} rows, "
+                f"deduplicated on {dedup_on}) to {appended / f'{cut}.arrow'}"
+                + (f", see {cut_log_location}" if cut_log_location else "") + "\n"
+            )
+    return event["rows_out"]
+
+
+def merge_many(datasets: List, dedup_on: Sequence[str] = DEDUPLICATION_OPTIONS):
+    """
+    Merges the tretools `ProcessedDataset`s `datasets` (of the same coding system) and deduplicates
+    the result, as `merge_with_dataset()` on each of them then `deduplicate()` did.  The log of the
+    result refers to the datasets (by file) rather than copying their logs; the merge is recorded
+    in the run log.
+
+    The datasets are concatenated lazily and deduplicated in a single streaming pass, so the time
+    taken grows with the total number of rows, and no merged but not yet deduplicated copy is made.
+    The datasets themselves are left unchanged.
+
+    Returns:
+        ProcessedDataset: with the path, dataset type and coding system of the first dataset
+    """
+    from bi_py.dates import processed_dataset_from_frame
+
+    if not datasets:
+        raise ValueError("No datasets to merge")
+    coding_systems = {dataset.coding_system for dataset in datasets}
+    if len(coding_systems) != 1:
+        raise ValueError(f"Only datasets of the same coding system can be merged, got {sorted(coding_systems)}")
+
+    dedup_on = list(dedup_on)
+    rows = sum(dataset.data.height for dataset in datasets)
+    with run_log.stage("merge_many", inputs=[dataset.path for dataset in datasets], rows_in=rows, dedup_on=dedup_on) as event:
+        data = (
+            pl.concat([dataset.data.lazy() for dataset in datasets], how="vertical_relaxed")
+            .unique(subset=dedup_on, maintain_order=False)
+            .collect(engine="streaming")
+        )
+        event["rows_out"] = data.height
+
+    # the logs of the datasets are referred to, not copied (see `bi_py.run_log`)
+    log = [f"{datetime.now()}: Merged {dataset.path} ({dataset.data.height} rows)" for dataset in datasets]
+    log.append(
+        f"{datetime.now()}: Merged {len(datasets)} datasets ({rows} rows) and deduplicated on {dedup_on}: "
+        f"{data.height} rows, {rows - data.height} duplicates removed"
+    )
+    first = datasets[0]
+    return processed_dataset_from_frame(data, first.path, first.dataset_type, first.coding_system, log)
+
@@ -0,0 +1,114 @@
+"""
+Raw datasets delivered as several files (e.g. the NHS Digital ECDS extracts).
+
+NB#5 used to union the ECDS `.txt` files of a cut with a glob `scan_csv(..., infer_schema=False)`
+and `sink_csv` them into a single `nic338864_ecds_YYYY_MM_all.csv`, only for `RawDataset` to parse
+that (multi-GB) CSV again.  Instead:
+
+- `scan_csvs()` takes a glob or a list of files and unions them lazily, as text, keeping only the
+  columns asked for.  The dtypes polars would infer for each file are compared column by column:
+  where the files disagree (principally String vs Float) the column is reported, and the integral
+  floats (`1234.0`) of the files read as Float are normalised to `1234`, so that the same code is
+  spelt the same way whichever file it comes from
+- `raw_dataset_from_files()` collects that union straight into a `RawDataset`, ready for
+  `process_dataset()`, which then writes the processed Arrow file as usual
+
+so the largest NHS Digital dataset is parsed once and never written out as an intermediate CSV.
+"""
+
+import glob
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Union
+
+import polars as pl
+
+from bi_py.quarantine import raw_dataset_from_frame
+
+INFER_SCHEMA_LENGTH = 10_000
+INTEGRAL_FLOAT = r"^(-?\d+)\.0+$"
+
+
+def expand_sources(sources: Union[str, Sequence[str]]) -> List[str]:
+    """The files of `sources`: a file, a glob (`.../ECDS/*ECDS*.txt`) or a list of either, sorted."""
+    if isinstance(sources, (str, os.PathLike)):
+        sources = [sources]
+    files = []
+    for source in map(str, sources):
+        matches = sorted(glob.glob(source)) if glob.has_magic(source) else [source]
+        if not matches:
+            raise FileNotFoundError(f"No file matches {source}")
+        files.extend(matches)
+    return files
+
+
+def schema_drift(files: Sequence[str], separator: str = ",", columns: Optional[Sequence[str]] = None) -> Dict[str, Dict[str, List[str]]]:
+    """
+    The columns whose inferred dtype differs between `files`, as column -> dtype -> files.
+
+    Only the header and the first `INFER_SCHEMA_LENGTH` rows of each file are read.
+    """
+    dtypes = defaultdict(lambda: defaultdict(list))
+    for file in files:
+        schema = pl.scan_csv(file, separator=separator, infer_schema_length=INFER_SCHEMA_LENGTH).collect_schema()
+        for name, dtype in schema.items():
+            if columns is None or name in columns:
+                dtypes[name][str(dtype)].append(file)
+    return {name: dict(by_dtype) for name, by_dtype in dtypes.items() if len(by_dtype) > 1}
+
+
+def scan_csvs(
+    sources: Union[str, Sequence[str]],
+    separator: str = ",",
+    columns: Optional[Sequence[str]] = None,
+) -> pl.LazyFrame:
+    """
+    Lazily unions the files of `sources` (see `expand_sources()`), every column as `pl.Utf8`.
+
+    Args:
+        sources: a file, a glob or a list of either
+        separator: the CSV separator
+        columns: the columns to keep (all by default); a file without one of them gets nulls
+    """
+    files = expand_sources(sources)
+    drift = schema_drift(files, separator, columns)
+    for name, by_dtype in drift.items():
+        print(f"{datetime.now()}: column {name} is inferred as " + ", ".join(f"{dtype} in {len(in_files)} file(s)" for dtype, in_files in by_dtype.items()))
+
+    frames = []
+    for file in files:
+        frame = pl.scan_csv(file, separator=separator, infer_schema=False)
+        names = frame.collect_schema().names()
+        if columns is not None:
+            frame = frame.select([name for name in columns if name in names])
+        # integral floats are normalised in the files read as Float only, so text such as `A01.0` is never touched
+        float_columns = [
+            name for name, by_dtype in drift.items()
+            if name in names and any(file in in_files for dtype, in_files in by_dtype.items() if dtype.startswith("Float"))
+        ]
+        if float_columns:
+            frame = frame.with_columns(pl.col(float_columns).str.replace(INTEGRAL_FLOAT, "${1}"))
+        frames.append(frame)
+
+    data = pl.concat(frames, how="diagonal")
+    if columns is not None:
+        missing = [name for name in columns if name not in data.collect_schema().names()]
+        if missing:
+            raise ValueError(f"Columns {missing} are in none of {files}")
+        data = data.select(columns)
+    return data
+
+
+def raw_dataset_from_files(
+    sources: Union[str, Sequence[str]],
+    dataset_type: str,
+    coding_system: str,
+    separator: str = ",",
+    columns: Optional[Sequence[str]] = None,
+):
+    """A tretools `RawDataset` holding the union of the files of `sources` (see `scan_csvs()`)."""
+    files = expand_sources(sources)
+    data = scan_csvs(files, separator=separator, columns=columns).collect()
+    path = files[0] if len(files) == 1 else os.path.commonpath(files)
+    return raw_dataset_from_frame(data, path, dataset_type, coding_system, note=f"union of {len(files)} file(s): {', '.join(os.path.basename(file) for file in files)}")
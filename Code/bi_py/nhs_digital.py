@@ -0,0 +1,127 @@
+"""
+The expansion of the wide NHS Digital extracts, including the ECDS ones tretools has no config for.
+
+tretools' `RawDataset.process_dataset(..., nhs_digital_subtype=...)` unpivots the code columns of
+an HES (APC, OP) or civil registration episode into one row per code, with the layout of its
+`configs/NHS_D/<subtype>.json`.  NB#5 used to override that expansion in a cell of its own, so
+that it also knows `ECDS_CONFIG`; the override is now here, so that `bi_py.benchmark` expands the
+synthetic ECDS extracts the same way.  Install it before processing:
+
+    install_ecds()
+    processed_ecds_data = ecds_data.process_dataset(..., nhs_digital_subtype="ECDS")
+
+The codes of the ECDS extracts are SNOMED, cast to the canonical type (see `bi_py.snomed`); those
+which are not SNOMED codes are dropped, and counted in the log of the dataset.
+"""
+
+import importlib.util
+import json
+from datetime import datetime
+from pathlib import Path
+
+import polars as pl
+
+from bi_py.snomed import snomed_codes
+
+ECDS_CONFIG = {
+    "nhs_number": "STUDY_ID",
+    "date": "ARRIVAL_DATE",
+    "column_to_expand": [
+        'CHIEF_COMPLAINT',
+        'COMORBIDITIES_1',
+        'COMORBIDITIES_10',
+        'COMORBIDITIES_2',
+        'COMORBIDITIES_3',
+        'COMORBIDITIES_4',
+        'COMORBIDITIES_5',
+        'COMORBIDITIES_6',
+        'COMORBIDITIES_7',
+        'COMORBIDITIES_8',
+        'COMORBIDITIES_9',
+        'DIAGNOSIS_CODE_1',
+        'DIAGNOSIS_CODE_10',
+        'DIAGNOSIS_CODE_11',
+        'DIAGNOSIS_CODE_12',
+        'DIAGNOSIS_CODE_2',
+        'DIAGNOSIS_CODE_3',
+        'DIAGNOSIS_CODE_4',
+        'DIAGNOSIS_CODE_5',
+        'DIAGNOSIS_CODE_6',
+        'DIAGNOSIS_CODE_7',
+        'DIAGNOSIS_CODE_8',
+        'DIAGNOSIS_CODE_9',
+    ],
+}
+# the only columns of the ECDS extracts which are used
+ECDS_COLUMNS = [ECDS_CONFIG["nhs_number"], ECDS_CONFIG["date"], *ECDS_CONFIG["column_to_expand"]]
+
+
+def nhs_digital_config(hes_subtype: str) -> dict:
+    """
+    The layout (`nhs_number`, `date`, `column_to_expand`) of the `hes_subtype` extracts:
+    `ECDS_CONFIG`, or the config of the installed tretools (e.g. `configs/NHS_D/civ_reg.json`).
+    """
+    if hes_subtype == "ECDS":
+        return ECDS_CONFIG
+    spec = importlib.util.find_spec("tretools")
+    if spec is None or not spec.submodule_search_locations:
+        raise ModuleNotFoundError(f"tretools is needed for the config of the {hes_subtype} extracts")
+    # the package files of tretools (NB#5 used to read them from /usr/local/lib/python3.9/dist-packages)
+    config_location = Path(list(spec.submodule_search_locations)[0]) / "datasets" / "configs" / "NHS_D" / f"{hes_subtype.lower()}.json"
+    return json.loads(config_location.read_text())
+
+
+def expand_cols_to_rows(self, hes_subtype: str, config_path: str = None):
+    """`RawDataset._expand_cols_to_rows()`, with the configs of `nhs_digital_config()`."""
+    from tretools.datasets.dataset_enums.dataset_types import DatasetType
+
+    # check the dataset type
+    if self.dataset_type != DatasetType.NHS_DIGITAL.value:
+        raise NotImplementedError("This method is only implemented for NHS Digital datasets")
+
+    # a config given overrides the default one
+    config = json.loads(Path(config_path).read_text()) if config_path is not None else nhs_digital_config(hes_subtype)
+
+    # log the shape of the data
+    self.log.append(f"{datetime.now()}: Data shape before expanding wide columns into rows: {self.data.shape}")
+
+    # unpivot the data
+    self.data = (
+        self.data.lazy()
+        .unpivot(
+            on=config["column_to_expand"],
+            value_name="code",
+            index=[config["nhs_number"], config["date"]],
+        )
+        .drop_nulls()
+        .filter(pl.col("code") != "")
+        .collect()
+    )
+
+    # drop the variable column
+    self.data = self.data.drop("variable")
+    self._standarise_column_names(
+        column_maps={
+            config["nhs_number"]: "nhs_number",
+            config["date"]: "date",
+            "code": "code"
+        }
+    )
+    if hes_subtype == "ECDS":
+        # the canonical SNOMED code type (see bi_py/snomed.py); the codes which are not SNOMED are
+        # dropped, as NB#6 used to drop them from the NHS-D SNOMED data
+        rows = self.data.height
+        self.data = snomed_codes(self.data, strict=False)
+        self.log.append(f"{datetime.now()}: {rows - self.data.height} rows without a SNOMED code dropped")
+        if rows > self.data.height:
+            print(f"{datetime.now()}: {rows - self.data.height} row(s) of the ECDS extracts without a SNOMED code dropped")
+
+    # log the action
+    self.log.append(f"{datetime.now()}: Data shape after expanding wide columns into rows: {self.data.shape}")
+
+
+def install_ecds() -> None:
+    """Makes `RawDataset.process_dataset()` expand the extracts with `expand_cols_to_rows()`, i.e. also the ECDS ones."""
+    from tretools.datasets.raw_dataset import RawDataset
+
+    RawDataset._expand_cols_to_rows = expand_cols_to_rows
@@ -0,0 +1,112 @@
+"""
+Out-of-core deduplication of megadata too large to deduplicate in memory.
+
+A hash `unique()` holds every distinct event at once: for the final merge of NB#2 (~66M rows over
+six cuts), in one kernel.  `partitioned_unique()` instead spills the rows to `n_partitions` files
+on local disk, hash-partitioned by `nhs_number`, so that all the copies of an event are in the
+same partition:
+
+    <spill_location>/.<output>.<pid>.spill/partition=00003/000017.arrow    # rows of input batch 17 in partition 3
+
+Each partition is then deduplicated and sorted on the deduplication columns on its own,
+`max_workers` at a time.  No event is in two partitions, so the partitions are disjoint on these
+columns, and `bi_py.sorted_merge.merge_sorted_unique()` only puts them back in order.  Memory is
+bounded by `max_workers` partitions rather than by the whole megadata, and a larger cohort only
+needs more partitions: by default one per `PARTITION_ROWS` input rows.
+
+`bi_py.sorted_merge.merge_files()` uses it for inputs which are not known to be sorted.
+"""
+
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, Sequence
+
+import polars as pl
+
+from bi_py import run_log
+from bi_py.megadata import DEDUPLICATION_OPTIONS
+from bi_py.sorted_merge import BATCH_ROWS, mark_sorted, merge_sorted_unique, read_batches
+
+PARTITION_ROWS = 4_000_000
+PARTITION_COLUMN = "nhs_number"
+HASH_SEED = 0
+
+
+def _spill(locations: Sequence[str], spill_location: Path, n_partitions: int, schema: pl.Schema, batch_rows: int) -> None:
+    batch_number = 0
+    for location in locations:
+        for batch in read_batches(location, batch_rows):
+            batch = batch.select([pl.col(name).cast(dtype) for name, dtype in schema.items()])
+            partition = (pl.col(PARTITION_COLUMN).hash(seed=HASH_SEED) % n_partitions).alias("_partition")
+            for (number,), rows in batch.with_columns(partition).partition_by("_partition", as_dict=True, include_key=False).items():
+                partition_location = spill_location / f"partition={number:05d}"
+                partition_location.mkdir(exist_ok=True)
+                rows.write_ipc(partition_location / f"{batch_number:06d}.arrow")
+            batch_number += 1
+
+
+def _deduplicate_partition(partition_location: Path, dedup_on: Sequence[str]) -> str:
+    deduplicated_location = str(partition_location.with_suffix(".arrow"))
+    (
+        pl.scan_ipc(str(partition_location / "*.arrow"))
+        .unique(subset=list(dedup_on), maintain_order=False)
+        .sort(list(dedup_on))
+        .sink_ipc(deduplicated_location)
+    )
+    shutil.rmtree(partition_location)
+    mark_sorted(deduplicated_location, dedup_on)
+    return deduplicated_location
+
+
+def partitioned_unique(
+    locations: Sequence[str],
+    output_location: str,
+    dedup_on: Sequence[str] = DEDUPLICATION_OPTIONS,
+    n_partitions: Optional[int] = None,
+    max_workers: int = 4,
+    spill_location: Optional[str] = None,
+    batch_rows: int = BATCH_ROWS,
+) -> int:
+    """
+    Writes the rows of the Arrow files `locations`, deduplicated on `dedup_on` (which must include
+    `nhs_number`) and sorted by `dedup_on`, to `output_location`, and marks it as sorted.
+
+    Args:
+        n_partitions: the number of spill partitions; by default one per `PARTITION_ROWS` rows
+        max_workers: the number of partitions deduplicated at the same time
+        spill_location: a directory on local disk for the spill files (which are removed
+            afterwards); by default that of `output_location`
+        batch_rows: the rows of each input read at a time while spilling
+
+    Returns:
+        int: the number of rows written
+    """
+    dedup_on = list(dedup_on)
+    if PARTITION_COLUMN not in dedup_on:
+        raise ValueError(f"Deduplication on {list(dedup_on)} cannot be partitioned by {PARTITION_COLUMN}")
+
+    schema = pl.scan_ipc(locations[0]).collect_schema()
+    if n_partitions is None:
+        rows = sum(pl.scan_ipc(location).select(pl.len()).collect().item() for location in locations)
+        n_partitions = max(1, -(-rows // PARTITION_ROWS))
+
+    spill_location = Path(spill_location or Path(output_location).parent) / f".{Path(output_location).name}.{os.getpid()}.spill"
+    spill_location.mkdir(parents=True, exist_ok=True)
+    with run_log.stage("partitioned_unique", inputs=locations, outputs=[output_location], n_partitions=n_partitions) as event:
+        try:
+            _spill(locations, spill_location, n_partitions, schema, batch_rows)
+            partitions = sorted(location for location in spill_location.glob("partition=*") if location.is_dir())
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                deduplicated = list(pool.map(lambda location: _deduplicate_partition(location, dedup_on), partitions))
+            if deduplicated:
+                # the partitions are disjoint on `dedup_on`: the merge only puts them back in order
+                event["rows_out"] = merge_sorted_unique(deduplicated, output_location, dedup_on, batch_rows)
+            else:
+                pl.DataFrame(schema=schema).write_ipc(output_location)
+                mark_sorted(output_location, dedup_on)
+                event["rows_out"] = 0
+        finally:
+            shutil.rmtree(spill_location, ignore_errors=True)
+    return event["rows_out"]
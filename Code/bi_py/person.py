@@ -0,0 +1,136 @@
+"""
+Dense `pl.UInt32` person ids in place of the pseudo NHS numbers.
+
+Every event carries the pseudo NHS number of its person, a 64-character string, which the merges
+(NB#6), the deduplications and the joins on the demographics (`remove_unrealistic_dates()`, NB#7,
+NB#8) hash and compare again and again, and which the Arrow files store once per event.  NB#1
+instead keeps a person dictionary:
+
+    nhs_number (pl.Utf8) | person_id (pl.UInt32)
+
+The dictionary is append-only: `update_person_dictionary()` keeps the ids of the people it already
+has, and gives the people new to the demographics the next ids, in the order of their sorted pseudo
+NHS numbers.  A person therefore keeps their id from one run (and release) to the next, even when
+the demographics change, so that the files of earlier runs (e.g. the megadata a new cut is appended
+to, see `bi_py.megadata.append_cut()`) stay keyed on the same ids.  NB#1 updates the dictionary of
+all the runs, `<ROOT_LOCATION>/person_dictionary.arrow`, and writes a copy of it next to
+`clean_demographics.arrow`, which is written with the id in its `nhs_number` column.  Every dataset
+is encoded as soon as it is processed:
+
+- `bi_py.processing.process_dataset()` encodes the datasets processed by tretools, given the
+  dictionary (`read_person_dictionary()`); `process_and_clean()` does whenever the clean
+  demographics are encoded
+- `ingestion.remove_unrealistic_dates()` encodes the lazily ingested datasets
+
+so that the megadata files and everything downstream of them are keyed on the 4-byte id.  The
+pseudo NHS numbers are only restored, with `decode()`, in the outputs which leave the pipeline: the
+individual trait files and the regenie files of NB#7 and NB#8.
+
+The events of people who were never in the demographics are dropped by the encoding, those of people
+who have left them by `remove_unrealistic_dates()` a step later, as they all used to be.
+"""
+
+import os
+from pathlib import Path
+from typing import Optional, TypeVar, Union
+
+import polars as pl
+
+PERSON_ID_DTYPE = pl.UInt32
+PERSON_DICTIONARY_FILE = "person_dictionary.arrow"
+
+Frame = TypeVar("Frame", pl.DataFrame, pl.LazyFrame)
+
+
+def build_person_dictionary(nhs_numbers: pl.Series, previous: Optional[pl.DataFrame] = None) -> pl.DataFrame:
+    """
+    The dictionary of the distinct (non-null) `nhs_numbers` and of the people of `previous`: the
+    people of `previous` keep their ids, the others are given the next ids in sorted order.
+    """
+    if previous is None:
+        previous = pl.DataFrame(schema={"nhs_number": pl.Utf8, "person_id": PERSON_ID_DTYPE})
+    distinct = nhs_numbers.cast(pl.Utf8).drop_nulls().unique()
+    new_numbers = distinct.filter(~distinct.is_in(previous["nhs_number"].implode())).sort()
+    start = previous["person_id"].max() + 1 if previous.height else 0
+    if start + len(new_numbers) > 2**32:
+        raise ValueError(f"{start + len(new_numbers)} people do not fit in {PERSON_ID_DTYPE}")
+    return pl.concat([
+        previous.select("nhs_number", pl.col("person_id").cast(PERSON_ID_DTYPE)),
+        pl.DataFrame({
+            "nhs_number": new_numbers,
+            "person_id": pl.int_range(start, start + len(new_numbers), dtype=pl.Int64, eager=True).cast(PERSON_ID_DTYPE),
+        }),
+    ])
+
+
+def update_person_dictionary(nhs_numbers: pl.Series, location: Union[str, Path]) -> pl.DataFrame:
+    """
+    Adds the people of `nhs_numbers` who are not yet in the person dictionary at `location` (created
+    if there is none) to it, with `build_person_dictionary()`.
+
+    Returns:
+        pl.DataFrame: the updated dictionary
+    """
+    previous = pl.read_ipc(location) if Path(location).exists() else None
+    dictionary = build_person_dictionary(nhs_numbers, previous)
+    Path(location).parent.mkdir(parents=True, exist_ok=True)
+    temp_location = f"{location}.{os.getpid()}.tmp"
+    dictionary.write_ipc(temp_location)
+    os.replace(temp_location, location)
+    return dictionary
+
+
+def person_dictionary_location(demographics_location: Union[str, Path]) -> str:
+    """The person dictionary written by NB#1 next to the clean demographics at `demographics_location`."""
+    return str(Path(demographics_location).parent / PERSON_DICTIONARY_FILE)
+
+
+def _like(data, dictionary):
+    # joins need both sides lazy or both eager
+    if isinstance(data, pl.LazyFrame):
+        return dictionary.lazy()
+    return dictionary.collect() if isinstance(dictionary, pl.LazyFrame) else dictionary
+
+
+def is_encoded(data: Union[pl.DataFrame, pl.LazyFrame], column: str = "nhs_number") -> bool:
+    return data.collect_schema()[column] == PERSON_ID_DTYPE
+
+
+def encode(data: Frame, dictionary: Union[pl.DataFrame, pl.LazyFrame], column: str = "nhs_number") -> Frame:
+    """
+    `data` with the pseudo NHS numbers of `column` replaced by their person ids.
+
+    The column keeps its name and position; rows whose NHS number is not in `dictionary` are
+    dropped.  A no-op on a column which is already encoded.
+    """
+    if is_encoded(data, column):
+        return data
+    columns = data.collect_schema().names()
+    dictionary = _like(data, dictionary)
+    return (
+        data
+        .join(dictionary.rename({"nhs_number": column}), on=column, how="inner")
+        .drop(column)
+        .rename({"person_id": column})
+        .select(columns)
+    )
+
+
+def decode(data: Frame, dictionary: Union[pl.DataFrame, pl.LazyFrame], column: str = "nhs_number") -> Frame:
+    """`data` with the person ids of `column` replaced by the pseudo NHS numbers they stand for."""
+    if not is_encoded(data, column):
+        return data
+    columns = data.collect_schema().names()
+    dictionary = _like(data, dictionary)
+    return (
+        data
+        .join(dictionary.rename({"nhs_number": "_nhs_number", "person_id": column}), on=column, how="left")
+        .drop(column)
+        .rename({"_nhs_number": column})
+        .select(columns)
+    )
+
+
+def read_person_dictionary(demographics_location: Union[str, Path]) -> pl.DataFrame:
+    return pl.scan_ipc(person_dictionary_location(demographics_location)).collect()
+
@@ -0,0 +1,257 @@
+"""
+Headless runner for the `BI_PY` pipeline.
+
+The notebooks normally hand over to one another with `redirect_to_next_notebook_in_pipeline()`
+which means NB#2 to NB#5 are run one after the other.  They are however independent of one
+another: each one only needs `clean_demographics.arrow` (NB#1) and the mapping files.  Here we
+model NB#1 to NB#8 as a dependency graph and execute each notebook in its own worker process
+(with its own kernel) as soon as all the notebooks it depends on have completed:
+
+    NB1 --> NB2, NB3, NB4, NB5 --> NB6 --> NB7, NB8
+
+Usage (from the `Code` directory):
+
+    python -m bi_py.pipeline                      # whole pipeline
+    python -m bi_py.pipeline --stages NB6 NB7 NB8  # only some notebooks, earlier outputs must exist
+    python -m bi_py.pipeline --max-workers 2       # fewer concurrent notebooks on smaller VMs
+
+Executed copies of the notebooks (with their outputs) are saved in the run directory so they
+can be inspected after the run, with the run log of every stage of every notebook,
+`run_log.jsonl` (see `bi_py.run_log`), its metrics, `metrics.parquet` (see `bi_py.profiling`),
+and `budget_report.csv`, the stages over their budget or slower than in the earlier runs of the
+same `--scale` (see `bi_py.budgets`).  The notebooks themselves are not modified.
+"""
+
+import argparse
+import ast
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bi_py import budgets, profiling, run_log
+from bi_py.budgets import DEFAULT_SCALE
+
+CODE_LOCATION = Path(__file__).resolve().parents[1]
+NOTEBOOKS_LOCATION = CODE_LOCATION / "notebooks"
+RUNS_LOCATION = CODE_LOCATION.parent / "runs"
+RUN_LOG_FILE = "run_log.jsonl"
+
+# the last cell a headless run executes in each notebook is the one which calls this function;
+# anything after it (e.g. the "THIS NOT RUN" no-NHS-D section of NB#6) is not part of the pipeline
+HAND_OFF_FUNCTION = "redirect_to_next_notebook_in_pipeline"
+
+
+@dataclass(frozen=True)
+class Stage:
+    notebook: str
+    depends_on: Tuple[str, ...] = ()
+
+
+PIPELINE_STAGES: Dict[str, Stage] = {
+    "NB1": Stage("1-create-clean-demographics-notebook"),
+    "NB2": Stage("2-process-datasets-discovery-primary-care", depends_on=("NB1",)),
+    "NB3": Stage("3-process-datasets-barts-health", depends_on=("NB1",)),
+    "NB4": Stage("4-process-datasets-bradford", depends_on=("NB1",)),
+    "NB5": Stage("5-process-datasets-nhs-digital", depends_on=("NB1",)),
+    "NB6": Stage("6-merge-datasets-notebook", depends_on=("NB2", "NB3", "NB4", "NB5")),
+    "NB7": Stage("7-three-and-four-digit-ICD", depends_on=("NB6",)),
+    "NB8": Stage("8-custom-phenotypes-individual-trait-files-and-regenie", depends_on=("NB6",)),
+}
+
+
+def _calls_hand_off(source: str) -> bool:
+    # a top-level call of HAND_OFF_FUNCTION, not the cell defining it nor one where it is commented out
+    # (the IPython magics and shell commands of a cell are not Python, they are left out)
+    code = "\n".join("" if line.lstrip().startswith(("%", "!")) else line for line in source.splitlines())
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return False
+    return any(
+        isinstance(node, ast.Expr)
+        and isinstance(node.value, ast.Call)
+        and isinstance(node.value.func, ast.Name)
+        and node.value.func.id == HAND_OFF_FUNCTION
+        for node in tree.body
+    )
+
+
+def _cells_up_to_hand_off(cells: list) -> list:
+    """Returns the notebook cells up to, and including, the cell which initiates the next notebook."""
+    for i, cell in enumerate(cells):
+        if cell["cell_type"] == "code" and _calls_hand_off(cell["source"]):
+            return cells[:i + 1]
+    return cells
+
+
+def run_notebook(notebook_location: str, output_location: str, kernel_name: str = "python3") -> str:
+    """
+    Executes a single notebook in a fresh kernel and writes the executed copy to `output_location`.
+
+    The notebook is executed with its own directory as working directory, i.e. exactly as it
+    would be when opened in Jupyter.  The executed copy is written even if a cell fails.
+    """
+    # imported here so that the DAG can be inspected without a Jupyter install
+    import nbformat
+    from nbclient import NotebookClient
+
+    notebook = nbformat.read(notebook_location, as_version=4)
+    notebook.cells = _cells_up_to_hand_off(notebook.cells)
+    client = NotebookClient(
+        notebook,
+        timeout=None,  # some cuts take hours
+        kernel_name=kernel_name,
+        resources={"metadata": {"path": str(Path(notebook_location).parent)}},
+    )
+    try:
+        client.execute()
+    finally:
+        nbformat.write(notebook, output_location)
+    return output_location
+
+
+def _run_stage(name: str, notebook_location: str, output_location: str, kernel_name: str, run_log_parent: Optional[str]) -> str:
+    # the notebook is recorded in the run log, as the parent of the stages its kernel runs
+    run_log.set_parent(run_log_parent)
+    with run_log.stage(name, inputs=[notebook_location], outputs=[output_location]) as event:
+        run_log.set_parent(event["event_id"])
+        try:
+            return run_notebook(notebook_location, output_location, kernel_name)
+        finally:
+            # the memory of the notebook is that of its kernel, not of this worker
+            event["peak_rss_mb"] = run_log.descendants_peak_rss_mb(event["event_id"])
+
+
+def execution_order(stages: Dict[str, Stage]) -> List[List[str]]:
+    """Groups the stages in "waves", each wave only depending on the previous ones (used for --dry-run)."""
+    done, waves = set(), []
+    remaining = dict(stages)
+    while remaining:
+        wave = sorted(
+            name for name, stage in remaining.items()
+            if all(dep in done or dep not in stages for dep in stage.depends_on)
+        )
+        if not wave:
+            raise ValueError(f"Circular dependency between stages: {sorted(remaining)}")
+        waves.append(wave)
+        done.update(wave)
+        for name in wave:
+            del remaining[name]
+    return waves
+
+
+def select_stages(names: Optional[Iterable[str]] = None, stages: Dict[str, Stage] = PIPELINE_STAGES) -> Dict[str, Stage]:
+    """
+    Restricts the pipeline to the requested stages.  Dependencies on stages which are not selected
+    are considered satisfied, i.e. their outputs from a previous run are used.
+    """
+    if names is None:
+        return dict(stages)
+    unknown = set(names) - set(stages)
+    if unknown:
+        raise ValueError(f"Unknown stage(s) {sorted(unknown)}.  Try one of {sorted(stages)}.")
+    return {name: stage for name, stage in stages.items() if name in names}
+
+
+def run_pipeline(
+    stages: Dict[str, Stage],
+    run_location: Path,
+    notebooks_location: Path = NOTEBOOKS_LOCATION,
+    max_workers: int = 4,
+    kernel_name: str = "python3",
+    scale: str = DEFAULT_SCALE,
+) -> Dict[str, str]:
+    """
+    Runs the stages, each in its own worker process, as soon as their dependencies have completed.
+
+    If a stage fails, the stages depending on it (directly or not) are skipped; independent stages
+    carry on.  Returns the status ("completed", "failed" or "skipped") of each stage.  The run is
+    recorded with its `scale`, the runs it is compared with (see `bi_py.budgets`), and the status
+    of each stage; the `pipeline` event is an error unless every stage completed.
+    """
+    execution_order(stages)  # fails early on circular dependencies
+    run_location.mkdir(parents=True, exist_ok=True)
+    status: Dict[str, str] = {}
+    pending = dict(stages)
+    running = {}
+
+    with run_log.stage("pipeline", stages=sorted(stages), scale=scale) as pipeline_event, ProcessPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            for name, stage in list(pending.items()):
+                selected_deps = [dep for dep in stage.depends_on if dep in stages]
+                if any(status.get(dep) in ("failed", "skipped") for dep in selected_deps):
+                    print(f"{datetime.now()}: {name} skipped (an upstream notebook did not complete)")
+                    status[name] = "skipped"
+                    del pending[name]
+                elif all(status.get(dep) == "completed" for dep in selected_deps):
+                    print(f"{datetime.now()}: {name} started ({stage.notebook})")
+                    future = pool.submit(
+                        _run_stage,
+                        name,
+                        str(notebooks_location / f"{stage.notebook}.ipynb"),
+                        str(run_location / f"{stage.notebook}.ipynb"),
+                        kernel_name,
+                        pipeline_event["event_id"],
+                    )
+                    running[future] = name
+                    del pending[name]
+
+            if not running:
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    future.result()
+                    status[name] = "completed"
+                    print(f"{datetime.now()}: {name} completed")
+                except Exception as e:
+                    status[name] = "failed"
+                    print(f"{datetime.now()}: {name} FAILED: {type(e).__name__}: {e}")
+
+        # a run in which a notebook did not complete is not a baseline for the later runs
+        pipeline_event["details"]["status"] = status
+        if any(s != "completed" for s in status.values()):
+            pipeline_event["status"] = "error"
+
+    return status
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the BI_PY notebooks as a dependency graph.")
+    parser.add_argument("--stages", nargs="+", metavar="NB#", help="only run these notebooks (default: all)")
+    parser.add_argument("--max-workers", type=int, default=4, help="maximum number of notebooks run at once")
+    parser.add_argument("--run-location", help="where executed notebooks are saved (default: runs/<timestamp>)")
+    parser.add_argument("--kernel-name", default="python3")
+    parser.add_argument("--scale", default=DEFAULT_SCALE, help="the data of the run, only compared with the runs of the same scale (default: %(default)s)")
+    parser.add_argument("--dry-run", action="store_true", help="print the execution order and exit")
+    args = parser.parse_args(argv)
+
+    stages = select_stages(args.stages)
+
+    if args.dry_run:
+        for i, wave in enumerate(execution_order(stages)):
+            print(f"{i + 1}. " + ", ".join(f"{name} ({stages[name].notebook})" for name in wave))
+        return 0
+
+    run_location = Path(args.run_location) if args.run_location else RUNS_LOCATION / datetime.now().strftime("%Y-%m-%d_%H%M%S")
+    run_log.start_run(str(run_location / RUN_LOG_FILE))
+    try:
+        status = run_pipeline(stages, run_location, max_workers=args.max_workers, kernel_name=args.kernel_name, scale=args.scale)
+    finally:
+        if (run_location / RUN_LOG_FILE).exists():
+            profiling.write_metrics(str(run_location / RUN_LOG_FILE))
+    budgets.check_run(str(run_location))
+    print(
+        f"{datetime.now()}: executed notebooks, run log ({RUN_LOG_FILE}), metrics ({profiling.METRICS_FILE}) "
+        f"and budget report ({budgets.REPORT_FILE}) saved to {run_location}"
+    )
+    return 0 if all(s == "completed" for s in status.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+"""
+The per-file stage repeated throughout NB#2 to NB#5:
+
+1. Load the raw file into a tretools `RawDataset`
+2. `process_dataset()` (rename columns, deduplicate, encode the person ids) and save to `processed_data/`
+3. `remove_unrealistic_dates()` and save to `clean_processed_data/`
+
+With `ingestion` options, the three steps are instead fused into one lazy plan per file which is
+written once, to `clean_processed_data/` (see `bi_py.ingestion.ingest_and_clean_csv()`); the
+`processed_data/` copy is then only written if `write_processed` is set.
+
+Either way the clean file is written sorted by (nhs_number, code, date), and marked as such, so that
+the merge of the cut can deduplicate by sort-merge (see `bi_py.sorted_merge`).
+
+If a `StageCache` is given, the stage is skipped whenever its inputs are unchanged since a
+previous run (see `bi_py.stage_cache`).  Each file is recorded in the run log (see `bi_py.run_log`).
+"""
+
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, NamedTuple, Optional
+
+import polars as pl
+
+from bi_py import person, run_log
+from bi_py.dates import native_date_column, process_native_dates
+from bi_py.sorted_merge import SORT_KEY, mark_sorted
+from bi_py.stage_cache import StageCache
+
+
+def _count(location: str) -> int:
+    return pl.scan_ipc(location).select(pl.len()).collect().item()
+
+
+class StageOutput(NamedTuple):
+    clean_location: str
+    clean_log_location: str
+    cache_hit: bool
+
+
+def process_dataset(raw_dataset, deduplication_options: list, column_maps: dict, person_dictionary: Optional[pl.DataFrame] = None, **options):
+    """
+    `raw_dataset.process_dataset(deduplication_options, column_maps, **options)`, with the
+    `nhs_number` of the result encoded as person ids if a `person_dictionary` is given (see
+    `bi_py.person`).  A dataset whose dates are already `pl.Date` keeps them as they are (see
+    `bi_py.dates`).
+    """
+    if not options and native_date_column(raw_dataset.data, column_maps) is not None:
+        processed_dataset = process_native_dates(raw_dataset, deduplication_options, column_maps)
+    else:
+        processed_dataset = raw_dataset.process_dataset(deduplication_options, column_maps, **options)
+    if person_dictionary is not None:
+        rows = processed_dataset.data.height
+        processed_dataset.data = person.encode(processed_dataset.data, person_dictionary)
+        processed_dataset.log.append(
+            f"{datetime.now()}: nhs_number encoded as {person.PERSON_ID_DTYPE} person ids, "
+            f"{rows - processed_dataset.data.height} rows of people not in the person dictionary dropped"
+        )
+    return processed_dataset
+
+
+def process_and_clean(
+    raw_location: str,
+    output_location: str,
+    name: str,
+    dataset_type: str,
+    coding_system: str,
+    column_maps: dict,
+    deduplication_options: list,
+    demographics: Optional[Callable],
+    demographics_location: str,
+    date_start: datetime,
+    date_end: datetime,
+    nhs_digital_subtype: Optional[str] = None,
+    stage_cache: Optional[StageCache] = None,
+    ingestion: Optional[dict] = None,
+    write_processed: bool = True,
+) -> StageOutput:
+    """
+    Processes and cleans one raw file.
+
+    Args:
+        raw_location: the raw file
+        output_location: the directory of the cut, e.g. `.../primary_care/april_2022`
+        name: stem of the output files, e.g. `GNH_thwfnech_observations`
+        dataset_type, coding_system: as for tretools' `RawDataset`
+        column_maps, deduplication_options, nhs_digital_subtype: as for `RawDataset.process_dataset()`
+        demographics: returns the `DemographicDataset` loaded from `demographics_location`; only
+            called when the stage is run through `RawDataset`.  If its `nhs_number` are person ids,
+            the dataset is encoded with the person dictionary next to it.
+        date_start, date_end: as for `ProcessedDataset.remove_unrealistic_dates()`
+        stage_cache: if given, the stage is only run if not already cached
+        ingestion: if given, e.g. `{"date_format": "%Y-%m-%d"}`, the stage is run with
+            `bi_py.ingestion.ingest_and_clean_csv(**ingestion)` rather than `RawDataset`
+        write_processed: whether `ingestion` also writes the `processed_data/` copy
+
+    Returns:
+        StageOutput: the clean file, its log and whether the stage was skipped
+    """
+    if ingestion is not None and nhs_digital_subtype is not None:
+        raise ValueError(f"{name}: NHS Digital datasets need RawDataset to expand their code columns, remove `ingestion`")
+
+    with run_log.stage("process_and_clean", inputs=[raw_location], outputs=[f"{output_location}/clean_processed_data/{name}.arrow"], file=name, cut=Path(output_location).name) as event:
+        outputs = {
+            "processed": f"{output_location}/processed_data/{name}.arrow",
+            "processed_log": f"{output_location}/processed_data/{name}_log.txt",
+            "clean": f"{output_location}/clean_processed_data/{name}.arrow",
+            "clean_log": f"{output_location}/clean_processed_data/{name}_log.txt",
+        }
+        if ingestion is not None and not write_processed:
+            del outputs["processed"], outputs["processed_log"]
+
+        if stage_cache is not None:
+            dictionary_location = Path(person.person_dictionary_location(demographics_location))
+            key = stage_cache.key(
+                raw_locations=[raw_location],
+                column_maps=column_maps,
+                deduplication_options=deduplication_options,
+                date_start=date_start,
+                demographics_location=demographics_location,
+                dataset_type=dataset_type,
+                coding_system=coding_system,
+                nhs_digital_subtype=nhs_digital_subtype,
+                ingestion=ingestion,
+                write_processed=write_processed,
+                person_dictionary=stage_cache.file_digest(dictionary_location) if dictionary_location.exists() else None,
+            )
+            if stage_cache.lookup(key, date_end=date_end, outputs=outputs):
+                print(f"{datetime.now()}: {name}: unchanged since previous run, reusing {outputs['clean']}")
+                event["details"]["cache_hit"] = True
+                event["rows_out"] = _count(outputs["clean"])
+                return StageOutput(outputs["clean"], outputs["clean_log"], cache_hit=True)
+
+        process_options = {"deduplication_options": deduplication_options, "column_maps": column_maps}
+        if nhs_digital_subtype is not None:
+            process_options["nhs_digital_subtype"] = nhs_digital_subtype
+
+        for location in outputs.values():
+            Path(location).parent.mkdir(parents=True, exist_ok=True)
+
+        if ingestion is not None:
+            from bi_py import ingestion as lazy_ingestion
+
+            ingested = lazy_ingestion.ingest_and_clean_csv(
+                raw_location,
+                clean_location=outputs["clean"],
+                clean_log_location=outputs["clean_log"],
+                column_maps=column_maps,
+                deduplication_options=deduplication_options,
+                demographics_location=demographics_location,
+                date_start=date_start,
+                date_end=date_end,
+                processed_location=outputs.get("processed"),
+                processed_log_location=outputs.get("processed_log"),
+                **ingestion,
+            )
+            event["rows_in"] = ingested.rows_in
+            event["details"]["date_rejects"] = ingested.date_rejects
+            event["details"]["code_rejects"] = ingested.code_rejects
+            max_event_date = ingested.max_event_date
+        else:
+            # imported here so that the cache and the lazy ingestion can be used without tretools
+            from tretools.datasets.raw_dataset import RawDataset
+
+            demographic_dataset = demographics()
+            person_dictionary = person.read_person_dictionary(demographics_location) if person.is_encoded(demographic_dataset.data) else None
+            raw_dataset = RawDataset(path=raw_location, dataset_type=dataset_type, coding_system=coding_system)
+            event["rows_in"] = raw_dataset.data.height
+            processed_dataset = process_dataset(raw_dataset, person_dictionary=person_dictionary, **process_options)
+            processed_dataset.write_to_feather(outputs["processed"])
+            processed_dataset.write_to_log(outputs["processed_log"])
+            max_event_date = processed_dataset.data["date"].max()
+
+            cleaned_dataset = processed_dataset.remove_unrealistic_dates(
+                date_start=date_start,
+                date_end=date_end,
+                before_born=True,
+                demographic_dataset=demographic_dataset,
+            )
+            cleaned_dataset.data = cleaned_dataset.data.sort(SORT_KEY)
+            cleaned_dataset.write_to_feather(outputs["clean"])
+            cleaned_dataset.write_to_log(outputs["clean_log"])
+            mark_sorted(outputs["clean"], SORT_KEY)
+
+        if stage_cache is not None:
+            stage_cache.store(key, date_end=date_end, max_event_date=max_event_date, outputs=outputs, raw_location=raw_location)
+
+        event["details"]["cache_hit"] = False
+        event["rows_out"] = _count(outputs["clean"])
+        return StageOutput(outputs["clean"], outputs["clean_log"], cache_hit=False)
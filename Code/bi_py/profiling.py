@@ -0,0 +1,164 @@
+"""
+Profiling of the stages of the pipeline, in place of the `%%time` cell magics.
+
+`%%time` only works in a notebook, and what it prints is lost with the cell output.  A stage is
+now run in `profile()` (or a function decorated with `profiled()`):
+
+    with profile("NB2: merge the discovery cuts") as event:
+        final_log = merge_files(...)
+
+which records it in the run log (see `bi_py.run_log`), like the stages of `bi_py` themselves, and
+prints a line in the cell output:
+
+    [NB2: merge the discovery cuts] wall 512.3 s, CPU 1843.0 s (3.6 of 16 polars threads), peak RSS 20480 MB,
+    70123456 rows in (136877 rows/s), 5066.0 MB in, 4756.0 MB out
+
+The stages run within it (e.g. `merge_files()`) are recorded with it as their parent.  Rows are
+those set on the event (`event["rows_in"] = ...`); the bytes are the sizes of its `inputs` and
+`outputs`.
+
+At the end of a run, `bi_py.pipeline` writes the run log as `runs/<timestamp>/metrics.parquet`
+with `write_metrics()`, one row per stage, and `scan_metrics()` reads the metrics of every run, to
+see which cut or stage dominates a release and follow it over time.  From the `Code` directory:
+
+    python -m bi_py.profiling ../runs                   # time per stage, per run
+    python -m bi_py.profiling ../runs --stage merge_files
+"""
+
+import argparse
+import functools
+import json
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional
+
+import polars as pl
+
+from bi_py import run_log
+
+METRICS_FILE = "metrics.parquet"
+
+
+def summary(event: dict) -> str:
+    """The profile of the stage recorded by `event`, on one line."""
+    parts = [f"wall {event['duration_s']:.1f} s"]
+    if event["cpu_s"] is not None:
+        parallelism = event["cpu_s"] / event["duration_s"] if event["duration_s"] else 0.0
+        parts.append(f"CPU {event['cpu_s']:.1f} s ({parallelism:.1f} of {event['polars_threads']} polars threads)")
+    parts.append(f"peak RSS {event['peak_rss_mb']:.0f} MB")
+    rows = event["rows_in"] if event["rows_in"] is not None else event["rows_out"]
+    if rows is not None:
+        direction = "in" if event["rows_in"] is not None else "out"
+        parts.append(f"{rows} rows {direction}" + (f" ({rows / event['duration_s']:.0f} rows/s)" if event["duration_s"] else ""))
+    for direction in ("in", "out"):
+        if event[f"bytes_{direction}"] is not None:
+            parts.append(f"{event[f'bytes_{direction}'] / 1e6:.1f} MB {direction}")
+    return f"[{event['stage']}] " + ", ".join(parts)
+
+
+@contextmanager
+def profile(
+    name: str,
+    inputs: Iterable[str] = (),
+    outputs: Iterable[str] = (),
+    rows_in: Optional[int] = None,
+    quiet: bool = False,
+    **details,
+) -> Iterator[dict]:
+    """
+    Profiles the stage `name` run within the `with` block: records it in the run log (see
+    `bi_py.run_log.stage()`, the event is yielded) and, unless `quiet`, prints its `summary()`.
+    """
+    with run_log.stage(name, inputs, outputs, rows_in, **details) as event:
+        yield event
+    if not quiet:
+        print(summary(event))
+
+
+def profiled(name: Optional[str] = None, quiet: bool = False) -> Callable:
+    """Decorator profiling every call of the function as the stage `name` (by default the function's name)."""
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with profile(name or function.__name__, quiet=quiet):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def metrics(events: pl.DataFrame, run: str) -> pl.DataFrame:
+    """The events of a run log (see `bi_py.run_log.read_run_log()`) as the metrics of the run `run`."""
+    return (
+        events
+        .with_columns(
+            pl.lit(run).alias("run"),
+            # the cut of the stages which know it, e.g. process_and_clean()
+            pl.col("details").map_elements(lambda details: json.loads(details).get("cut"), return_dtype=pl.Utf8).alias("cut"),
+            (pl.col("cpu_s") / pl.col("duration_s")).alias("parallelism"),
+            (pl.coalesce("rows_in", "rows_out") / pl.col("duration_s")).alias("rows_per_s"),
+        )
+        .select(
+            "run", "event_id", "parent_id", "stage", "cut", "started", "status",
+            "duration_s", "cpu_s", "parallelism", "polars_threads", "peak_rss_mb",
+            "rows_in", "rows_out", "rows_per_s", "bytes_in", "bytes_out",
+            "inputs", "outputs", "details",
+        )
+    )
+
+
+def write_metrics(run_log_location: str, metrics_location: Optional[str] = None) -> str:
+    """
+    Writes the metrics of the run log `run_log_location` to `metrics_location`, by default
+    `metrics.parquet` next to it; the run is named after their directory (e.g. its timestamp).
+
+    Returns:
+        str: the metrics file
+    """
+    metrics_location = metrics_location or str(Path(run_log_location).with_name(METRICS_FILE))
+    run = Path(run_log_location).parent.name
+    metrics(run_log.read_run_log(run_log_location), run).write_parquet(metrics_location, compression="zstd")
+    return metrics_location
+
+
+def scan_metrics(runs_location: str) -> pl.LazyFrame:
+    """The metrics of every run in `runs_location` (`<run>/metrics.parquet`)."""
+    return pl.scan_parquet(f"{runs_location}/*/{METRICS_FILE}")
+
+
+def stage_history(metrics: pl.LazyFrame, stage: Optional[str] = None) -> pl.DataFrame:
+    """Per run and stage (or per run and cut of `stage`): total duration and CPU time, rows, peak memory."""
+    keys = ["run", "stage"] if stage is None else ["run", "cut"]
+    if stage is not None:
+        metrics = metrics.filter(pl.col("stage") == stage)
+    return (
+        metrics
+        .group_by(keys)
+        .agg(
+            pl.len().alias("events"),
+            pl.col("duration_s").sum().alias("total_s"),
+            pl.col("cpu_s").sum(),
+            pl.col("rows_in").sum(),
+            pl.col("rows_out").sum(),
+            pl.col("peak_rss_mb").max(),
+        )
+        .sort(["run", "total_s"], descending=[False, True])
+        .collect()
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Stage metrics of the BI_PY runs.")
+    parser.add_argument("runs", help="the runs directory, with <run>/metrics.parquet")
+    parser.add_argument("--stage", help="per cut, the events of this stage only")
+    args = parser.parse_args(argv)
+
+    pl.Config.set_tbl_rows(-1)
+    print(stage_history(scan_metrics(args.runs), args.stage))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+Reading raw CSV files which contain a few malformed ("ragged") rows.
+
+Some raw files have rows with more or fewer fields than the header, e.g. line 6010 of the Barts
+March 2022 problems file, which makes polars (and so `RawDataset`) fail with
+
+    ComputeError: found more fields than defined in 'Schema'
+
+Rather than deleting that line by hand, `scan_csv_quarantine()` reads the file once, record by
+record (quoted fields may span lines), sends every record whose number of fields differs from the
+header to a small rejects sidecar CSV, with its line number, and streams the good records to a CSV
+of their own, which it scans lazily; `read_csv_quarantine()` loads them into a DataFrame, through a
+temporary file, so that the file is never held in memory as text as well.  Nothing is hard-coded:
+a new bad line in a new extract ends up in the sidecar too.
+
+`raw_dataset_from_frame()` then wraps that DataFrame in a `RawDataset`, so that the usual
+`process_dataset()` / `remove_unrealistic_dates()` steps follow.
+"""
+
+import csv
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import polars as pl
+
+REJECTS_SCHEMA = {"line_number": pl.Int64, "fields_expected": pl.Int64, "fields_found": pl.Int64, "line": pl.Utf8}
+
+
+def scan_csv_quarantine(
+    raw_location: str,
+    rejects_location: str,
+    good_location: str,
+    separator: str = ",",
+    quote_char: Optional[str] = '"',
+    encoding: str = "utf-8",
+    **scan_csv_options,
+) -> pl.LazyFrame:
+    """
+    Scans `raw_location`, keeping only the records with as many fields as the header.
+
+    The good records are written, as they are read, to `good_location` (UTF-8), which is scanned;
+    the rejected records to `rejects_location` (columns `line_number` - of the first line of the
+    record, the header being line 1 -, `fields_expected`, `fields_found` and `line`).
+    `scan_csv_options` are passed on to `pl.scan_csv()` for the good records.
+    """
+    rejects = []
+
+    def fields(record: str) -> int:
+        reader = csv.reader([record], delimiter=separator, quotechar=quote_char or None, quoting=csv.QUOTE_MINIMAL if quote_char else csv.QUOTE_NONE)
+        return len(next(reader, []))
+
+    Path(good_location).parent.mkdir(parents=True, exist_ok=True)
+    with open(raw_location, encoding=encoding, newline="") as f, open(good_location, "w", encoding="utf-8", newline="") as good:
+        header = f.readline()
+        fields_expected = fields(header.rstrip("\r\n"))
+        good.write(header)
+
+        record, record_line_number, line_number = "", None, 1
+        for line in f:
+            line_number += 1
+            if not record:
+                record_line_number = line_number
+            record += line
+            if quote_char and record.count(quote_char) % 2:
+                continue  # a quoted field spans lines, the record goes on on the next line
+
+            fields_found = fields(record.rstrip("\r\n"))
+            if fields_found == fields_expected:
+                good.write(record if record.endswith("\n") else record + "\n")
+            elif record.strip():
+                rejects.append((record_line_number, fields_expected, fields_found, record.rstrip("\r\n")))
+            record = ""
+
+        if record:  # unterminated quote at the end of the file
+            rejects.append((record_line_number, fields_expected, fields(record), record.rstrip("\r\n")))
+
+    Path(rejects_location).parent.mkdir(parents=True, exist_ok=True)
+    pl.DataFrame(rejects, schema=REJECTS_SCHEMA, orient="row").write_csv(rejects_location)
+    print(f"{datetime.now()}: {Path(raw_location).name}: {len(rejects)} malformed record(s) quarantined to {rejects_location}")
+
+    return pl.scan_csv(good_location, separator=separator, quote_char=quote_char, **scan_csv_options)
+
+
+def read_csv_quarantine(
+    raw_location: str,
+    rejects_location: str,
+    separator: str = ",",
+    quote_char: Optional[str] = '"',
+    encoding: str = "utf-8",
+    **scan_csv_options,
+) -> pl.DataFrame:
+    """
+    `scan_csv_quarantine()` into a DataFrame, the good records being written to a temporary file
+    next to `rejects_location`, removed once they are loaded.
+    """
+    Path(rejects_location).parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=Path(rejects_location).parent) as temp_location:
+        good_location = str(Path(temp_location) / Path(raw_location).name)
+        return scan_csv_quarantine(raw_location, rejects_location, good_location, separator, quote_char, encoding, **scan_csv_options).collect()
+
+
+def raw_dataset_from_frame(data: pl.DataFrame, path: str, dataset_type: str, coding_system: str, note: Optional[str] = None):
+    """
+    A tretools `RawDataset` holding `data`, as if it had been loaded from `path`.
+
+    `RawDataset.__init__` always reads its file, so the dataset is built without it and given the
+    attributes `__init__` sets (`path`, `dataset_type`, `coding_system`, `data`, `log`).
+    """
+    from tretools.datasets.raw_dataset import RawDataset
+
+    raw_dataset = RawDataset.__new__(RawDataset)
+    raw_dataset.path = path
+    raw_dataset.dataset_type = dataset_type
+    raw_dataset.coding_system = coding_system
+    raw_dataset.data = data
+    raw_dataset.log = [f"{datetime.now()}: Data loaded from {path}{f' ({note})' if note else ''}, shape {data.shape}"]
+    return raw_dataset
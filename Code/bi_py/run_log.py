@@ -0,0 +1,315 @@
+"""
+A structured, append-only log of a run of the pipeline, one JSON event per line.
+
+The tretools logs are lists of "<timestamp>: <message>" strings, which every merge used to copy
+into the merged dataset's log and sort, so that `final_log.txt` and its like grew with every cut
+and were rewritten at every stage, without a machine-readable row count.  Each stage of `bi_py`
+(`process_and_clean()`, `merge_files()`, `merge_many()`, `write_partition()`, ...) now records one
+event in the run log instead:
+
+    {"event_id": "3f2c...", "parent_id": "9a1b...", "stage": "merge_files", "started": "2025-05-02T10:31:07",
+     "duration_s": 512.3, "cpu_s": 1843.0, "polars_threads": 16, "peak_rss_mb": 20480.0,
+     "inputs": [".../april_22.arrow", ...], "outputs": [".../final_merged_data.arrow"],
+     "bytes_in": 5312000000, "bytes_out": 4987000000, "rows_in": 70123456, "rows_out": 66012345,
+     "status": "ok", "pid": 4242, "details": {"method": "sort-merge"}}
+
+A merge lists its input files rather than copying their history: the events which produced them
+are found from their `outputs` (see `lineage()`), and the text logs of merged files only refer to
+the logs of their inputs.  `parent_id` is the stage the event ran in (e.g. a `process_and_clean`
+in a `run_manifest`, itself in a notebook of a `bi_py.pipeline` run); `cpu_s` is the CPU time of
+the process (all its threads) during the stage and `bytes_in`/`bytes_out` the sizes of the input
+and output files.  `bi_py.profiling` turns a run log into a metrics Parquet file.
+
+`peak_rss_mb` is the peak resident memory of the process during the stage (and the stages within
+it).  The high-water mark of the process (`VmHWM`) only ever goes up, so each stage resets it as it
+starts (`/proc/self/clear_refs`), after adding the peak so far to the stages still open; a later
+stage no longer reports the peak of an earlier, bigger one.  Where the high-water mark cannot be
+reset (not Linux), it is that of the process up to the end of the stage.  The peak is that of the
+whole process, i.e. also of the threads running other stages at the same time, and not of the
+processes it starts: a stage which runs processes sets its `peak_rss_mb` itself, e.g. a notebook
+of a `bi_py.pipeline` run to the highest of the stages its kernel records (`descendants_peak_rss_mb()`),
+or `run_manifest()` to the highest of its workers; the stages it is part of then report it too.
+
+The run log is `$BI_PY_RUN_LOG`, which `bi_py.pipeline` sets to `runs/<timestamp>/run_log.jsonl`
+(a notebook run by hand can call `start_run()`); the environment variables are inherited by the
+notebook kernels and the worker processes.  Without a run log, stages are not recorded.
+
+Query a run log with `read_run_log()`, `stage_summary()` and `lineage()`, or from the `Code`
+directory:
+
+    python -m bi_py.run_log runs/<timestamp>/run_log.jsonl                 # per stage summary
+    python -m bi_py.run_log runs/<timestamp>/run_log.jsonl --stage merge_files
+    python -m bi_py.run_log runs/<timestamp>/run_log.jsonl --lineage .../final_merged_data.arrow
+"""
+
+import argparse
+import contextvars
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import polars as pl
+
+RUN_LOG_ENV = "BI_PY_RUN_LOG"
+PARENT_ENV = "BI_PY_RUN_LOG_PARENT"
+CLEAR_REFS = "/proc/self/clear_refs"
+PROC_STATUS = "/proc/self/status"
+
+# the event of the stage running in this thread, parent of the events started within it
+_CURRENT = contextvars.ContextVar("bi_py_run_log_current", default=None)
+
+# the peak memory so far of the stages open in this process, see _checkpoint_peak(), and their parents
+_OPEN_PEAKS: Dict[str, float] = {}
+_OPEN_PARENTS: Dict[str, Optional[str]] = {}
+_PEAKS_LOCK = threading.Lock()
+
+
+def start_run(location: str) -> str:
+    """Records the stages run from now on, in this process and the processes it starts, in `location`."""
+    Path(location).parent.mkdir(parents=True, exist_ok=True)
+    os.environ[RUN_LOG_ENV] = str(location)
+    return str(location)
+
+
+def current_run_log() -> Optional[str]:
+    return os.environ.get(RUN_LOG_ENV)
+
+
+def set_parent(event_id: Optional[str]) -> None:
+    """Makes `event_id` the parent of the events of the processes started from now on (e.g. kernels, workers)."""
+    if event_id is None:
+        os.environ.pop(PARENT_ENV, None)
+    else:
+        os.environ[PARENT_ENV] = event_id
+
+
+def _peak_rss_mb() -> float:
+    # the high-water mark since the last reset_peak_rss(), in kilobytes; since the process started if there is no /proc
+    try:
+        with open(PROC_STATUS) as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def reset_peak_rss() -> bool:
+    """Resets the high-water mark of the resident memory of the process to its current memory, where the kernel allows it."""
+    try:
+        with open(CLEAR_REFS, "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _checkpoint_peak() -> float:
+    # adds the peak so far to the stages open in this process, then resets it
+    peak = _peak_rss_mb()
+    for event_id, open_peak in _OPEN_PEAKS.items():
+        _OPEN_PEAKS[event_id] = max(open_peak, peak)
+    reset_peak_rss()
+    return peak
+
+
+def _bytes(locations: Iterable[str]) -> Optional[int]:
+    # the local files (or directories) which exist, None if there are none
+    sizes = []
+    for location in locations:
+        path = Path(location)
+        if path.is_file():
+            sizes.append(path.stat().st_size)
+        elif path.is_dir():
+            sizes.append(sum(file.stat().st_size for file in path.rglob("*") if file.is_file()))
+    return sum(sizes) if sizes else None
+
+
+def write_event(event: dict, location: Optional[str] = None) -> None:
+    location = location or current_run_log()
+    if location is None:
+        return
+    # a single append of a single line, so that concurrent processes do not interleave
+    with open(location, "a") as f:
+        f.write(json.dumps(event, default=str) + "\n")
+
+
+@contextmanager
+def stage(
+    name: str,
+    inputs: Iterable[str] = (),
+    outputs: Iterable[str] = (),
+    rows_in: Optional[int] = None,
+    **details,
+) -> Iterator[dict]:
+    """
+    Records the stage `name` run within the `with` block as one event of the run log.
+
+    The event is yielded so that what is only known at the end can be set, e.g.
+    `event["rows_out"] = ...` or `event["details"]["method"] = ...`; a `peak_rss_mb` set by the
+    block (the memory of the processes the stage ran) is kept if it is higher than that of the
+    process, and passed on to the stages it is part of.  A stage which raises is recorded with `"status": "error"`.
+    """
+    event = {
+        "event_id": uuid.uuid4().hex,
+        "parent_id": _CURRENT.get() or os.environ.get(PARENT_ENV),
+        "stage": name,
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "duration_s": None,
+        "cpu_s": None,
+        "polars_threads": pl.thread_pool_size(),
+        "peak_rss_mb": None,
+        "inputs": [str(location) for location in inputs],
+        "outputs": [str(location) for location in outputs],
+        "bytes_in": None,
+        "bytes_out": None,
+        "rows_in": rows_in,
+        "rows_out": None,
+        "status": "ok",
+        "pid": os.getpid(),
+        "details": details,
+    }
+    token = _CURRENT.set(event["event_id"])
+    with _PEAKS_LOCK:
+        _checkpoint_peak()
+        _OPEN_PEAKS[event["event_id"]] = 0.0
+        _OPEN_PARENTS[event["event_id"]] = event["parent_id"]
+    start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield event
+    except BaseException as e:
+        event["status"] = "error"
+        event["details"]["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _CURRENT.reset(token)
+        event["duration_s"] = round(time.perf_counter() - start, 3)
+        event["cpu_s"] = round(time.process_time() - cpu_start, 3)
+        with _PEAKS_LOCK:
+            peak = _peak_rss_mb()
+            for event_id, open_peak in _OPEN_PEAKS.items():
+                _OPEN_PEAKS[event_id] = max(open_peak, peak)
+            event["peak_rss_mb"] = round(max(_OPEN_PEAKS.pop(event["event_id"]), event["peak_rss_mb"] or 0.0), 1)
+            del _OPEN_PARENTS[event["event_id"]]
+            # the memory of the processes the stage ran is also that of the stages it is part of
+            parent = event["parent_id"]
+            while parent in _OPEN_PEAKS:
+                _OPEN_PEAKS[parent] = max(_OPEN_PEAKS[parent], event["peak_rss_mb"])
+                parent = _OPEN_PARENTS[parent]
+        event["bytes_in"] = _bytes(event["inputs"])
+        event["bytes_out"] = _bytes(event["outputs"])
+        write_event(event)
+
+
+def read_run_log(location: str) -> pl.DataFrame:
+    """The events of the run log at `location`, `details` as a JSON string."""
+    events = []
+    for line in Path(location).read_text().splitlines():
+        if line.strip():
+            event = json.loads(line)
+            event["details"] = json.dumps(event.get("details", {}), default=str)
+            events.append(event)
+    return pl.DataFrame(
+        events,
+        schema={
+            "event_id": pl.Utf8,
+            "parent_id": pl.Utf8,
+            "stage": pl.Utf8,
+            "started": pl.Utf8,
+            "duration_s": pl.Float64,
+            "cpu_s": pl.Float64,
+            "polars_threads": pl.Int64,
+            "peak_rss_mb": pl.Float64,
+            "inputs": pl.List(pl.Utf8),
+            "outputs": pl.List(pl.Utf8),
+            "bytes_in": pl.Int64,
+            "bytes_out": pl.Int64,
+            "rows_in": pl.Int64,
+            "rows_out": pl.Int64,
+            "status": pl.Utf8,
+            "pid": pl.Int64,
+            "details": pl.Utf8,
+        },
+    ).with_columns(pl.col("started").str.to_datetime("%Y-%m-%dT%H:%M:%S"))
+
+
+def descendants_peak_rss_mb(event_id: str, location: Optional[str] = None) -> Optional[float]:
+    """The highest peak memory of the stages recorded (so far) within the stage `event_id`, in whichever process."""
+    location = location or current_run_log()
+    if location is None or not Path(location).exists():
+        return None
+    events = read_run_log(location)
+    parents, peak, wanted = dict(zip(events["event_id"], events["parent_id"])), None, {event_id}
+    for event in events.iter_rows(named=True):
+        parent = event["parent_id"]
+        while parent is not None and parent not in wanted:
+            parent = parents.get(parent)
+        if parent is not None and event["peak_rss_mb"] is not None:
+            peak = max(peak or 0.0, event["peak_rss_mb"])
+    return peak
+
+
+def stage_summary(events: pl.DataFrame) -> pl.DataFrame:
+    """Per stage: number of events and errors, rows in and out, total and longest duration, CPU time, peak memory."""
+    return (
+        events
+        .group_by("stage")
+        .agg(
+            pl.len().alias("events"),
+            (pl.col("status") == "error").sum().alias("errors"),
+            pl.col("rows_in").sum(),
+            pl.col("rows_out").sum(),
+            pl.col("duration_s").sum().alias("total_s"),
+            pl.col("duration_s").max().alias("longest_s"),
+            pl.col("cpu_s").sum(),
+            pl.col("peak_rss_mb").max(),
+        )
+        .sort("total_s", descending=True)
+    )
+
+
+def lineage(events: pl.DataFrame, location: str) -> pl.DataFrame:
+    """The events which produced the file `location`, and, recursively, its inputs."""
+    wanted, found, seen = [str(location)], [], set()
+    while wanted:
+        location = wanted.pop()
+        producers = events.filter(pl.col("outputs").list.contains(location) & (pl.col("status") == "ok"))
+        for event in producers.iter_rows(named=True):
+            if event["event_id"] not in seen:
+                seen.add(event["event_id"])
+                found.append(event["event_id"])
+                wanted.extend(event["inputs"])
+    return events.filter(pl.col("event_id").is_in(found)).sort("started")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Query a BI_PY run log.")
+    parser.add_argument("run_log", help="the run_log.jsonl of a run")
+    parser.add_argument("--stage", help="only the events of this stage")
+    parser.add_argument("--lineage", metavar="FILE", help="the events which produced FILE, and its inputs")
+    args = parser.parse_args(argv)
+
+    events = read_run_log(args.run_log)
+    pl.Config.set_tbl_rows(-1)
+    pl.Config.set_fmt_str_lengths(120)
+    columns = ["started", "stage", "duration_s", "peak_rss_mb", "rows_in", "rows_out", "status", "outputs"]
+    if args.lineage:
+        print(lineage(events, args.lineage).select(columns))
+    elif args.stage:
+        print(events.filter(pl.col("stage") == args.stage).sort("started").select(columns + ["details"]))
+    else:
+        print(stage_summary(events))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""
+Versioned per-source schemas of the raw files, applied when the files are scanned.
+
+The raw extracts used to be scanned with `infer_schema=False` (or `infer_schema_length=0`), every
+column as text, and then cast (`conceptId` to `pl.Int64`, `DiagDate` with `str.to_date()`, ...)
+column by column in the notebooks.  The registry (see `Code/schemas/*.json`) instead records, for
+each source, file family and cut, the dtype of the columns which are used, the tokens which mean
+null and the format of the dates:
+
+    {
+        "source": "barts_health",
+        "null_values": ["", " ", "NULL", "NA"],          # default for every family
+        "families": {
+            "RDE_PC_DIAGNOSIS": [                          # one entry per version of the layout
+                {
+                    "version": 1,
+                    "cuts": ["2024_09"],
+                    "separator": "\t",
+                    "quote_char": "\"",                    # optional, null for none
+                    "columns": {
+                        "Confirmation": {"dtype": "Categorical"},
+                        "DiagDt": {"dtype": "Date", "format": "%d/%m/%Y %H:%M"},
+                        "Procedure_date": {"dtype": "Date", "format": "...", "null_values": ["1899-12-30 00:00"]}
+                    }
+                }
+            ]
+        }
+    }
+
+`scan_with_schema()` applies it in the scan: integers, floats, booleans, categoricals and ISO dates
+are parsed by the CSV reader itself, other dates and enums are parsed in the same lazy plan, so
+that they never exist as a materialised column of strings.  Columns not in the registry are read as
+text, as before.  A new cut whose layout changed gets a new version rather than an edited one.
+"""
+
+import json
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+import polars as pl
+
+SCHEMAS_LOCATION = Path(__file__).resolve().parents[1] / "schemas"
+ISO_DATE_FORMATS = (None, "%Y-%m-%d")
+NATIVE_DTYPES = {
+    "Int8", "Int16", "Int32", "Int64", "UInt8", "UInt16", "UInt32", "UInt64",
+    "Float32", "Float64", "Boolean", "Categorical", "Utf8", "String",
+}
+
+
+class ColumnSchema(NamedTuple):
+    dtype: pl.DataType
+    format: Optional[str]
+    null_values: List[str]
+    strict: bool
+
+
+class FileSchema(NamedTuple):
+    source: str
+    family: str
+    version: int
+    separator: str
+    quote_char: Optional[str]
+    null_values: List[str]
+    columns: Dict[str, ColumnSchema]
+
+
+def _dtype(spec: dict) -> pl.DataType:
+    if spec["dtype"] == "Enum":
+        return pl.Enum(spec["categories"])
+    if spec["dtype"] not in NATIVE_DTYPES | {"Date", "Datetime"}:
+        raise ValueError(f"Unsupported dtype {spec['dtype']} in the schema registry")
+    return getattr(pl, spec["dtype"])
+
+
+def load_registry(source: str, schemas_location: Optional[str] = None) -> dict:
+    """The registry of `source`, i.e. `<schemas_location>/<source>.json`."""
+    with open(Path(schemas_location or SCHEMAS_LOCATION) / f"{source}.json") as f:
+        registry = json.load(f)
+    if registry.get("source") != source:
+        raise ValueError(f"The registry of {source} is for source {registry.get('source')}")
+    return registry
+
+
+def file_schema(source: str, family: str, cut: str, schemas_location: Optional[str] = None) -> FileSchema:
+    """The schema of the files of `family` in `cut` of `source`."""
+    registry = load_registry(source, schemas_location)
+    if family not in registry["families"]:
+        raise ValueError(f"No schema for file family {family} of {source}, known families: {sorted(registry['families'])}")
+
+    versions = [entry for entry in registry["families"][family] if cut in entry["cuts"]]
+    if len(versions) != 1:
+        raise ValueError(f"{len(versions)} schema versions of {source}/{family} cover cut {cut}, expected exactly 1")
+    entry = versions[0]
+
+    return FileSchema(
+        source=source,
+        family=family,
+        version=entry["version"],
+        separator=entry.get("separator", ","),
+        quote_char=entry.get("quote_char", '"'),
+        null_values=entry.get("null_values", registry.get("null_values", [])),
+        columns={
+            name: ColumnSchema(_dtype(spec), spec.get("format"), spec.get("null_values", []), spec.get("strict", True))
+            for name, spec in entry["columns"].items()
+        },
+    )
+
+
+def _parsed_by_reader(column: ColumnSchema) -> bool:
+    if column.null_values:
+        return False  # the column's own null tokens are replaced before it is parsed
+    if column.dtype == pl.Date:
+        return column.format in ISO_DATE_FORMATS
+    return str(column.dtype) in NATIVE_DTYPES or column.dtype in (pl.Categorical, pl.Utf8)
+
+
+def scan_with_schema(raw_location, source: str, family: str, cut: str, schemas_location: Optional[str] = None) -> pl.LazyFrame:
+    """
+    `pl.scan_csv(raw_location)` typed with the registry's schema of `source`/`family`/`cut`.
+
+    Raises if a column of the schema is not in the file.
+    """
+    schema = file_schema(source, family, cut, schemas_location)
+    data = pl.scan_csv(
+        raw_location,
+        separator=schema.separator,
+        quote_char=schema.quote_char,
+        infer_schema=False,
+        null_values=schema.null_values,
+        schema_overrides={name: column.dtype for name, column in schema.columns.items() if _parsed_by_reader(column)},
+    )
+
+    missing = set(schema.columns) - set(data.collect_schema().names())
+    if missing:
+        raise ValueError(
+            f"{raw_location}: columns {sorted(missing)} of schema version {schema.version} of {source}/{family} are not in the file"
+        )
+
+    parsed = []
+    for name, column in schema.columns.items():
+        if _parsed_by_reader(column):
+            continue
+        text = pl.col(name)
+        if column.null_values:
+            text = pl.when(text.is_in(column.null_values)).then(None).otherwise(text)
+        if column.dtype == pl.Date:
+            parsed.append(text.str.to_date(format=column.format, strict=column.strict).alias(name))
+        elif column.dtype == pl.Datetime:
+            parsed.append(text.str.to_datetime(format=column.format, strict=column.strict).alias(name))
+        else:
+            parsed.append(text.cast(column.dtype, strict=column.strict).alias(name))
+    return data.with_columns(parsed) if parsed else data
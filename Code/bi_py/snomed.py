@@ -0,0 +1,67 @@
+"""
+The canonical representation of SNOMED CT codes: `pl.UInt64`.
+
+SNOMED CT identifiers are positive integers of at most 18 digits, but they reached the megadata
+files as whatever each extract happened to give: floats (in scientific notation) in the mapping
+file, `Int64` after a cast here, strings with trailing whitespace there, and NB#8 cast them all
+back to `pl.Utf8` to join the codelists.  `snomed_codes()` converts a code column to `UInt64` once,
+when a dataset is ingested, and is a no-op on a column which is already `UInt64`, so it can be
+applied wherever SNOMED datasets meet (e.g. the NB#6 merge) at no cost.
+
+tretools' `map_snomed_to_icd()` reads the mapping file itself, as `Int64`, so the codes are given
+to it with `tretools_snomed_codes()` (lossless, as 18 digits fit in an `Int64`).
+"""
+
+from typing import TypeVar
+
+import polars as pl
+
+SNOMED_CODE_DTYPE = pl.UInt64
+
+Frame = TypeVar("Frame", pl.DataFrame, pl.LazyFrame)
+
+
+def _integral(codes: pl.Series) -> pl.Series:
+    fractional = codes.filter(codes.is_not_null() & (codes != codes.floor()))
+    if len(fractional):
+        raise ValueError(f"{len(fractional)} SNOMED codes of {codes.name!r} are not integral, e.g. {fractional.head(3).to_list()}")
+    return codes
+
+
+def snomed_code(column: str, dtype: pl.DataType) -> pl.Expr:
+    """The codes of `column` (of `dtype`) as `SNOMED_CODE_DTYPE`, null where there is no SNOMED code, as `snomed_codes(strict=False)`."""
+    code = pl.col(column)
+    if dtype == pl.Utf8:
+        code = code.str.strip_chars()
+    elif dtype.is_float():
+        code = pl.when(code == code.floor()).then(code)
+    return code.cast(SNOMED_CODE_DTYPE, strict=False)
+
+
+def snomed_codes(data: Frame, column: str = "code", strict: bool = True, alias: str = None) -> Frame:
+    """
+    `data` with `column` (as `alias` if given) converted to `SNOMED_CODE_DTYPE`.
+
+    Strings are stripped of whitespace first; floats (e.g. codes in scientific notation, which
+    should be read as `pl.Float64`) must be integral, as a cast would truncate them.  With
+    `strict=False` the rows without a SNOMED code (null, a fractional float, or e.g. an ICD-10 code
+    in a column of SNOMED codes) are dropped rather than raising.
+    """
+    alias = alias or column
+    dtype = data.collect_schema()[column]
+    if dtype == SNOMED_CODE_DTYPE and alias == column:
+        return data
+
+    if not strict:
+        return data.with_columns(snomed_code(column, dtype).alias(alias)).filter(pl.col(alias).is_not_null())
+    code = pl.col(column)
+    if dtype == pl.Utf8:
+        code = code.str.strip_chars()
+    elif dtype.is_float():
+        code = code.map_batches(_integral, return_dtype=dtype)
+    return data.with_columns(code.cast(SNOMED_CODE_DTYPE).alias(alias))
+
+
+def tretools_snomed_codes(data: Frame, column: str = "code") -> Frame:
+    """`data` with its SNOMED `column` as the `Int64` which tretools' `map_snomed_to_icd()` joins on."""
+    return data.with_columns(pl.col(column).cast(pl.Int64))
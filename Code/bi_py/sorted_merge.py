@@ -0,0 +1,222 @@
+"""
+Sort-merge deduplication of processed files written sorted by (nhs_number, code, date).
+
+`deduplicate()` (and `merge_many()`) deduplicate with a hash table of every distinct event, so
+the peak memory of the final merge of NB#2 grows with `final_merged_data.arrow` itself.  When the
+inputs are already sorted on the deduplication columns, the duplicates of an event are next to
+each other once the inputs are merged in order, so they can be dropped as the merge streams past.
+
+The clean files (`bi_py.ingestion`, `bi_py.processing`) and the merged megadata files are
+therefore written sorted with `sink_sorted()`, which records the sort order in a marker next to
+the file, `<file>.sorted_by.json`:
+
+    {"sorted_by": ["nhs_number", "code", "date"], "size": ..., "mtime_ns": ...}
+
+The marker only holds while the file keeps the size and modification time it was written with
+(as the raw file digests of `bi_py.stage_cache`), so a file rewritten by anything else is simply
+no longer known to be sorted.
+
+`merge_files()` merges files into one megadata file: if every input is marked as sorted on the
+deduplication columns, with `merge_sorted_unique()`, a k-way merge which reads `batch_rows` rows of
+each input at a time, so that memory is bounded by a few batches per input rather than by the
+size of the output; otherwise with a hash `unique()` of one hash partition at a time (see
+`bi_py.partitioned_dedup`).  Either way the output is written sorted, and marked.  Its log refers
+to the logs of the inputs rather than copying them (see `bi_py.run_log`).
+"""
+
+import json
+import os
+import shutil
+from datetime import datetime
+from itertools import zip_longest
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence
+
+import polars as pl
+
+from bi_py import run_log
+from bi_py.megadata import DEDUPLICATION_OPTIONS
+
+SORT_KEY = ["nhs_number", "code", "date"]
+MARKER_SUFFIX = ".sorted_by.json"
+BATCH_ROWS = 256_000
+
+
+def marker_location(location: str) -> Path:
+    return Path(f"{location}{MARKER_SUFFIX}")
+
+
+def mark_sorted(location: str, by: Sequence[str] = SORT_KEY) -> None:
+    """Records that the file at `location`, as it is now, is sorted by `by`."""
+    stat = Path(location).stat()
+    marker_location(location).write_text(
+        json.dumps({"sorted_by": list(by), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+    )
+
+
+def sorted_by(location: str) -> Optional[List[str]]:
+    """The columns the file at `location` is sorted by, or None if it is not known to be sorted."""
+    marker = marker_location(location)
+    if not marker.exists() or not Path(location).exists():
+        return None
+    content = json.loads(marker.read_text())
+    stat = Path(location).stat()
+    if content["size"] != stat.st_size or content["mtime_ns"] != stat.st_mtime_ns:
+        return None  # rewritten since it was marked
+    return content["sorted_by"]
+
+
+def sink_sorted(data: pl.LazyFrame, location: str, by: Sequence[str] = SORT_KEY) -> None:
+    """Sinks `data` sorted by `by` to the Arrow file `location`, and marks it as such."""
+    temp_location = f"{location}.{os.getpid()}.tmp"
+    data.sort(list(by)).sink_ipc(temp_location)
+    os.replace(temp_location, location)
+    mark_sorted(location, by)
+
+
+def read_batches(location: str, batch_rows: int) -> Iterator[pl.DataFrame]:
+    data = pl.scan_ipc(location)
+    offset = 0
+    while True:
+        batch = data.slice(offset, batch_rows).collect()
+        if not batch.height:
+            return
+        yield batch
+        offset += batch.height
+
+
+def _at_most(by: Sequence[str], bound: tuple) -> pl.Expr:
+    # (by) <= bound in the order of `sort()`, i.e. nulls first
+    at_most = pl.lit(True)
+    for column, value in reversed(list(zip(by, bound))):
+        if value is None:
+            less, equal = pl.lit(False), pl.col(column).is_null()
+        else:
+            less = pl.col(column).is_null() | (pl.col(column) < value).fill_null(False)
+            equal = (pl.col(column) == value).fill_null(False)
+        at_most = less | (equal & at_most)
+    return at_most
+
+
+def _drop_adjacent_duplicates(data: pl.DataFrame, by: Sequence[str]) -> pl.DataFrame:
+    first = pl.int_range(pl.len()) == 0
+    changed = pl.any_horizontal([pl.col(column).ne_missing(pl.col(column).shift(1)) for column in by])
+    return data.filter(first | changed)
+
+
+def merge_sorted_unique(
+    locations: Sequence[str],
+    output_location: str,
+    by: Sequence[str] = SORT_KEY,
+    batch_rows: int = BATCH_ROWS,
+) -> int:
+    """
+    Merges the Arrow files `locations`, each sorted by `by`, into `output_location`, sorted by `by`
+    and without duplicates on `by`.
+
+    Each input is read `batch_rows` rows at a time.  At every step all the buffered rows up to the
+    smallest of the last keys of the inputs which are not yet exhausted are merged and written out:
+    any later row is greater or equal, so the duplicates of these rows are all among them, or equal
+    to the last row written.
+
+    Returns:
+        int: the number of rows written
+    """
+    by = list(by)
+    schema = pl.scan_ipc(locations[0]).collect_schema()
+    key_schema = {column: schema[column] for column in by}
+    inputs = [read_batches(location, batch_rows) for location in locations]
+    buffers = [next(batches, None) for batches in inputs]
+
+    parts_location = Path(f"{output_location}.{os.getpid()}.parts")
+    parts_location.mkdir(parents=True, exist_ok=True)
+    parts, rows, last_key = [], 0, None
+    try:
+        while any(buffer is not None for buffer in buffers):
+            pending = [i for i, buffer in enumerate(buffers) if buffer is not None]
+            last_keys = pl.concat([buffers[i].tail(1).select(by).cast(key_schema) for i in pending]).sort(by)
+            bound = last_keys.row(0)
+
+            chunks = []
+            for i in pending:
+                buffer = buffers[i].select([pl.col(name).cast(dtype) for name, dtype in schema.items()])
+                up_to_bound = buffer.select(_at_most(by, bound)).to_series()
+                chunks.append(buffer.filter(up_to_bound))
+                buffers[i] = buffer.filter(~up_to_bound)
+                if not buffers[i].height:
+                    buffers[i] = next(inputs[i], None)
+
+            chunk = _drop_adjacent_duplicates(pl.concat(chunks).sort(by), by)
+            # the next batch of an input may start with the key its previous batch ended with
+            if chunk.height and chunk.select(by).row(0) == last_key:
+                chunk = chunk.slice(1)
+            if chunk.height:
+                last_key = chunk.select(by).row(-1)
+                part_location = str(parts_location / f"{len(parts):06d}.arrow")
+                chunk.write_ipc(part_location)
+                parts.append(part_location)
+                rows += chunk.height
+
+        temp_location = f"{output_location}.{os.getpid()}.tmp"
+        if parts:
+            pl.scan_ipc(parts).sink_ipc(temp_location)
+        else:
+            pl.DataFrame(schema=schema).write_ipc(temp_location)
+        os.replace(temp_location, output_location)
+    finally:
+        shutil.rmtree(parts_location, ignore_errors=True)
+
+    mark_sorted(output_location, by)
+    return rows
+
+
+def merge_files(
+    locations: Sequence[str],
+    output_location: str,
+    log_locations: Sequence[str] = (),
+    output_log_location: Optional[str] = None,
+    dedup_on: Sequence[str] = DEDUPLICATION_OPTIONS,
+    batch_rows: int = BATCH_ROWS,
+    max_workers: int = 4,
+    spill_location: Optional[str] = None,
+) -> List[str]:
+    """
+    Merges the processed Arrow files `locations` into `output_location`, deduplicated on `dedup_on`
+    and sorted by `dedup_on`.  The log of the merge refers to the logs of the inputs
+    (`log_locations`), and the merge is recorded in the run log.
+
+    With a sort-merge (`merge_sorted_unique()`) if every input is marked as sorted by `dedup_on`,
+    otherwise out of core, by `max_workers` hash partitions at a time, spilled to `spill_location`
+    (see `bi_py.partitioned_dedup.partitioned_unique()`).
+
+    Returns:
+        list: the log, also written to `output_log_location` if given
+    """
+    dedup_on = list(dedup_on)
+    rows_in = sum(pl.scan_ipc(location).select(pl.len()).collect().item() for location in locations)
+    Path(output_location).parent.mkdir(parents=True, exist_ok=True)
+
+    with run_log.stage("merge_files", inputs=locations, outputs=[output_location], rows_in=rows_in, dedup_on=dedup_on) as event:
+        if all(sorted_by(location) == dedup_on for location in locations):
+            method = "sort-merge"
+            rows_out = merge_sorted_unique(locations, output_location, dedup_on, batch_rows)
+        else:
+            from bi_py.partitioned_dedup import partitioned_unique
+
+            method = "partitioned hash"
+            rows_out = partitioned_unique(locations, output_location, dedup_on, max_workers=max_workers, spill_location=spill_location)
+        event["rows_out"] = rows_out
+        event["details"]["method"] = method
+
+    # the logs of the inputs are referred to, not copied (see `bi_py.run_log`)
+    log = [
+        f"{datetime.now()}: Merged {location}" + (f", see {log_location}" if log_location else "")
+        for location, log_location in zip_longest(locations, log_locations[:len(locations)])
+    ]
+    log.append(
+        f"{datetime.now()}: Merged {len(locations)} files ({rows_in} rows) and deduplicated on {dedup_on} ({method}): "
+        f"{rows_out} rows, {rows_in - rows_out} duplicates removed"
+    )
+    if output_log_location is not None:
+        Path(output_log_location).write_text("\n".join(log) + "\n")
+    return log
@@ -0,0 +1,196 @@
+"""
+Content-addressed cache for the per-file process/clean stages of NB#2 to NB#5.
+
+Historical cuts (e.g. Discovery 2022_04, Barts 2022_03) never change but were re-processed at
+every release.  A cache entry is keyed on everything which determines the output of a stage:
+
+- the content (sha256) of the raw file(s)
+- the column maps and deduplication options passed to `process_dataset()`
+- `date_start` of `remove_unrealistic_dates()`
+- the content of `clean_demographics.arrow`
+- the tretools version
+- `transform_version()`, a hash of the source of bi_py's own transforms of the data
+  (`TRANSFORM_MODULES`), so that any change to them invalidates the cache without anyone having
+  to remember to bump a version number
+
+`date_end` is deliberately not part of the key because it is usually "today": instead each entry
+records the `date_end` it was made with and the latest event date in the processed data.  The
+entry remains valid for a new `date_end` if neither the old nor the new `date_end` removed any
+event, i.e. if both are after the latest event date.
+
+On a hit, the files saved by the original run (`processed_data/*.arrow`, `clean_processed_data/*.arrow`
+and their logs) are reused: in place if the output location is unchanged, otherwise hard-linked
+(or copied) into the new location, e.g. a new release directory.
+
+Raw file digests are memoised on (path, size, modification time) so that unchanged multi-GB raw
+files are only read once.
+"""
+
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Sequence, Union
+
+from bi_py.sorted_merge import marker_location
+
+CACHE_FORMAT_VERSION = 1
+# the modules whose code determines the processed data
+TRANSFORM_MODULES = ("bi_py.dates", "bi_py.ingestion", "bi_py.person", "bi_py.processing", "bi_py.snomed")
+
+PathLike = Union[str, os.PathLike]
+
+
+def _atomic_write_json(path: Path, content: dict) -> None:
+    # several worker processes may share the cache; never leave a half-written file behind
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    temp_path.write_text(json.dumps(content, indent=2, sort_keys=True, default=str))
+    os.replace(temp_path, path)
+
+
+def _as_iso_date(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, (datetime, date)):
+        return value.strftime("%Y-%m-%d")
+    return str(value)[:10]
+
+
+def transform_version(modules: Sequence[str] = TRANSFORM_MODULES) -> str:
+    """sha256 of the source of `modules` (found, not imported)."""
+    digest = hashlib.sha256()
+    for module in modules:
+        spec = importlib.util.find_spec(module)
+        if spec is None or spec.origin is None:
+            raise ModuleNotFoundError(f"No source for the transform module {module!r}")
+        digest.update(module.encode())
+        digest.update(Path(spec.origin).read_bytes())
+    return digest.hexdigest()
+
+
+def tretools_version() -> str:
+    try:
+        from importlib.metadata import version
+        return version("tretools")
+    except Exception:
+        return "unknown"
+
+
+class StageCache:
+    def __init__(self, cache_location: PathLike) -> None:
+        self.cache_path = Path(cache_location)
+        self.entries_path = self.cache_path / "entries"
+        self.digests_path = self.cache_path / "digests"
+        self.entries_path.mkdir(parents=True, exist_ok=True)
+        self.digests_path.mkdir(parents=True, exist_ok=True)
+
+    def file_digest(self, location: PathLike, chunk_size: int = 16 * 1024 * 1024) -> str:
+        """sha256 of a file's content, memoised on (path, size, modification time)."""
+        path = Path(location).resolve()
+        stat = path.stat()
+        memo_path = self.digests_path / (hashlib.sha256(str(path).encode()).hexdigest() + ".json")
+        if memo_path.exists():
+            memo = json.loads(memo_path.read_text())
+            if memo["size"] == stat.st_size and memo["mtime_ns"] == stat.st_mtime_ns:
+                return memo["sha256"]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+
+        _atomic_write_json(
+            memo_path,
+            {"path": str(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest.hexdigest()},
+        )
+        return digest.hexdigest()
+
+    def key(
+        self,
+        raw_locations: Iterable[PathLike],
+        column_maps: dict,
+        deduplication_options: list,
+        date_start,
+        demographics_location: PathLike,
+        **other_options,
+    ) -> str:
+        """
+        Cache key of a stage.  `other_options` is for anything else which changes the output
+        (dataset_type, coding_system, nhs_digital_subtype...); values must be JSON serialisable.
+        """
+        key_content = {
+            "cache_format_version": CACHE_FORMAT_VERSION,
+            "transform_version": transform_version(TRANSFORM_MODULES),
+            "tretools_version": tretools_version(),
+            "raw_files": sorted(self.file_digest(location) for location in raw_locations),
+            "column_maps": column_maps,
+            "deduplication_options": list(deduplication_options),
+            "date_start": _as_iso_date(date_start),
+            "demographics": self.file_digest(demographics_location),
+            **other_options,
+        }
+        return hashlib.sha256(json.dumps(key_content, sort_keys=True, default=str).encode()).hexdigest()
+
+    def lookup(self, key: str, date_end, outputs: Dict[str, PathLike]) -> bool:
+        """
+        Returns True if the stage can be skipped, in which case every file in `outputs`
+        (name -> location) now holds the cached result.
+        """
+        entry_path = self.entries_path / f"{key}.json"
+        if not entry_path.exists():
+            return False
+        entry = json.loads(entry_path.read_text())
+
+        date_end = _as_iso_date(date_end)
+        max_event_date = entry["max_event_date"]
+        if date_end != entry["date_end"] and not (
+            max_event_date is not None
+            and entry["date_end"] > max_event_date
+            and date_end > max_event_date
+        ):
+            return False
+
+        if set(outputs) != set(entry["outputs"]):
+            return False
+        for name, cached in entry["outputs"].items():
+            cached_path = Path(cached["location"])
+            if not cached_path.exists() or self.file_digest(cached_path) != cached["sha256"]:
+                return False  # cached output deleted or overwritten since
+
+        for name, location in outputs.items():
+            cached_path = Path(entry["outputs"][name]["location"])
+            target_path = Path(location)
+            if target_path.exists() and target_path.resolve() == cached_path.resolve():
+                continue
+            target_path.parent.mkdir(parents=True, exist_ok=True)
+            if target_path.exists():
+                target_path.unlink()
+            try:
+                os.link(cached_path, target_path)
+            except OSError:
+                shutil.copy2(cached_path, target_path)
+            # a linked or copied file keeps its size and modification time, hence its sorted marker
+            if marker_location(cached_path).exists():
+                shutil.copy2(marker_location(cached_path), marker_location(target_path))
+        return True
+
+    def store(self, key: str, date_end, max_event_date, outputs: Dict[str, PathLike], **description) -> None:
+        """Records the outputs of a stage which has just been run.  `description` is informative only."""
+        _atomic_write_json(
+            self.entries_path / f"{key}.json",
+            {
+                "key": key,
+                "created": datetime.now(),
+                "date_end": _as_iso_date(date_end),
+                "max_event_date": _as_iso_date(max_event_date),
+                "outputs": {
+                    name: {"location": str(Path(location).resolve()), "sha256": self.file_digest(location)}
+                    for name, location in outputs.items()
+                },
+                "description": description,
+            },
+        )
@@ -0,0 +1,631 @@
+"""
+Synthetic raw extracts shaped like the Genes & Health ones, to benchmark the pipeline outside the TRE.
+
+The real extracts never leave the TRE, so the cost of a change to the pipeline could only be
+measured there, one release at a time.  `generate()` writes a tree of raw files with the layouts
+(file names, columns, separators, date formats) the notebooks read, for a cohort `SCALES` times the
+size of the current one:
+
+    <root>/synthetic.json                                  # scale, people, seed, rows of every file
+    <root>/demographics/2025_04_25__S1QSTredacted.csv      # and 2025_02_10__MegaLinkage_forTRE.csv
+    <root>/primary_care/<path of every file of Code/manifests/discovery.json>
+    <root>/primary_care/discovery.json                     # the manifest, input_location = <root>/primary_care
+    <root>/barts_health/2024_09_ResearchDataset/RDE_*.ascii.redacted.tab
+    <root>/bradford/2021_02_BTHFT_ICD10_OPCS/*.xlsx
+    <root>/nhs_digital/2023_07/NIC338864_HES_{APC,OP}_*.txt, FILE0138006_NIC338864_CIVREG_MORT_.txt
+    <root>/nhs_digital/2023_07/ECDS/NIC338864_ECDS_2023_07_*.txt
+    <root>/mapping/snomed_to_icd_map.tsv
+    <root>/codelists/custom_phenotypes.csv
+
+The values are random, but shaped like the real ones where it matters to the cost of the pipeline:
+
+- the codes of each coding system follow a Zipf distribution, so a few codes hold most of the
+  events (and of the trait files of NB#7 and NB#8)
+- the number of events per person is heavy-tailed; a few percent of the events are of people who
+  are not in the demographics, or have no NHS number
+- the dates lean towards the release; a few are before 1910 or in the future
+- a few percent of the rows are exact duplicates, and the Discovery cuts overlap as the real ones
+  do: each holds every event of its stream up to the date of the cut
+- the files have the columns the pipeline does not read, so that projection matters
+
+The rows per person of each file (`rows_per_person`) are estimates of the 2025 release, not
+counts.  Every value is derived from `seed` with polars' hash (no numpy), so a scale and seed always
+give the same files.  From the `Code` directory:
+
+    python -m bi_py.synthetic /tmp/gh_synthetic --scale 5x
+    python -m bi_py.synthetic /tmp/gh_synthetic_smoke --scale 1x --fraction 0.01
+"""
+
+import argparse
+import hashlib
+import json
+import string
+import sys
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import polars as pl
+
+from bi_py.manifest import active_cuts, load_manifest
+from bi_py.nhs_digital import ECDS_CONFIG, nhs_digital_config
+
+COHORT = 55_000
+SCALES = {"1x": 1, "5x": 5, "20x": 20}
+RELEASE_DATE = date(2025, 5, 1)
+METADATA_FILE = "synthetic.json"
+# part of the metadata; bumped whenever generate() writes different files for the same seed
+GENERATOR_VERSION = 1
+
+BATCH_ROWS = 1_000_000
+DUPLICATE_RATE = 0.05
+OUTSIDE_RATE = 0.03  # events of people who are not in the demographics
+NULL_NHS_NUMBER_RATE = 0.002
+UNREALISTIC_DATE_RATE = 0.003
+MEAN_EVENT_AGE_DAYS = 8 * 365
+ZIPF_EXPONENT = 1.1
+ACTIVITY_TAIL = 1.5  # Pareto index of the events per person
+SNOMED_CODES = 40_000
+MAPPED_SNOMED_SHARE = 0.1
+
+MANIFEST_LOCATION = Path(__file__).resolve().parents[1] / "manifests" / "discovery.json"
+BARTS_LOCATION = "barts_health/2024_09_ResearchDataset"
+BRADFORD_LOCATION = "bradford/2021_02_BTHFT_ICD10_OPCS"
+NHS_DIGITAL_LOCATION = "nhs_digital/2023_07"
+
+
+class Layout(NamedTuple):
+    """One raw file: its columns, by what they hold, and how it is written."""
+    source: str
+    path: str  # relative to the root
+    # column -> "nhs_number", "code", "term" or "date"; "" for the columns the pipeline does not read
+    columns: Dict[str, str]
+    coding_system: str  # "SNOMED", "ICD10" or "OPCS4"
+    rows_per_person: float  # per person of the cohort
+    coverage: float = 1.0  # the share of the cohort with events in the source
+    separator: str = ","
+    date_format: str = "%Y-%m-%d"
+    code_format: str = "plain"  # ICD-10: "plain" (E119), "dotted" (E11.9) or "hes" (E11X for a 3-character code)
+    choices: Dict[str, Sequence[str]] = {}  # column -> values drawn uniformly, e.g. Confirmation
+    # (column, {value -> coding system}): the coding system of each row, e.g. Catalogue
+    catalogue: Optional[Tuple[str, Dict[str, str]]] = None
+    wide: Sequence[str] = ()  # code columns of a row, e.g. the DIAG_4_nn of an HES episode
+    codes_per_row: float = 1.0  # mean number of the `wide` columns filled
+    missing_date: Optional[str] = None  # token written for ~1% of the dates
+    stream: Optional[str] = None  # files of the same stream hold the same events (by default the path)
+    as_of: Optional[date] = None  # only the events up to this date
+    share: Tuple[int, int] = (0, 1)  # only the people with index % share[1] == share[0]
+
+
+BARTS_LAYOUTS = [
+    Layout(
+        "barts_health", f"{BARTS_LOCATION}/RDE_MSDS_Diagnosis.ascii.redacted.tab",
+        {"PseudoNHS_2024-07-10": "nhs_number", "DiagScheme": "", "Diagnosis": "code", "DiagDate": "date",
+         "LocalFetalID": "", "FetalOrder": "", "SnomedCD": "code", "DiagDesc": "term"},
+        "SNOMED", 0.3, coverage=0.2, separator="\t", date_format="%d/%m/%Y %H:%M",
+    ),
+    Layout(
+        "barts_health", f"{BARTS_LOCATION}/RDE_PC_DIAGNOSIS.ascii.redacted.tab",
+        {"PseudoNHS_2024-07-10": "nhs_number", "Diagnosis": "term", "Confirmation": "", "DiagDt": "date",
+         "Classification": "", "ClinService": "", "DiagType": "", "DiagCode": "code", "Vocab": "", "Axis": ""},
+        "SNOMED", 6, coverage=0.6, separator="\t", date_format="%d/%m/%Y %H:%M",
+        choices={"Confirmation": ["Confirmed", "Confirmed", "Confirmed", "Differential", "Provisional"]},
+    ),
+    Layout(
+        "barts_health", f"{BARTS_LOCATION}/RDE_OP_DIAGNOSIS.ascii.redacted.tab",
+        {"PseudoNHS_2024-07-10": "nhs_number", "ICD_Diagnosis_Num": "", "ICD_Diagnosis_Cd": "code",
+         "ICD_Diag_Desc": "term", "NHS_Number": "", "Activity_date": "date", "CDS_Activity_Dt": ""},
+        "ICD10", 3, coverage=0.5, separator="\t", date_format="%d/%m/%Y",
+    ),
+    Layout(
+        "barts_health", f"{BARTS_LOCATION}/RDE_PC_PROBLEMS.ascii.redacted.tab",
+        {"PseudoNHS_2024-07-10": "nhs_number", "Problem": "term", "Annot_Disp": "term", "Confirmation": "",
+         "Classification": "", "OnsetDate": "date", "StatusDate": "", "Stat_LifeCycle": "", "LifeCycleCancReson": "",
+         "Vocab": "", "Axis": "", "SecDesc": "", "ProbCode": "code"},
+        "SNOMED", 8, coverage=0.6, separator="\t", date_format="%Y-%m-%d %H:%M",
+        choices={
+            "Confirmation": ["Confirmed", "Confirmed", "Confirmed", "Provisional"],
+            "Vocab": ["SNOMED CT"] * 9 + ["Local"],
+            "Stat_LifeCycle": ["Active", "Resolved", "Inactive"],
+        },
+    ),
+    Layout(
+        "barts_health", f"{BARTS_LOCATION}/RDE_PC_PROCEDURES.ascii.redacted.tab",
+        {"PseudoNHS_2024-07-10": "nhs_number", "AdmissionDT": "", "DischargeDT": "", "TreatmentFunc": "",
+         "Specialty": "", "ProcDt": "date", "ProcDetails": "term", "ProcCD": "code", "ProcType": "", "EncType": "",
+         "Comment": ""},
+        "SNOMED", 3, coverage=0.4, separator="\t", date_format="%d/%m/%Y %H:%M",
+        catalogue=("ProcType", {"SNOMED CT": "SNOMED", "OPCS4": "OPCS4"}),
+        choices={"EncType": ["Inpatient", "Outpatient", "Day Case"]},
+    ),
+    Layout(
+        "barts_health", f"{BARTS_LOCATION}/RDE_OPA_OPCS.ascii.redacted.tab",
+        {"PseudoNHS_2024-07-10": "nhs_number", "OPCS_Proc_Num": "", "OPCS_Proc_Scheme_Cd": "",
+         "OPCS_Proc_Cd": "code", "Proc_Desc": "term", "OPCS_Proc_Dt": "date", "CDS_Activity_Dt": ""},
+        "OPCS4", 2, coverage=0.4, separator="\t", date_format="%d/%m/%Y %H:%M",
+    ),
+    Layout(
+        "barts_health", f"{BARTS_LOCATION}/RDE_APC_OPCS.ascii.redacted.tab",
+        {"PseudoNHS_2024-07-10": "nhs_number", "OPCS_Proc_Num": "", "OPCS_Proc_Scheme_Cd": "",
+         "OPCS_Proc_Cd": "code", "Proc_Desc": "term", "OPCS_Proc_Dt": "date", "Activity_date": "",
+         "CDS_Activity_Dt": ""},
+        "OPCS4", 3, coverage=0.4, separator="\t", date_format="%d/%m/%Y %H:%M",
+    ),
+    Layout(
+        "barts_health", f"{BARTS_LOCATION}/RDE_APC_DIAGNOSIS.ascii.redacted.tab",
+        {"PseudoNHS_2024-07-10": "nhs_number", "ICD_Diagnosis_Num": "", "ICD_Diagnosis_Cd": "code",
+         "ICD_Diag_Desc": "term", "Activity_date": "date", "CDS_Activity_Dt": ""},
+        "ICD10", 8, coverage=0.5, separator="\t", date_format="%d/%m/%Y %H:%M",
+    ),
+    Layout(
+        "barts_health", f"{BARTS_LOCATION}/RDE_ALL_PROCEDURES.ascii.redacted.tab",
+        {"PseudoNHS_2024-07-10": "nhs_number", "Procedure_Code": "code", "Catalogue": "", "Code_text": "term",
+         "Procedure_note": "term", "Procedure_date": "date"},
+        "SNOMED", 6, coverage=0.5, separator="\t", date_format="%d/%m/%Y %H:%M",
+        catalogue=("Catalogue", {"SNOMED CT": "SNOMED", "OPCS4": "OPCS4", "ICD10WHO": "ICD10"}),
+        missing_date="1899-12-30 00:00",
+    ),
+]
+
+BRADFORD_LAYOUTS = [
+    Layout(
+        "bradford", f"{BRADFORD_LOCATION}/icd10_bfs_1578_2021-02-02_deident.xlsx",
+        {"pseudonhs": "nhs_number", "icd10_code": "code", "icd10_name": "term", "episode_start_date": "date",
+         "episode_end_date": ""},
+        "ICD10", 0.4, coverage=0.05, code_format="dotted",
+    ),
+    Layout(
+        "bradford", f"{BRADFORD_LOCATION}/opcs_bfd_1578_2021-02-02_deident.xlsx",
+        {"pseudonhs": "nhs_number", "opcs_code": "code", "opcs_procedure_description": "term",
+         "episode_start_date": "date", "episode_end_date": ""},
+        "OPCS4", 0.2, coverage=0.05,
+    ),
+]
+
+# the layouts of tretools' configs/NHS_D/*.json (nhs_number, date, column_to_expand), if tretools is not installed
+NHS_DIGITAL_CONFIGS = {
+    "APC": {"nhs_number": "STUDY_ID", "date": "ADMIDATE", "column_to_expand": [f"DIAG_4_{i:02d}" for i in range(1, 21)]},
+    "OP": {"nhs_number": "STUDY_ID", "date": "APPTDATE", "column_to_expand": [f"DIAG_4_{i:02d}" for i in range(1, 13)]},
+    "CIV_REG": {
+        "nhs_number": "STUDY_ID",
+        "date": "REG_DATE_OF_DEATH",
+        "column_to_expand": ["S_UNDERLYING_COD_ICD10", *[f"S_COD_CODE_{i}" for i in range(1, 16)]],
+    },
+}
+NHS_DIGITAL_FILES = {
+    # subtype: (file, episodes per person, coverage, mean codes per episode, columns not read)
+    "APC": ("NIC338864_HES_APC_2023_07.txt", 2.5, 0.8, 3.0, ["EPIKEY", "ADMIMETH", "ADMISORC", "EPIORDER", "PROCODE3", "SPELDUR"]),
+    "OP": ("NIC338864_HES_OP_2023_07.txt", 4, 0.8, 1.2, ["ATTENDKEY", "ATTENDED", "FIRSTATT", "MAINSPEF", "PROCODE3"]),
+    "CIV_REG": ("FILE0138006_NIC338864_CIVREG_MORT_.txt", 0.03, 0.03, 3.0, ["DEC_AGEC", "POD_CODE", "REG_STAT_DOD"]),
+}
+
+ECDS_FILES = 3  # the ECDS extracts of a cut, split by person
+ECDS_COLUMNS_NOT_READ = ["EC_IDENT", "ARRIVAL_TIME", "ARRIVAL_MODE", "DISCHARGE_DESTINATION", "PROVIDER_CODE"]
+
+DISCOVERY_ROWS_PER_PERSON = {"observations": 180, "procedures": 12}
+DISCOVERY_COLUMNS_NOT_READ = [
+    "id", "organization_id", "patient_id", "person_id", "encounter_id", "practitioner_id",
+    "problem_end_date", "result_value", "result_value_units", "age_at_event", "is_problem", "is_review",
+]
+
+S1QST_FILE = "2025_04_25__S1QSTredacted.csv"
+MEGA_LINKAGE_FILE = "2025_02_10__MegaLinkage_forTRE.csv"
+MAPPING_FILE = "snomed_to_icd_map.tsv"
+CUSTOM_CODELIST_FILE = "custom_phenotypes.csv"
+CUSTOM_PHENOTYPES = 40
+
+
+def _seed(seed: int, *keys) -> int:
+    return int.from_bytes(hashlib.sha256(json.dumps([seed, *keys]).encode()).digest()[:8], "little") >> 1
+
+
+def _uniform(n: int, seed: int, offset: int = 0) -> pl.Series:
+    """`n` floats in [0, 1): those of rows `offset` to `offset + n` of the stream `seed`."""
+    bits = pl.int_range(offset, offset + n, dtype=pl.UInt64, eager=True).hash(seed) // 2048
+    return bits.cast(pl.Float64) / 2.0**53
+
+
+def _zipf_cdf(n: int) -> pl.Series:
+    weights = pl.int_range(1, n + 1, eager=True).cast(pl.Float64) ** -ZIPF_EXPONENT
+    return weights.cum_sum() / weights.sum()
+
+
+def _draw(cdf: pl.Series, u: pl.Series) -> pl.Series:
+    """The indices drawn by `u` from the distribution of cumulative probabilities `cdf`."""
+    return cdf.search_sorted(u).clip(0, len(cdf) - 1)
+
+
+def vocabulary(coding_system: str, seed: int = 0) -> pl.DataFrame:
+    """The codes (undotted) and terms of `coding_system`, most frequent first."""
+    if coding_system == "ICD10":
+        three = [f"{letter}{number:02d}" for letter in string.ascii_uppercase if letter != "U" for number in range(100)]
+        codes = pl.Series(three + [f"{code}{digit}" for code in three for digit in range(10)])
+    elif coding_system == "OPCS4":
+        codes = pl.Series(
+            [f"{letter}{number:02d}{digit}" for letter in string.ascii_uppercase if letter not in "IU" for number in range(1, 100) for digit in range(10)]
+        )
+    elif coding_system == "SNOMED":
+        ids = pl.int_range(0, SNOMED_CODES, dtype=pl.UInt64, eager=True).hash(_seed(seed, "snomed")) % 10**12 + 10**5
+        codes = ids.unique(maintain_order=True).cast(pl.Utf8)
+    else:
+        raise ValueError(f"No synthetic vocabulary for {coding_system}")
+    return (
+        pl.DataFrame({"code": codes})
+        .with_columns(pl.format("Synthetic {} concept {}", pl.lit(coding_system), pl.col("code")).alias("term"))
+        .sort(pl.col("code").hash(_seed(seed, "ranks", coding_system)))
+    )
+
+
+def _format_code(code: pl.Expr, coding_system: str, code_format: str) -> pl.Expr:
+    if coding_system != "ICD10" or code_format == "plain":
+        return code
+    if code_format == "dotted":
+        return pl.when(code.str.len_chars() == 4).then(pl.concat_str(code.str.slice(0, 3), pl.lit("."), code.str.slice(3))).otherwise(code)
+    if code_format == "hes":
+        return pl.when(code.str.len_chars() == 3).then(code + "X").otherwise(code)
+    raise ValueError(f"Unknown code format {code_format}")
+
+
+class Cohort(NamedTuple):
+    people: int
+    nhs_numbers: pl.Series  # of the people, then of those who are not in the demographics
+    activity: pl.Series  # relative number of events of each person
+    seed: int
+
+
+def cohort(people: int, seed: int = 0) -> Cohort:
+    outside = max(1, round(people * OUTSIDE_RATE))
+    nhs_numbers = pl.Series(
+        "nhs_number", [hashlib.sha256(f"{seed}:{i}".encode()).hexdigest().upper() for i in range(people + outside)]
+    )
+    activity = ((1 - _uniform(people, _seed(seed, "activity"))) ** (-1 / ACTIVITY_TAIL)).clip(upper_bound=100.0)
+    return Cohort(people, nhs_numbers, activity, seed)
+
+
+class _Generator:
+    def __init__(self, cohort: Cohort):
+        self.cohort = cohort
+        self._vocabularies = {}
+        self._people_cdfs = {}
+
+    def vocabulary(self, coding_system: str) -> Tuple[pl.DataFrame, pl.Series]:
+        if coding_system not in self._vocabularies:
+            codes = vocabulary(coding_system, self.cohort.seed)
+            self._vocabularies[coding_system] = (codes, _zipf_cdf(codes.height))
+        return self._vocabularies[coding_system]
+
+    def people_cdf(self, source: str, coverage: float) -> pl.Series:
+        if (source, coverage) not in self._people_cdfs:
+            covered = _uniform(self.cohort.people, _seed(self.cohort.seed, "coverage", source)) < coverage
+            weights = pl.select(pl.when(covered).then(self.cohort.activity).otherwise(0.0)).to_series()
+            self._people_cdfs[(source, coverage)] = weights.cum_sum() / weights.sum()
+        return self._people_cdfs[(source, coverage)]
+
+    def codes(self, coding_system: str, code_format: str, u: pl.Series) -> pl.DataFrame:
+        codes, cdf = self.vocabulary(coding_system)
+        return codes.select(pl.all().gather(_draw(cdf, u))).with_columns(_format_code(pl.col("code"), coding_system, code_format))
+
+    def rows(self, layout: Layout, offset: int, n: int) -> pl.DataFrame:
+        """Rows `offset` to `offset + n` of the file's stream (before `as_of` and `share`), dates not yet formatted."""
+        stream = _seed(self.cohort.seed, layout.stream or layout.path)
+
+        def u(*keys) -> pl.Series:
+            return _uniform(n, _seed(stream, *keys), offset)
+
+        person = _draw(self.people_cdf(layout.source, layout.coverage), u("person")).cast(pl.UInt32)
+        outside = self.cohort.people + (u("outside_person") * (len(self.cohort.nhs_numbers) - self.cohort.people)).cast(pl.UInt32)
+        person = pl.select(pl.when(u("outside") < OUTSIDE_RATE).then(outside).otherwise(person)).to_series()
+
+        event_date = (
+            pl.when(pl.col("_unrealistic") < UNREALISTIC_DATE_RATE / 2)
+            .then(pl.lit(date(1900, 1, 1)) + pl.duration(days=pl.col("_unrealistic_days")))
+            .when(pl.col("_unrealistic") < UNREALISTIC_DATE_RATE)
+            .then(pl.lit(RELEASE_DATE) + pl.duration(days=pl.col("_unrealistic_days") // 5))
+            .otherwise(pl.lit(RELEASE_DATE) - pl.duration(days=pl.col("_days_back")))
+            .cast(pl.Datetime("us"))
+            + pl.duration(minutes=pl.col("_minutes"))
+        )
+        if layout.missing_date is not None:
+            event_date = pl.when(pl.col("_missing_date") >= 0.01).then(event_date)
+        events = pl.DataFrame({
+            "_person": person,
+            "_row": pl.int_range(offset, offset + n, dtype=pl.UInt64, eager=True),
+            "_null_nhs_number": u("null_nhs_number") < NULL_NHS_NUMBER_RATE,
+            "_days_back": (-(1 - u("date")).log() * MEAN_EVENT_AGE_DAYS).cast(pl.Int32),
+            "_unrealistic": u("unrealistic"),
+            "_unrealistic_days": (u("unrealistic_days") * 3650).cast(pl.Int32),
+            "_minutes": (u("minutes") * 1440).cast(pl.Int32),
+            "_missing_date": u("missing_date"),
+            "_duplicate": u("duplicate") < DUPLICATE_RATE,
+        }).with_columns(
+            pl.when(~pl.col("_null_nhs_number")).then(pl.lit(self.cohort.nhs_numbers).gather(pl.col("_person"))).alias("nhs_number"),
+            event_date.alias("date"),
+        )
+
+        if layout.catalogue is not None:
+            column, systems = layout.catalogue
+            values = list(systems)
+            # the first value is the most frequent
+            catalogue = pl.Series(column, values)[(u("catalogue") ** 2 * len(values)).cast(pl.UInt32)]
+            drawn = {system: self.codes(system, layout.code_format, u("code", system)) for system in set(systems.values())}
+            events = events.with_columns(
+                catalogue,
+                *[
+                    pl.coalesce([pl.when(catalogue == value).then(drawn[system][role]) for value, system in systems.items()]).alias(role)
+                    for role in ("code", "term")
+                ],
+            )
+        elif layout.wide:
+            filled = 1 + (-(1 - u("codes_per_row")).log() * (layout.codes_per_row - 1)).cast(pl.Int32)
+            events = events.with_columns(
+                pl.when(filled > i).then(self.codes(layout.coding_system, layout.code_format, u("code", i))["code"]).alias(column)
+                for i, column in enumerate(layout.wide)
+            )
+        else:
+            events = events.hstack(self.codes(layout.coding_system, layout.code_format, u("code")))
+
+        # the files of a cut are split by person; a cut of the stream holds its events up to the
+        # date of the cut (and the few in the future)
+        events = events.filter(pl.col("_person") % layout.share[1] == layout.share[0])
+        if layout.as_of is not None:
+            events = events.filter(pl.col("date").is_null() | (pl.col("date").dt.date() <= layout.as_of) | (pl.col("date").dt.date() > RELEASE_DATE))
+
+        columns = []
+        for column, role in layout.columns.items():
+            if role in ("nhs_number", "code", "term", "date"):
+                columns.append(pl.col(role).alias(column))
+            elif column in layout.choices:
+                choices = dict(enumerate(layout.choices[column]))
+                columns.append((pl.col("_row").hash(_seed(stream, column)) % len(choices)).replace_strict(choices, return_dtype=pl.Utf8).alias(column))
+            elif column in events.columns:
+                columns.append(pl.col(column))
+            else:
+                columns.append(pl.col("_row").hash(_seed(stream, column)).cast(pl.Utf8).str.slice(0, 8).alias(column))
+        columns.extend(pl.col(column) for column in layout.wide)
+        return pl.concat([events, events.filter(pl.col("_duplicate"))]).select(columns)
+
+
+def _batches(generator: _Generator, layout: Layout, people: int):
+    # the rows of the whole stream, of which the file keeps its `share`
+    rows = round(layout.rows_per_person * people * layout.share[1])
+    for offset in range(0, rows, BATCH_ROWS):
+        yield generator.rows(layout, offset, min(BATCH_ROWS, rows - offset))
+
+
+def _write_text(generator: _Generator, layout: Layout, location: Path) -> int:
+    date_columns = [column for column, role in layout.columns.items() if role == "date"]
+    location.parent.mkdir(parents=True, exist_ok=True)
+    written = 0
+    with open(location, "wb") as f:
+        for i, batch in enumerate(_batches(generator, layout, generator.cohort.people)):
+            batch = batch.with_columns(pl.col(date_columns).dt.strftime(layout.date_format))
+            if layout.missing_date is not None:
+                batch = batch.with_columns(pl.col(date_columns).fill_null(layout.missing_date))
+            batch.write_csv(f, separator=layout.separator, include_header=i == 0)
+            written += batch.height
+    return written
+
+
+def _write_xlsx(generator: _Generator, layout: Layout, location: Path) -> int:
+    from openpyxl import Workbook
+
+    location.parent.mkdir(parents=True, exist_ok=True)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(list(layout.columns))
+    written = 0
+    date_columns = [column for column, role in layout.columns.items() if role == "date"]
+    for batch in _batches(generator, layout, generator.cohort.people):
+        for row in batch.with_columns(pl.col(date_columns).dt.date()).iter_rows():
+            sheet.append(row)
+        written += batch.height
+    workbook.save(location)
+    return written
+
+
+def _config(subtype: str) -> dict:
+    # the layout the `subtype` files are expanded with, as tretools is not needed to generate them
+    try:
+        return nhs_digital_config(subtype)
+    except (ModuleNotFoundError, FileNotFoundError):
+        return NHS_DIGITAL_CONFIGS[subtype]
+
+
+def nhs_digital_layouts() -> List[Layout]:
+    layouts = []
+    for subtype, (file, episodes, coverage, codes_per_row, not_read) in NHS_DIGITAL_FILES.items():
+        config = _config(subtype)
+        wide = config["column_to_expand"]
+        wide = [wide] if isinstance(wide, str) else list(wide)
+        layouts.append(
+            Layout(
+                "nhs_digital", f"{NHS_DIGITAL_LOCATION}/{file}",
+                {config["nhs_number"]: "nhs_number", config["date"]: "date", **{column: "" for column in not_read}},
+                "ICD10", episodes, coverage=coverage, separator="|", code_format="hes",
+                wide=wide, codes_per_row=codes_per_row,
+            )
+        )
+    # the ECDS extracts of a cut are several files, split by person
+    for i in range(ECDS_FILES):
+        layouts.append(
+            Layout(
+                "nhs_digital", f"{NHS_DIGITAL_LOCATION}/ECDS/NIC338864_ECDS_2023_07_{i + 1:02d}.txt",
+                {ECDS_CONFIG["nhs_number"]: "nhs_number", ECDS_CONFIG["date"]: "date", **{column: "" for column in ECDS_COLUMNS_NOT_READ}},
+                "SNOMED", 1.5, coverage=0.6, separator="|", wide=ECDS_CONFIG["column_to_expand"], codes_per_row=2.5,
+                stream="nhs_digital/ecds", share=(i, ECDS_FILES),
+            )
+        )
+    return layouts
+
+
+def discovery_layouts(manifest: dict) -> List[Layout]:
+    """
+    The files of the active cuts of the Discovery manifest.  The files of a cut are split by
+    person, e.g. between the two groups of CCGs of 2022; a stream (e.g. the observations) holds
+    the same events in every cut, up to the date of the cut.
+    """
+    layouts = []
+    for cut in active_cuts(manifest):
+        streams = {}
+        for file in cut["files"]:
+            streams.setdefault(file["name"].rsplit("_", 1)[-1], []).append(file)
+        for stream, files in streams.items():
+            as_of = datetime.strptime(Path(files[0]["path"]).parts[0][:7], "%Y_%m").date()
+            for i, file in enumerate(files):
+                column_maps = manifest["column_maps"][file["column_maps"]]
+                layouts.append(
+                    Layout(
+                        "primary_care", f"primary_care/{file['path']}",
+                        {**{column: "" for column in DISCOVERY_COLUMNS_NOT_READ}, **column_maps},
+                        file["coding_system"], DISCOVERY_ROWS_PER_PERSON.get(stream, 12), coverage=0.9,
+                        date_format=manifest.get("ingestion", {}).get("date_format", "%Y-%m-%d"),
+                        stream=f"discovery/{stream}", as_of=as_of, share=(i, len(files)),
+                    )
+                )
+    return layouts
+
+
+def _write_demographics(cohort: Cohort, location: Path) -> Dict[str, int]:
+    location.mkdir(parents=True, exist_ok=True)
+    people = cohort.people
+
+    def u(key) -> pl.Series:
+        return _uniform(people, _seed(cohort.seed, "demographics", key))
+
+    oragene_ids = pl.format("{}", 15_000_000_000 + pl.int_range(0, people, dtype=pl.Int64))
+    birth = pl.datetime(1930, 1, 1) + pl.duration(days=pl.lit(u("dob") * 75 * 365).cast(pl.Int64))
+    (
+        pl.select(
+            oragene_ids.alias("S1QST_Oragene_ID"),
+            pl.when(u("gender") < 0.5).then(pl.lit(1)).otherwise(2).alias("S1QST_Gender"),
+            pl.when(u("dob_missing") < 0.005).then(pl.lit("NA")).otherwise(birth.dt.strftime("%m-%Y")).alias("S1QST_MM-YYYY_ofBirth"),
+            *[(pl.lit(u(f"question_{i}")) * 5).cast(pl.Int32).alias(f"S1QST_Q{i:02d}") for i in range(1, 11)],
+        )
+        .write_csv(location / S1QST_FILE)
+    )
+    (
+        pl.select(
+            oragene_ids.alias("OrageneID"),
+            pl.lit(1).alias("Number of OrageneIDs with this NHS number (i.e. taken part twice or more)"),
+            pl.when(u("gender") < 0.5).then(pl.lit(1)).otherwise(2).alias("S1QST_Gender"),
+            (u("valid_nhs") >= 0.03).alias("HasValidNHS"),
+            pl.when(u("valid_nhs") >= 0.03).then(pl.lit(cohort.nhs_numbers[:people])).alias("pseudonhs_2024-07-10"),
+            pl.when(u("gsa") < 0.93).then(pl.format("GSA{}", pl.int_range(0, people))).alias("51176GSA-Jul2024"),
+            pl.when(u("exome") < 0.75).then(pl.format("EX{}", pl.int_range(0, people))).alias("44028exomes_release_2023-JUL-07"),
+            pl.when(u("exome") < 0.95).then(pl.format("EX{}", pl.int_range(0, people))).alias("55273exomes_release_2024-OCT-08"),
+        )
+        .write_csv(location / MEGA_LINKAGE_FILE)
+    )
+    return {f"demographics/{S1QST_FILE}": people, f"demographics/{MEGA_LINKAGE_FILE}": people}
+
+
+def _write_mapping(generator: _Generator, location: Path) -> int:
+    snomed, _ = generator.vocabulary("SNOMED")
+    icd10, _ = generator.vocabulary("ICD10")
+    icd10 = icd10.filter(pl.col("code").str.len_chars() == 4)["code"]
+    mapped = snomed.filter(_uniform(snomed.height, _seed(generator.cohort.seed, "mapped")) < MAPPED_SNOMED_SHARE)
+    targets = icd10[(_uniform(mapped.height, _seed(generator.cohort.seed, "targets")) * len(icd10)).cast(pl.UInt32)]
+    # a few of the concept ids in scientific notation, as in the real mapping file
+    concept_ids = [
+        f"{int(code):.{len(code) - 1}E}" if i % 20 == 0 else code
+        for i, code in enumerate(mapped["code"])
+    ]
+    location.mkdir(parents=True, exist_ok=True)
+    pl.DataFrame({
+        "conceptId": concept_ids,
+        "mapTarget": targets.str.slice(0, 3) + "." + targets.str.slice(3),
+        "ICD10_3digit": targets.str.slice(0, 3),
+    }).write_csv(location / MAPPING_FILE, separator="\t")
+    return mapped.height
+
+
+def _write_codelist(generator: _Generator, location: Path) -> int:
+    # the custom phenotypes of NB#8: "term" is the coding system of the code, "name" its term
+    codelists = []
+    for coding_system, name, per_phenotype in (("ICD10", "ICD10", 6), ("OPCS4", "OPCS4", 2), ("SNOMED", "SNOMED_ConceptID", 6)):
+        codes, _ = generator.vocabulary(coding_system)
+        codes = codes.head(2_000).sample(CUSTOM_PHENOTYPES * per_phenotype, seed=generator.cohort.seed % 2**32)
+        codelists.append(
+            codes.select(
+                pl.format("synthetic_phenotype_{}", pl.int_range(0, pl.len()) % CUSTOM_PHENOTYPES).alias("phenotype"),
+                pl.col("code"),
+                pl.lit(name).alias("term"),
+                pl.col("term").alias("name"),
+            )
+        )
+    location.mkdir(parents=True, exist_ok=True)
+    codelist = pl.concat(codelists)
+    codelist.write_csv(location / CUSTOM_CODELIST_FILE)
+    return codelist.height
+
+
+def people(scale: str, fraction: float = 1.0) -> int:
+    """The size of the cohort at `scale` (see `SCALES`), or a `fraction` of it for a quick run."""
+    if scale not in SCALES:
+        raise ValueError(f"Unknown scale {scale}, known scales: {list(SCALES)}")
+    return max(100, round(COHORT * SCALES[scale] * fraction))
+
+
+def read_metadata(root: str) -> Optional[dict]:
+    metadata_location = Path(root) / METADATA_FILE
+    return json.loads(metadata_location.read_text()) if metadata_location.exists() else None
+
+
+def generate(root: str, scale: str = "1x", fraction: float = 1.0, seed: int = 0, manifest_location: str = str(MANIFEST_LOCATION)) -> dict:
+    """
+    Writes the synthetic extracts of a cohort at `scale` to `root`, unless it already holds those of
+    the same scale, fraction and seed.
+
+    Returns:
+        dict: the metadata of the extracts (also written to `<root>/synthetic.json`): scale,
+        fraction, people, seed, the manifest of the Discovery files and the rows of every file
+    """
+    metadata = {"scale": scale, "fraction": fraction, "people": people(scale, fraction), "seed": seed, "generator_version": GENERATOR_VERSION}
+    existing = read_metadata(root)
+    if existing is not None and all(existing.get(key) == value for key, value in metadata.items()):
+        print(f"{datetime.now()}: {root} already holds the {scale} extracts, reusing them")
+        return existing
+
+    root_path = Path(root)
+    root_path.mkdir(parents=True, exist_ok=True)
+    (root_path / METADATA_FILE).unlink(missing_ok=True)
+    generator = _Generator(cohort(metadata["people"], seed))
+    rows = _write_demographics(generator.cohort, root_path / "demographics")
+
+    manifest = load_manifest(manifest_location)
+    layouts = [*discovery_layouts(manifest), *BARTS_LAYOUTS, *BRADFORD_LAYOUTS, *nhs_digital_layouts()]
+    for layout in layouts:
+        writer = _write_xlsx if layout.path.endswith(".xlsx") else _write_text
+        rows[layout.path] = writer(generator, layout, root_path / layout.path)
+        print(f"{datetime.now()}: {layout.path}: {rows[layout.path]} rows")
+
+    manifest_copy = {**manifest, "input_location": str(root_path / "primary_care")}
+    (root_path / "primary_care" / MANIFEST_LOCATION.name).write_text(json.dumps(manifest_copy, indent=4))
+    rows[f"mapping/{MAPPING_FILE}"] = _write_mapping(generator, root_path / "mapping")
+    rows[f"codelists/{CUSTOM_CODELIST_FILE}"] = _write_codelist(generator, root_path / "codelists")
+
+    metadata.update({
+        "release_date": RELEASE_DATE.isoformat(),
+        "manifest": str(root_path / "primary_care" / MANIFEST_LOCATION.name),
+        "rows": rows,
+        "generated": datetime.now().isoformat(),
+    })
+    (root_path / METADATA_FILE).write_text(json.dumps(metadata, indent=4))
+    return metadata
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Synthetic Genes & Health shaped raw extracts.")
+    parser.add_argument("root", help="the directory to write the extracts to")
+    parser.add_argument("--scale", choices=list(SCALES), default="1x", help="the size of the cohort, in multiples of the current one")
+    parser.add_argument("--fraction", type=float, default=1.0, help="only this fraction of the cohort, for a quick run")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    metadata = generate(args.root, args.scale, args.fraction, args.seed)
+    print(f"{metadata['people']} people, {sum(metadata['rows'].values())} rows in {len(metadata['rows'])} files")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+The `TRE` namespace of polars LazyFrames: `filter()`, `unique()` and `join()` which log how many
+rows they keep.
+
+    valid_regenie_55k = (
+        pl.scan_csv(MEGA_LINKAGE_PATH, ...)
+        .TRE.filter_with_logging(pl.col("exome_id").is_not_null(), label="...")
+        .TRE.unique_with_logging(["OrageneID"], label="...")
+    )
+
+NB#1, NB#7 and NB#8 each used to define the namespace, which counted the rows before and after
+every step with a `.collect()` of its own: a chain of four logged steps on the linkage file
+scanned it eight times (a join, three plans) before the query itself ran.  Each step now only
+adds row counters to the plan, `map_batches()` nodes which count the rows going through them, and
+the counts are logged when the query is executed, once per execution:
+
+    [Filter] Before filter: 55273 rows, After filter: 54932 rows (-0.6%)
+
+The counters stop the predicate and slice pushdown, so that a later filter or `head()` is not
+counted as part of the step; the projection pushdown still applies.  A counter holds its input in
+memory, as the query collected with the in-memory engine does.
+
+With `strict=True`, or `$BI_PY_TRE_STRICT=1`, the counts are collected as the steps are defined,
+as they used to be, e.g. to verify the counts of a plan without executing it.
+"""
+
+import os
+from typing import Callable, Dict, Optional
+
+import polars as pl
+
+STRICT_ENV = "BI_PY_TRE_STRICT"
+
+
+def _strict(strict: Optional[bool]) -> bool:
+    return os.environ.get(STRICT_ENV) == "1" if strict is None else strict
+
+
+def _height(lzdf: pl.LazyFrame) -> int:
+    return lzdf.select(pl.len()).collect().item()
+
+
+def _count(lzdf: pl.LazyFrame, counts: Dict[str, int], key: str, then: Optional[Callable[[], None]] = None) -> pl.LazyFrame:
+    # `counts[key]` is set to the rows of `lzdf` each time the plan is executed, and `then` called
+    def count(df: pl.DataFrame) -> pl.DataFrame:
+        counts[key] = df.height
+        if then is not None:
+            then()
+        return df
+
+    return lzdf.map_batches(count, projection_pushdown=True)
+
+
+def _change(before: int, after: int) -> str:
+    if before == 0:
+        return ""
+    change = ((after - before) / before) * 100
+    return f" ({'+' if change > 0 else ''}{change:.1f}%)"
+
+
+def _unchanged(before: int, after: int) -> str:
+    return " (row count unchanged)" if after == before else ""
+
+
+@pl.api.register_lazyframe_namespace("TRE")
+class TRETools:
+    def __init__(self, lzdf: pl.LazyFrame) -> None:
+        self._lzdf = lzdf
+
+    def _logged(self, step: Callable[[pl.LazyFrame], pl.LazyFrame], log: Callable[[int, int], None], strict: Optional[bool]) -> pl.LazyFrame:
+        if _strict(strict):
+            log(_height(self._lzdf), _height(step(self._lzdf)))
+            return step(self._lzdf)
+        counts = {}
+        return _count(
+            step(_count(self._lzdf, counts, "before")),
+            counts,
+            "after",
+            then=lambda: log(counts["before"], counts["after"]),
+        )
+
+    def unique_with_logging(self, *args, label: str = "Unique", strict: Optional[bool] = None, **kwargs) -> pl.LazyFrame:
+        def log(before: int, after: int) -> None:
+            print(f"[{label}: on {args}] Before unique: {before} rows, After unique: {after} rows{_unchanged(before, after)}{_change(before, after)}")
+
+        return self._logged(lambda lzdf: lzdf.unique(*args, **kwargs), log, strict)
+
+    def filter_with_logging(self, *args, label: str = "Filter", strict: Optional[bool] = None, **kwargs) -> pl.LazyFrame:
+        def log(before: int, after: int) -> None:
+            print(f"[{label}] Before filter: {before} rows, After filter: {after} rows{_unchanged(before, after)}{_change(before, after)}")
+
+        return self._logged(lambda lzdf: lzdf.filter(*args, **kwargs), log, strict)
+
+    def join_with_logging(
+        self,
+        other: pl.LazyFrame,
+        *args,
+        how: str = "inner",
+        label: str = "Join",
+        strict: Optional[bool] = None,
+        **kwargs
+    ) -> pl.LazyFrame:
+        def log(left_before: int, right_before: int, after: int) -> None:
+            if left_before > 0:
+                change = ((after - left_before) / left_before) * 100
+                change_str = f" ({'+' if change > 0 else ''}{change:.1f}%)" if abs(change) > 1.00 else f" ({after - left_before} rows {' removed' if change < 0 else ' added'})"
+            else:
+                change_str = ""
+            print(f"[{label}] Join type: {how.upper()}")
+            print(f"[{label}] Left: {left_before} rows, Right: {right_before} rows -> After: {after} rows{_unchanged(left_before, after)}{change_str}")
+
+        if _strict(strict):
+            log(_height(self._lzdf), _height(other), _height(self._lzdf.join(other, *args, how=how, **kwargs)))
+            return self._lzdf.join(other, *args, how=how, **kwargs)
+        counts = {}
+        joined_lzdf = _count(self._lzdf, counts, "left").join(_count(other, counts, "right"), *args, how=how, **kwargs)
+        return _count(joined_lzdf, counts, "after", then=lambda: log(counts["left"], counts["right"], counts["after"]))
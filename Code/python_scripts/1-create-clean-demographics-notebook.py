@@ -48,68 +48,6 @@ from datetime import datetime
 import polars as pl
 
 
-# In[ ]:
-
-
-# polars namespace additions
-
-# In subsequent version this code may be integrated with the establisted TRE Tools package
-
-@pl.api.register_lazyframe_namespace("TRE")
-class TRETools:
-    def __init__(self, lzdf: pl.LazyFrame) -> None:
-        self._lzdf = lzdf
-        
-    def unique_with_logging(self, *args, label: str = "Unique", **kwargs) -> pl.LazyFrame:
-        before = self._lzdf.select(pl.first()).collect().height
-        filtered_lzdf = self._lzdf.unique(*args, **kwargs)
-        after = filtered_lzdf.select(pl.first()).collect().height
-        
-        if before > 0:
-            change = ((after - before) / before) * 100
-            change_str = f" ({'+' if change > 0 else ''}{change:.1f}%)"
-        
-        unchanged = " (row count unchanged)" if after == before else ""
-        
-        print(f"[{label}: on {args}] Before unique: {before} rows, After unique: {after} rows{unchanged}{change_str}")
-        return filtered_lzdf    
-    
-    def filter_with_logging(self, *args, label: str = "Filter", **kwargs) -> pl.LazyFrame:
-        before = self._lzdf.select(pl.first()).collect().height
-        filtered_lzdf = self._lzdf.filter(*args, **kwargs)
-        after = filtered_lzdf.select(pl.first()).collect().height
-        
-        if before > 0:
-            change = ((after - before) / before) * 100
-            change_str = f" ({'+' if change > 0 else ''}{change:.1f}%)"
-        
-        unchanged = " (row count unchanged)" if after == before else ""
-        print(f"[{label}] Before filter: {before} rows, After filter: {after} rows{unchanged}{change_str}")
-        return filtered_lzdf
-    
-    def join_with_logging(
-        self,
-        other: pl.LazyFrame,
-        *args,
-        how: str = "inner",
-        label: str = "Join",
-        **kwargs
-    ) -> pl.LazyFrame:
-        left_before = self._lzdf.select(pl.first()).collect().height
-        right_before = other.select(pl.first()).collect().height
-        joined_lzdf = self._lzdf.join(other, *args, how=how, **kwargs)
-        after = joined_lzdf.select(pl.first()).collect().height
-        
-        if left_before > 0:
-            change = ((after - left_before) / left_before) * 100
-            change_str = f" ({'+' if change > 0 else ''}{change:.1f}%)" if abs(change) > 1.00 else f" ({after - left_before} rows {' removed' if change < 0 else ' added'})"
-        
-        unchanged = " (row count unchanged)" if after == left_before else ""
-        print(f"[{label}] Join type: {how.upper()}")
-        print(f"[{label}] Left: {left_before} rows, Right: {right_before} rows -> After: {after} rows{unchanged}{change_str}")
-        return joined_lzdf
-
-
 # ### Scripting for automated next notebook initation
 
 # In[ ]:
@@ -159,6 +97,16 @@ PROCESSED_DATASETS_LOCATION =  f"{ROOT_LOCATION}/{VERSION}/processed_datasets"
 # In[ ]:
 
 
+import sys
+sys.path.append(f"{ROOT_LOCATION}/{VERSION}/Code")
+
+from bi_py.person import PERSON_DICTIONARY_FILE, encode, update_person_dictionary
+from bi_py.tre_logging import TRETools  # the polars .TRE namespace, see bi_py/tre_logging.py
+
+
+# In[ ]:
+
+
 DEMOGRAPHICS_LOCATION = f"{PROCESSED_DATASETS_LOCATION}/demographics"
 AnyPath(DEMOGRAPHICS_LOCATION).mkdir(parents=True, exist_ok=True)
 
@@ -284,6 +232,19 @@ demographics.process_dataset(column_maps=config, round_to_day_in_month=1)
 demographics.log.append(f"{datetime.now()}: Data cleaned and processed")
 
 
+# ### Person ids
+# 
+# Every pseudo NHS number is given a dense `UInt32` person id. The person dictionary of all the releases, `PERSON_DICTIONARY_LOCATION`, is append-only: the people already in it keep their id, the people new to the demographics are given the next ids (in sorted order), so that the files of earlier releases stay keyed on the same ids. A copy of it is saved with the clean demographics. The clean demographics, and every dataset processed by the next notebooks, are keyed on the id; the pseudo NHS numbers are only restored in the trait and regenie files of notebooks 7 and 8.
+
+# In[ ]:
+
+
+PERSON_DICTIONARY_LOCATION = f"{ROOT_LOCATION}/{PERSON_DICTIONARY_FILE}"
+person_dictionary = update_person_dictionary(demographics.data["nhs_number"], PERSON_DICTIONARY_LOCATION)
+demographics.data = encode(demographics.data, person_dictionary)
+demographics.log.append(f"{datetime.now()}: nhs_number encoded as person ids, {demographics.data.height} people, {person_dictionary.height} in the person dictionary")
+
+
 # ### Save the data
 # 
 
@@ -291,6 +252,7 @@ demographics.log.append(f"{datetime.now()}: Data cleaned and processed")
 
 
 demographics.write_to_feather(f"{DEMOGRAPHICS_LOCATION}/clean_demographics.arrow")
+person_dictionary.write_ipc(f"{DEMOGRAPHICS_LOCATION}/{PERSON_DICTIONARY_FILE}")
 
 
 # In[ ]:
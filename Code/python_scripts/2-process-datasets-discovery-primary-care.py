@@ -19,7 +19,7 @@
 # 4) Load the demographic dataset and use the remove unrealistic dates method to remove rows where the event took place before 1st Jan 1910, after today's date (5th Dec 2024) or before the patient was born. 
 # 5) Save this dataset
 # 
-# We do this processs for observations and procedure csv files separately. Then we:
+# We do this processs for observations and procedure csv files separately, in parallel, for all the cuts listed in `Code/manifests/discovery.json`. Then we:
 # 
 # 1) Reload the cleaned and deduplicated observation dataset from processed file made in step 5 above. 
 # 2) Reload the cleaned and deduplicated procedures dataset from processed file made in step 5 above. 
@@ -131,18 +131,13 @@ AnyPath(MEGADATA_PRIMARY_CARE_LOCATION).mkdir(parents=True, exist_ok=True)
 AnyPath(MAPPING_FILES_LOCATION).mkdir(parents=True, exist_ok=True)
 
 
-# We create the paths to the dataset original folders
+# We locate the manifest listing the original files of each cut of data
 
 # In[ ]:
 
 
-april_2022_path = f"{INPUT_LOCATION}/2022_04_Discovery"
-dec_2022_path = f"{INPUT_LOCATION}/2022_12_Discovery"
-jan_2023_path = f"{INPUT_LOCATION}/2023_01_Discovery"
-mar_2023_path = f"{INPUT_LOCATION}/2023_03_Discovery"
-nov_2023_path = f"{INPUT_LOCATION}/2023_11_Discovery"
-july_2024_path = f"{INPUT_LOCATION}/2024_07_Discovery"
-dec_2024_path = f"{INPUT_LOCATION}/2024_12_Discovery"
+CODE_LOCATION = f"{ROOT_LOCATION}/{VERSION}/Code"
+DISCOVERY_MANIFEST_LOCATION = f"{CODE_LOCATION}/manifests/discovery.json"
 
 
 # In[ ]:
@@ -157,1269 +152,119 @@ DEMOGRAPHICS_FILE_LOCATION = f"{DEMOGRAPHICS_LOCATION}/clean_demographics.arrow"
 # In[ ]:
 
 
-from tretools.datasets.raw_dataset import RawDataset
 from tretools.datasets.processed_dataset import ProcessedDataset
 from tretools.datasets.dataset_enums.dataset_types import DatasetType
 from tretools.codelists.codelist_types import CodelistType
-from tretools.datasets.demographic_dataset import DemographicDataset
 
 
-# ## Load the data and transform it
-# 
-# Here we are defining the common variables that we will need. We also load the demographics data file that was created in the first notebook so that we can run the remove the unrealistic dates method. 
-
-# In[ ]:
-
-
-deduplication_options = ['nhs_number', 'code', 'date']
-
-
-# In[ ]:
-
-
-col_maps = {
-    "original_code": "code",
-    "original_term": "term",
-    "clinical_effective_date": "date",
-    "pseudo_nhs_number": "nhs_number"
-}
-
-
-# In[ ]:
-
-
-demographics = DemographicDataset(path=DEMOGRAPHICS_FILE_LOCATION)
-
-
-# In[ ]:
-
-
-date_start=datetime.strptime("1910-01-01", "%Y-%m-%d")
-# set end date to today
-date_end=datetime.today()
-
-
-# ### 1st cut of data - April 2022 Data
-# 
-# There are 4 different files in this dataset which we will merge together. There are 4 different files because according to the README, the volunteers in Tower Hamlets, Waltham Forest, Newham and City and Hackney, were kept in one dataset (observations and procedure files) and Barking, Havering, Redbridge Outer East London CCGs were kept in a different dataset. For reference, I will call the first dataset (Tower Hamlets, Waltham Forest, Newham and City and Hackney) one and the other one two. 
-
-# In[ ]:
-
-
-dataset_one_apr_2022_observations_path = f"{april_2022_path}/GNH_thwfnech-phase2-outfiles_merge/GNH_thwfnech_observations_output_dataset_20220423.csv"
-dataset_one_apr_2022_procedures_path = f"{april_2022_path}/GNH_thwfnech-phase2-outfiles_merge/GNH_thwfnech_procedure_req_output_dataset_20220424.csv"
-dataset_two_apr_2022_observations_path = f"{april_2022_path}/GNH_bhr-phase2-outfiles_merge/GNH_bhr_observations_output_dataset_20220412.csv"
-dataset_two_apr_2022_procedures_path = f"{april_2022_path}/GNH_bhr-phase2-outfiles_merge/GNH_bhr_procedure_req_output_dataset_20220412.csv"
-
-
-# In[ ]:
-
-
-AnyPath(f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/april_2022/clean_processed_data").mkdir(parents=True, exist_ok=True)
-AnyPath(f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/april_2022/processed_data").mkdir(parents=True, exist_ok=True)
-
-
-# **Dataset one observations processing**
-# 
-# We load the data, process it by deduplicating on code, nhs number and date and save, with a log file. 
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'dataset_one_obs = RawDataset(\n    path=dataset_one_apr_2022_observations_path,\n    dataset_type=DatasetType.PRIMARY_CARE.value,\n    coding_system=CodelistType.SNOMED.value\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_obs = (\n    dataset_one_obs\n    .process_dataset(\n        deduplication_options=deduplication_options,\n        column_maps=col_maps\n    )\n)\n')
-
-
-# In[ ]:
-
-
-processed_dataset_one_obs.write_to_feather(
-    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/april_2022/processed_data/GNH_thwfnech_observations.arrow"
-)
-
-
-# In[ ]:
-
-
-processed_dataset_one_obs.write_to_log(
-    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/april_2022/processed_data/GNH_thwfnech_observations_log.txt"
-)
-
-
-# We now remove the unrealistic data (i.e. event before birth, before 1st Jan 1910 or after 5th Dec 2024) and save this into a cleaned_processed_data folder
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_one_obs = (\n    processed_dataset_one_obs\n    .remove_unrealistic_dates(\n        date_start=date_start,\n        date_end=date_end,\n        before_born=True,\n        demographic_dataset=demographics\n    )\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', '(\n    cleaned_dataset_one_obs\n    .write_to_feather(\n        f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/april_2022/clean_processed_data/GNH_thwfnech_observations.arrow"\n    )\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', '(\n    cleaned_dataset_one_obs\n    .write_to_log(f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/april_2022/clean_processed_data/GNH_thwfnech_observations_log.txt")\n)\n')
-
-
-# **Dataset one procedures processing**
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'dataset_one_proc = RawDataset(\n    path=dataset_one_apr_2022_procedures_path, \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    coding_system=CodelistType.SNOMED.value\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_proc = dataset_one_proc.process_dataset(\n    deduplication_options=deduplication_options, \n    column_maps=col_maps\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_proc.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/april_2022/processed_data/GNH_thwfnech_procedures.arrow"\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_proc.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/april_2022/processed_data/GNH_thwfnech_procedures_log.txt"\n)\n')
-
-
-# We now remove the unrealistic data (i.e. event before birth, before 1st Jan 1910 or after 5th Dec 2024) and save this into a cleaned_processed_data folder
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_one_proc = processed_dataset_one_proc.remove_unrealistic_dates(\n    date_start=date_start,\n    date_end=date_end,\n    before_born=True,\n    demographic_dataset=demographics\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_one_proc.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/april_2022/clean_processed_data/GNH_thwfnech_procedures.arrow"\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_one_proc.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/april_2022/clean_processed_data/GNH_thwfnech_procedures_log.txt"\n)\n')
-
-
-# **Dataset two observations processing**
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'dataset_two_obs = RawDataset(\n    path=dataset_two_apr_2022_observations_path, \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    coding_system=CodelistType.SNOMED.value\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_two_obs = dataset_two_obs.process_dataset(\n    deduplication_options=deduplication_options, \n    column_maps=col_maps\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_two_obs.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/april_2022/processed_data/GNH_bhr_observations.arrow"\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_two_obs.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/april_2022/processed_data/GNH_bhr_observations_log.txt"\n)\n')
-
-
-# We now remove the unrealistic data (i.e. event before birth, before 1st Jan 1910 or after 5th Dec 2024) and save this into a cleaned_processed_data folder
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_processed_dataset_two_obs = processed_dataset_two_obs.remove_unrealistic_dates(\n    date_start=date_start,\n    date_end=date_end,\n    before_born=True,\n    demographic_dataset=demographics\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_processed_dataset_two_obs.write_to_feather(f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/april_2022/clean_processed_data/GNH_bhr_observations.arrow")\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_processed_dataset_two_obs.write_to_log(f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/april_2022/clean_processed_data/GNH_bhr_observations_log.txt")\n')
-
-
-# **Dataset two procedure processing**
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'dataset_two_proc = RawDataset(\n    path=dataset_two_apr_2022_procedures_path, \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    coding_system=CodelistType.SNOMED.value\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_two_proc = dataset_two_proc.process_dataset(\n    deduplication_options=deduplication_options, \n    column_maps=col_maps\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_two_proc.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/april_2022/processed_data/GNH_bhr_procedures.arrow"\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_two_proc.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/april_2022/processed_data/GNH_bhr_procedures_log.txt"\n)\n')
-
-
-# We now remove the unrealistic data (i.e. event before birth, before 1st Jan 1910 or after 5th Dec 2024) and save this into a cleaned_processed_data folder
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_processed_dataset_two_proc = processed_dataset_two_proc.remove_unrealistic_dates(\n    date_start=date_start,\n    date_end=date_end,\n    before_born=True,\n    demographic_dataset=demographics\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_processed_dataset_two_proc.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/april_2022/clean_processed_data/GNH_bhr_procedures.arrow"\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_processed_dataset_two_proc.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/april_2022/clean_processed_data/GNH_bhr_procedures_log.txt"\n)\n')
-
-
-# ### Merge all the data from April 2022 together 
-# 
-# Now we merge all the datasets into one dataset. We are going to load these from file to ensure that we are loading the right files as sometimes we run cells in different orders and that can cause issues. 
-
-# Load from file
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_obs = ProcessedDataset(\n    path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/april_2022/clean_processed_data/GNH_thwfnech_observations.arrow", \n    coding_system=CodelistType.SNOMED.value, \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    log_path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/april_2022/processed_data/GNH_thwfnech_observations_log.txt"\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_proc = ProcessedDataset(\n    path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/april_2022/clean_processed_data/GNH_thwfnech_procedures.arrow", \n    coding_system=CodelistType.SNOMED.value, \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    log_path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/april_2022/processed_data/GNH_thwfnech_procedures_log.txt"\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_two_obs = ProcessedDataset(\n    path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/april_2022/clean_processed_data/GNH_bhr_observations.arrow", \n    coding_system=CodelistType.SNOMED.value, \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    log_path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/april_2022/processed_data/GNH_bhr_observations_log.txt"\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_two_proc = ProcessedDataset(\n    path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/april_2022/clean_processed_data/GNH_bhr_procedures.arrow",\n    coding_system=CodelistType.SNOMED.value, \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    log_path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/april_2022/processed_data/GNH_bhr_procedures_log.txt"\n)\n')
-
-
-# Merge all the data together
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_obs.merge_with_dataset(processed_dataset_one_proc)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_obs.merge_with_dataset(processed_dataset_two_obs)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_obs.merge_with_dataset(processed_dataset_two_proc)\n')
-
-
-# Deduplicate the data
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'deduplicated_data = processed_dataset_one_obs.deduplicate()\n')
-
-
-# We now merge all the logs from the creation of the datasets into the log, and then sort by timestamps. 
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'for log in processed_dataset_one_proc.log:\n    deduplicated_data.log.append(log)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'for log in processed_dataset_two_obs.log:\n    deduplicated_data.log.append(log)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'for log in processed_dataset_two_proc.log:\n    deduplicated_data.log.append(log)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'deduplicated_data.log.sort()\n')
-
-
-# Writing the data and logs to files to allow permanent access
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'deduplicated_data.write_to_log(f"{MEGADATA_PRIMARY_CARE_LOCATION}/log_apr_2022.txt")\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'deduplicated_data.write_to_feather(f"{MEGADATA_PRIMARY_CARE_LOCATION}/april_22.arrow")\n')
-
-
-# ### 2nd cut of data - Dec 2022 Data
-# 
-# There are 4 different files in this dataset which we will merge together. There are 4 different files because according to the README, the volunteers in Tower Hamlets, Waltham Forest, Newham and City and Hackney, were kept in one dataset (observations and procedure files) and Barking, Havering, Redbridge Outer East London CCGs were kept in a different dataset. For reference, I will call the first dataset (Tower Hamlets, Waltham Forest, Newham and City and Hackney) one and the other one two. 
-
-# In[ ]:
-
-
-dataset_one_dec_2022_observations_path = f"{dec_2022_path}/GNH_thwfnech-phase2-outfiles_merge/cohort_gh2_observations_output_dataset_20221207.csv"
-dataset_one_dec_2022_procedures_path = f"{dec_2022_path}/GNH_thwfnech-phase2-outfiles_merge/cohort_gh2_procedure_req_output_dataset_20221208.csv"
-dataset_two_dec_2022_observations_path = f"{dec_2022_path}/GNH_bhr-phase2-outfiles_merge/gh2_observations_dataset_20221207.csv"
-dataset_two_dec_2022_procedures_path = f"{dec_2022_path}/GNH_bhr-phase2-outfiles_merge/gh2_procedure_req_20221207.csv"
-
-
-# In[ ]:
-
-
-AnyPath(f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2022/clean_processed_data").mkdir(parents=True, exist_ok=True)
-AnyPath(f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2022/processed_data").mkdir(parents=True, exist_ok=True)
-
-
-# **Dataset one obs**
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'dataset_one_obs = RawDataset(\n    path=dataset_one_dec_2022_observations_path, \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    coding_system=CodelistType.SNOMED.value\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_obs = dataset_one_obs.process_dataset(\n    deduplication_options=deduplication_options, \n    column_maps=col_maps\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_obs.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2022/processed_data/GNH_thwfnech_observations.arrow"\n)\nprocessed_dataset_one_obs.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2022/processed_data/GNH_thwfnech_observations_log.txt"\n)\n')
-
-
-# We now remove the unrealistic data (i.e. event before birth, before 1st Jan 1910 or after 5th Dec 2024) and save this into a cleaned_processed_data folder
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_one_obs = (\n    processed_dataset_one_obs\n    .remove_unrealistic_dates(\n        date_start=date_start,\n        date_end=date_end,\n        before_born=True,\n        demographic_dataset=demographics\n    )\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_one_obs.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2022/clean_processed_data/GNH_thwfnech_observations.arrow"\n)\ncleaned_dataset_one_obs.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2022/clean_processed_data/GNH_thwfnech_observations_log.txt"\n)\n')
-
-
-# **Dataset one procedures**
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'dataset_one_proc = RawDataset(\n    path=dataset_one_dec_2022_procedures_path, \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    coding_system=CodelistType.SNOMED.value\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_proc = dataset_one_proc.process_dataset(\n    deduplication_options=deduplication_options, \n    column_maps=col_maps\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_proc.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2022/processed_data/GNH_thwfnech_procedures.arrow"\n)\nprocessed_dataset_one_proc.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2022/processed_data/GNH_thwfnech_procedures_log.txt"\n)\n')
-
-
-# We now remove the unrealistic data (i.e. event before birth, before 1st Jan 1910 or after 5th Dec 2024) and save this into a cleaned_processed_data folder
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_one_proc = processed_dataset_one_proc.remove_unrealistic_dates(\n    date_start=date_start,\n    date_end=date_end,\n    before_born=True,\n    demographic_dataset=demographics\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_one_proc.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2022/clean_processed_data/GNH_thwfnech_procedures.arrow"\n)\ncleaned_dataset_one_proc.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2022/clean_processed_data/GNH_thwfnech_procedures_log.txt"\n)\n')
-
-
-# **Dataset two obs**
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'dataset_two_obs = RawDataset(\n    path=dataset_two_dec_2022_observations_path, \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    coding_system=CodelistType.SNOMED.value\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_two_obs = dataset_two_obs.process_dataset(\n    deduplication_options=deduplication_options, \n    column_maps=col_maps\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_two_obs.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2022/processed_data/GNH_bhr_observations.arrow"\n)\nprocessed_dataset_two_obs.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2022/processed_data/NH_bhr_observations_log.txt"\n)\n')
-
-
-# We now remove the unrealistic data (i.e. event before birth, before 1st Jan 1910 or after 5th Dec 2024) and save this into a cleaned_processed_data folder
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_two_obs = (\n    processed_dataset_two_obs\n    .remove_unrealistic_dates(\n        date_start=date_start,\n        date_end=date_end,\n        before_born=True,\n        demographic_dataset=demographics\n    )\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_two_obs.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2022/clean_processed_data/GNH_bhr_observations.arrow")\ncleaned_dataset_two_obs.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2022/clean_processed_data/GNH_bhr_observations_log.txt")\n')
-
-
-# **Dataset two proc**
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'dataset_two_proc = RawDataset(\n    path=dataset_two_dec_2022_procedures_path, \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    coding_system=CodelistType.SNOMED.value\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_two_proc = dataset_two_proc.process_dataset(\n    deduplication_options=deduplication_options, \n    column_maps=col_maps\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_two_proc.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2022/processed_data/GNH_bhr_procedures.arrow"\n)\nprocessed_dataset_two_proc.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2022/processed_data/GNH_bhr_procedures_log.txt"\n)\n')
-
-
-# We now remove the unrealistic data (i.e. event before birth, before 1st Jan 1910 or after 5th Dec 2024) and save this into a cleaned_processed_data folder
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_two_proc = processed_dataset_two_proc.remove_unrealistic_dates(\n    date_start=date_start,\n    date_end=date_end,\n    before_born=True,\n    demographic_dataset=demographics\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_two_proc.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2022/clean_processed_data/GNH_bhr_procedures.arrow"\n)\ncleaned_dataset_two_proc.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2022/clean_processed_data/GNH_bhr_procedures_log.txt"\n)\n')
-
-
-# Now we merge all the datasets into one. For this we will merge `dataset_one_proc`, `dataset_two_obs` and `dataset_two_proc` into `dataset_one_obs`. We will reload them from file to be safe. 
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_obs = ProcessedDataset(\n    path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2022/clean_processed_data/GNH_thwfnech_observations.arrow", \n    coding_system=CodelistType.SNOMED.value, \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    log_path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2022/clean_processed_data/GNH_thwfnech_observations_log.txt"\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_proc = ProcessedDataset(\n    path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2022/clean_processed_data/GNH_thwfnech_procedures.arrow", \n    coding_system=CodelistType.SNOMED.value, \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    log_path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2022/clean_processed_data/GNH_thwfnech_procedures_log.txt"\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_two_obs = ProcessedDataset(\n    path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2022/clean_processed_data/GNH_bhr_observations.arrow",\n    coding_system=CodelistType.SNOMED.value, \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    log_path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2022/clean_processed_data/GNH_bhr_observations_log.txt"\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_two_proc = ProcessedDataset(\n    path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2022/clean_processed_data/GNH_bhr_procedures.arrow",\n    coding_system=CodelistType.SNOMED.value, \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    log_path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2022/clean_processed_data/GNH_bhr_procedures_log.txt"\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_obs.merge_with_dataset(processed_dataset_one_proc)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_obs.merge_with_dataset(processed_dataset_two_obs)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_obs.merge_with_dataset(processed_dataset_two_proc)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_obs.log.append(f"{datetime.now()}: The merged datasets has {processed_dataset_one_obs.data.shape[0]} rows")\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'deduplicated_data = processed_dataset_one_obs.deduplicate()\n')
-
-
-# We now merge all the logs from the creation of the datasets into the log, and then sort by timestamps. 
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'for log in processed_dataset_one_proc.log:\n    deduplicated_data.log.append(log)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'for log in processed_dataset_two_obs.log:\n    deduplicated_data.log.append(log)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'for log in processed_dataset_two_proc.log:\n    deduplicated_data.log.append(log)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'deduplicated_data.log.sort()\n')
-
-
-# Writing the data and logs to files to allow permanent access
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'deduplicated_data.write_to_log(f"{MEGADATA_PRIMARY_CARE_LOCATION}/log_dec_2022.txt")\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'deduplicated_data.write_to_feather(f"{MEGADATA_PRIMARY_CARE_LOCATION}/dec_22.arrow")\n')
-
-
-# ### 3rd cut of data - Jan 2023 Data \[Corrupted, Skipped\]
-# 
-# 2025-04-14: In previous run of BI_PY, this note was present: "The data had an error in procedures and observations according to the readme so this has been removed." but (in heading)refered to Dec 2022 cut which is fine.  Jan 2023 cut is however corrupted and should be skipped. 
-# 
-
-# ### 4th cut of data - March 2023 Data
-# 
-# There are 2 different files - observations and procedures for this cut of data. 
-
-# In[ ]:
-
-
-dataset_one_march_2023_observations_path = f"{mar_2023_path}/gh3_observations.csv"
-dataset_one_march_2023_procedures_path = f"{mar_2023_path}/gh3_procedure_req.csv"
-
-
-# In[ ]:
-
-
-AnyPath(f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/march_2023/processed_data").mkdir(parents=True, exist_ok=True)
-AnyPath(f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/march_2023/clean_processed_data").mkdir(parents=True, exist_ok=True)
-
-
-# **Dataset one obs**
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'dataset_one_obs = RawDataset(path=dataset_one_march_2023_observations_path, dataset_type=DatasetType.PRIMARY_CARE.value, coding_system=CodelistType.SNOMED.value)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_obs = dataset_one_obs.process_dataset(deduplication_options=deduplication_options, column_maps=col_maps)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_obs.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/march_2023/processed_data/observations.arrow")\nprocessed_dataset_one_obs.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/march_2023/processed_data/observations_log.txt")\n')
-
-
-# We now remove the unrealistic data (i.e. event before birth, before 1st Jan 1910 or after 5th Dec 2024) and save this into a cleaned_processed_data folder
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_one_obs = (\n    processed_dataset_one_obs.remove_unrealistic_dates(\n        date_start=date_start,\n        date_end=date_end,\n        before_born=True,\n        demographic_dataset=demographics\n    )\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_one_obs.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/march_2023/clean_processed_data/observations.arrow")\ncleaned_dataset_one_obs.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/march_2023/clean_processed_data/observations_log.txt")\n')
-
-
-# **Dataset one procedures**
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'dataset_one_proc = RawDataset(path=dataset_one_march_2023_procedures_path, dataset_type=DatasetType.PRIMARY_CARE.value, coding_system=CodelistType.SNOMED.value)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_proc = dataset_one_proc.process_dataset(deduplication_options=deduplication_options, column_maps=col_maps)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_proc.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/march_2023/processed_data/procedures.arrow"\n)\nprocessed_dataset_one_proc.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/march_2023/processed_data/procedures_log.txt"\n)\n')
-
-
-# We now remove the unrealistic data (i.e. event before birth, before 1st Jan 1910 or after 5th Dec 2024) and save this into a cleaned_processed_data folder
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_one_proc = processed_dataset_one_proc.remove_unrealistic_dates(\n    date_start=date_start,\n    date_end=date_end,\n    before_born=True,\n    demographic_dataset=demographics\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_one_proc.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/march_2023/clean_processed_data/procedures.arrow"\n)\ncleaned_dataset_one_proc.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/march_2023/clean_processed_data/procedures_log.txt"\n)\n')
-
-
-# Now we merge all the datasets into one. For this we will merge `dataset_one_proc` into `dataset_one_obs`. We will load them file. 
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_one_obs = ProcessedDataset(\n    path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/march_2023/clean_processed_data/observations.arrow", \n    coding_system=CodelistType.SNOMED.value,\n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    log_path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/march_2023/clean_processed_data/observations_log.txt"\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_one_proc = ProcessedDataset(\n    path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/march_2023/clean_processed_data/procedures.arrow", \n    coding_system=CodelistType.SNOMED.value,\n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    log_path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/march_2023/clean_processed_data/procedures_log.txt"\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_one_obs.merge_with_dataset(cleaned_dataset_one_proc)\n')
-
-
-# We now merge all the logs from the creation of the datasets into the log, and then sort by timestamps. 
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'deduplicated_data = cleaned_dataset_one_obs.deduplicate()\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'for log in processed_dataset_one_proc.log:\n    deduplicated_data.log.append(log)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'deduplicated_data.log.sort()\n')
-
-
-# Writing the data and logs to files to allow permanent access
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'deduplicated_data.write_to_log(f"{MEGADATA_PRIMARY_CARE_LOCATION}/log_march_23.txt")\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'deduplicated_data.write_to_feather(f"{MEGADATA_PRIMARY_CARE_LOCATION}/march_2023.arrow")\n')
-
-
-# ### 5th cut of data - Nov 2023 Data
-# 
-# There are 2 different files - observations and procedures for this cut of data. 
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'dataset_one_nov_2023_observations_path = f"{nov_2023_path}/gh3_observations.csv"\ndataset_one_nov_2023_procedures_path = f"{nov_2023_path}/gh3_procedure_req.csv"\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'AnyPath(f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/nov_2023/processed_data").mkdir(parents=True, exist_ok=True)\nAnyPath(f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/nov_2023/clean_processed_data").mkdir(parents=True, exist_ok=True)\n')
-
-
-# **Dataset one obs**
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'dataset_one_obs = RawDataset(\n    path=dataset_one_nov_2023_observations_path, \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    coding_system=CodelistType.SNOMED.value\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_obs = dataset_one_obs.process_dataset(\n    deduplication_options=deduplication_options, \n    column_maps=col_maps\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_obs.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/nov_2023/processed_data/observations.arrow"\n)\nprocessed_dataset_one_obs.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/nov_2023/processed_data/observations_log.txt"\n)\n')
-
-
-# We now remove the unrealistic data (i.e. event before birth, before 1st Jan 1910 or after 5th Dec 2024) and save this into a cleaned_processed_data folder
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_one_obs = processed_dataset_one_obs.remove_unrealistic_dates(\n    date_start=date_start,\n    date_end=date_end,\n    before_born=True,\n    demographic_dataset=demographics\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_one_obs.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/nov_2023/clean_processed_data/observations.arrow"\n)\ncleaned_dataset_one_obs.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/nov_2023/clean_processed_data/observations_log.txt"\n)\n')
-
-
-# **Dataset one procedures**
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'dataset_one_proc = RawDataset(\n    path=dataset_one_nov_2023_procedures_path, \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    coding_system=CodelistType.SNOMED.value\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_proc = dataset_one_proc.process_dataset(\n    deduplication_options=deduplication_options, \n    column_maps=col_maps\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_proc.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/nov_2023/processed_data/procedures.arrow"\n)\nprocessed_dataset_one_proc.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/nov_2023/processed_data/procedures_log.txt"\n)\n')
-
-
-# We now remove the unrealistic data (i.e. event before birth, before 1st Jan 1910 or after 5th Dec 2024) and save this into a cleaned_processed_data folder
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_one_proc = processed_dataset_one_proc.remove_unrealistic_dates(\n    date_start=date_start,\n    date_end=date_end,\n    before_born=True,\n    demographic_dataset=demographics\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_one_proc.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/nov_2023/clean_processed_data/procedures.arrow"\n)\ncleaned_dataset_one_proc.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/nov_2023/clean_processed_data/procedures_log.txt"\n)\n')
-
-
-# Now we merge all the datasets into one. For this we will merge `dataset_one_proc` into `dataset_one_obs`. We are loading them from file into the datasets. 
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'obs_data = ProcessedDataset(\n    path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/nov_2023/clean_processed_data/observations.arrow", \n    coding_system=CodelistType.SNOMED.value, \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    log_path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/nov_2023/clean_processed_data/observations_log.txt"\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'proc_data = ProcessedDataset(\n    path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/nov_2023/clean_processed_data/procedures.arrow", \n    coding_system=CodelistType.SNOMED.value, \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    log_path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/nov_2023/clean_processed_data/procedures_log.txt"\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'obs_data.merge_with_dataset(proc_data)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'deduplicated_data = obs_data.deduplicate()\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'for log in processed_dataset_one_proc.log:\n    deduplicated_data.log.append(log)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'deduplicated_data.log.sort()\n')
-
-
-# Writing the data and logs to files to allow permanent access
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'deduplicated_data.write_to_log(f"{MEGADATA_PRIMARY_CARE_LOCATION}/log_nov_23.txt")\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'deduplicated_data.write_to_feather(f"{MEGADATA_PRIMARY_CARE_LOCATION}/nov_2023.arrow")\n')
-
-
-# ### 6th cut of data - July 2024 Data
-# 
-# There are 2 different files - observations and procedures for this cut of data. 
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'dataset_one_jul_2024_observations_path = f"{july_2024_path}/gh3_observations.csv"\ndataset_one_jul_2024_procedures_path = f"{july_2024_path}/gh3_procedure_req.csv"\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'AnyPath(f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/jul_2024/processed_data").mkdir(parents=True, exist_ok=True)\nAnyPath(f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/jul_2024/clean_processed_data").mkdir(parents=True, exist_ok=True)\n')
-
-
-# **Dataset one obs**
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'dataset_one_obs = RawDataset(\n    path=dataset_one_jul_2024_observations_path,\n    dataset_type=DatasetType.PRIMARY_CARE.value,\n    coding_system=CodelistType.SNOMED.value\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_obs = dataset_one_obs.process_dataset(\n    deduplication_options=deduplication_options,\n    column_maps=col_maps\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_obs.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/jul_2024/processed_data/observations.arrow"\n)\nprocessed_dataset_one_obs.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/jul_2024/processed_data/observations_log.txt"\n)\n')
-
-
-# We now remove the unrealistic data (i.e. event before birth, before 1st Jan 1910 or after 5th Dec 2024) and save this into a cleaned_processed_data folder
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_one_obs = processed_dataset_one_obs.remove_unrealistic_dates(\n    date_start=date_start,\n    date_end=date_end,\n    before_born=True,\n    demographic_dataset=demographics\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_one_obs.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/jul_2024/clean_processed_data/observations.arrow"\n)\ncleaned_dataset_one_obs.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/jul_2024/clean_processed_data/observations_log.txt"\n)\n')
-
-
-# **Dataset one procedures**
-# 
-# 2025-04-14: incorrect file specified here; replaced from `dataset_one_nov_2023_procedures_path` to `dataset_one_jul_2024_procedures_path`
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'dataset_one_proc = RawDataset(\n    path=dataset_one_jul_2024_procedures_path, \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    coding_system=CodelistType.SNOMED.value\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_proc = dataset_one_proc.process_dataset(\n    deduplication_options=deduplication_options, \n    column_maps=col_maps\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_proc.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/jul_2024/processed_data/procedures.arrow")\nprocessed_dataset_one_proc.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/jul_2024/processed_data/procedures_log.txt"\n)\n')
-
-
-# We now remove the unrealistic data (i.e. event before birth, before 1st Jan 1910 or after 5th Dec 2024) and save this into a cleaned_processed_data folder
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_one_proc = processed_dataset_one_proc.remove_unrealistic_dates(\n    date_start=date_start,\n    date_end=date_end,\n    before_born=True,\n    demographic_dataset=demographics\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_one_proc.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/jul_2024/clean_processed_data/procedures.arrow"\n)\ncleaned_dataset_one_proc.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/jul_2024/clean_processed_data/procedures_log.txt"\n)\n')
-
-
-# Now we merge all the datasets into one. For this we will merge `dataset_one_proc` into `dataset_one_obs`. We are loading them from file into the datasets. 
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'obs_data = ProcessedDataset(\n    path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/jul_2024/clean_processed_data/observations.arrow", \n    coding_system=CodelistType.SNOMED.value, \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    log_path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/jul_2024/clean_processed_data/observations_log.txt"\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'proc_data = ProcessedDataset(\n    path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/jul_2024/clean_processed_data/procedures.arrow", \n    coding_system=CodelistType.SNOMED.value, \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    log_path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/jul_2024/clean_processed_data/procedures_log.txt"\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'obs_data.merge_with_dataset(proc_data)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'deduplicated_data = obs_data.deduplicate()\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'for log in processed_dataset_one_proc.log:\n    deduplicated_data.log.append(log)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'deduplicated_data.log.sort()\n')
-
-
-# Writing the data and logs to files to allow permanent access
-
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', 'deduplicated_data.write_to_log(f"{MEGADATA_PRIMARY_CARE_LOCATION}/log_jul_24.txt")\n')
-
-
-# In[ ]:
-
+import sys
+sys.path.append(CODE_LOCATION)
 
-get_ipython().run_cell_magic('time', '', 'deduplicated_data.write_to_feather(f"{MEGADATA_PRIMARY_CARE_LOCATION}/jul_2024.arrow")\n')
+from bi_py.dates import processed_dataset_from_frame
+from bi_py.manifest import active_cuts, load_manifest, run_manifest
+from bi_py.megadata import append_cut, appended_location, clear_appended, megadata_files
+from bi_py.profiling import profile
+from bi_py.snomed import snomed_codes, tretools_snomed_codes
+from bi_py.sorted_merge import merge_files
 
 
-# ### 7th cut of data - December 2024 Data
+# ## Load the data and transform it
 # 
-# There are 2 different files - observations and procedures for this cut of data. 
-
-# In[ ]:
-
-
-dataset_one_dec_2024_observations_path = f"{dec_2024_path}/gh3_observations.csv"
-dataset_one_dec_2024_procedures_path = f"{dec_2024_path}/gh3_procedure_req.csv"
-
-
-# In[ ]:
-
-
-AnyPath(f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2024/processed_data").mkdir(parents=True, exist_ok=True)
-AnyPath(f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2024/clean_processed_data").mkdir(parents=True, exist_ok=True)
-
-
-# **Dataset one obs**
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'dataset_one_obs = RawDataset(\n    path=dataset_one_dec_2024_observations_path,\n    dataset_type=DatasetType.PRIMARY_CARE.value,\n    coding_system=CodelistType.SNOMED.value\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_obs = dataset_one_obs.process_dataset(\n    deduplication_options=deduplication_options,\n    column_maps=col_maps\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_obs.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2024/processed_data/observations.arrow")\nprocessed_dataset_one_obs.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2024/processed_data/observations_log.txt")\n')
-
-
-# We now remove the unrealistic data (i.e. event before birth, before 1st Jan 1910 or after 5th Dec 2024) and save this into a cleaned_processed_data folder
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_one_obs = processed_dataset_one_obs.remove_unrealistic_dates(\n    date_start=date_start,\n    date_end=date_end,\n    before_born=True,\n    demographic_dataset=demographics\n)\n')
-
+# Here we are defining the common variables that we will need. The deduplication options and column maps are defined in the manifest, and the demographics data file that was created in the first notebook is used to remove the unrealistic dates. 
 
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_one_obs.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2024/clean_processed_data/observations.arrow"\n)\ncleaned_dataset_one_obs.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2024/clean_processed_data/observations_log.txt"\n)\n')
+date_start=datetime.strptime("1910-01-01", "%Y-%m-%d")
+# set end date to today
+date_end=datetime.today()
 
 
-# **Dataset one procedures**
+# ### Process all the cuts of data
 # 
-# 2025-04-14: incorrect file specified here; replaced from `dataset_one_nov_2023_procedures_path` to `dataset_one_jul_2024_procedures_path`
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'dataset_one_proc = RawDataset(\n    path=dataset_one_dec_2024_procedures_path,\n    dataset_type=DatasetType.PRIMARY_CARE.value,\n    coding_system=CodelistType.SNOMED.value\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_proc = dataset_one_proc.process_dataset(\n    deduplication_options=deduplication_options, \n    column_maps=col_maps\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'processed_dataset_one_proc.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2024/processed_data/procedures.arrow"\n)\nprocessed_dataset_one_proc.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2024/processed_data/procedures_log.txt"\n)\n')
-
-
-# We now remove the unrealistic data (i.e. event before birth, before 1st Jan 1910 or after 5th Dec 2024) and save this into a cleaned_processed_data folder
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_one_proc = processed_dataset_one_proc.remove_unrealistic_dates(\n    date_start=date_start, \n    date_end=date_end, \n    before_born=True,\n    demographic_dataset=demographics\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'cleaned_dataset_one_proc.write_to_feather(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2024/clean_processed_data/procedures.arrow"\n)\ncleaned_dataset_one_proc.write_to_log(\n    f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2024/clean_processed_data/procedures_log.txt"\n)\n')
-
-
-# Now we merge all the datasets into one. For this we will merge `dataset_one_proc` into `dataset_one_obs`. We are loading them from file into the datasets. 
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'obs_data = ProcessedDataset(\n    path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2024/clean_processed_data/observations.arrow", \n    coding_system=CodelistType.SNOMED.value, \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    log_path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2024/clean_processed_data/observations_log.txt"\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'proc_data = ProcessedDataset(\n    path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2024/clean_processed_data/procedures.arrow", \n    coding_system=CodelistType.SNOMED.value, \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    log_path=f"{PROCESSED_DATASETS_PRIMARY_CARE_LOCATION}/dec_2024/clean_processed_data/procedures_log.txt"\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'obs_data.merge_with_dataset(proc_data)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'deduplicated_data = obs_data.deduplicate()\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'for log in processed_dataset_one_proc.log:\n    deduplicated_data.log.append(log)\n')
-
+# The cuts of data, and the files of each cut, are listed in the manifest `Code/manifests/discovery.json`; a new cut is added by adding an entry there (the Jan 2023 cut is corrupted and is marked `"skip": true`).
+# 
+# Every file is processed in the same way, in a single pass over the CSV:
+# 
+# 1) Load the mapped columns from the CSV and deduplicate on code, nhs number and date
+# 2) Remove the unrealistic data (i.e. event before birth, before 1st Jan 1910 or after today) and save it to `clean_processed_data/`
+# 
+# The deduplicated data before step 2 is no longer saved to `processed_data/`; set `"write_processed_data": true` in the manifest to save it again.
+# 
+# The files are independent of one another so they are processed in parallel, `MAX_WORKERS` files at a time. As soon as all the files of a cut are processed, they are merged, deduplicated and saved, with their logs, to the megadata file of the cut (e.g. `april_22.arrow` and `log_apr_2022.txt`).
+# 
+# Files whose raw data, options and demographics are unchanged since a previous run are not processed again (see `bi_py/stage_cache.py`).
+# 
+# `APPEND_CUTS` lists the cuts which arrived since `final_merged_data.arrow` was last made from all the cuts (e.g. `["mar_2025"]`): only those are processed, and they are appended to it (see below) rather than all the cuts being merged again. Leave it empty to process and merge every cut.
 
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', 'deduplicated_data.log.sort()\n')
+MAX_WORKERS = 4
+STAGE_CACHE_LOCATION = f"{ROOT_LOCATION}/stage_cache"
+APPEND_CUTS = []
 
 
-# Writing the data and logs to files to allow permanent access
-
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', 'deduplicated_data.write_to_log(f"{MEGADATA_PRIMARY_CARE_LOCATION}/log_dec_24.txt")\n')
+discovery_manifest = load_manifest(DISCOVERY_MANIFEST_LOCATION)
 
 
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', 'deduplicated_data.write_to_feather(f"{MEGADATA_PRIMARY_CARE_LOCATION}/dec_2024.arrow")\n')
+with profile("NB2: process the discovery manifest"):
+    cut_megadata_files = run_manifest(
+        discovery_manifest,
+        processed_location=PROCESSED_DATASETS_PRIMARY_CARE_LOCATION,
+        megadata_location=MEGADATA_PRIMARY_CARE_LOCATION,
+        demographics_location=DEMOGRAPHICS_FILE_LOCATION,
+        date_start=date_start,
+        date_end=date_end,
+        max_workers=MAX_WORKERS,
+        stage_cache_location=STAGE_CACHE_LOCATION,
+        cuts=APPEND_CUTS or None,
+    )
 
 
 # ### Merge all the primary care datasets together
 # 
-# Here we are merging all the 6 datasets together (7 cuts but one invalid) and then deduplicate this. We will read in each cleaned, deduplicated file and merge them into each other. Once they are all merged, we will deduplicate them. 
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'apr_2022_data = ProcessedDataset(\n    path=f"{MEGADATA_PRIMARY_CARE_LOCATION}/april_22.arrow", \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    coding_system=CodelistType.SNOMED.value, \n    log_path=f"{MEGADATA_PRIMARY_CARE_LOCATION}/log_apr_2022.txt"\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'dec_2022_data = ProcessedDataset(\n    path=f"{MEGADATA_PRIMARY_CARE_LOCATION}/dec_22.arrow", \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    coding_system=CodelistType.SNOMED.value, \n    log_path=f"{MEGADATA_PRIMARY_CARE_LOCATION}/log_dec_2022.txt"\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'mar_2023_data = ProcessedDataset(\n    path=f"{MEGADATA_PRIMARY_CARE_LOCATION}/march_2023.arrow", \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    coding_system=CodelistType.SNOMED.value, \n    log_path=f"{MEGADATA_PRIMARY_CARE_LOCATION}/log_march_23.txt"\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'nov_2023_data = ProcessedDataset(\n    path=f"{MEGADATA_PRIMARY_CARE_LOCATION}/nov_2023.arrow", \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    coding_system=CodelistType.SNOMED.value, \n    log_path=f"{MEGADATA_PRIMARY_CARE_LOCATION}/log_nov_23.txt"\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'jul_2024_data = ProcessedDataset(\n    path=f"{MEGADATA_PRIMARY_CARE_LOCATION}/jul_2024.arrow",\n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    coding_system=CodelistType.SNOMED.value, \n    log_path=f"{MEGADATA_PRIMARY_CARE_LOCATION}/log_jul_24.txt"\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'dec_2024_data = ProcessedDataset(\n    path=f"{MEGADATA_PRIMARY_CARE_LOCATION}/dec_2024.arrow", \n    dataset_type=DatasetType.PRIMARY_CARE.value, \n    coding_system=CodelistType.SNOMED.value, \n    log_path=f"{MEGADATA_PRIMARY_CARE_LOCATION}/log_dec_24.txt"\n)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'apr_2022_data.merge_with_dataset(dec_2022_data)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'apr_2022_data.merge_with_dataset(mar_2023_data)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'apr_2022_data.merge_with_dataset(nov_2023_data)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'apr_2022_data.merge_with_dataset(jul_2024_data)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'apr_2022_data.merge_with_dataset(dec_2024_data)\n')
-
-
-# We then merge all the log files together, and sort based on timestamp.
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'for log in dec_2022_data.log:\n    apr_2022_data.log.append(log)\n    \nfor log in mar_2023_data.log:\n    apr_2022_data.log.append(log)\n        \nfor log in nov_2023_data.log:\n    apr_2022_data.log.append(log)\n    \nfor log in jul_2024_data.log:\n    apr_2022_data.log.append(log)\n    \nfor log in dec_2024_data.log:\n    apr_2022_data.log.append(log)\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'apr_2022_data.log.sort()\n')
-
-
-# Now we deduplicate and save the resulting file. 
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'final_dataset = apr_2022_data.deduplicate()\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'final_dataset.write_to_feather(f"{MEGADATA_PRIMARY_CARE_LOCATION}/final_merged_data.arrow")\n')
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'final_dataset.write_to_log(f"{MEGADATA_PRIMARY_CARE_LOCATION}/final_log.txt")\n')
+# Here we are merging all the 6 datasets together (7 cuts but one invalid) and then deduplicate this. The merged file of each cut of the manifest is written sorted by (nhs_number, code, date), and marked as such, so `merge_files()` (see `bi_py/sorted_merge.py`) merges them in order and drops the duplicates as it goes, reading a few batches of each file at a time rather than loading them all; the log of the merged file refers to the logs of the cuts, and the merge is recorded, with its row counts, in the run log (see `bi_py/run_log.py`). Files which are not marked as sorted (e.g. made before this change) are instead spilled to disk in partitions by nhs_number, each partition deduplicated on its own, `MAX_WORKERS` at a time, so that the whole megadata never has to fit in memory (see `bi_py/partitioned_dedup.py`). 
+# 
+# The cuts of `APPEND_CUTS` are instead appended to `final_merged_data.arrow`, which is neither read nor rewritten: the rows of each cut whose (nhs_number, code, date) are not in it yet, found with its key index (the key columns only), are written to a file of their own, `final_merged_data.arrow.appended/<cut>.arrow` (see `bi_py/megadata.py`). The next notebooks read `megadata_files()`, i.e. `final_merged_data.arrow` and the cuts appended to it. A merge of every cut removes the appended cuts.
+
+# In[ ]:
+
+
+FINAL_MERGED_DATA_LOCATION = f"{MEGADATA_PRIMARY_CARE_LOCATION}/final_merged_data.arrow"
+FINAL_LOG_LOCATION = f"{MEGADATA_PRIMARY_CARE_LOCATION}/final_log.txt"
+
+with profile("NB2: merge the discovery cuts"):
+    if APPEND_CUTS:
+        for cut in active_cuts(discovery_manifest, APPEND_CUTS):
+            append_cut(
+                FINAL_MERGED_DATA_LOCATION,
+                f"{MEGADATA_PRIMARY_CARE_LOCATION}/{cut['megadata']}",
+                cut["cut"],
+                megadata_log_location=FINAL_LOG_LOCATION,
+                cut_log_location=f"{MEGADATA_PRIMARY_CARE_LOCATION}/{cut['megadata_log']}",
+                dedup_on=discovery_manifest["deduplication_options"],
+            )
+    else:
+        discovery_cuts = active_cuts(discovery_manifest)
+        final_log = merge_files(
+            [f"{MEGADATA_PRIMARY_CARE_LOCATION}/{cut['megadata']}" for cut in discovery_cuts],
+            FINAL_MERGED_DATA_LOCATION,
+            log_locations=[f"{MEGADATA_PRIMARY_CARE_LOCATION}/{cut['megadata_log']}" for cut in discovery_cuts],
+            output_log_location=FINAL_LOG_LOCATION,
+            dedup_on=discovery_manifest["deduplication_options"],
+            max_workers=MAX_WORKERS,
+        )
+        clear_appended(FINAL_MERGED_DATA_LOCATION)
 
 
 # ## Map SNOMED codes to ICD10
@@ -1447,47 +292,94 @@ get_ipython().run_cell_magic('time', '', 'final_dataset.write_to_log(f"{MEGADATA
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', 'mapping_file = AnyPath(\n    "/genesandhealth/library-red/genesandhealth",\n    "phenotypes_curated/version008_2024_02",\n    "3digitICD10/snomed-to-icd-mapping/snomed_to_icd_map.tsv"\n)\n')
+mapping_file = AnyPath(
+    "/genesandhealth/library-red/genesandhealth",
+    "phenotypes_curated/version008_2024_02",
+    "3digitICD10/snomed-to-icd-mapping/snomed_to_icd_map.tsv"
+)
 
 
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', 'schema = {\n    "conceptId": pl.Utf8,\n    "mapTarget": pl.Utf8,\n    "ICD10_3digit": pl.Utf8\n}\n')
+schema = {
+    "conceptId": pl.Float64,  # some in scientific notation
+    "mapTarget": pl.Utf8,
+    "ICD10_3digit": pl.Utf8
+}
 
 
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', 'mapping_data = pl.read_csv(mapping_file, separator="\\t", schema=schema)\n')
+with profile("NB2: read the SNOMED to ICD-10 mapping"):
+    mapping_data = pl.read_csv(mapping_file, separator="\t", schema=schema)
 
 
-# Here we are converting the strings to floats and then integers which will remove the scientific notation. 
+# Here we are converting the floats to the canonical SNOMED code type (`UInt64`, see `bi_py/snomed.py`), which removes the scientific notation. 
 
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', "mapping_data = mapping_data.with_columns(pl.col('conceptId').cast(pl.Float64).cast(pl.Int64))\n")
+with profile("NB2: SNOMED codes of the mapping"):
+    mapping_data = snomed_codes(mapping_data, column='conceptId')
 
 
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', 'mapping_data.write_csv(\n    AnyPath(\n        MAPPING_FILES_LOCATION,\n        "processed_mapping_file.csv"\n    )\n)\n')
+with profile("NB2: write the processed mapping file"):
+    mapping_data.write_csv(
+        AnyPath(
+            MAPPING_FILES_LOCATION,
+            "processed_mapping_file.csv"
+        )
+    )
 
 
-# Now we actually do the mapping. We first need to load out feather file and log file. The feather file is the final merged file from above. We are loading from memory as doing this over a day. 
+# Now we actually do the mapping. We first need to load out feather file and log file. The feather file is the final merged file from above. We are loading from memory as doing this over a day.
+# 
+# After an append (`APPEND_CUTS`), only the rows the cuts added to `final_merged_data.arrow` are mapped, as the mapping is row by row: their mapped rows are appended to `final_mapped_data.arrow` in the same way, rather than the whole megadata being mapped again.
 
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', 'final_dataset = ProcessedDataset(\n    path=f"{MEGADATA_PRIMARY_CARE_LOCATION}/final_merged_data.arrow",\n    dataset_type=DatasetType.PRIMARY_CARE.value,\n    coding_system=CodelistType.SNOMED.value,\n    log_path=f"{MEGADATA_PRIMARY_CARE_LOCATION}/final_log.txt"\n)\n')
+with profile("NB2: load the final merged data"):
+    if APPEND_CUTS:
+        # only the rows the cuts added to the megadata
+        to_map = [str(appended_location(FINAL_MERGED_DATA_LOCATION) / f"{cut['cut']}.arrow") for cut in active_cuts(discovery_manifest, APPEND_CUTS)]
+    else:
+        # the merged cuts, and those appended to them since
+        to_map = megadata_files(FINAL_MERGED_DATA_LOCATION)
+    final_dataset = processed_dataset_from_frame(
+        pl.scan_ipc(to_map).collect(),
+        path=FINAL_MERGED_DATA_LOCATION,
+        dataset_type=DatasetType.PRIMARY_CARE.value,
+        coding_system=CodelistType.SNOMED.value,
+        log=[line for line in AnyPath(FINAL_LOG_LOCATION).read_text().splitlines() if line],
+    )
 
 
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', '\n# 2025-04-14: the .map_snomed_to_icd tretools function applies\n# an inner join, i.e, only snomed codes which exist both in\n# `final_dataset` and `mapping_file` are preserved\n# I.e. approx 4m rows kep from approx 66m row (nb. lot fever unique obvs)\n\nmapped_data = (\n    final_dataset\n    .map_snomed_to_icd(\n        mapping_file=f"{MAPPING_FILES_LOCATION}/processed_mapping_file.csv", \n        snomed_col="conceptId",\n        icd_col="mapTarget"\n    )\n)\n')
+with profile("NB2: map SNOMED to ICD-10"):
+    # 2025-04-14: the .map_snomed_to_icd tretools function applies
+    # an inner join, i.e, only snomed codes which exist both in
+    # `final_dataset` and `mapping_file` are preserved
+    # I.e. approx 4m rows kep from approx 66m row (nb. lot fever unique obvs)
+
+    # the codes are UInt64 (see bi_py/snomed.py) but tretools reads the mapping file as Int64
+    final_dataset.data = tretools_snomed_codes(final_dataset.data)
+
+    mapped_data = (
+        final_dataset
+        .map_snomed_to_icd(
+            mapping_file=f"{MAPPING_FILES_LOCATION}/processed_mapping_file.csv", 
+            snomed_col="conceptId",
+            icd_col="mapTarget"
+        )
+    )
 
 
 # We now do a final deduplicate. 
@@ -1495,7 +387,8 @@ get_ipython().run_cell_magic('time', '', '\n# 2025-04-14: the .map_snomed_to_icd
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', 'dedup = mapped_data.deduplicate()\n')
+with profile("NB2: deduplicate the mapped data"):
+    dedup = mapped_data.deduplicate()
 
 
 # Finally we write the merged and mapped dataset to feather and the log to a text file. 
@@ -1505,13 +398,25 @@ get_ipython().run_cell_magic('time', '', 'dedup = mapped_data.deduplicate()\n')
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', 'dedup.write_to_feather(f"{MEGADATA_PRIMARY_CARE_LOCATION}/final_mapped_data.arrow")\n')
-
-
-# In[ ]:
-
+FINAL_MAPPED_DATA_LOCATION = f"{MEGADATA_PRIMARY_CARE_LOCATION}/final_mapped_data.arrow"
+FINAL_MAPPED_LOG_LOCATION = f"{MEGADATA_PRIMARY_CARE_LOCATION}/final_mapped_log.txt"
 
-get_ipython().run_cell_magic('time', '', 'dedup.write_to_log(f"{MEGADATA_PRIMARY_CARE_LOCATION}/final_mapped_log.txt")\n')
+with profile("NB2: write the mapped data"):
+    if APPEND_CUTS:
+        appended_cuts = "-".join(cut["cut"] for cut in active_cuts(discovery_manifest, APPEND_CUTS))
+        dedup.write_to_feather(f"{MEGADATA_PRIMARY_CARE_LOCATION}/mapped_{appended_cuts}.arrow")
+        dedup.write_to_log(f"{MEGADATA_PRIMARY_CARE_LOCATION}/mapped_{appended_cuts}_log.txt")
+        append_cut(
+            FINAL_MAPPED_DATA_LOCATION,
+            f"{MEGADATA_PRIMARY_CARE_LOCATION}/mapped_{appended_cuts}.arrow",
+            appended_cuts,
+            megadata_log_location=FINAL_MAPPED_LOG_LOCATION,
+            cut_log_location=f"{MEGADATA_PRIMARY_CARE_LOCATION}/mapped_{appended_cuts}_log.txt",
+        )
+    else:
+        dedup.write_to_feather(FINAL_MAPPED_DATA_LOCATION)
+        dedup.write_to_log(FINAL_MAPPED_LOG_LOCATION)
+        clear_appended(FINAL_MAPPED_DATA_LOCATION)
 
 
 # ### Run next cell to initiate next notebook
@@ -26,7 +26,7 @@
 # 
 # Once all the datasets have been created:
 # 
-# 1.  Reload each dataset from file and merge with other datasets of the same type for a time period (i.e. the same cut of the data)
+# 1.  Reload each dataset (from memory if verifiably unchanged, see `bi_py/handoff.py`, otherwise from file) and merge with other datasets of the same type for a time period (i.e. the same cut of the data)
 # 2. Deduplicate and merge all the log files together
 # 3. Save in processed merged data folder
 # 
@@ -66,7 +66,6 @@ from tretools.datasets.processed_dataset import ProcessedDataset
 
 from cloudpathlib import AnyPath
 import polars as pl
-import subprocess
 
 
 # ## Paths
@@ -80,6 +79,24 @@ ROOT_LOCATION = "/home/ivm/BI_PY"
 # In[ ]:
 
 
+import sys
+sys.path.append(f"{ROOT_LOCATION}/{VERSION}/Code")
+
+from bi_py.handoff import HandOff
+from bi_py.megadata import merge_many
+from bi_py.person import read_person_dictionary
+from bi_py.processing import process_dataset
+from bi_py.profiling import profile
+from bi_py.snomed import snomed_codes, tretools_snomed_codes
+
+# clean datasets written with `hand_off.write()` are loaded back from memory by `hand_off.load()`,
+# after checking they are unchanged, rather than re-read from file (see `bi_py/handoff.py`)
+hand_off = HandOff()
+
+
+# In[ ]:
+
+
 INPUT_LOCATION = "/genesandhealth/library-red/genesandhealth/phenotypes_rawdata/DSA__BartsHealth_NHS_Trust"
 
 
@@ -193,6 +210,8 @@ date_end=datetime.today()  # datetime.strptime("2024-10-26", "%Y-%m-%d")
 
 #  Line creating demographic object not present, now added SR
 demographics = DemographicDataset(path=demographic_file_path)
+# process_dataset() keys the datasets on the person ids of notebook 1 (see bi_py/person.py)
+person_dictionary = read_person_dictionary(demographic_file_path)
 
 
 # 
@@ -246,8 +265,8 @@ dataset_icd = RawDataset(
 # In[ ]:
 
 
-processed_dataset_icd = dataset_icd.process_dataset(deduplication_options=deduplication_options, 
-                                                    column_maps=col_maps_icd)
+processed_dataset_icd = process_dataset(dataset_icd, deduplication_options=deduplication_options, 
+                                        column_maps=col_maps_icd, person_dictionary=person_dictionary)
 
 
 # In[ ]:
@@ -282,11 +301,10 @@ cleaned_dataset = processed_dataset_icd.remove_unrealistic_dates(
 # In[ ]:
 
 
-cleaned_dataset.write_to_feather(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_ICD.arrow"
-)
-cleaned_dataset.write_to_log(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_ICD_log.txt"
+hand_off.write(
+    cleaned_dataset,
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_ICD.arrow",
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_ICD_log.txt",
 )
 
 
@@ -311,7 +329,13 @@ dataset_opcs = RawDataset(
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', 'processed_dataset_opcs = dataset_opcs.process_dataset(\n    deduplication_options=deduplication_options,\n    column_maps=col_maps_opcs\n)\n')
+with profile("NB3: process the OPCS procedures"):
+    processed_dataset_opcs = process_dataset(
+        dataset_opcs,
+        deduplication_options=deduplication_options,
+        column_maps=col_maps_opcs,
+        person_dictionary=person_dictionary
+    )
 
 
 # In[ ]:
@@ -347,11 +371,10 @@ cleaned_dataset = processed_dataset_opcs.remove_unrealistic_dates(
 # In[ ]:
 
 
-cleaned_dataset.write_to_feather(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_OPCS.arrow"
-)
-cleaned_dataset.write_to_log(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_OPCS_log.txt"
+hand_off.write(
+    cleaned_dataset,
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_OPCS.arrow",
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_OPCS_log.txt",
 )
 
 
@@ -367,13 +390,23 @@ cleaned_dataset.write_to_log(
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', 'dataset_diagnosis = RawDataset(\n    path=dataset_diagnosis_snomed_path,\n    dataset_type=DatasetType.BARTS_HEALTH.value,\n    coding_system=CodelistType.SNOMED.value\n)\n')
+with profile("NB3: read the SNOMED diagnoses"):
+    dataset_diagnosis = RawDataset(
+        path=dataset_diagnosis_snomed_path,
+        dataset_type=DatasetType.BARTS_HEALTH.value,
+        coding_system=CodelistType.SNOMED.value
+    )
 
 
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', "## Why is the polar read with Barts Diagnoiis (2022) importing column DiscriptionID as int64 w/ no problem but only\n## importing conceptId as float64 requiring a recast to int64?\n\n## Note that this seems specific to this file (?to all Diagnosis files) as no recasting needed with Procedures\ndataset_diagnosis.data = dataset_diagnosis.data.with_columns(\n    dataset_diagnosis.data['conceptId'].cast(pl.Int64).alias('code')\n)\n")
+with profile("NB3: SNOMED codes of the diagnoses"):
+    ## Why is the polar read with Barts Diagnoiis (2022) importing column DiscriptionID as int64 w/ no problem but only
+    ## importing conceptId as float64 requiring a recast to int64?
+
+    ## Note that this seems specific to this file (?to all Diagnosis files) as no recasting needed with Procedures
+    dataset_diagnosis.data = snomed_codes(dataset_diagnosis.data, column='conceptId', alias='code')
 
 
 # In[ ]:
@@ -391,8 +424,8 @@ col_maps_snomed = {
 
 
 get_ipython().run_line_magic('time', '')
-processed_diagnosis = dataset_diagnosis.process_dataset(deduplication_options=deduplication_options,
-                                                        column_maps=col_maps_snomed)
+processed_diagnosis = process_dataset(dataset_diagnosis, deduplication_options=deduplication_options,
+                                      column_maps=col_maps_snomed, person_dictionary=person_dictionary)
 
 
 # In[ ]:
@@ -422,11 +455,10 @@ cleaned_dataset = processed_diagnosis.remove_unrealistic_dates(date_start=date_s
 # In[ ]:
 
 
-cleaned_dataset.write_to_feather(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_SNOMED_diagnosis.arrow"
-)
-cleaned_dataset.write_to_log(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_SNOMED_diagnosis_log.txt"
+hand_off.write(
+    cleaned_dataset,
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_SNOMED_diagnosis.arrow",
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_SNOMED_diagnosis_log.txt",
 )
 
 
@@ -455,15 +487,24 @@ procedure_map = {
 # In[ ]:
 
 
-processed_dataset_procedures = dataset_procedures.process_dataset(
+processed_dataset_procedures = process_dataset(
+    dataset_procedures,
     deduplication_options=deduplication_options,
-    column_maps=procedure_map
+    column_maps=procedure_map,
+    person_dictionary=person_dictionary
 )
 
 
 # In[ ]:
 
 
+# the canonical SNOMED code type, as the other SNOMED datasets (see bi_py/snomed.py)
+processed_dataset_procedures.data = snomed_codes(processed_dataset_procedures.data)
+
+
+# In[ ]:
+
+
 processed_dataset_procedures.write_to_feather(
     f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/processed_data/dataset_SNOMED_procedures.arrow"
 )
@@ -486,11 +527,10 @@ cleaned_dataset = processed_dataset_procedures.remove_unrealistic_dates(date_sta
 # In[ ]:
 
 
-cleaned_dataset.write_to_feather(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_SNOMED_procedures.arrow"
-)
-cleaned_dataset.write_to_log(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_SNOMED_procedures_log.txt"
+hand_off.write(
+    cleaned_dataset,
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_SNOMED_procedures.arrow",
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_SNOMED_procedures_log.txt",
 )
 
 
@@ -522,48 +562,23 @@ cleaned_dataset.write_to_log(
 # In[ ]:
 
 
-line_to_exclude = "6010"
-processed_file_name = (
-    AnyPath(
-        dataset_problems_snomed_path
-    ).stem +
-    f"_without_line_{line_to_exclude}" +
-    AnyPath(
-        dataset_problems_snomed_path
-    ).suffix
-)
+from bi_py.quarantine import raw_dataset_from_frame, read_csv_quarantine
 
 
 # In[ ]:
 
 
-barts_2022_03_preprocessing_command = (
-    f"""sed '{line_to_exclude}d' """
-    f"""\"{dataset_problems_snomed_path}\" > """
-    f"""\"{PREPROCESSED_FILES_LOCATION}/{processed_file_name}\""""
-)
-
-
-# In[ ]:
-
-
-subprocess.run(
-    barts_2022_03_preprocessing_command,
-    shell=True,
-    check=True,
-    capture_output=True,
-    text=True
-)
-
-
-# In[ ]:
-
-
-## In order to allow pipeline to run, we have created a file with no truncated line
-dataset_problems = RawDataset(
-    f"{PREPROCESSED_FILES_LOCATION}/{processed_file_name}",
+## In order to allow pipeline to run, the records with more or fewer fields than the header
+## (e.g. line 6010 above) are set aside, with their line numbers, in a rejects file
+dataset_problems = raw_dataset_from_frame(
+    read_csv_quarantine(
+        dataset_problems_snomed_path,
+        rejects_location=f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/processed_data/dataset_SNOMED_problems_rejects.csv",
+    ),
+    path=dataset_problems_snomed_path,
     dataset_type=DatasetType.BARTS_HEALTH.value, 
-    coding_system=CodelistType.SNOMED.value
+    coding_system=CodelistType.SNOMED.value,
+    note="malformed records quarantined",
 )
 
 
@@ -576,11 +591,7 @@ dataset_problems = RawDataset(
 ## 1. To preserve original pipeline
 ## 2. to rename create 'code' column
 
-dataset_problems.data = dataset_problems.data.with_columns(
-    dataset_problems.data['conceptId']
-    .cast(pl.Int64)
-    .alias('code')
-)
+dataset_problems.data = snomed_codes(dataset_problems.data, column='conceptId', alias='code')
 
 
 # In[ ]:
@@ -596,9 +607,11 @@ problems_map = {
 # In[ ]:
 
 
-processed_dataset_problems = dataset_problems.process_dataset(
+processed_dataset_problems = process_dataset(
+    dataset_problems,
     deduplication_options=deduplication_options,
-    column_maps=problems_map
+    column_maps=problems_map,
+    person_dictionary=person_dictionary
 )
 
 
@@ -627,10 +640,11 @@ cleaned_dataset = processed_dataset_problems.remove_unrealistic_dates(date_start
 # In[ ]:
 
 
-cleaned_dataset.write_to_feather(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_SNOMED_problems.arrow")
-cleaned_dataset.write_to_log(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_SNOMED_problems.txt")
+hand_off.write(
+    cleaned_dataset,
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_SNOMED_problems.arrow",
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_SNOMED_problems.txt",
+)
 
 
 # ## Merge all the SNOMED datasets from March 2022 together
@@ -640,7 +654,7 @@ cleaned_dataset.write_to_log(
 # In[ ]:
 
 
-dataset_diagnosis = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_SNOMED_diagnosis.arrow", 
+dataset_diagnosis = hand_off.load(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_SNOMED_diagnosis.arrow", 
                                      dataset_type=DatasetType.BARTS_HEALTH.value, 
                                      coding_system=CodelistType.SNOMED.value, 
                                      log_path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_SNOMED_diagnosis_log.txt")
@@ -649,7 +663,7 @@ dataset_diagnosis = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/
 # In[ ]:
 
 
-dataset_problems = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_SNOMED_problems.arrow", 
+dataset_problems = hand_off.load(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_SNOMED_problems.arrow", 
                                     dataset_type=DatasetType.BARTS_HEALTH.value, 
                                     coding_system=CodelistType.SNOMED.value, 
                                     log_path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_SNOMED_problems.txt")
@@ -658,7 +672,7 @@ dataset_problems = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/m
 # In[ ]:
 
 
-dataset_procedures = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_SNOMED_procedures.arrow", 
+dataset_procedures = hand_off.load(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_SNOMED_procedures.arrow", 
                                       dataset_type=DatasetType.BARTS_HEALTH.value, 
                                       coding_system=CodelistType.SNOMED.value, 
                                       log_path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_SNOMED_procedures_log.txt")
@@ -667,25 +681,7 @@ dataset_procedures = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}
 # In[ ]:
 
 
-dataset_diagnosis.merge_with_dataset(dataset_procedures)
-
-
-# In[ ]:
-
-
-dataset_diagnosis.merge_with_dataset(dataset_problems)
-
-
-# In[ ]:
-
-
-# Now we deduplicate
-
-
-# In[ ]:
-
-
-dedup = dataset_diagnosis.deduplicate()
+dedup = merge_many([dataset_diagnosis, dataset_procedures, dataset_problems], dedup_on=deduplication_options)
 
 
 # In[ ]:
@@ -698,19 +694,6 @@ dedup.write_to_feather(
 # In[ ]:
 
 
-# Add all the logs from the datasets to this final log and sort
-
-
-# In[ ]:
-
-
-for l in dataset_problems.log:
-    dedup.log.append(l)
-    
-for l in dataset_procedures.log:
-    dedup.log.append(l)
-
-dedup.log.sort()
 dedup.write_to_log(
     f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/merged_SNOMED_log.txt")
 
@@ -766,9 +749,11 @@ col_mapping = {
 # In[ ]:
 
 
-processed_dataset_icd1 = dataset_icd1.process_dataset(
+processed_dataset_icd1 = process_dataset(
+    dataset_icd1,
     deduplication_options=deduplication_options,
-    column_maps=col_mapping
+    column_maps=col_mapping,
+    person_dictionary=person_dictionary
 )
 
 
@@ -794,9 +779,11 @@ dataset_icd2 = RawDataset(
 # In[ ]:
 
 
-processed_dataset_icd2 = dataset_icd2.process_dataset(
+processed_dataset_icd2 = process_dataset(
+    dataset_icd2,
     deduplication_options=deduplication_options,
-    column_maps=col_mapping)
+    column_maps=col_mapping,
+    person_dictionary=person_dictionary)
 
 
 # In[ ]:
@@ -813,13 +800,7 @@ processed_dataset_icd2.write_to_log(
 # In[ ]:
 
 
-processed_dataset_icd1.merge_with_dataset(processed_dataset_icd2)
-
-
-# In[ ]:
-
-
-merged_icd = processed_dataset_icd1.deduplicate()
+merged_icd = merge_many([processed_dataset_icd1, processed_dataset_icd2], dedup_on=deduplication_options)
 
 
 # In[ ]:
@@ -831,10 +812,6 @@ merged_icd.write_to_feather(f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/proce
 # In[ ]:
 
 
-for log in processed_dataset_icd2.log:
-    merged_icd.log.append(log)
-
-merged_icd.log.sort()
 merged_icd.write_to_log(f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/processed_data/merged_ICD_log.txt")
 
 
@@ -852,10 +829,11 @@ cleaned_dataset = merged_icd.remove_unrealistic_dates(date_start=date_start,
 # In[ ]:
 
 
-cleaned_dataset.write_to_feather(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/clean_processed_data/merged_ICD.arrow")
-cleaned_dataset.write_to_log(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/clean_processed_data/merged_ICD_log.txt")
+hand_off.write(
+    cleaned_dataset,
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/clean_processed_data/merged_ICD.arrow",
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/clean_processed_data/merged_ICD_log.txt",
+)
 
 
 # ### OPCS
@@ -884,9 +862,11 @@ col_mapping = {
 # In[ ]:
 
 
-processed_dataset_opcs1 = dataset_opcs1.process_dataset(
+processed_dataset_opcs1 = process_dataset(
+    dataset_opcs1,
     deduplication_options=deduplication_options,
-    column_maps=col_mapping
+    column_maps=col_mapping,
+    person_dictionary=person_dictionary
 )
 
 
@@ -912,9 +892,11 @@ dataset_opcs2 = RawDataset(
 # In[ ]:
 
 
-processed_dataset_opcs2 = dataset_opcs2.process_dataset(
+processed_dataset_opcs2 = process_dataset(
+    dataset_opcs2,
     deduplication_options=deduplication_options,
-    column_maps=col_mapping
+    column_maps=col_mapping,
+    person_dictionary=person_dictionary
 )
 
 
@@ -932,18 +914,13 @@ processed_dataset_opcs2.write_to_log(
 # In[ ]:
 
 
-processed_dataset_opcs1.merge_with_dataset(processed_dataset_opcs2)
-merged_opcs = processed_dataset_opcs1.deduplicate()
+merged_opcs = merge_many([processed_dataset_opcs1, processed_dataset_opcs2], dedup_on=deduplication_options)
 merged_opcs.write_to_feather(f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/processed_data/merged_OPCS.arrow")
 
 
 # In[ ]:
 
 
-for log in processed_dataset_opcs2.log:
-    merged_opcs.log.append(log)
-
-merged_opcs.log.sort()
 merged_opcs.write_to_log(f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/processed_data/merged_OPCS_log.txt")
 
 
@@ -956,10 +933,11 @@ cleaned_dataset = merged_opcs.remove_unrealistic_dates(date_start=date_start,
                                                       date_end=date_end,
                                                       before_born=True,
                                                       demographic_dataset=demographics)
-cleaned_dataset.write_to_feather(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/clean_processed_data/merged_OPCS.arrow")
-cleaned_dataset.write_to_log(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/clean_processed_data/merged_OPCS_log.txt")
+hand_off.write(
+    cleaned_dataset,
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/clean_processed_data/merged_OPCS.arrow",
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/clean_processed_data/merged_OPCS_log.txt",
+)
 
 
 # ### SNOMED
@@ -1005,8 +983,7 @@ dataset_diagnosis.log.append(f"{datetime.now()}: After removing ICD codes (G51.0
 # In[ ]:
 
 
-dataset_diagnosis.data = dataset_diagnosis.data.with_columns(
-    dataset_diagnosis.data['DiagCode'].cast(pl.Int64).alias('code'))
+dataset_diagnosis.data = snomed_codes(dataset_diagnosis.data, column='DiagCode', alias='code')
 
 
 # In[ ]:
@@ -1018,17 +995,18 @@ col_maps_snomed = {"code": "code", "Diagnosis": "term", "DiagDt": "date", "Pseud
 # In[ ]:
 
 
-processed_diagnosis = dataset_diagnosis.process_dataset(deduplication_options=deduplication_options,
-                                                        column_maps=col_maps_snomed)
+processed_diagnosis = process_dataset(dataset_diagnosis, deduplication_options=deduplication_options,
+                                      column_maps=col_maps_snomed, person_dictionary=person_dictionary)
 
 
 # In[ ]:
 
 
-processed_diagnosis.write_to_feather(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/processed_data/dataset_SNOMED_diagnosis.arrow")
-processed_diagnosis.write_to_log(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/processed_data/dataset_SNOMED_diagnosis_log.txt")
+hand_off.write(
+    processed_diagnosis,
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/processed_data/dataset_SNOMED_diagnosis.arrow",
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/processed_data/dataset_SNOMED_diagnosis_log.txt",
+)
 
 
 # ### Procedures
@@ -1150,19 +1128,29 @@ col_maps_snomed = {"ProcCD": "code", "ProcDetails": "term", "ProcDt": "date", "P
 # In[ ]:
 
 
-processed_procedures = dataset_procedures.process_dataset(
+processed_procedures = process_dataset(
+    dataset_procedures,
     deduplication_options=deduplication_options,
-    column_maps=col_maps_snomed
+    column_maps=col_maps_snomed,
+    person_dictionary=person_dictionary
 )
 
 
 # In[ ]:
 
 
-processed_procedures.write_to_feather(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/processed_data/dataset_SNOMED_procedures.arrow")
-processed_procedures.write_to_log(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/processed_data/dataset_SNOMED_procedures_log.txt")
+# the canonical SNOMED code type, as the other SNOMED datasets (see bi_py/snomed.py)
+processed_procedures.data = snomed_codes(processed_procedures.data)
+
+
+# In[ ]:
+
+
+hand_off.write(
+    processed_procedures,
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/processed_data/dataset_SNOMED_procedures.arrow",
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/processed_data/dataset_SNOMED_procedures_log.txt",
+)
 
 
 # And now OPCS. Remember this is the OPCS dataset that has come from SNOMED.
@@ -1180,9 +1168,11 @@ dataset_procedures_opcs = RawDataset(
 # In[ ]:
 
 
-processed_procedures_opcs = dataset_procedures_opcs.process_dataset(
+processed_procedures_opcs = process_dataset(
+    dataset_procedures_opcs,
     deduplication_options=deduplication_options,
-    column_maps=col_maps_snomed
+    column_maps=col_maps_snomed,
+    person_dictionary=person_dictionary
 )
 
 
@@ -1279,11 +1269,7 @@ dataset_problems = RawDataset(
 # In[ ]:
 
 
-dataset_problems.data = dataset_problems.data.with_columns(
-    dataset_problems.data['ProbCode']
-    .cast(pl.Int64)
-    .alias('code')
-)
+dataset_problems.data = snomed_codes(dataset_problems.data, column='ProbCode', alias='code')
 
 
 # In[ ]:
@@ -1300,19 +1286,22 @@ col_maps_snomed = {
 # In[ ]:
 
 
-processed_problems = dataset_problems.process_dataset(
+processed_problems = process_dataset(
+    dataset_problems,
     deduplication_options=deduplication_options,
-    column_maps=col_maps_snomed
+    column_maps=col_maps_snomed,
+    person_dictionary=person_dictionary
 )
 
 
 # In[ ]:
 
 
-processed_problems.write_to_feather(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/processed_data/dataset_SNOMED_problems.arrow")
-processed_problems.write_to_log(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/processed_data/dataset_SNOMED_problems_log.txt")
+hand_off.write(
+    processed_problems,
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/processed_data/dataset_SNOMED_problems.arrow",
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/processed_data/dataset_SNOMED_problems_log.txt",
+)
 
 
 # ### Merge all snomed data together for May 2023
@@ -1324,7 +1313,7 @@ processed_problems.write_to_log(
 # In[ ]:
 
 
-processed_diagnosis = ProcessedDataset(
+processed_diagnosis = hand_off.load(
     path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/processed_data/dataset_SNOMED_diagnosis.arrow",
     dataset_type=DatasetType.BARTS_HEALTH.value,
     coding_system=CodelistType.SNOMED.value,
@@ -1334,7 +1323,7 @@ processed_diagnosis = ProcessedDataset(
 # In[ ]:
 
 
-processed_procedures = ProcessedDataset(
+processed_procedures = hand_off.load(
     path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/processed_data/dataset_SNOMED_procedures.arrow",
     dataset_type=DatasetType.BARTS_HEALTH.value,
     coding_system=CodelistType.SNOMED.value,
@@ -1344,7 +1333,7 @@ processed_procedures = ProcessedDataset(
 # In[ ]:
 
 
-processed_problems = ProcessedDataset(
+processed_problems = hand_off.load(
     path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/processed_data/dataset_SNOMED_problems.arrow",
     dataset_type=DatasetType.BARTS_HEALTH.value,
     coding_system=CodelistType.SNOMED.value,
@@ -1356,32 +1345,18 @@ processed_problems = ProcessedDataset(
 # In[ ]:
 
 
-processed_problems.merge_with_dataset(processed_procedures)
-
-
-# In[ ]:
-
-
-processed_problems.merge_with_dataset(processed_diagnosis)
+dedup = merge_many([processed_problems, processed_procedures, processed_diagnosis], dedup_on=deduplication_options)
 
 
 # In[ ]:
 
 
-dedup = processed_problems.deduplicate()
 dedup.write_to_feather(f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/processed_data/merged_SNOMED.arrow")
 
 
 # In[ ]:
 
 
-for l in processed_procedures.log:
-    dedup.log.append(l)
-        
-for l in processed_diagnosis.log:
-    dedup.log.append(l)
-
-dedup.log.sort()
 dedup.write_to_log(f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/processed_data/merged_SNOMED_log.txt")
 
 
@@ -1394,10 +1369,11 @@ cleaned_dataset = dedup.remove_unrealistic_dates(date_start=date_start,
                                                       date_end=date_end,
                                                       before_born=True,
                                                       demographic_dataset=demographics)
-cleaned_dataset.write_to_feather(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/clean_processed_data/merged_SNOMED.arrow")
-cleaned_dataset.write_to_log(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/clean_processed_data/merged_SNOMED_log.txt")
+hand_off.write(
+    cleaned_dataset,
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/clean_processed_data/merged_SNOMED.arrow",
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/clean_processed_data/merged_SNOMED_log.txt",
+)
 
 
 # ## 3rd cut of data - Dec 2023 Data
@@ -1447,9 +1423,11 @@ icd_col_map = {
 # In[ ]:
 
 
-processed_icd_1 = dataset_icd1.process_dataset(
+processed_icd_1 = process_dataset(
+    dataset_icd1,
     deduplication_options=deduplication_options,
-    column_maps=icd_col_map
+    column_maps=icd_col_map,
+    person_dictionary=person_dictionary
 )
 
 
@@ -1491,9 +1469,11 @@ icd_col_map = {
 # In[ ]:
 
 
-processed_icd_2 = dataset_icd2.process_dataset(
+processed_icd_2 = process_dataset(
+    dataset_icd2,
     deduplication_options=deduplication_options,
-    column_maps=icd_col_map
+    column_maps=icd_col_map,
+    person_dictionary=person_dictionary
 )
 
 
@@ -1509,14 +1489,9 @@ processed_icd_2.write_to_log(
 # In[ ]:
 
 
-processed_icd_1.merge_with_dataset(processed_icd_2)
-merged_icd = processed_icd_1.deduplicate()
+merged_icd = merge_many([processed_icd_1, processed_icd_2], dedup_on=deduplication_options)
 merged_icd.write_to_feather(f"{PROCESSED_DATASETS_BARTS_LOCATION}/dec_2023/processed_data/merged_ICD.arrow")
 
-for log in processed_icd_2.log:
-    merged_icd.log.append(log)
-
-merged_icd.log.sort()
 merged_icd.write_to_log(f"{PROCESSED_DATASETS_BARTS_LOCATION}/dec_2023/processed_data/merged_ICD_log.txt")
 
 
@@ -1529,10 +1504,11 @@ cleaned_dataset = merged_icd.remove_unrealistic_dates(date_start=date_start,
                                                       date_end=date_end,
                                                       before_born=True,
                                                       demographic_dataset=demographics)
-cleaned_dataset.write_to_feather(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/dec_2023/clean_processed_data/merged_ICD.arrow")
-cleaned_dataset.write_to_log(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/dec_2023/clean_processed_data/merged_ICD_log.txt")
+hand_off.write(
+    cleaned_dataset,
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/dec_2023/clean_processed_data/merged_ICD.arrow",
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/dec_2023/clean_processed_data/merged_ICD_log.txt",
+)
 
 
 # ### OPCS
@@ -1556,7 +1532,7 @@ col_map = {
 # In[ ]:
 
 
-processed_opcs1 = opcs_1.process_dataset(deduplication_options=deduplication_options, column_maps=col_map)
+processed_opcs1 = process_dataset(opcs_1, deduplication_options=deduplication_options, column_maps=col_map, person_dictionary=person_dictionary)
 
 
 # In[ ]:
@@ -1575,7 +1551,7 @@ opcs_2 = RawDataset(path=dataset_opcs2_path, dataset_type=DatasetType.BARTS_HEAL
 # In[ ]:
 
 
-processed_opcs2 = opcs_2.process_dataset(deduplication_options=deduplication_options, column_maps=col_map)
+processed_opcs2 = process_dataset(opcs_2, deduplication_options=deduplication_options, column_maps=col_map, person_dictionary=person_dictionary)
 
 
 # In[ ]:
@@ -1590,14 +1566,9 @@ processed_opcs2.write_to_log(f"{PROCESSED_DATASETS_BARTS_LOCATION}/dec_2023/proc
 # In[ ]:
 
 
-processed_opcs1.merge_with_dataset(processed_opcs2)
-merged_opcs = processed_opcs1.deduplicate()
+merged_opcs = merge_many([processed_opcs1, processed_opcs2], dedup_on=deduplication_options)
 merged_opcs.write_to_feather(f"{PROCESSED_DATASETS_BARTS_LOCATION}/dec_2023/processed_data/merged_OPCS.arrow")
 
-for log in processed_opcs2.log:
-    merged_opcs.log.append(log)
-
-merged_opcs.log.sort()
 merged_opcs.write_to_log(f"{PROCESSED_DATASETS_BARTS_LOCATION}/dec_2023/processed_data/merged_OPCS_log.txt")
 
 
@@ -1610,10 +1581,11 @@ cleaned_dataset = merged_opcs.remove_unrealistic_dates(date_start=date_start,
                                                       date_end=date_end,
                                                       before_born=True,
                                                       demographic_dataset=demographics)
-cleaned_dataset.write_to_feather(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/dec_2023/clean_processed_data/merged_OPCS.arrow")
-cleaned_dataset.write_to_log(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/dec_2023/clean_processed_data/merged_OPCS_log.txt")
+hand_off.write(
+    cleaned_dataset,
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/dec_2023/clean_processed_data/merged_OPCS.arrow",
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/dec_2023/clean_processed_data/merged_OPCS_log.txt",
+)
 
 
 # ### SNOMED
@@ -1640,7 +1612,14 @@ col_map = {
 # In[ ]:
 
 
-processed_snomed = snomed_data.process_dataset(deduplication_options=deduplication_options, column_maps=col_map)
+processed_snomed = process_dataset(snomed_data, deduplication_options=deduplication_options, column_maps=col_map, person_dictionary=person_dictionary)
+
+
+# In[ ]:
+
+
+# the canonical SNOMED code type, as the other SNOMED datasets (see bi_py/snomed.py)
+processed_snomed.data = snomed_codes(processed_snomed.data)
 
 
 # In[ ]:
@@ -1661,10 +1640,11 @@ cleaned_dataset = processed_snomed.remove_unrealistic_dates(date_start=date_star
                                                       date_end=date_end,
                                                       before_born=True,
                                                       demographic_dataset=demographics)
-cleaned_dataset.write_to_feather(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/dec_2023/clean_processed_data/merged_SNOMED.arrow")
-cleaned_dataset.write_to_log(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/dec_2023/clean_processed_data/merged_SNOMED_log.txt")
+hand_off.write(
+    cleaned_dataset,
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/dec_2023/clean_processed_data/merged_SNOMED.arrow",
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/dec_2023/clean_processed_data/merged_SNOMED_log.txt",
+)
 
 
 # ###### 2024_12 cut start
@@ -1758,6 +1738,14 @@ TARGET_OUTPUT_COLUMNS = [
 TARGET_OUTPUT_COLUMNS_WITH_HASH = TARGET_OUTPUT_COLUMNS + [pl.col("hash")]
 
 
+# The RDE files are scanned with their schema from the registry (`Code/schemas/barts_health.json`, see `bi_py/schema_registry.py`): the dates are parsed, the `Confirmation`/`Vocab` columns read as categoricals and the null tokens (`''`, `' '`, `NULL`, `NA`) read as nulls within the scan, rather than every column being read as a string and cast afterwards.
+
+# In[ ]:
+
+
+from bi_py.schema_registry import scan_with_schema
+
+
 # In[ ]:
 
 
@@ -1783,14 +1771,10 @@ OUTPUT_DATAFRAMES = {}
 
 
 OUTPUT_DATAFRAMES['rde_msds_diagnosis'] = (
-    pl.scan_csv(
-        files["RDE_MSDS_Diagnosis"],
-        separator="\t",
-        infer_schema=False,
-    )
+    scan_with_schema(files["RDE_MSDS_Diagnosis"], source="barts_health", family="RDE_MSDS_Diagnosis", cut="2024_09")
     .select(
         pl.col("PseudoNHS_2024-07-10").alias("pseudo_nhs_number"),
-        pl.col("DiagDate").str.to_date(format="%d/%m/%Y %H:%M").alias("date"),
+        pl.col("DiagDate").alias("date"),
         pl.lit("SNOMED").cast(codesets_enum).alias("codeset"),
         pl.col("Diagnosis").alias("original_code"),  # SNOMED codes, can be cast to .cast(pl.Int64) succesfully.
         pl.col("DiagDesc").alias("original_term"),  # Description of diagnosis
@@ -1804,7 +1788,6 @@ OUTPUT_DATAFRAMES['rde_msds_diagnosis'] = (
     .with_columns(
         HASH_COLUMN       
     )
-    .unique("hash")
     .select(
         TARGET_OUTPUT_COLUMNS_WITH_HASH
     )
@@ -1836,18 +1819,14 @@ OUTPUT_DATAFRAMES['rde_msds_diagnosis'] = (
 
 
 OUTPUT_DATAFRAMES["rde_pc_diagnosis"] = (
-    pl.scan_csv(
-        files["RDE_PC_DIAGNOSIS"],
-        separator="\t",
-        infer_schema=False,
-    )
+    scan_with_schema(files["RDE_PC_DIAGNOSIS"], source="barts_health", family="RDE_PC_DIAGNOSIS", cut="2024_09")
     .filter(
         pl.col("Confirmation").eq("Confirmed"),
 #         pl.col("DiagCode").is_not_null(),   
     )
     .select(
         pl.col("PseudoNHS_2024-07-10").alias("pseudo_nhs_number"),
-        pl.col("DiagDt").str.to_date(format="%d/%m/%Y %H:%M").alias("date"),
+        pl.col("DiagDt").alias("date"),
         pl.lit("SNOMED").cast(codesets_enum).alias("codeset"),
         pl.col("DiagCode").alias("original_code"),
         pl.col("Diagnosis").alias("original_term"),
@@ -1863,7 +1842,6 @@ OUTPUT_DATAFRAMES["rde_pc_diagnosis"] = (
     .with_columns(
         HASH_COLUMN       
     )
-    .unique("hash")
     .select(
         TARGET_OUTPUT_COLUMNS_WITH_HASH
     )
@@ -1889,14 +1867,10 @@ OUTPUT_DATAFRAMES["rde_pc_diagnosis"] = (
 
 
 OUTPUT_DATAFRAMES["rde_op_diagnosis"] = (
-    pl.scan_csv(
-        files["RDE_OP_DIAGNOSIS"],
-        separator="\t",
-        infer_schema=False,
-    )
+    scan_with_schema(files["RDE_OP_DIAGNOSIS"], source="barts_health", family="RDE_OP_DIAGNOSIS", cut="2024_09")
     .select(
         pl.col("PseudoNHS_2024-07-10").alias("pseudo_nhs_number"),
-        pl.col("Activity_date").str.to_date(format="%d/%m/%Y").alias("date"),
+        pl.col("Activity_date").alias("date"),
         pl.lit("ICD10").cast(codesets_enum).alias("codeset"),
         pl.col("ICD_Diagnosis_Cd").alias("original_code"),
         pl.col("ICD_Diag_Desc").alias("original_term"),
@@ -1905,7 +1879,6 @@ OUTPUT_DATAFRAMES["rde_op_diagnosis"] = (
     .with_columns(
         HASH_COLUMN       
     )
-    .unique("hash")
     .select(
         TARGET_OUTPUT_COLUMNS_WITH_HASH
     )
@@ -1950,18 +1923,14 @@ OUTPUT_DATAFRAMES["rde_op_diagnosis"] = (
 
 
 OUTPUT_DATAFRAMES["rde_pc_problems"] = (
-    pl.scan_csv(
-        files["RDE_PC_PROBLEMS"],
-        separator="\t",
-        infer_schema=False,
-    )
+    scan_with_schema(files["RDE_PC_PROBLEMS"], source="barts_health", family="RDE_PC_PROBLEMS", cut="2024_09")
     .filter(
         pl.col("Confirmation").eq("Confirmed"),
         pl.col("Vocab").eq("SNOMED CT")
     )
     .select(
         pl.col("PseudoNHS_2024-07-10").alias("pseudo_nhs_number"),
-        pl.col("OnsetDate").str.to_date(format="%Y-%m-%d %H:%M").alias("date"), # note hypens separating date elements
+        pl.col("OnsetDate").alias("date"), # note hypens separating date elements (format in the schema registry)
         pl.lit("SNOMED").cast(codesets_enum).alias("codeset"),
         pl.col("ProbCode").str.strip_chars().alias("original_code"),
         pl.col("Problem").alias("original_term"),
@@ -1970,7 +1939,6 @@ OUTPUT_DATAFRAMES["rde_pc_problems"] = (
     .with_columns(
         HASH_COLUMN       
     )
-    .unique("hash")
     .select(
         TARGET_OUTPUT_COLUMNS_WITH_HASH
     )
@@ -2010,12 +1978,7 @@ OUTPUT_DATAFRAMES["rde_pc_problems"] = (
 
 
 OUTPUT_DATAFRAMES['rde_pc_procedures'] = (
-    pl.scan_csv(
-        [
-            files["RDE_PC_PROCEDURES"],
-        ],
-        separator="\t"
-    )
+    scan_with_schema(files["RDE_PC_PROCEDURES"], source="barts_health", family="RDE_PC_PROCEDURES", cut="2024_09")
     .select(
         pl.col("PseudoNHS_2024-07-10").alias("pseudo_nhs_number"),
         pl.col("ProcType")
@@ -2027,7 +1990,7 @@ OUTPUT_DATAFRAMES['rde_pc_procedures'] = (
 #         pl.col("DischargeDT"),
 #         pl.col("TreatmentFunc"),
 #         pl.col("Specialty"),
-        pl.col("ProcDt").str.to_date(format="%d/%m/%Y %H:%M").alias("date"),
+        pl.col("ProcDt").alias("date"),
         pl.col("ProcCD").alias("original_code"),
         pl.col("ProcDetails").alias("original_term"),
         pl.lit("RDE_PC_PROCEDURES").cast(provenance_enum).alias("provenance")
@@ -2035,7 +1998,6 @@ OUTPUT_DATAFRAMES['rde_pc_procedures'] = (
     .with_columns(
         HASH_COLUMN       
     )
-    .unique("hash")
     .select(
         TARGET_OUTPUT_COLUMNS_WITH_HASH
     )
@@ -2064,15 +2026,10 @@ OUTPUT_DATAFRAMES['rde_pc_procedures'] = (
 
 
 OUTPUT_DATAFRAMES["rde_opa_opcs"] = (
-    pl.scan_csv(
-        [
-            files["RDE_OPA_OPCS"],
-        ],
-        separator="\t"
-    )
+    scan_with_schema(files["RDE_OPA_OPCS"], source="barts_health", family="RDE_OPA_OPCS", cut="2024_09")
     .select(
         pl.col("PseudoNHS_2024-07-10").alias("pseudo_nhs_number"),
-        pl.col("OPCS_Proc_Dt").str.to_date(format="%d/%m/%Y %H:%M").alias("date"),
+        pl.col("OPCS_Proc_Dt").alias("date"),
         pl.lit("OPCS").cast(codesets_enum).alias("codeset"),
         pl.col("OPCS_Proc_Cd").alias("original_code"),
         pl.col("Proc_Desc").alias("original_term"),
@@ -2081,7 +2038,6 @@ OUTPUT_DATAFRAMES["rde_opa_opcs"] = (
     .with_columns(
         HASH_COLUMN       
     )
-    .unique("hash")
     .select(
         TARGET_OUTPUT_COLUMNS_WITH_HASH
     )
@@ -2111,15 +2067,10 @@ OUTPUT_DATAFRAMES["rde_opa_opcs"] = (
 
 
 OUTPUT_DATAFRAMES["rde_apc_opcs"] = (
-    pl.scan_csv(
-        [
-            files["RDE_APC_OPCS"],
-        ],
-        separator="\t"
-    )
+    scan_with_schema(files["RDE_APC_OPCS"], source="barts_health", family="RDE_APC_OPCS", cut="2024_09")
     .select(
         pl.col("PseudoNHS_2024-07-10").alias("pseudo_nhs_number"),
-        pl.col("OPCS_Proc_Dt").str.to_date(format="%d/%m/%Y %H:%M").alias("date"),
+        pl.col("OPCS_Proc_Dt").alias("date"),
         pl.lit("OPCS").cast(codesets_enum).alias("codeset"),
         pl.col("OPCS_Proc_Cd").alias("original_code"),
         pl.col("Proc_Desc").alias("original_term"),
@@ -2128,7 +2079,6 @@ OUTPUT_DATAFRAMES["rde_apc_opcs"] = (
     .with_columns(
         HASH_COLUMN       
     )
-    .unique("hash")
     .select(
         TARGET_OUTPUT_COLUMNS_WITH_HASH
     )
@@ -2156,15 +2106,10 @@ OUTPUT_DATAFRAMES["rde_apc_opcs"] = (
 
 
 OUTPUT_DATAFRAMES["rde_apc_diagnosis"] = (
-    pl.scan_csv(
-        [
-            files["RDE_APC_DIAGNOSIS"],
-        ],
-        separator="\t"
-    )
+    scan_with_schema(files["RDE_APC_DIAGNOSIS"], source="barts_health", family="RDE_APC_DIAGNOSIS", cut="2024_09")
     .select(
         pl.col("PseudoNHS_2024-07-10").alias("pseudo_nhs_number"),
-        pl.col("Activity_date").str.to_date(format="%d/%m/%Y %H:%M").alias("date"),
+        pl.col("Activity_date").alias("date"),
         pl.lit("ICD10").cast(codesets_enum).alias("codeset"),
         pl.col("ICD_Diagnosis_Cd").alias("original_code"),
         pl.col("ICD_Diag_Desc").alias("original_term"),
@@ -2173,7 +2118,6 @@ OUTPUT_DATAFRAMES["rde_apc_diagnosis"] = (
     .with_columns(
         HASH_COLUMN       
     )
-    .unique("hash")
     .select(
         TARGET_OUTPUT_COLUMNS_WITH_HASH
     )
@@ -2210,19 +2154,13 @@ OUTPUT_DATAFRAMES["rde_apc_diagnosis"] = (
 
 
 OUTPUT_DATAFRAMES["rde_all_procedures"] = (
-    pl.scan_csv(
-        [
-            files["RDE_ALL_PROCEDURES"],
-        ],
-        separator="\t",
-        quote_char=None,
-    )
+    scan_with_schema(files["RDE_ALL_PROCEDURES"], source="barts_health", family="RDE_ALL_PROCEDURES", cut="2024_09")
     .filter(
-        pl.col("Procedure_date").ne("1899-12-30 00:00")
+        pl.col("Procedure_date").is_not_null()  # 1899-12-30 00:00 is read as null, see the schema registry
     )
     .select(
         pl.col("PseudoNHS_2024-07-10").alias("pseudo_nhs_number"),
-        pl.col("Procedure_date").str.to_date(format="%d/%m/%Y %H:%M").alias("date"),
+        pl.col("Procedure_date").alias("date"),
         (
             pl.col("Catalogue")
             .str.replace("ICD10WHO", "ICD10")
@@ -2237,7 +2175,6 @@ OUTPUT_DATAFRAMES["rde_all_procedures"] = (
     .with_columns(
         HASH_COLUMN       
     )
-    .unique("hash")
     .select(
         TARGET_OUTPUT_COLUMNS_WITH_HASH
     )
@@ -2247,35 +2184,39 @@ OUTPUT_DATAFRAMES["rde_all_procedures"] = (
 # rde_all_procedures
 
 
-# ### 10. Now concat all 9 lazyframes into a single dataframe
+# ### 10. Now concat all 9 lazyframes into a single dataframe and de-duplicate it
+# 
+# The 9 lazyframes are not de-duplicated one by one: rows duplicated within a file are also duplicated across the concatenation, so a single `unique("hash")` over all of them gives the same result.  The 9 files are scanned concurrently (`parallel=True`) within one query, and `collect_all` computes the row count before de-duplication in the same pass, so the cut takes about as long as its largest file.
 
 # In[ ]:
 
 
-rde_all_all = pl.concat(OUTPUT_DATAFRAMES.values()).collect()
+rde_all_all = pl.concat(OUTPUT_DATAFRAMES.values(), parallel=True)
 
 
-# #### De-duplicate concatenated 2024_09 cut
-
 # In[ ]:
 
 
-height_before = rde_all_all.shape[0]
+with profile("NB3: deduplicate rde_all_all"):
+    height_before, rde_all_all = pl.collect_all(
+        [
+            rde_all_all.select(pl.len()),
+            rde_all_all.unique("hash"),
+        ]
+    )
+    height_before = height_before.item()
 
 
 # In[ ]:
 
 
-rde_all_all = (
-    rde_all_all
-    .unique("hash")
-)
+height_after = rde_all_all.shape[0]
 
 
 # In[ ]:
 
 
-height_after = rde_all_all.shape[0]
+print(f"{height_before - height_after} rows removed by de-duplicating.")
 
 
 # In[ ]:
@@ -2303,21 +2244,21 @@ rde_all_all.write_ipc(
 
 
 for codeset in codesets_enum.categories:
-    (
+    rde_codeset = (
         rde_all_all
         .filter(
             pl.col("codeset").eq(codeset),
             pl.col("date").is_not_null(),
         )
-        .with_columns(
-            # in order to comply wit tretools specifications, we have to recast "date" as a string
-            pl.col("date").cast(pl.Utf8)
-        )
-        .write_ipc(
-            AnyPath(
-                PREPROCESSED_FILES_LOCATION,
-                f"2024_09_Barts_RDE_{codeset}.arrow"
-            )
+        # "date" stays a pl.Date, which process_dataset() keeps as is (see bi_py/dates.py)
+    )
+    if codeset == "SNOMED":
+        # the canonical SNOMED code type (see bi_py/snomed.py); the few non-numeric codes are dropped
+        rde_codeset = snomed_codes(rde_codeset, column="original_code", strict=False)
+    rde_codeset.write_ipc(
+        AnyPath(
+            PREPROCESSED_FILES_LOCATION,
+            f"2024_09_Barts_RDE_{codeset}.arrow"
         )
     )
 
@@ -2366,9 +2307,11 @@ col_map = {
 # In[ ]:
 
 
-processed_icd = dataset_icd.process_dataset(
+processed_icd = process_dataset(
+    dataset_icd,
     deduplication_options=deduplication_options,
-    column_maps=col_map
+    column_maps=col_map,
+    person_dictionary=person_dictionary
 )
 
 
@@ -2393,10 +2336,11 @@ cleaned_dataset = processed_icd.remove_unrealistic_dates(date_start=date_start,
                                                       date_end=date_end,
                                                       before_born=True,
                                                       demographic_dataset=demographics)
-cleaned_dataset.write_to_feather(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/sep_2024/clean_processed_data/merged_ICD.arrow")
-cleaned_dataset.write_to_log(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/sep_2024/clean_processed_data/merged_ICD_log.txt")
+hand_off.write(
+    cleaned_dataset,
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/sep_2024/clean_processed_data/merged_ICD.arrow",
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/sep_2024/clean_processed_data/merged_ICD_log.txt",
+)
 
 
 # ### OPCS
@@ -2414,9 +2358,11 @@ opcs = RawDataset(
 # In[ ]:
 
 
-processed_opcs = opcs.process_dataset(
+processed_opcs = process_dataset(
+    opcs,
     deduplication_options=deduplication_options,
-    column_maps=col_map
+    column_maps=col_map,
+    person_dictionary=person_dictionary
 )
 
 
@@ -2441,10 +2387,11 @@ cleaned_dataset = processed_opcs.remove_unrealistic_dates(
     demographic_dataset=demographics
 )
 
-cleaned_dataset.write_to_feather(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/sep_2024/clean_processed_data/merged_OPCS.arrow")
-cleaned_dataset.write_to_log(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/sep_2024/clean_processed_data/merged_OPCS_log.txt")
+hand_off.write(
+    cleaned_dataset,
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/sep_2024/clean_processed_data/merged_OPCS.arrow",
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/sep_2024/clean_processed_data/merged_OPCS_log.txt",
+)
 
 
 # ### SNOMED
@@ -2462,7 +2409,7 @@ snomed_data = RawDataset(
 # In[ ]:
 
 
-processed_snomed = snomed_data.process_dataset(deduplication_options=deduplication_options, column_maps=col_map)
+processed_snomed = process_dataset(snomed_data, deduplication_options=deduplication_options, column_maps=col_map, person_dictionary=person_dictionary)
 
 
 # In[ ]:
@@ -2486,10 +2433,11 @@ cleaned_dataset = processed_snomed.remove_unrealistic_dates(
     demographic_dataset=demographics
 )
 
-cleaned_dataset.write_to_feather(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/sep_2024/clean_processed_data/merged_SNOMED.arrow")
-cleaned_dataset.write_to_log(
-    f"{PROCESSED_DATASETS_BARTS_LOCATION}/sep_2024/clean_processed_data/merged_SNOMED_log.txt")
+hand_off.write(
+    cleaned_dataset,
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/sep_2024/clean_processed_data/merged_SNOMED.arrow",
+    f"{PROCESSED_DATASETS_BARTS_LOCATION}/sep_2024/clean_processed_data/merged_SNOMED_log.txt",
+)
 
 
 # ###### 2024_09 cut end
@@ -2504,7 +2452,7 @@ cleaned_dataset.write_to_log(
 # In[ ]:
 
 
-march_2022_icd = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_ICD.arrow", 
+march_2022_icd = hand_off.load(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_ICD.arrow", 
                                   dataset_type=DatasetType.BARTS_HEALTH.value, 
                                   coding_system=CodelistType.ICD10.value, 
                                   log_path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_ICD_log.txt")
@@ -2513,7 +2461,7 @@ march_2022_icd = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/mar
 # In[ ]:
 
 
-may_2023_icd = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/clean_processed_data/merged_ICD.arrow", 
+may_2023_icd = hand_off.load(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/clean_processed_data/merged_ICD.arrow", 
                                   dataset_type=DatasetType.BARTS_HEALTH.value, 
                                   coding_system=CodelistType.ICD10.value, 
                                   log_path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/clean_processed_data/merged_ICD_log.txt")
@@ -2522,7 +2470,7 @@ may_2023_icd = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2
 # In[ ]:
 
 
-dec_2023_icd = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/dec_2023/clean_processed_data/merged_ICD.arrow", 
+dec_2023_icd = hand_off.load(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/dec_2023/clean_processed_data/merged_ICD.arrow", 
                                   dataset_type=DatasetType.BARTS_HEALTH.value, 
                                   coding_system=CodelistType.ICD10.value, 
                                   log_path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/dec_2023/clean_processed_data/merged_ICD_log.txt")
@@ -2531,7 +2479,7 @@ dec_2023_icd = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/dec_2
 # In[ ]:
 
 
-sep_2024_icd = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/sep_2024/clean_processed_data/merged_ICD.arrow", 
+sep_2024_icd = hand_off.load(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/sep_2024/clean_processed_data/merged_ICD.arrow", 
                                   dataset_type=DatasetType.BARTS_HEALTH.value, 
                                   coding_system=CodelistType.ICD10.value, 
                                   log_path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/sep_2024/clean_processed_data/merged_ICD_log.txt")
@@ -2540,47 +2488,13 @@ sep_2024_icd = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/sep_2
 # In[ ]:
 
 
-march_2022_icd.merge_with_dataset(may_2023_icd)
-
-
-# In[ ]:
-
-
-march_2022_icd.merge_with_dataset(dec_2023_icd)
-
-
-# In[ ]:
-
-
-march_2022_icd.merge_with_dataset(sep_2024_icd)
-
-
-# In[ ]:
-
-
-dedup_icd = march_2022_icd.deduplicate()
-
-
-# In[ ]:
-
-
-for log in may_2023_icd.log:
-    dedup_icd.log.append(log)
-
-for log in dec_2023_icd.log:
-    dedup_icd.log.append(log)
-    
-for log in sep_2024_icd.log:
-    dedup_icd.log.append(log)
-
-dedup_icd.log.sort()
+dedup_icd = merge_many([march_2022_icd, may_2023_icd, dec_2023_icd, sep_2024_icd], dedup_on=deduplication_options)
 
 
 # In[ ]:
 
 
-dedup_icd.write_to_feather(f"{MEGADATA_BARTS_LOCATION}/merged_ICD.arrow")
-dedup_icd.write_to_log(f"{MEGADATA_BARTS_LOCATION}/merged_ICD_log.txt")
+hand_off.write(dedup_icd, f"{MEGADATA_BARTS_LOCATION}/merged_ICD.arrow", f"{MEGADATA_BARTS_LOCATION}/merged_ICD_log.txt")
 
 
 # ### OPCS codes
@@ -2588,7 +2502,7 @@ dedup_icd.write_to_log(f"{MEGADATA_BARTS_LOCATION}/merged_ICD_log.txt")
 # In[ ]:
 
 
-march_2022_opcs = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_OPCS.arrow", 
+march_2022_opcs = hand_off.load(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_OPCS.arrow", 
                                   dataset_type=DatasetType.BARTS_HEALTH.value, 
                                   coding_system=CodelistType.OPCS.value, 
                                   log_path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/march_2022/clean_processed_data/dataset_OPCS_log.txt")
@@ -2597,7 +2511,7 @@ march_2022_opcs = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/ma
 # In[ ]:
 
 
-may_2023_opcs = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/clean_processed_data/merged_OPCS.arrow", 
+may_2023_opcs = hand_off.load(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/clean_processed_data/merged_OPCS.arrow", 
                                   dataset_type=DatasetType.BARTS_HEALTH.value, 
                                   coding_system=CodelistType.OPCS.value, 
                                   log_path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/clean_processed_data/merged_OPCS_log.txt")
@@ -2606,7 +2520,7 @@ may_2023_opcs = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_
 # In[ ]:
 
 
-dec_2023_opcs = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/dec_2023/clean_processed_data/merged_OPCS.arrow", 
+dec_2023_opcs = hand_off.load(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/dec_2023/clean_processed_data/merged_OPCS.arrow", 
                                   dataset_type=DatasetType.BARTS_HEALTH.value, 
                                   coding_system=CodelistType.OPCS.value, 
                                   log_path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/dec_2023/clean_processed_data/merged_OPCS_log.txt")
@@ -2615,7 +2529,7 @@ dec_2023_opcs = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/dec_
 # In[ ]:
 
 
-sep_2024_opcs = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/sep_2024/clean_processed_data/merged_OPCS.arrow",
+sep_2024_opcs = hand_off.load(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/sep_2024/clean_processed_data/merged_OPCS.arrow",
                                   dataset_type=DatasetType.BARTS_HEALTH.value, 
                                   coding_system=CodelistType.OPCS.value, 
                                   log_path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/sep_2024/clean_processed_data/merged_OPCS_log.txt")
@@ -2624,40 +2538,7 @@ sep_2024_opcs = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/sep_
 # In[ ]:
 
 
-march_2022_opcs.merge_with_dataset(may_2023_opcs)
-
-
-# In[ ]:
-
-
-march_2022_opcs.merge_with_dataset(dec_2023_opcs)
-
-
-# In[ ]:
-
-
-march_2022_opcs.merge_with_dataset(sep_2024_opcs)
-
-
-# In[ ]:
-
-
-dedup_opcs = march_2022_opcs.deduplicate()
-
-
-# In[ ]:
-
-
-for log in may_2023_opcs.log:
-    dedup_opcs.log.append(log)
-    
-for log in dec_2023_opcs.log:
-    dedup_opcs.log.append(log)
-
-for log in sep_2024_opcs.log:
-    dedup_opcs.log.append(log)
-
-dedup_opcs.log.sort()
+dedup_opcs = merge_many([march_2022_opcs, may_2023_opcs, dec_2023_opcs, sep_2024_opcs], dedup_on=deduplication_options)
 
 
 # In[ ]:
@@ -2681,7 +2562,7 @@ march_2022_snomed = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/
 # In[ ]:
 
 
-may_2023_snomed = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/clean_processed_data/merged_SNOMED.arrow", 
+may_2023_snomed = hand_off.load(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/clean_processed_data/merged_SNOMED.arrow", 
                                   dataset_type=DatasetType.BARTS_HEALTH.value, 
                                   coding_system=CodelistType.SNOMED.value, 
                                   log_path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/may_2023/clean_processed_data/merged_SNOMED_log.txt")
@@ -2690,7 +2571,7 @@ may_2023_snomed = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/ma
 # In[ ]:
 
 
-dec_2023_snomed = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/dec_2023/clean_processed_data/merged_SNOMED.arrow", 
+dec_2023_snomed = hand_off.load(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/dec_2023/clean_processed_data/merged_SNOMED.arrow", 
                                   dataset_type=DatasetType.BARTS_HEALTH.value, 
                                   coding_system=CodelistType.SNOMED.value, 
                                   log_path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/dec_2023/clean_processed_data/merged_SNOMED_log.txt")
@@ -2699,7 +2580,7 @@ dec_2023_snomed = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/de
 # In[ ]:
 
 
-sep_2024_snomed = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/sep_2024/clean_processed_data/merged_SNOMED.arrow", 
+sep_2024_snomed = hand_off.load(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/sep_2024/clean_processed_data/merged_SNOMED.arrow", 
                                   dataset_type=DatasetType.BARTS_HEALTH.value, 
                                   coding_system=CodelistType.SNOMED.value, 
                                   log_path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/sep_2024/clean_processed_data/merged_SNOMED_log.txt")
@@ -2708,58 +2589,13 @@ sep_2024_snomed = ProcessedDataset(path=f"{PROCESSED_DATASETS_BARTS_LOCATION}/se
 # In[ ]:
 
 
-march_2022_snomed.merge_with_dataset(may_2023_snomed)
+dedup_snomed = merge_many([march_2022_snomed, may_2023_snomed, dec_2023_snomed, sep_2024_snomed], dedup_on=deduplication_options)
 
 
 # In[ ]:
 
 
-march_2022_snomed.merge_with_dataset(dec_2023_snomed)
-
-
-# In[ ]:
-
-
-sep_2024_snomed.data = (
-    # We have to do a little madness here to comply with expected tretools input
-    sep_2024_snomed.data
-    .with_columns(
-        pl.col("code")
-        .cast(pl.Int64, strict=False)
-    )
-    .filter(
-        pl.col("code").is_not_null()
-    )
-)
-march_2022_snomed.merge_with_dataset(sep_2024_snomed)
-
-
-# In[ ]:
-
-
-dedup_snomed = march_2022_snomed.deduplicate()
-
-
-# In[ ]:
-
-
-for log in may_2023_snomed.log:
-    dedup_snomed.log.append(log)
-    
-for log in dec_2023_snomed.log:
-    dedup_snomed.log.append(log)
-
-for log in sep_2024_snomed.log:
-    dedup_snomed.log.append(log)
-     
-dedup_snomed.log.sort()
-
-
-# In[ ]:
-
-
-dedup_snomed.write_to_feather(f"{MEGADATA_BARTS_LOCATION}/merged_SNOMED.arrow")
-dedup_snomed.write_to_log(f"{MEGADATA_BARTS_LOCATION}/merged_SNOMED_log.txt")
+hand_off.write(dedup_snomed, f"{MEGADATA_BARTS_LOCATION}/merged_SNOMED.arrow", f"{MEGADATA_BARTS_LOCATION}/merged_SNOMED_log.txt")
 
 
 # ## Mapping SNOMED to ICD
@@ -2777,7 +2613,7 @@ dedup_snomed.write_to_log(f"{MEGADATA_BARTS_LOCATION}/merged_SNOMED_log.txt")
 # In[ ]:
 
 
-snomed_data = ProcessedDataset(path=f"{MEGADATA_BARTS_LOCATION}/merged_SNOMED.arrow", 
+snomed_data = hand_off.load(path=f"{MEGADATA_BARTS_LOCATION}/merged_SNOMED.arrow", 
                                dataset_type=DatasetType.BARTS_HEALTH.value, 
                                coding_system=CodelistType.SNOMED.value,
                                log_path=f"{MEGADATA_BARTS_LOCATION}/merged_SNOMED_log.txt"
@@ -2793,6 +2629,9 @@ snomed_data = ProcessedDataset(path=f"{MEGADATA_BARTS_LOCATION}/merged_SNOMED.ar
 # In[ ]:
 
 
+# the codes are UInt64 (see bi_py/snomed.py) but tretools reads the mapping file as Int64
+snomed_data.data = tretools_snomed_codes(snomed_data.data)
+
 mapped_data = snomed_data.map_snomed_to_icd(
     mapping_file=f"{MAPPING_FILES_LOCATION}/processed_mapping_file.csv",
     snomed_col="conceptId",
@@ -2809,8 +2648,7 @@ final_dedup = mapped_data.deduplicate()
 # In[ ]:
 
 
-final_dedup.write_to_feather(f"{MEGADATA_BARTS_LOCATION}/final_mapped_snomed_to_icd.arrow")
-final_dedup.write_to_log(f"{MEGADATA_BARTS_LOCATION}/final_mapped_snomed_to_icd_log.txt")
+hand_off.write(final_dedup, f"{MEGADATA_BARTS_LOCATION}/final_mapped_snomed_to_icd.arrow", f"{MEGADATA_BARTS_LOCATION}/final_mapped_snomed_to_icd_log.txt")
 
 
 # Now we merged with the ICD codes
@@ -2818,7 +2656,7 @@ final_dedup.write_to_log(f"{MEGADATA_BARTS_LOCATION}/final_mapped_snomed_to_icd_
 # In[ ]:
 
 
-icd_data = ProcessedDataset(path=f"{MEGADATA_BARTS_LOCATION}/merged_ICD.arrow", 
+icd_data = hand_off.load(path=f"{MEGADATA_BARTS_LOCATION}/merged_ICD.arrow", 
                                dataset_type=DatasetType.BARTS_HEALTH.value, 
                                coding_system=CodelistType.ICD10.value,
                                log_path=f"{MEGADATA_BARTS_LOCATION}/merged_ICD_log.txt"
@@ -2828,7 +2666,7 @@ icd_data = ProcessedDataset(path=f"{MEGADATA_BARTS_LOCATION}/merged_ICD.arrow",
 # In[ ]:
 
 
-snomed_to_icd_data =  ProcessedDataset(path=f"{MEGADATA_BARTS_LOCATION}/final_mapped_snomed_to_icd.arrow", 
+snomed_to_icd_data =  hand_off.load(path=f"{MEGADATA_BARTS_LOCATION}/final_mapped_snomed_to_icd.arrow", 
                                dataset_type=DatasetType.BARTS_HEALTH.value, 
                                coding_system=CodelistType.ICD10.value,
                                log_path=f"{MEGADATA_BARTS_LOCATION}/final_mapped_snomed_to_icd_log.txt"
@@ -2838,13 +2676,7 @@ snomed_to_icd_data =  ProcessedDataset(path=f"{MEGADATA_BARTS_LOCATION}/final_ma
 # In[ ]:
 
 
-icd_data.merge_with_dataset(snomed_to_icd_data)
-
-
-# In[ ]:
-
-
-merged_final = icd_data.deduplicate()
+merged_final = merge_many([icd_data, snomed_to_icd_data], dedup_on=deduplication_options)
 
 
 # In[ ]:
@@ -2856,11 +2688,6 @@ merged_final.write_to_feather(f"{MEGADATA_BARTS_LOCATION}/merged_and_mapped_icd.
 # In[ ]:
 
 
-for log in snomed_to_icd_data.log:
-    merged_final.log.append(log)
-
-merged_final.log.sort()
-
 merged_final.write_to_log(f"{MEGADATA_BARTS_LOCATION}/merged_and_mapped_icd_log.txt")
 
 
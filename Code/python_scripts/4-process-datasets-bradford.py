@@ -23,7 +23,7 @@
 # 5) Save this "clean" data
 # 
 # Once we have done this:
-# 1) Reload each dataset from file and merge with other datasets of the same type for a time period (i.e. the same cut of the data)
+# 1) Reload each dataset (from memory if verifiably unchanged, see `bi_py/handoff.py`, otherwise from file) and merge with other datasets of the same type for a time period (i.e. the same cut of the data)
 # 2) Deduplicate and merge all the log files together
 # 3) Save
 # 
@@ -65,18 +65,6 @@ from tretools.datasets.processed_dataset import ProcessedDataset
 # In[ ]:
 
 
-import pandas as pd # Why Pandas? 
-# Maybe because at the time of writing polars has limited read_xlsx support?
-# if we were to use polars for the .xlsx imports, then the `fastexcel` package must be installed:
-# """
-# ModuleNotFoundError: required package 'fastexcel' not found.
-# """
-# when using `import polars as pl` and `pl.read_excel(...)`
-
-
-# In[ ]:
-
-
 INPUT_FOLDER = (
     "/genesandhealth/library-red/genesandhealth/phenotypes_rawdata/"
     "DSA__BradfordTeachingHospitals_NHSFoundation_Trust"
@@ -92,6 +80,24 @@ ROOT_LOCATION = "/home/ivm/BI_PY"
 # In[ ]:
 
 
+import sys
+sys.path.append(f"{ROOT_LOCATION}/{VERSION}/Code")
+
+from bi_py.handoff import HandOff
+from bi_py.megadata import merge_many
+from bi_py.person import read_person_dictionary
+from bi_py.processing import process_dataset
+from bi_py.profiling import profile
+from bi_py.snomed import snomed_codes, tretools_snomed_codes
+
+# clean datasets written with `hand_off.write()` are loaded back from memory by `hand_off.load()`,
+# after checking they are unchanged, rather than re-read from file (see `bi_py/handoff.py`)
+hand_off = HandOff()
+
+
+# In[ ]:
+
+
 PROCESSED_DATASETS_LOCATION = f"{ROOT_LOCATION}/{VERSION}/processed_datasets"
 MEGADATA_LOCATION = f"{ROOT_LOCATION}/{VERSION}/megadata"
 PREPROCESSED_FILES_LOCATION = f"{ROOT_LOCATION}/{VERSION}/preprocessed_files"
@@ -170,6 +176,8 @@ demographic_file_path = f"{PROCESSED_DATASETS_LOCATION}/demographics/clean_demog
 date_start=datetime.strptime("1910-01-01", "%Y-%m-%d")
 date_end=datetime.today() # Was hardcoded as 2024-01-29.
 demographics = DemographicDataset(path=demographic_file_path)
+# process_dataset() keys the datasets on the person ids of notebook 1 (see bi_py/person.py)
+person_dictionary = read_person_dictionary(demographic_file_path)
 
 
 # In[ ]:
@@ -182,7 +190,7 @@ deduplication_options = ['nhs_number', 'code', 'date']
 # 
 # In this first set of data we have 1 ICD file and 1 OPCS file. 
 # 
-# We do need to do some pre-processsing with these datasets as they are saved in Excel. This step will be removed with the next update of `tretools` but is included here for speed. I am doing this pre-processing step in pandas for now as I am just reading in the file and saving as a CSV, and polars is missing a library. This has been requested to the TRE team. 
+# We do need to do some pre-processsing with these datasets as they are saved in Excel. Each workbook is converted straight to an Arrow file (no pandas, no intermediate CSV) with `bi_py.excel.convert_xlsx()`, which `RawDataset` then reads. The Arrow file is named after the content of the workbook, so the Excel parsing (the slowest step of this notebook) is only done the first time the notebook is run on a cut. 
 
 # **Preprocessing**
 
@@ -196,25 +204,43 @@ deduplication_options = ['nhs_number', 'code', 'date']
 # In[ ]:
 
 
-icd_pre_data = pd.read_excel(f"{feb_2021_path}/icd10_bfs_1578_2021-02-02_deident.xlsx")
-
-
-# In[ ]:
+import polars as pl
 
+from bi_py.excel import convert_xlsx
 
-icd_pre_data.to_csv(f"{PREPROCESSED_FILES_LOCATION}/Brad_icd_cut_1.csv")
+EXCEL_CACHE_LOCATION = f"{PREPROCESSED_FILES_LOCATION}/excel_cache"
 
 
 # In[ ]:
 
 
-opcs_pre_data = pd.read_excel(f"{feb_2021_path}/opcs_bfd_1578_2021-02-02_deident.xlsx")
+with profile("NB4: convert the Feb 2021 ICD-10 workbook"):
+    ICD_FEB_2021_LOCATION = convert_xlsx(
+        f"{feb_2021_path}/icd10_bfs_1578_2021-02-02_deident.xlsx",
+        EXCEL_CACHE_LOCATION,
+        schema={
+            "pseudonhs": pl.Utf8,
+            "icd10_code": pl.Utf8,
+            "icd10_name": pl.Utf8,
+            "episode_start_date": pl.Date,
+        },
+    )
 
 
 # In[ ]:
 
 
-opcs_pre_data.to_csv(f"{PREPROCESSED_FILES_LOCATION}/Brad_opcs_cut_1.csv")
+with profile("NB4: convert the Feb 2021 OPCS workbook"):
+    OPCS_FEB_2021_LOCATION = convert_xlsx(
+        f"{feb_2021_path}/opcs_bfd_1578_2021-02-02_deident.xlsx",
+        EXCEL_CACHE_LOCATION,
+        schema={
+            "pseudonhs": pl.Utf8,
+            "opcs_code": pl.Utf8,
+            "opcs_procedure_description": pl.Utf8,
+            "episode_start_date": pl.Date,
+        },
+    )
 
 
 # **ICD Processing**
@@ -231,7 +257,7 @@ AnyPath(FEB_2021_CLEAN_FOLDER).mkdir(parents=True, exist_ok=True)
 # In[ ]:
 
 
-icd_data = RawDataset(path=f"{PREPROCESSED_FILES_LOCATION}/Brad_icd_cut_1.csv", 
+icd_data = RawDataset(path=ICD_FEB_2021_LOCATION, 
                       dataset_type=DatasetType.BRADFORD.value, 
                       coding_system=CodelistType.ICD10.value)
 
@@ -250,7 +276,7 @@ col_maps = {
 # In[ ]:
 
 
-processed_icd_data = icd_data.process_dataset(deduplication_options=deduplication_options, column_maps=col_maps)
+processed_icd_data = process_dataset(icd_data, deduplication_options=deduplication_options, column_maps=col_maps, person_dictionary=person_dictionary)
 
 
 # In[ ]:
@@ -276,8 +302,7 @@ cleaned_dataset = processed_icd_data.remove_unrealistic_dates(date_start=date_st
 # In[ ]:
 
 
-cleaned_dataset.write_to_feather(f"{FEB_2021_CLEAN_FOLDER}/icd.arrow")
-cleaned_dataset.write_to_log(f"{FEB_2021_CLEAN_FOLDER}/icd_log.txt")
+hand_off.write(cleaned_dataset, f"{FEB_2021_CLEAN_FOLDER}/icd.arrow", f"{FEB_2021_CLEAN_FOLDER}/icd_log.txt")
 
 
 # **OPCS Processing**
@@ -287,7 +312,7 @@ cleaned_dataset.write_to_log(f"{FEB_2021_CLEAN_FOLDER}/icd_log.txt")
 # In[ ]:
 
 
-opcs_data = RawDataset(path=f"{PREPROCESSED_FILES_LOCATION}/Brad_opcs_cut_1.csv", 
+opcs_data = RawDataset(path=OPCS_FEB_2021_LOCATION, 
                       dataset_type=DatasetType.BRADFORD.value, 
                       coding_system=CodelistType.OPCS.value)
 
@@ -306,7 +331,7 @@ col_maps = {
 # In[ ]:
 
 
-processed_opcs_data = opcs_data.process_dataset(deduplication_options=deduplication_options, column_maps=col_maps)
+processed_opcs_data = process_dataset(opcs_data, deduplication_options=deduplication_options, column_maps=col_maps, person_dictionary=person_dictionary)
 
 
 # In[ ]:
@@ -325,8 +350,7 @@ cleaned_dataset = processed_opcs_data.remove_unrealistic_dates(date_start=date_s
                                                                  date_end=date_end,
                                                                  before_born=True,
                                                                  demographic_dataset=demographics)
-cleaned_dataset.write_to_feather(f"{FEB_2021_CLEAN_FOLDER}/opcs.arrow")
-cleaned_dataset.write_to_log(f"{FEB_2021_CLEAN_FOLDER}/opcs_log.txt")
+hand_off.write(cleaned_dataset, f"{FEB_2021_CLEAN_FOLDER}/opcs.arrow", f"{FEB_2021_CLEAN_FOLDER}/opcs_log.txt")
 
 
 # ### 2nd cut of data - June 2022 Data
@@ -366,7 +390,7 @@ col_maps = {
 # In[ ]:
 
 
-processed_icd_data = icd_data.process_dataset(deduplication_options, col_maps)
+processed_icd_data = process_dataset(icd_data, deduplication_options, col_maps, person_dictionary=person_dictionary)
 
 
 # In[ ]:
@@ -385,8 +409,7 @@ cleaned_dataset = processed_icd_data.remove_unrealistic_dates(date_start=date_st
                                                                  date_end=date_end,
                                                                  before_born=True,
                                                                  demographic_dataset=demographics)
-cleaned_dataset.write_to_feather(f"{JUNE_2022_CLEAN_FOLDER}/icd.arrow")
-cleaned_dataset.write_to_log(f"{JUNE_2022_CLEAN_FOLDER}/icd_log.txt")
+hand_off.write(cleaned_dataset, f"{JUNE_2022_CLEAN_FOLDER}/icd.arrow", f"{JUNE_2022_CLEAN_FOLDER}/icd_log.txt")
 
 
 # **OPCS Processing**
@@ -413,7 +436,7 @@ col_maps = {
 # In[ ]:
 
 
-processed_opcs_data = opcs_data.process_dataset(deduplication_options, col_maps)
+processed_opcs_data = process_dataset(opcs_data, deduplication_options, col_maps, person_dictionary=person_dictionary)
 
 
 # In[ ]:
@@ -432,8 +455,7 @@ cleaned_dataset = processed_opcs_data.remove_unrealistic_dates(date_start=date_s
                                                                  date_end=date_end,
                                                                  before_born=True,
                                                                  demographic_dataset=demographics)
-cleaned_dataset.write_to_feather(f"{JUNE_2022_CLEAN_FOLDER}/opcs.arrow")
-cleaned_dataset.write_to_log(f"{JUNE_2022_CLEAN_FOLDER}/opcs_log.txt")
+hand_off.write(cleaned_dataset, f"{JUNE_2022_CLEAN_FOLDER}/opcs.arrow", f"{JUNE_2022_CLEAN_FOLDER}/opcs_log.txt")
 
 
 # **SNOMED diagnosis**
@@ -460,7 +482,14 @@ col_maps = {
 # In[ ]:
 
 
-processed_diagnosis_data = diagnosis_data.process_dataset(deduplication_options, col_maps)
+processed_diagnosis_data = process_dataset(diagnosis_data, deduplication_options, col_maps, person_dictionary=person_dictionary)
+
+
+# In[ ]:
+
+
+# the canonical SNOMED code type, as the other SNOMED datasets (see bi_py/snomed.py)
+processed_diagnosis_data.data = snomed_codes(processed_diagnosis_data.data)
 
 
 # In[ ]:
@@ -479,8 +508,7 @@ cleaned_dataset = processed_diagnosis_data.remove_unrealistic_dates(date_start=d
                                                                  date_end=date_end,
                                                                  before_born=True,
                                                                  demographic_dataset=demographics)
-cleaned_dataset.write_to_feather(f"{JUNE_2022_CLEAN_FOLDER}/snomed_diagnosis.arrow")
-cleaned_dataset.write_to_log(f"{JUNE_2022_CLEAN_FOLDER}/snomed_diagnosis_log.txt")
+hand_off.write(cleaned_dataset, f"{JUNE_2022_CLEAN_FOLDER}/snomed_diagnosis.arrow", f"{JUNE_2022_CLEAN_FOLDER}/snomed_diagnosis_log.txt")
 
 
 # **SNOMED Problems**
@@ -507,7 +535,14 @@ col_maps = {
 # In[ ]:
 
 
-processed_prob_data = prob_data.process_dataset(deduplication_options, col_maps)
+processed_prob_data = process_dataset(prob_data, deduplication_options, col_maps, person_dictionary=person_dictionary)
+
+
+# In[ ]:
+
+
+# the canonical SNOMED code type, as the other SNOMED datasets (see bi_py/snomed.py)
+processed_prob_data.data = snomed_codes(processed_prob_data.data)
 
 
 # In[ ]:
@@ -526,8 +561,7 @@ cleaned_dataset = processed_prob_data.remove_unrealistic_dates(date_start=date_s
                                                                  date_end=date_end,
                                                                  before_born=True,
                                                                  demographic_dataset=demographics)
-cleaned_dataset.write_to_feather(f"{JUNE_2022_CLEAN_FOLDER}/snomed_prob.arrow")
-cleaned_dataset.write_to_log(f"{JUNE_2022_CLEAN_FOLDER}/snomed_prob_log.txt")
+hand_off.write(cleaned_dataset, f"{JUNE_2022_CLEAN_FOLDER}/snomed_prob.arrow", f"{JUNE_2022_CLEAN_FOLDER}/snomed_prob_log.txt")
 
 
 # **Merged data**
@@ -537,7 +571,7 @@ cleaned_dataset.write_to_log(f"{JUNE_2022_CLEAN_FOLDER}/snomed_prob_log.txt")
 # In[ ]:
 
 
-prob_data = ProcessedDataset(path=f"{JUNE_2022_CLEAN_FOLDER}/snomed_prob.arrow", 
+prob_data = hand_off.load(path=f"{JUNE_2022_CLEAN_FOLDER}/snomed_prob.arrow", 
                              dataset_type=DatasetType.BRADFORD.value,
                              coding_system=CodelistType.SNOMED.value, 
                              log_path=f"{JUNE_2022_CLEAN_FOLDER}/snomed_prob_log.txt")
@@ -546,7 +580,7 @@ prob_data = ProcessedDataset(path=f"{JUNE_2022_CLEAN_FOLDER}/snomed_prob.arrow",
 # In[ ]:
 
 
-diag_data = ProcessedDataset(path=f"{JUNE_2022_CLEAN_FOLDER}/snomed_diagnosis.arrow", 
+diag_data = hand_off.load(path=f"{JUNE_2022_CLEAN_FOLDER}/snomed_diagnosis.arrow", 
                              dataset_type=DatasetType.BRADFORD.value,
                              coding_system=CodelistType.SNOMED.value, 
                              log_path=f"{JUNE_2022_CLEAN_FOLDER}/snomed_diagnosis_log.txt")
@@ -555,22 +589,7 @@ diag_data = ProcessedDataset(path=f"{JUNE_2022_CLEAN_FOLDER}/snomed_diagnosis.ar
 # In[ ]:
 
 
-prob_data.merge_with_dataset(diag_data)
-
-
-# In[ ]:
-
-
-dedup_data = prob_data.deduplicate()
-
-
-# In[ ]:
-
-
-for log in diag_data.log:
-    dedup_data.log.append(log)
-
-dedup_data.log.sort()
+dedup_data = merge_many([prob_data, diag_data], dedup_on=deduplication_options)
 
 
 # In[ ]:
@@ -622,7 +641,7 @@ col_maps = {
 # In[ ]:
 
 
-processed_icd_data = icd_data.process_dataset(deduplication_options, col_maps)
+processed_icd_data = process_dataset(icd_data, deduplication_options, col_maps, person_dictionary=person_dictionary)
 
 
 # In[ ]:
@@ -641,8 +660,7 @@ cleaned_dataset = processed_icd_data.remove_unrealistic_dates(date_start=date_st
                                                                  date_end=date_end,
                                                                  before_born=True,
                                                                  demographic_dataset=demographics)
-cleaned_dataset.write_to_feather(f"{MAY_2023_CLEAN_FOLDER}/icd.arrow")
-cleaned_dataset.write_to_log(f"{MAY_2023_CLEAN_FOLDER}/icd_log.txt")
+hand_off.write(cleaned_dataset, f"{MAY_2023_CLEAN_FOLDER}/icd.arrow", f"{MAY_2023_CLEAN_FOLDER}/icd_log.txt")
 
 
 # **OPCS Processing**
@@ -669,7 +687,7 @@ col_maps = {
 # In[ ]:
 
 
-processed_opcs_data = opcs_data.process_dataset(deduplication_options, col_maps)
+processed_opcs_data = process_dataset(opcs_data, deduplication_options, col_maps, person_dictionary=person_dictionary)
 processed_opcs_data.write_to_feather(f"{MAY_2023_FOLDER}/opcs.arrow")
 processed_opcs_data.write_to_log(f"{MAY_2023_FOLDER}/opcs_log.txt")
 
@@ -681,8 +699,7 @@ cleaned_dataset = processed_opcs_data.remove_unrealistic_dates(date_start=date_s
                                                                  date_end=date_end,
                                                                  before_born=True,
                                                                  demographic_dataset=demographics)
-cleaned_dataset.write_to_feather(f"{MAY_2023_CLEAN_FOLDER}/opcs.arrow")
-cleaned_dataset.write_to_log(f"{MAY_2023_CLEAN_FOLDER}/opcs_log.txt")
+hand_off.write(cleaned_dataset, f"{MAY_2023_CLEAN_FOLDER}/opcs.arrow", f"{MAY_2023_CLEAN_FOLDER}/opcs_log.txt")
 
 
 # **SNOMED Diagnosis Processing**
@@ -709,7 +726,14 @@ col_maps = {
 # In[ ]:
 
 
-processed_diag = diag.process_dataset(deduplication_options, col_maps)
+processed_diag = process_dataset(diag, deduplication_options, col_maps, person_dictionary=person_dictionary)
+
+
+# In[ ]:
+
+
+# the canonical SNOMED code type, as the other SNOMED datasets (see bi_py/snomed.py)
+processed_diag.data = snomed_codes(processed_diag.data)
 
 
 # In[ ]:
@@ -726,8 +750,7 @@ cleaned_dataset = processed_diag.remove_unrealistic_dates(date_start=date_start,
                                                                  date_end=date_end,
                                                                  before_born=True,
                                                                  demographic_dataset=demographics)
-cleaned_dataset.write_to_feather(f"{MAY_2023_CLEAN_FOLDER}/snomed_diagnosis.arrow")
-cleaned_dataset.write_to_log(f"{MAY_2023_CLEAN_FOLDER}/snomed_diagnosis_log.txt")
+hand_off.write(cleaned_dataset, f"{MAY_2023_CLEAN_FOLDER}/snomed_diagnosis.arrow", f"{MAY_2023_CLEAN_FOLDER}/snomed_diagnosis_log.txt")
 
 
 # **SNOMED Problems Processing**
@@ -754,7 +777,14 @@ col_maps = {
 # In[ ]:
 
 
-processed_prob = prob.process_dataset(deduplication_options, col_maps)
+processed_prob = process_dataset(prob, deduplication_options, col_maps, person_dictionary=person_dictionary)
+
+
+# In[ ]:
+
+
+# the canonical SNOMED code type, as the other SNOMED datasets (see bi_py/snomed.py)
+processed_prob.data = snomed_codes(processed_prob.data)
 
 
 # In[ ]:
@@ -771,8 +801,7 @@ cleaned_dataset = processed_prob.remove_unrealistic_dates(date_start=date_start,
                                                                  date_end=date_end,
                                                                  before_born=True,
                                                                  demographic_dataset=demographics)
-cleaned_dataset.write_to_feather(f"{MAY_2023_CLEAN_FOLDER}/snomed_problems.arrow")
-cleaned_dataset.write_to_log(f"{MAY_2023_CLEAN_FOLDER}/snomed_problems_log.txt")
+hand_off.write(cleaned_dataset, f"{MAY_2023_CLEAN_FOLDER}/snomed_problems.arrow", f"{MAY_2023_CLEAN_FOLDER}/snomed_problems_log.txt")
 
 
 # **Merged data**
@@ -782,7 +811,7 @@ cleaned_dataset.write_to_log(f"{MAY_2023_CLEAN_FOLDER}/snomed_problems_log.txt")
 # In[ ]:
 
 
-prob_data = ProcessedDataset(path=f"{MAY_2023_CLEAN_FOLDER}/snomed_problems.arrow", 
+prob_data = hand_off.load(path=f"{MAY_2023_CLEAN_FOLDER}/snomed_problems.arrow", 
                              dataset_type=DatasetType.BRADFORD.value,
                              coding_system=CodelistType.SNOMED.value, 
                              log_path=f"{MAY_2023_CLEAN_FOLDER}/snomed_problems_log.txt")
@@ -791,7 +820,7 @@ prob_data = ProcessedDataset(path=f"{MAY_2023_CLEAN_FOLDER}/snomed_problems.arro
 # In[ ]:
 
 
-diag_data = ProcessedDataset(path=f"{MAY_2023_CLEAN_FOLDER}/snomed_diagnosis.arrow", 
+diag_data = hand_off.load(path=f"{MAY_2023_CLEAN_FOLDER}/snomed_diagnosis.arrow", 
                              dataset_type=DatasetType.BRADFORD.value,
                              coding_system=CodelistType.SNOMED.value, 
                              log_path=f"{MAY_2023_CLEAN_FOLDER}/snomed_diagnosis_log.txt")
@@ -800,29 +829,13 @@ diag_data = ProcessedDataset(path=f"{MAY_2023_CLEAN_FOLDER}/snomed_diagnosis.arr
 # In[ ]:
 
 
-prob_data.merge_with_dataset(diag_data)
+dedup_data = merge_many([prob_data, diag_data], dedup_on=deduplication_options)
 
 
 # In[ ]:
 
 
-dedup_data = prob_data.deduplicate()
-
-
-# In[ ]:
-
-
-for log in diag_data.log:
-    dedup_data.log.append(log)
-
-dedup_data.log.sort()
-
-
-# In[ ]:
-
-
-dedup_data.write_to_feather(f"{MAY_2023_CLEAN_FOLDER}/snomed_merged.arrow")
-dedup_data.write_to_log(f"{MAY_2023_CLEAN_FOLDER}/snomed_merged_log.txt")
+hand_off.write(dedup_data, f"{MAY_2023_CLEAN_FOLDER}/snomed_merged.arrow", f"{MAY_2023_CLEAN_FOLDER}/snomed_merged_log.txt")
 
 
 # ### 4th cut of data - Dec 2024 Data
@@ -848,7 +861,7 @@ dedup_data.write_to_log(f"{MAY_2023_CLEAN_FOLDER}/snomed_merged_log.txt")
 # In[ ]:
 
 
-icd_1 = ProcessedDataset(path=f"{FEB_2021_CLEAN_FOLDER}/icd.arrow", 
+icd_1 = hand_off.load(path=f"{FEB_2021_CLEAN_FOLDER}/icd.arrow", 
                          dataset_type=DatasetType.BRADFORD.value, 
                          coding_system=CodelistType.ICD10.value, 
                          log_path=f"{FEB_2021_CLEAN_FOLDER}/icd_log.txt")
@@ -857,7 +870,7 @@ icd_1 = ProcessedDataset(path=f"{FEB_2021_CLEAN_FOLDER}/icd.arrow",
 # In[ ]:
 
 
-icd_2 = ProcessedDataset(path=f"{JUNE_2022_CLEAN_FOLDER}/icd.arrow", 
+icd_2 = hand_off.load(path=f"{JUNE_2022_CLEAN_FOLDER}/icd.arrow", 
                          dataset_type=DatasetType.BRADFORD.value, 
                          coding_system=CodelistType.ICD10.value, 
                          log_path=f"{JUNE_2022_CLEAN_FOLDER}/icd_log.txt")
@@ -866,7 +879,7 @@ icd_2 = ProcessedDataset(path=f"{JUNE_2022_CLEAN_FOLDER}/icd.arrow",
 # In[ ]:
 
 
-icd_3 = ProcessedDataset(path=f"{MAY_2023_CLEAN_FOLDER}/icd.arrow", 
+icd_3 = hand_off.load(path=f"{MAY_2023_CLEAN_FOLDER}/icd.arrow", 
                          dataset_type=DatasetType.BRADFORD.value, 
                          coding_system=CodelistType.ICD10.value, 
                          log_path=f"{MAY_2023_CLEAN_FOLDER}/icd_log.txt")
@@ -875,36 +888,13 @@ icd_3 = ProcessedDataset(path=f"{MAY_2023_CLEAN_FOLDER}/icd.arrow",
 # In[ ]:
 
 
-icd_1.merge_with_dataset(icd_2)
-
-
-# In[ ]:
-
-
-icd_1.merge_with_dataset(icd_3)
-
-
-# In[ ]:
-
-
-dedup = icd_1.deduplicate()
-
-
-# In[ ]:
-
-
-for log in icd_2.log:
-    dedup.log.append(log)
-for log in icd_3.log:
-    dedup.log.append(log)
-dedup.log.sort()
+dedup = merge_many([icd_1, icd_2, icd_3], dedup_on=deduplication_options)
 
 
 # In[ ]:
 
 
-dedup.write_to_feather(f"{MEGADATA_BRADFORD_LOCATION}/icd.arrow")
-dedup.write_to_log(f"{MEGADATA_BRADFORD_LOCATION}/icd_log.txt")
+hand_off.write(dedup, f"{MEGADATA_BRADFORD_LOCATION}/icd.arrow", f"{MEGADATA_BRADFORD_LOCATION}/icd_log.txt")
 
 
 # **OPCS Dataset**
@@ -914,7 +904,7 @@ dedup.write_to_log(f"{MEGADATA_BRADFORD_LOCATION}/icd_log.txt")
 # In[ ]:
 
 
-opcs_1 = ProcessedDataset(path=f"{FEB_2021_CLEAN_FOLDER}/opcs.arrow", 
+opcs_1 = hand_off.load(path=f"{FEB_2021_CLEAN_FOLDER}/opcs.arrow", 
                          dataset_type=DatasetType.BRADFORD.value, 
                          coding_system=CodelistType.ICD10.value, 
                          log_path=f"{FEB_2021_CLEAN_FOLDER}/opcs_log.txt")
@@ -923,7 +913,7 @@ opcs_1 = ProcessedDataset(path=f"{FEB_2021_CLEAN_FOLDER}/opcs.arrow",
 # In[ ]:
 
 
-opcs_2 = ProcessedDataset(path=f"{JUNE_2022_CLEAN_FOLDER}/opcs.arrow", 
+opcs_2 = hand_off.load(path=f"{JUNE_2022_CLEAN_FOLDER}/opcs.arrow", 
                          dataset_type=DatasetType.BRADFORD.value, 
                          coding_system=CodelistType.ICD10.value, 
                          log_path=f"{JUNE_2022_CLEAN_FOLDER}/opcs_log.txt")
@@ -932,7 +922,7 @@ opcs_2 = ProcessedDataset(path=f"{JUNE_2022_CLEAN_FOLDER}/opcs.arrow",
 # In[ ]:
 
 
-opcs_3 = ProcessedDataset(path=f"{MAY_2023_CLEAN_FOLDER}/opcs.arrow", 
+opcs_3 = hand_off.load(path=f"{MAY_2023_CLEAN_FOLDER}/opcs.arrow", 
                          dataset_type=DatasetType.BRADFORD.value, 
                          coding_system=CodelistType.ICD10.value, 
                          log_path=f"{MAY_2023_CLEAN_FOLDER}/opcs_log.txt")
@@ -941,24 +931,7 @@ opcs_3 = ProcessedDataset(path=f"{MAY_2023_CLEAN_FOLDER}/opcs.arrow",
 # In[ ]:
 
 
-opcs_1.merge_with_dataset(opcs_2)
-opcs_1.merge_with_dataset(opcs_3)
-
-
-# In[ ]:
-
-
-dedup = opcs_1.deduplicate()
-
-
-# In[ ]:
-
-
-for log in opcs_2.log:
-    dedup.log.append(log)
-for log in opcs_3.log:
-    dedup.log.append(log)
-dedup.log.sort()
+dedup = merge_many([opcs_1, opcs_2, opcs_3], dedup_on=deduplication_options)
 
 
 # In[ ]:
@@ -979,7 +952,7 @@ snomed_1 = ProcessedDataset(path=f"{JUNE_2022_CLEAN_FOLDER}/snomed_merged.arrow"
                          dataset_type=DatasetType.BRADFORD.value, 
                          coding_system=CodelistType.ICD10.value, 
                          log_path=f"{JUNE_2022_CLEAN_FOLDER}/snomed_merged_log.txt")
-snomed_2 = ProcessedDataset(path=f"{MAY_2023_CLEAN_FOLDER}/snomed_merged.arrow", 
+snomed_2 = hand_off.load(path=f"{MAY_2023_CLEAN_FOLDER}/snomed_merged.arrow", 
                          dataset_type=DatasetType.BRADFORD.value, 
                          coding_system=CodelistType.ICD10.value, 
                          log_path=f"{MAY_2023_CLEAN_FOLDER}/snomed_merged_log.txt")
@@ -988,23 +961,13 @@ snomed_2 = ProcessedDataset(path=f"{MAY_2023_CLEAN_FOLDER}/snomed_merged.arrow",
 # In[ ]:
 
 
-snomed_1.merge_with_dataset(snomed_2)
-dedup = snomed_1.deduplicate()
+dedup = merge_many([snomed_1, snomed_2], dedup_on=deduplication_options)
 
 
 # In[ ]:
 
 
-for log in snomed_2.log:
-    dedup.log.append(log)
-dedup.log.sort()
-
-
-# In[ ]:
-
-
-dedup.write_to_feather(f"{MEGADATA_BRADFORD_LOCATION}/snomed.arrow")
-dedup.write_to_log(f"{MEGADATA_BRADFORD_LOCATION}/snomed_log.txt")
+hand_off.write(dedup, f"{MEGADATA_BRADFORD_LOCATION}/snomed.arrow", f"{MEGADATA_BRADFORD_LOCATION}/snomed_log.txt")
 
 
 # **Map SNOMED to ICD10** 
@@ -1020,7 +983,7 @@ dedup.write_to_log(f"{MEGADATA_BRADFORD_LOCATION}/snomed_log.txt")
 # In[ ]:
 
 
-snomed_data = ProcessedDataset(path=f"{MEGADATA_BRADFORD_LOCATION}/snomed.arrow", 
+snomed_data = hand_off.load(path=f"{MEGADATA_BRADFORD_LOCATION}/snomed.arrow", 
                                dataset_type=DatasetType.BRADFORD.value, 
                                coding_system=CodelistType.SNOMED.value,
                                log_path=f"{MEGADATA_BRADFORD_LOCATION}/snomed_log.txt"
@@ -1030,6 +993,9 @@ snomed_data = ProcessedDataset(path=f"{MEGADATA_BRADFORD_LOCATION}/snomed.arrow"
 # In[ ]:
 
 
+# the codes are UInt64 (see bi_py/snomed.py) but tretools reads the mapping file as Int64
+snomed_data.data = tretools_snomed_codes(snomed_data.data)
+
 mapped_data = snomed_data.map_snomed_to_icd(
     mapping_file=f"{MAPPING_FILES_LOCATION}/processed_mapping_file.csv",
     snomed_col="conceptId",
@@ -1074,7 +1040,7 @@ final_dedup.coding_system = CodelistType.ICD10.value
 # In[ ]:
 
 
-icd_data = ProcessedDataset(path=f"{MEGADATA_BRADFORD_LOCATION}/icd.arrow", 
+icd_data = hand_off.load(path=f"{MEGADATA_BRADFORD_LOCATION}/icd.arrow", 
                                dataset_type=DatasetType.BRADFORD.value, 
                                coding_system=CodelistType.ICD10.value,
                                log_path=f"{MEGADATA_BRADFORD_LOCATION}/icd_log.txt"
@@ -1084,26 +1050,7 @@ icd_data = ProcessedDataset(path=f"{MEGADATA_BRADFORD_LOCATION}/icd.arrow",
 # In[ ]:
 
 
-icd_data.merge_with_dataset(final_dedup)
-
-
-# In[ ]:
-
-
-merged_dedup = icd_data.deduplicate()
-
-
-# In[ ]:
-
-
-for log in icd_data.log:
-    merged_dedup.log.append(log)
-
-
-# In[ ]:
-
-
-merged_dedup.log.sort()
+merged_dedup = merge_many([icd_data, final_dedup], dedup_on=deduplication_options)
 
 
 # In[ ]:
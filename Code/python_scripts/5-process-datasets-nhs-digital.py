@@ -59,102 +59,6 @@ from tretools.datasets.demographic_dataset import DemographicDataset
 from tretools.datasets.processed_dataset import ProcessedDataset
 
 
-# In[ ]:
-
-
-# Override of tretools to accommodate NHSDIgital ECDS data
-
-import pkg_resources
-import json
-def override_expand_cols_to_rows(self, hes_subtype: str, config_path: str = None):
-        # check the dataset type
-        if self.dataset_type != DatasetType.NHS_DIGITAL.value:
-            raise NotImplementedError("This method is only implemented for NHS Digital datasets")
-
-        # check if has overwritten config
-
-        # if not, check default config
-        if config_path is None:
-            if hes_subtype == "ECDS":
-                config = {
-                    "nhs_number": "STUDY_ID",
-                    "date": "ARRIVAL_DATE",
-                    "column_to_expand": [
-                        'CHIEF_COMPLAINT',
-                        'COMORBIDITIES_1', 
-                        'COMORBIDITIES_10',
-                        'COMORBIDITIES_2',
-                        'COMORBIDITIES_3',
-                        'COMORBIDITIES_4',
-                        'COMORBIDITIES_5',
-                        'COMORBIDITIES_6',
-                        'COMORBIDITIES_7',
-                        'COMORBIDITIES_8',
-                        'COMORBIDITIES_9',
-                        'DIAGNOSIS_CODE_1',
-                        'DIAGNOSIS_CODE_10',
-                        'DIAGNOSIS_CODE_11',
-                        'DIAGNOSIS_CODE_12',
-                        'DIAGNOSIS_CODE_2',
-                        'DIAGNOSIS_CODE_3',
-                        'DIAGNOSIS_CODE_4',
-                        'DIAGNOSIS_CODE_5',
-                        'DIAGNOSIS_CODE_6',
-                        'DIAGNOSIS_CODE_7',
-                        'DIAGNOSIS_CODE_8',
-                        'DIAGNOSIS_CODE_9',
-                    ],
-                }
-            else:
-                resource_path = "/usr/local/lib/python3.9/dist-packages/tretools/datasets/"
-                if hes_subtype == "CIV_REG":
-                    resource_path = resource_path + "configs/NHS_D/civ_reg.json"
-                elif hes_subtype == "APC":
-                    resource_path = resource_path + "configs/NHS_D/apc.json"
-                elif hes_subtype == "OP":
-                    resource_path = resource_path + "configs/NHS_D/op.json"
-                # this loads the default config from the package files. We get these 
-                # from the tretools package, which is installed in the environment
-                # config_path = pkg_resources.resource_filename(__name__, resource_path)
-                config_path = resource_path
-                config = json.loads(open(config_path).read())
-
-        # log the shape of the data
-        self.log.append(f"{datetime.now()}: Data shape before expanding wide columns into rows: {self.data.shape}")
-
-        # unpivot the data
-        self.data = (
-            self.data.lazy()
-            .unpivot(
-                on=config["column_to_expand"],
-                value_name="code",
-                index=[config["nhs_number"], config["date"]], 
-            )
-            .drop_nulls()
-            .filter(pl.col("code") != "")
-            .collect()
-        )
-        
-        # drop the variable column
-        self.data = self.data.drop("variable")
-        self._standarise_column_names(
-            column_maps={
-                config["nhs_number"]: "nhs_number",
-                config["date"]: "date",
-                "code": "code"
-            }
-        )
-
-        # log the action
-        self.log.append(f"{datetime.now()}: Data shape after expanding wide columns into rows: {self.data.shape}")
-
-
-# In[ ]:
-
-
-RawDataset._expand_cols_to_rows = override_expand_cols_to_rows
-
-
 # ### Scripting for automated next notebook initation
 
 # In[ ]:
@@ -196,6 +100,29 @@ ROOT_LOCATION = "/home/ivm/BI_PY"
 # In[ ]:
 
 
+import sys
+sys.path.append(f"{ROOT_LOCATION}/{VERSION}/Code")
+
+from bi_py.handoff import HandOff
+from bi_py.megadata import merge_many
+from bi_py.multifile import raw_dataset_from_files
+from bi_py.nhs_digital import ECDS_COLUMNS, install_ecds
+from bi_py.person import read_person_dictionary
+from bi_py.processing import process_dataset
+from bi_py.snomed import snomed_codes, tretools_snomed_codes
+
+# clean datasets written with `hand_off.write()` are loaded back from memory by `hand_off.load()`,
+# after checking they are unchanged, rather than re-read from file (see `bi_py/handoff.py`)
+hand_off = HandOff()
+
+# tretools has no config for the ECDS extracts: process_dataset() now expands them with
+# ECDS_CONFIG (see bi_py/nhs_digital.py, which used to be an override in this notebook)
+install_ecds()
+
+
+# In[ ]:
+
+
 PROCESSED_DATASETS_LOCATION = f"{ROOT_LOCATION}/{VERSION}/processed_datasets"
 MEGADATA_LOCATION = f"{ROOT_LOCATION}/{VERSION}/megadata"
 PREPROCESSED_FILES_LOCATION = f"{ROOT_LOCATION}/{VERSION}/preprocessed_files"
@@ -270,6 +197,8 @@ date_start=datetime.strptime("1910-01-01", "%Y-%m-%d")
 # date_end=datetime.strptime("2024-01-29", "%Y-%m-%d")  #  MS commented out
 date_end=datetime.today() #  MS happy to hear reasons why not.
 demographics = DemographicDataset(path=demographic_file_path)
+# process_dataset() keys the datasets on the person ids of notebook 1 (see bi_py/person.py)
+person_dictionary = read_person_dictionary(demographic_file_path)
 
 
 # ### 1st cut of data - Sept 2021 Data
@@ -311,10 +240,12 @@ civreg_data = RawDataset(
 # In[ ]:
 
 
-processed_civreg_data = civreg_data.process_dataset(
+processed_civreg_data = process_dataset(
+    civreg_data,
     deduplication_options=deduplication_options,
     column_maps=col_maps,
-    nhs_digital_subtype="CIV_REG"
+    nhs_digital_subtype="CIV_REG",
+    person_dictionary=person_dictionary
 )
 
 
@@ -346,8 +277,7 @@ cleaned_dataset = processed_civreg_data.remove_unrealistic_dates(
 # In[ ]:
 
 
-cleaned_dataset.write_to_feather(f"{SEP_2021_OUTPUT_CLEAN_PATH}/civ_reg.arrow")
-cleaned_dataset.write_to_log(f"{SEP_2021_OUTPUT_CLEAN_PATH}/civ_reg_log.txt")
+hand_off.write(cleaned_dataset, f"{SEP_2021_OUTPUT_CLEAN_PATH}/civ_reg.arrow", f"{SEP_2021_OUTPUT_CLEAN_PATH}/civ_reg_log.txt")
 
 
 # **APC Data**
@@ -365,10 +295,12 @@ apc_data = RawDataset(
 # In[ ]:
 
 
-processed_apc_data = apc_data.process_dataset(
+processed_apc_data = process_dataset(
+    apc_data,
     deduplication_options=deduplication_options,
     column_maps=col_maps,
-    nhs_digital_subtype="APC"
+    nhs_digital_subtype="APC",
+    person_dictionary=person_dictionary
 )
 
 
@@ -391,8 +323,7 @@ cleaned_dataset = processed_apc_data.remove_unrealistic_dates(
     demographic_dataset=demographics
 )
 
-cleaned_dataset.write_to_feather(f"{SEP_2021_OUTPUT_CLEAN_PATH}/apc.arrow")
-cleaned_dataset.write_to_log(f"{SEP_2021_OUTPUT_CLEAN_PATH}/apc_log.txt")
+hand_off.write(cleaned_dataset, f"{SEP_2021_OUTPUT_CLEAN_PATH}/apc.arrow", f"{SEP_2021_OUTPUT_CLEAN_PATH}/apc_log.txt")
 
 
 # **OP Data**
@@ -412,10 +343,12 @@ op_data = RawDataset(
 # In[ ]:
 
 
-processed_op_data = op_data.process_dataset(
+processed_op_data = process_dataset(
+    op_data,
     deduplication_options=deduplication_options,
     column_maps=col_maps,
-    nhs_digital_subtype="OP"
+    nhs_digital_subtype="OP",
+    person_dictionary=person_dictionary
 )
 
 
@@ -438,18 +371,17 @@ cleaned_dataset = processed_op_data.remove_unrealistic_dates(
     demographic_dataset=demographics
 )
 
-cleaned_dataset.write_to_feather(f"{SEP_2021_OUTPUT_CLEAN_PATH}/op.arrow")
-cleaned_dataset.write_to_log(f"{SEP_2021_OUTPUT_CLEAN_PATH}/op_log.txt")
+hand_off.write(cleaned_dataset, f"{SEP_2021_OUTPUT_CLEAN_PATH}/op.arrow", f"{SEP_2021_OUTPUT_CLEAN_PATH}/op_log.txt")
 
 
 # ### Merge these data together
 # 
-# Now we merge all these datasets together and deduplicate. We load from file so that we can be assured that the correct dataset is loaded as sometimes the cells can be run manually in the wrong order. 
+# Now we merge all these datasets together and deduplicate. We load with `hand_off.load()` so that we can be assured that the correct dataset is loaded as sometimes the cells can be run manually in the wrong order: the datasets written above are handed over from memory once their fingerprint shows they are unchanged, otherwise they are loaded from file. 
 
 # In[ ]:
 
 
-civ_data = ProcessedDataset(
+civ_data = hand_off.load(
     path=f"{SEP_2021_OUTPUT_CLEAN_PATH}/civ_reg.arrow",
     dataset_type=DatasetType.NHS_DIGITAL.value,
     coding_system=CodelistType.ICD10.value,
@@ -460,7 +392,7 @@ civ_data = ProcessedDataset(
 # In[ ]:
 
 
-apc_data = ProcessedDataset(
+apc_data = hand_off.load(
     path=f"{SEP_2021_OUTPUT_CLEAN_PATH}/apc.arrow",
     dataset_type=DatasetType.NHS_DIGITAL.value,
     coding_system=CodelistType.ICD10.value,
@@ -471,7 +403,7 @@ apc_data = ProcessedDataset(
 # In[ ]:
 
 
-op_data = ProcessedDataset(
+op_data = hand_off.load(
     path=f"{SEP_2021_OUTPUT_CLEAN_PATH}/op.arrow",
     dataset_type=DatasetType.NHS_DIGITAL.value,
     coding_system=CodelistType.ICD10.value,
@@ -479,42 +411,18 @@ op_data = ProcessedDataset(
 )
 
 
-# Merge the files together
-
-# In[ ]:
-
-
-civ_data.merge_with_dataset(apc_data)
-civ_data.merge_with_dataset(op_data)
-
-
-# Deduplicate on code, date and nhs number
-
-# In[ ]:
-
-
-dedup = civ_data.deduplicate()
-
-
-# Add all the logs together and sort. 
+# Merge the files together, deduplicate on code, date and nhs number, and add all the logs together and sort (all in one pass, see `merge_many()` in `bi_py/megadata.py`)
 
 # In[ ]:
 
 
-for log in apc_data.log:
-    dedup.log.append(log)
-    
-for log in op_data.log:
-    dedup.log.append(log)
-    
-dedup.log.sort()
+dedup = merge_many([civ_data, apc_data, op_data], dedup_on=deduplication_options)
 
 
 # In[ ]:
 
 
-dedup.write_to_feather(f"{SEP_2021_OUTPUT_CLEAN_PATH}/merged_data.arrow")
-dedup.write_to_log(f"{SEP_2021_OUTPUT_CLEAN_PATH}/merged_data_log.txt")
+hand_off.write(dedup, f"{SEP_2021_OUTPUT_CLEAN_PATH}/merged_data.arrow", f"{SEP_2021_OUTPUT_CLEAN_PATH}/merged_data_log.txt")
 
 
 # ### 2nd cut of data - July 2023 Data
@@ -557,10 +465,12 @@ civreg_data = RawDataset(
 # In[ ]:
 
 
-processed_civreg_data = civreg_data.process_dataset(
+processed_civreg_data = process_dataset(
+    civreg_data,
     deduplication_options=deduplication_options,
     column_maps=col_maps,
-    nhs_digital_subtype="CIV_REG"
+    nhs_digital_subtype="CIV_REG",
+    person_dictionary=person_dictionary
 )
 
 
@@ -588,8 +498,7 @@ cleaned_dataset = processed_civreg_data.remove_unrealistic_dates(
     demographic_dataset=demographics
 )
 
-cleaned_dataset.write_to_feather(f"{JULY_2023_OUTPUT_CLEAN_PATH}/civ_reg.arrow")
-cleaned_dataset.write_to_log(f"{JULY_2023_OUTPUT_CLEAN_PATH}/civ_reg_log.txt")
+hand_off.write(cleaned_dataset, f"{JULY_2023_OUTPUT_CLEAN_PATH}/civ_reg.arrow", f"{JULY_2023_OUTPUT_CLEAN_PATH}/civ_reg_log.txt")
 
 
 # **APC Data**
@@ -705,10 +614,12 @@ apc_data = RawDataset(
 # In[ ]:
 
 
-processed_apc_data = apc_data.process_dataset(
+processed_apc_data = process_dataset(
+    apc_data,
     deduplication_options=deduplication_options,
     column_maps=col_maps,
-    nhs_digital_subtype="APC"
+    nhs_digital_subtype="APC",
+    person_dictionary=person_dictionary
 )
 
 
@@ -731,8 +642,7 @@ cleaned_dataset = processed_apc_data.remove_unrealistic_dates(
     demographic_dataset=demographics
 )
 
-cleaned_dataset.write_to_feather(f"{JULY_2023_OUTPUT_CLEAN_PATH}/apc.arrow")
-cleaned_dataset.write_to_log(f"{JULY_2023_OUTPUT_CLEAN_PATH}/apc_log.txt")
+hand_off.write(cleaned_dataset, f"{JULY_2023_OUTPUT_CLEAN_PATH}/apc.arrow", f"{JULY_2023_OUTPUT_CLEAN_PATH}/apc_log.txt")
 
 
 # **OP Data**
@@ -815,10 +725,12 @@ op_data = RawDataset(
 # In[ ]:
 
 
-processed_op_data = op_data.process_dataset(
+processed_op_data = process_dataset(
+    op_data,
     deduplication_options=deduplication_options,
     column_maps=col_maps,
-    nhs_digital_subtype="OP"
+    nhs_digital_subtype="OP",
+    person_dictionary=person_dictionary
 )
 
 
@@ -841,8 +753,7 @@ cleaned_dataset = processed_op_data.remove_unrealistic_dates(
     demographic_dataset=demographics
 )
 
-cleaned_dataset.write_to_feather(f"{JULY_2023_OUTPUT_CLEAN_PATH}/op.arrow")
-cleaned_dataset.write_to_log(f"{JULY_2023_OUTPUT_CLEAN_PATH}/op_log.txt")
+hand_off.write(cleaned_dataset, f"{JULY_2023_OUTPUT_CLEAN_PATH}/op.arrow", f"{JULY_2023_OUTPUT_CLEAN_PATH}/op_log.txt")
 
 
 # **Cancer Registry Data**
@@ -898,12 +809,8 @@ ca_data.data = (
         .alias("full_year") 
     )
     .with_columns(
-        pl.concat_str(
-            pl.col("full_year"),
-            pl.lit("-07-02")
-        )
-#         .cast(pl.Date) # to reinstate one day. We should work dates as dates as soon as we can. 
-#         # The pipeline currently expects this date as a string at this stage.
+        # a pl.Date, which process_dataset() keeps as is (see bi_py/dates.py)
+        pl.date(pl.col("full_year").cast(pl.Int32), 7, 2)
         .alias("full_date") # this is the cancer registration full date
     )
 )
@@ -934,9 +841,11 @@ col_maps = {
 # In[ ]:
 
 
-processed_ca_data = ca_data.process_dataset(
+processed_ca_data = process_dataset(
+    ca_data,
     deduplication_options=deduplication_options, 
-    column_maps=col_maps
+    column_maps=col_maps,
+    person_dictionary=person_dictionary
 )
 
 
@@ -956,52 +865,28 @@ cleaned_dataset = processed_ca_data.remove_unrealistic_dates(date_start=date_sta
                                                                  date_end=date_end,
                                                                  before_born=True,
                                                                  demographic_dataset=demographics)
-cleaned_dataset.write_to_feather(f"{JULY_2023_OUTPUT_CLEAN_PATH}/ca.arrow")
-cleaned_dataset.write_to_log(f"{JULY_2023_OUTPUT_CLEAN_PATH}/ca_log.txt")
+hand_off.write(cleaned_dataset, f"{JULY_2023_OUTPUT_CLEAN_PATH}/ca.arrow", f"{JULY_2023_OUTPUT_CLEAN_PATH}/ca_log.txt")
 
 
 # **ECDS Data**
 
 # This is a "new" venture.
 # 
-# #### Again we need to preprocess files to a single .csv
+# #### The .txt files are read directly
 # 
 # For 2023_07 cut, there are only .txt files (i.e not .txt files + .csv file).  The separator is the pipe symbol `|`
 # 
-# Unfortunately, even within the glob based scan_csv, there are inconsistencies in field dtypes (principally String vs Float).  So easier again to cast all the str with `infer_schema=False` argument.
-
-# In[ ]:
-
-
-lf_temp_txt = pl.scan_csv(
-    AnyPath(
-        ecds_path,
-        "*ECDS*.txt"
-    ),
-    separator="|",
-    infer_schema=False
-)
-
-
-# In[ ]:
-
-
-PREPROCESSED_ECDS_2023_07_LOCATION = (
-    f"{PREPROCESSED_FILES_LOCATION}/nic338864_ecds_2023_07_all.csv"
-) 
-lf_temp_txt.sink_csv(
-    AnyPath(PREPROCESSED_ECDS_2023_07_LOCATION)
-)
-
+# Even within the glob based scan_csv, there are inconsistencies in field dtypes (principally String vs Float), so every field is read as text.  `raw_dataset_from_files()` (see `bi_py/multifile.py`) unions the files lazily, keeping only the `ECDS_COLUMNS`, reports the columns whose dtype differs between files and normalises their integral floats (`1234.0` -> `1234`), and hands the result straight to `RawDataset`: there is no intermediate single .csv to write and parse again.
 
 # In[ ]:
 
 
-ecds_data = RawDataset(
-#     path=op_path,
-    path=PREPROCESSED_ECDS_2023_07_LOCATION,
+ecds_data = raw_dataset_from_files(
+    AnyPath(ecds_path, "*ECDS*.txt"),
     dataset_type=DatasetType.NHS_DIGITAL.value,
     coding_system=CodelistType.SNOMED.value,
+    separator="|",
+    columns=ECDS_COLUMNS,
 )
 
 
@@ -1018,10 +903,12 @@ col_maps = {
 # In[ ]:
 
 
-processed_ecds_data = ecds_data.process_dataset(
+processed_ecds_data = process_dataset(
+    ecds_data,
     deduplication_options=deduplication_options,
     column_maps=col_maps,
     nhs_digital_subtype="ECDS",
+    person_dictionary=person_dictionary
 )
 
 
@@ -1044,18 +931,17 @@ cleaned_dataset = processed_ecds_data.remove_unrealistic_dates(
     demographic_dataset=demographics
 )
 
-cleaned_dataset.write_to_feather(f"{JULY_2023_OUTPUT_CLEAN_PATH}/ecds.arrow")
-cleaned_dataset.write_to_log(f"{JULY_2023_OUTPUT_CLEAN_PATH}/ecds_log.txt")
+hand_off.write(cleaned_dataset, f"{JULY_2023_OUTPUT_CLEAN_PATH}/ecds.arrow", f"{JULY_2023_OUTPUT_CLEAN_PATH}/ecds_log.txt")
 
 
 # ### Merge these data together
 # 
-# Now we merge all these datasets together and deduplicate. We load from file so that we can be assured that the correct dataset is loaded as sometimes the cells can be run manually in the wrong order. 
+# Now we merge all these datasets together and deduplicate. We load with `hand_off.load()` so that we can be assured that the correct dataset is loaded as sometimes the cells can be run manually in the wrong order: the datasets written above are handed over from memory once their fingerprint shows they are unchanged, otherwise they are loaded from file. 
 
 # In[ ]:
 
 
-civ_data = ProcessedDataset(path=f"{JULY_2023_OUTPUT_CLEAN_PATH}/civ_reg.arrow", 
+civ_data = hand_off.load(path=f"{JULY_2023_OUTPUT_CLEAN_PATH}/civ_reg.arrow", 
                             dataset_type=DatasetType.NHS_DIGITAL.value, 
                             coding_system=CodelistType.ICD10.value, 
                             log_path=f"{JULY_2023_OUTPUT_CLEAN_PATH}/civ_reg_log.txt")
@@ -1064,7 +950,7 @@ civ_data = ProcessedDataset(path=f"{JULY_2023_OUTPUT_CLEAN_PATH}/civ_reg.arrow",
 # In[ ]:
 
 
-apc_data = ProcessedDataset(path=f"{JULY_2023_OUTPUT_CLEAN_PATH}/apc.arrow", 
+apc_data = hand_off.load(path=f"{JULY_2023_OUTPUT_CLEAN_PATH}/apc.arrow", 
                             dataset_type=DatasetType.NHS_DIGITAL.value, 
                             coding_system=CodelistType.ICD10.value, 
                             log_path=f"{JULY_2023_OUTPUT_CLEAN_PATH}/apc_log.txt")
@@ -1073,7 +959,7 @@ apc_data = ProcessedDataset(path=f"{JULY_2023_OUTPUT_CLEAN_PATH}/apc.arrow",
 # In[ ]:
 
 
-op_data = ProcessedDataset(path=f"{JULY_2023_OUTPUT_CLEAN_PATH}/op.arrow", 
+op_data = hand_off.load(path=f"{JULY_2023_OUTPUT_CLEAN_PATH}/op.arrow", 
                             dataset_type=DatasetType.NHS_DIGITAL.value, 
                             coding_system=CodelistType.ICD10.value, 
                             log_path=f"{JULY_2023_OUTPUT_CLEAN_PATH}/op_log.txt")
@@ -1082,7 +968,7 @@ op_data = ProcessedDataset(path=f"{JULY_2023_OUTPUT_CLEAN_PATH}/op.arrow",
 # In[ ]:
 
 
-ca_data = ProcessedDataset(path=f"{JULY_2023_OUTPUT_CLEAN_PATH}/ca.arrow", 
+ca_data = hand_off.load(path=f"{JULY_2023_OUTPUT_CLEAN_PATH}/ca.arrow", 
                             dataset_type=DatasetType.NHS_DIGITAL.value, 
                             coding_system=CodelistType.ICD10.value, 
                             log_path=f"{JULY_2023_OUTPUT_CLEAN_PATH}/ca_log.txt")
@@ -1091,7 +977,7 @@ ca_data = ProcessedDataset(path=f"{JULY_2023_OUTPUT_CLEAN_PATH}/ca.arrow",
 # In[ ]:
 
 
-ecds_data = ProcessedDataset(path=f"{JULY_2023_OUTPUT_CLEAN_PATH}/ecds.arrow", 
+ecds_data = hand_off.load(path=f"{JULY_2023_OUTPUT_CLEAN_PATH}/ecds.arrow", 
                             dataset_type=DatasetType.NHS_DIGITAL.value, 
                             coding_system=CodelistType.SNOMED.value, 
                             log_path=f"{JULY_2023_OUTPUT_CLEAN_PATH}/ecds_log.txt")
@@ -1100,53 +986,19 @@ ecds_data = ProcessedDataset(path=f"{JULY_2023_OUTPUT_CLEAN_PATH}/ecds.arrow",
 # In[ ]:
 
 
-civ_data.merge_with_dataset(apc_data)
-
-
-# In[ ]:
-
-
-civ_data.merge_with_dataset(op_data)
-
-
-# In[ ]:
-
-
-civ_data.merge_with_dataset(ca_data)
+dedup = merge_many([civ_data, apc_data, op_data, ca_data], dedup_on=deduplication_options)
 
 
 # ## Note
 # 
-# ECDS data are SNOMED, others are ICD10; only same codeset data can be merged with `merge_with_dataset`
+# ECDS data are SNOMED, others are ICD10; only same codeset data can be merged with `merge_many`
 # 
 # ECDS data are merge later in pipeline
 
 # In[ ]:
 
 
-dedup = civ_data.deduplicate()
-
-
-# In[ ]:
-
-
-for log in apc_data.log:
-    dedup.log.append(log)
-    
-for log in op_data.log:
-    dedup.log.append(log)
-    
-for log in ca_data.log:
-    dedup.log.append(log)
-    
-dedup.log.sort()
-
-
-# In[ ]:
-
-
-dedup.write_to_feather(f"{JULY_2023_OUTPUT_CLEAN_PATH}/merged_data.arrow")
-dedup.write_to_log(f"{JULY_2023_OUTPUT_CLEAN_PATH}/merged_data_log.txt")
+hand_off.write(dedup, f"{JULY_2023_OUTPUT_CLEAN_PATH}/merged_data.arrow", f"{JULY_2023_OUTPUT_CLEAN_PATH}/merged_data_log.txt")
 
 
 # ###### 2024_10  START ######
@@ -1190,10 +1042,12 @@ civreg_data = RawDataset(
 # In[ ]:
 
 
-processed_civreg_data = civreg_data.process_dataset(
+processed_civreg_data = process_dataset(
+    civreg_data,
     deduplication_options=deduplication_options,
     column_maps=col_maps,
-    nhs_digital_subtype="CIV_REG"
+    nhs_digital_subtype="CIV_REG",
+    person_dictionary=person_dictionary
 )
 
 
@@ -1221,8 +1075,7 @@ cleaned_dataset = processed_civreg_data.remove_unrealistic_dates(
     demographic_dataset=demographics
 )
 
-cleaned_dataset.write_to_feather(f"{OCT_2024_OUTPUT_CLEAN_PATH}/civ_reg.arrow")
-cleaned_dataset.write_to_log(f"{OCT_2024_OUTPUT_CLEAN_PATH}/civ_reg_log.txt")
+hand_off.write(cleaned_dataset, f"{OCT_2024_OUTPUT_CLEAN_PATH}/civ_reg.arrow", f"{OCT_2024_OUTPUT_CLEAN_PATH}/civ_reg_log.txt")
 
 
 # **APC Data**
@@ -1240,10 +1093,12 @@ apc_data = RawDataset(
 # In[ ]:
 
 
-processed_apc_data = apc_data.process_dataset(
+processed_apc_data = process_dataset(
+    apc_data,
     deduplication_options=deduplication_options,
     column_maps=col_maps,
-    nhs_digital_subtype="APC"
+    nhs_digital_subtype="APC",
+    person_dictionary=person_dictionary
 )
 
 
@@ -1266,8 +1121,7 @@ cleaned_dataset = processed_apc_data.remove_unrealistic_dates(
     demographic_dataset=demographics
 )
 
-cleaned_dataset.write_to_feather(f"{OCT_2024_OUTPUT_CLEAN_PATH}/apc.arrow")
-cleaned_dataset.write_to_log(f"{OCT_2024_OUTPUT_CLEAN_PATH}/apc_log.txt")
+hand_off.write(cleaned_dataset, f"{OCT_2024_OUTPUT_CLEAN_PATH}/apc.arrow", f"{OCT_2024_OUTPUT_CLEAN_PATH}/apc_log.txt")
 
 
 # **OP Data**
@@ -1285,10 +1139,12 @@ op_data = RawDataset(
 # In[ ]:
 
 
-processed_op_data = op_data.process_dataset(
+processed_op_data = process_dataset(
+    op_data,
     deduplication_options=deduplication_options,
     column_maps=col_maps,
-    nhs_digital_subtype="OP"
+    nhs_digital_subtype="OP",
+    person_dictionary=person_dictionary
 )
 
 
@@ -1311,8 +1167,7 @@ cleaned_dataset = processed_op_data.remove_unrealistic_dates(
     demographic_dataset=demographics
 )
 
-cleaned_dataset.write_to_feather(f"{OCT_2024_OUTPUT_CLEAN_PATH}/op.arrow")
-cleaned_dataset.write_to_log(f"{OCT_2024_OUTPUT_CLEAN_PATH}/op_log.txt")
+hand_off.write(cleaned_dataset, f"{OCT_2024_OUTPUT_CLEAN_PATH}/op.arrow", f"{OCT_2024_OUTPUT_CLEAN_PATH}/op_log.txt")
 
 
 # **Cancer Registry Data**
@@ -1368,12 +1223,8 @@ ca_data.data = (
         .alias("full_year") 
     )
     .with_columns(
-        pl.concat_str(
-            pl.col("full_year"),
-            pl.lit("-07-02")
-        )
-#         .cast(pl.Date) # to reinstate one day. We should work dates as dates as soon as we can. 
-#         # The pipeline currently expects this date as a string at this stage.
+        # a pl.Date, which process_dataset() keeps as is (see bi_py/dates.py)
+        pl.date(pl.col("full_year").cast(pl.Int32), 7, 2)
         .alias("full_date") # this is the cancer registration full date
     )
 )
@@ -1404,9 +1255,11 @@ col_maps = {
 # In[ ]:
 
 
-processed_ca_data = ca_data.process_dataset(
+processed_ca_data = process_dataset(
+    ca_data,
     deduplication_options=deduplication_options, 
-    column_maps=col_maps
+    column_maps=col_maps,
+    person_dictionary=person_dictionary
 )
 
 
@@ -1429,19 +1282,18 @@ cleaned_dataset = processed_ca_data.remove_unrealistic_dates(
     demographic_dataset=demographics
 )
 
-cleaned_dataset.write_to_feather(f"{OCT_2024_OUTPUT_CLEAN_PATH}/ca.arrow")
-cleaned_dataset.write_to_log(f"{OCT_2024_OUTPUT_CLEAN_PATH}/ca_log.txt")
+hand_off.write(cleaned_dataset, f"{OCT_2024_OUTPUT_CLEAN_PATH}/ca.arrow", f"{OCT_2024_OUTPUT_CLEAN_PATH}/ca_log.txt")
 
 
 # **ECDS Data**
 
 # This is a "new" venture.
 # 
-# #### Again we need to preprocess files to a single .csv
+# #### The .txt files are read directly
 # 
 # For 2024_10 cut, there is a single .txt file.  The separator is the pipe symbol `|`
 # 
-# Unfortunately, even within the glob based scan_csv, there are inconsistencies in field dtypes (principally String vs Float).  So easier again to cast all the str with `infer_schema=False` argument.
+# Even within the glob based scan_csv, there are inconsistencies in field dtypes (principally String vs Float), so every field is read as text.  `raw_dataset_from_files()` (see `bi_py/multifile.py`) unions the files lazily, keeping only the `ECDS_COLUMNS`, reports the columns whose dtype differs between files and normalises their integral floats (`1234.0` -> `1234`), and hands the result straight to `RawDataset`: there is no intermediate single .csv to write and parse again.
 
 # In[ ]:
 
@@ -1452,35 +1304,12 @@ ecds_path
 # In[ ]:
 
 
-lf_temp_txt = pl.scan_csv(
-    AnyPath(
-        ecds_path
-#         "*ECDS*.txt"
-    ),
-    separator="|",
-    infer_schema=False
-)
-
-
-# In[ ]:
-
-
-PREPROCESSED_ECDS_2024_10_LOCATION = (
-    f"{PREPROCESSED_FILES_LOCATION}/nic338864_ecds_2024_10_all.csv"
-) 
-lf_temp_txt.sink_csv(
-    AnyPath(PREPROCESSED_ECDS_2024_10_LOCATION)
-)
-
-
-# In[ ]:
-
-
-ecds_data = RawDataset(
-#     path=op_path,
-    path=PREPROCESSED_ECDS_2024_10_LOCATION,
+ecds_data = raw_dataset_from_files(
+    ecds_path,
     dataset_type=DatasetType.NHS_DIGITAL.value,
     coding_system=CodelistType.SNOMED.value,
+    separator="|",
+    columns=ECDS_COLUMNS,
 )
 
 
@@ -1497,10 +1326,12 @@ col_maps = {
 # In[ ]:
 
 
-processed_ecds_data = ecds_data.process_dataset(
+processed_ecds_data = process_dataset(
+    ecds_data,
     deduplication_options=deduplication_options,
     column_maps=col_maps,
     nhs_digital_subtype="ECDS",
+    person_dictionary=person_dictionary
 )
 
 
@@ -1523,18 +1354,17 @@ cleaned_dataset = processed_ecds_data.remove_unrealistic_dates(
     demographic_dataset=demographics
 )
 
-cleaned_dataset.write_to_feather(f"{OCT_2024_OUTPUT_CLEAN_PATH}/ecds.arrow")
-cleaned_dataset.write_to_log(f"{OCT_2024_OUTPUT_CLEAN_PATH}/ecds_log.txt")
+hand_off.write(cleaned_dataset, f"{OCT_2024_OUTPUT_CLEAN_PATH}/ecds.arrow", f"{OCT_2024_OUTPUT_CLEAN_PATH}/ecds_log.txt")
 
 
 # ### Merge these data together
 # 
-# Now we merge all these datasets together and deduplicate. We load from file so that we can be assured that the correct dataset is loaded as sometimes the cells can be run manually in the wrong order. 
+# Now we merge all these datasets together and deduplicate. We load with `hand_off.load()` so that we can be assured that the correct dataset is loaded as sometimes the cells can be run manually in the wrong order: the datasets written above are handed over from memory once their fingerprint shows they are unchanged, otherwise they are loaded from file. 
 
 # In[ ]:
 
 
-civ_data = ProcessedDataset(path=f"{OCT_2024_OUTPUT_CLEAN_PATH}/civ_reg.arrow", 
+civ_data = hand_off.load(path=f"{OCT_2024_OUTPUT_CLEAN_PATH}/civ_reg.arrow", 
                             dataset_type=DatasetType.NHS_DIGITAL.value, 
                             coding_system=CodelistType.ICD10.value, 
                             log_path=f"{OCT_2024_OUTPUT_CLEAN_PATH}/civ_reg_log.txt")
@@ -1543,7 +1373,7 @@ civ_data = ProcessedDataset(path=f"{OCT_2024_OUTPUT_CLEAN_PATH}/civ_reg.arrow",
 # In[ ]:
 
 
-apc_data = ProcessedDataset(path=f"{OCT_2024_OUTPUT_CLEAN_PATH}/apc.arrow", 
+apc_data = hand_off.load(path=f"{OCT_2024_OUTPUT_CLEAN_PATH}/apc.arrow", 
                             dataset_type=DatasetType.NHS_DIGITAL.value, 
                             coding_system=CodelistType.ICD10.value, 
                             log_path=f"{OCT_2024_OUTPUT_CLEAN_PATH}/apc_log.txt")
@@ -1552,7 +1382,7 @@ apc_data = ProcessedDataset(path=f"{OCT_2024_OUTPUT_CLEAN_PATH}/apc.arrow",
 # In[ ]:
 
 
-op_data = ProcessedDataset(path=f"{OCT_2024_OUTPUT_CLEAN_PATH}/op.arrow", 
+op_data = hand_off.load(path=f"{OCT_2024_OUTPUT_CLEAN_PATH}/op.arrow", 
                             dataset_type=DatasetType.NHS_DIGITAL.value, 
                             coding_system=CodelistType.ICD10.value, 
                             log_path=f"{OCT_2024_OUTPUT_CLEAN_PATH}/op_log.txt")
@@ -1561,7 +1391,7 @@ op_data = ProcessedDataset(path=f"{OCT_2024_OUTPUT_CLEAN_PATH}/op.arrow",
 # In[ ]:
 
 
-ca_data = ProcessedDataset(path=f"{OCT_2024_OUTPUT_CLEAN_PATH}/ca.arrow", 
+ca_data = hand_off.load(path=f"{OCT_2024_OUTPUT_CLEAN_PATH}/ca.arrow", 
                             dataset_type=DatasetType.NHS_DIGITAL.value, 
                             coding_system=CodelistType.ICD10.value, 
                             log_path=f"{OCT_2024_OUTPUT_CLEAN_PATH}/ca_log.txt")
@@ -1570,47 +1400,13 @@ ca_data = ProcessedDataset(path=f"{OCT_2024_OUTPUT_CLEAN_PATH}/ca.arrow",
 # In[ ]:
 
 
-civ_data.merge_with_dataset(apc_data)
+dedup = merge_many([civ_data, apc_data, op_data, ca_data], dedup_on=deduplication_options)
 
 
 # In[ ]:
 
 
-civ_data.merge_with_dataset(op_data)
-
-
-# In[ ]:
-
-
-civ_data.merge_with_dataset(ca_data)
-
-
-# In[ ]:
-
-
-dedup = civ_data.deduplicate()
-
-
-# In[ ]:
-
-
-for log in apc_data.log:
-    dedup.log.append(log)
-    
-for log in op_data.log:
-    dedup.log.append(log)
-    
-for log in ca_data.log:
-    dedup.log.append(log)
-    
-dedup.log.sort()
-
-
-# In[ ]:
-
-
-dedup.write_to_feather(f"{OCT_2024_OUTPUT_CLEAN_PATH}/merged_data.arrow")
-dedup.write_to_log(f"{OCT_2024_OUTPUT_CLEAN_PATH}/merged_data_log.txt")
+hand_off.write(dedup, f"{OCT_2024_OUTPUT_CLEAN_PATH}/merged_data.arrow", f"{OCT_2024_OUTPUT_CLEAN_PATH}/merged_data_log.txt")
 
 
 # ###### 2024_10 END ######
@@ -1691,10 +1487,12 @@ apc_data = RawDataset(
 # In[ ]:
 
 
-processed_apc_data = apc_data.process_dataset(
+processed_apc_data = process_dataset(
+    apc_data,
     deduplication_options=deduplication_options,
     column_maps=col_maps,
-    nhs_digital_subtype="APC"
+    nhs_digital_subtype="APC",
+    person_dictionary=person_dictionary
 )
 
 
@@ -1717,8 +1515,7 @@ cleaned_dataset = processed_apc_data.remove_unrealistic_dates(
     demographic_dataset=demographics
 )
 
-cleaned_dataset.write_to_feather(f"{MAR_2025_OUTPUT_CLEAN_PATH}/apc.arrow")
-cleaned_dataset.write_to_log(f"{MAR_2025_OUTPUT_CLEAN_PATH}/apc_log.txt")
+hand_off.write(cleaned_dataset, f"{MAR_2025_OUTPUT_CLEAN_PATH}/apc.arrow", f"{MAR_2025_OUTPUT_CLEAN_PATH}/apc_log.txt")
 
 
 # **OP Data**
@@ -1773,10 +1570,12 @@ op_data = RawDataset(
 # In[ ]:
 
 
-processed_op_data = op_data.process_dataset(
+processed_op_data = process_dataset(
+    op_data,
     deduplication_options=deduplication_options,
     column_maps=col_maps,
-    nhs_digital_subtype="OP"
+    nhs_digital_subtype="OP",
+    person_dictionary=person_dictionary
 )
 
 
@@ -1799,52 +1598,28 @@ cleaned_dataset = processed_op_data.remove_unrealistic_dates(
     demographic_dataset=demographics
 )
 
-cleaned_dataset.write_to_feather(f"{MAR_2025_OUTPUT_CLEAN_PATH}/op.arrow")
-cleaned_dataset.write_to_log(f"{MAR_2025_OUTPUT_CLEAN_PATH}/op_log.txt")
+hand_off.write(cleaned_dataset, f"{MAR_2025_OUTPUT_CLEAN_PATH}/op.arrow", f"{MAR_2025_OUTPUT_CLEAN_PATH}/op_log.txt")
 
 
 # **ECDS Data**
 
 # This is a "new" venture.
 # 
-# #### Again we need to preprocess files to a single .csv
+# #### The .txt files are read directly
 # 
 # For 2025_03 cut, there are only .txt files (i.e not .txt files + .csv file).  The separator is the pipe symbol `|`
 # 
-# Unfortunately, even within the glob based scan_csv, there are inconsistencies in field dtypes (principally String vs Float).  So easier again to cast all the str with `infer_schema=False` argument.
+# Even within the glob based scan_csv, there are inconsistencies in field dtypes (principally String vs Float), so every field is read as text.  `raw_dataset_from_files()` (see `bi_py/multifile.py`) unions the files lazily, keeping only the `ECDS_COLUMNS`, reports the columns whose dtype differs between files and normalises their integral floats (`1234.0` -> `1234`), and hands the result straight to `RawDataset`: there is no intermediate single .csv to write and parse again.
 
 # In[ ]:
 
 
-lf_temp_txt = pl.scan_csv(
-    AnyPath(
-        ecds_path,
-        "*ECDS*.txt"
-    ),
-    separator="|",
-    infer_schema=False
-)
-
-
-# In[ ]:
-
-
-PREPROCESSED_ECDS_2025_03_LOCATION = (
-    f"{PREPROCESSED_FILES_LOCATION}/nic338864_ecds_2025_03_all.csv"
-) 
-lf_temp_txt.sink_csv(
-    AnyPath(PREPROCESSED_ECDS_2025_03_LOCATION)
-)
-
-
-# In[ ]:
-
-
-ecds_data = RawDataset(
-#     path=op_path,
-    path=PREPROCESSED_ECDS_2025_03_LOCATION,
+ecds_data = raw_dataset_from_files(
+    AnyPath(ecds_path, "*ECDS*.txt"),
     dataset_type=DatasetType.NHS_DIGITAL.value,
     coding_system=CodelistType.SNOMED.value,
+    separator="|",
+    columns=ECDS_COLUMNS,
 )
 
 
@@ -1861,10 +1636,12 @@ col_maps = {
 # In[ ]:
 
 
-processed_ecds_data = ecds_data.process_dataset(
+processed_ecds_data = process_dataset(
+    ecds_data,
     deduplication_options=deduplication_options,
     column_maps=col_maps,
     nhs_digital_subtype="ECDS",
+    person_dictionary=person_dictionary
 )
 
 
@@ -1887,18 +1664,17 @@ cleaned_dataset = processed_ecds_data.remove_unrealistic_dates(
     demographic_dataset=demographics
 )
 
-cleaned_dataset.write_to_feather(f"{MAR_2025_OUTPUT_CLEAN_PATH}/ecds.arrow")
-cleaned_dataset.write_to_log(f"{MAR_2025_OUTPUT_CLEAN_PATH}/ecds_log.txt")
+hand_off.write(cleaned_dataset, f"{MAR_2025_OUTPUT_CLEAN_PATH}/ecds.arrow", f"{MAR_2025_OUTPUT_CLEAN_PATH}/ecds_log.txt")
 
 
 # ### Merge these data together
 # 
-# Now we merge all these datasets together and deduplicate. We load from file so that we can be assured that the correct dataset is loaded as sometimes the cells can be run manually in the wrong order. 
+# Now we merge all these datasets together and deduplicate. We load with `hand_off.load()` so that we can be assured that the correct dataset is loaded as sometimes the cells can be run manually in the wrong order: the datasets written above are handed over from memory once their fingerprint shows they are unchanged, otherwise they are loaded from file. 
 
 # In[ ]:
 
 
-apc_data = ProcessedDataset(path=f"{MAR_2025_OUTPUT_CLEAN_PATH}/apc.arrow", 
+apc_data = hand_off.load(path=f"{MAR_2025_OUTPUT_CLEAN_PATH}/apc.arrow", 
                             dataset_type=DatasetType.NHS_DIGITAL.value, 
                             coding_system=CodelistType.ICD10.value, 
                             log_path=f"{MAR_2025_OUTPUT_CLEAN_PATH}/apc_log.txt")
@@ -1907,7 +1683,7 @@ apc_data = ProcessedDataset(path=f"{MAR_2025_OUTPUT_CLEAN_PATH}/apc.arrow",
 # In[ ]:
 
 
-op_data = ProcessedDataset(path=f"{MAR_2025_OUTPUT_CLEAN_PATH}/op.arrow", 
+op_data = hand_off.load(path=f"{MAR_2025_OUTPUT_CLEAN_PATH}/op.arrow", 
                             dataset_type=DatasetType.NHS_DIGITAL.value, 
                             coding_system=CodelistType.ICD10.value, 
                             log_path=f"{MAR_2025_OUTPUT_CLEAN_PATH}/op_log.txt")
@@ -1916,32 +1692,13 @@ op_data = ProcessedDataset(path=f"{MAR_2025_OUTPUT_CLEAN_PATH}/op.arrow",
 # In[ ]:
 
 
-apc_data.merge_with_dataset(op_data)
+dedup = merge_many([apc_data, op_data], dedup_on=deduplication_options)
 
 
 # In[ ]:
 
 
-dedup = apc_data.deduplicate()
-
-
-# In[ ]:
-
-
-for log in apc_data.log:
-    dedup.log.append(log)
-    
-for log in op_data.log:
-    dedup.log.append(log)
-    
-dedup.log.sort()
-
-
-# In[ ]:
-
-
-dedup.write_to_feather(f"{MAR_2025_OUTPUT_CLEAN_PATH}/merged_data.arrow")
-dedup.write_to_log(f"{MAR_2025_OUTPUT_CLEAN_PATH}/merged_data_log.txt")
+hand_off.write(dedup, f"{MAR_2025_OUTPUT_CLEAN_PATH}/merged_data.arrow", f"{MAR_2025_OUTPUT_CLEAN_PATH}/merged_data_log.txt")
 
 
 # ###### 2025_03 END ######
@@ -1953,7 +1710,7 @@ dedup.write_to_log(f"{MAR_2025_OUTPUT_CLEAN_PATH}/merged_data_log.txt")
 # In[ ]:
 
 
-sept_2021_data = ProcessedDataset(path=f"{SEP_2021_OUTPUT_CLEAN_PATH}/merged_data.arrow", 
+sept_2021_data = hand_off.load(path=f"{SEP_2021_OUTPUT_CLEAN_PATH}/merged_data.arrow", 
                                 coding_system=CodelistType.ICD10.value, 
                                 dataset_type=DatasetType.NHS_DIGITAL.value, 
                                 log_path=f"{SEP_2021_OUTPUT_CLEAN_PATH}/merged_data_log.txt")
@@ -1962,7 +1719,7 @@ sept_2021_data = ProcessedDataset(path=f"{SEP_2021_OUTPUT_CLEAN_PATH}/merged_dat
 # In[ ]:
 
 
-july_2023_data = ProcessedDataset(path=f"{JULY_2023_OUTPUT_CLEAN_PATH}/merged_data.arrow", 
+july_2023_data = hand_off.load(path=f"{JULY_2023_OUTPUT_CLEAN_PATH}/merged_data.arrow", 
                                 coding_system=CodelistType.ICD10.value, 
                                 dataset_type=DatasetType.NHS_DIGITAL.value, 
                                 log_path=f"{JULY_2023_OUTPUT_CLEAN_PATH}/merged_data_log.txt")
@@ -1971,7 +1728,7 @@ july_2023_data = ProcessedDataset(path=f"{JULY_2023_OUTPUT_CLEAN_PATH}/merged_da
 # In[ ]:
 
 
-oct_2024_data = ProcessedDataset(path=f"{OCT_2024_OUTPUT_CLEAN_PATH}/merged_data.arrow", 
+oct_2024_data = hand_off.load(path=f"{OCT_2024_OUTPUT_CLEAN_PATH}/merged_data.arrow", 
                                 coding_system=CodelistType.ICD10.value, 
                                 dataset_type=DatasetType.NHS_DIGITAL.value, 
                                 log_path=f"{OCT_2024_OUTPUT_CLEAN_PATH}/merged_data_log.txt")
@@ -1980,7 +1737,7 @@ oct_2024_data = ProcessedDataset(path=f"{OCT_2024_OUTPUT_CLEAN_PATH}/merged_data
 # In[ ]:
 
 
-mar_2025_data = ProcessedDataset(path=f"{MAR_2025_OUTPUT_CLEAN_PATH}/merged_data.arrow", 
+mar_2025_data = hand_off.load(path=f"{MAR_2025_OUTPUT_CLEAN_PATH}/merged_data.arrow", 
                                 coding_system=CodelistType.ICD10.value, 
                                 dataset_type=DatasetType.NHS_DIGITAL.value, 
                                 log_path=f"{MAR_2025_OUTPUT_CLEAN_PATH}/merged_data_log.txt")
@@ -1989,40 +1746,7 @@ mar_2025_data = ProcessedDataset(path=f"{MAR_2025_OUTPUT_CLEAN_PATH}/merged_data
 # In[ ]:
 
 
-sept_2021_data.merge_with_dataset(july_2023_data)
-
-
-# In[ ]:
-
-
-sept_2021_data.merge_with_dataset(oct_2024_data)
-
-
-# In[ ]:
-
-
-sept_2021_data.merge_with_dataset(mar_2025_data)
-
-
-# In[ ]:
-
-
-dedup = sept_2021_data.deduplicate()
-
-
-# In[ ]:
-
-
-for log in july_2023_data.log:
-    dedup.log.append(log)
-    
-for log in oct_2024_data.log:
-    dedup.log.append(log)
-    
-for log in mar_2025_data.log:
-    dedup.log.append(log)
-    
-dedup.log.sort()
+dedup = merge_many([sept_2021_data, july_2023_data, oct_2024_data, mar_2025_data], dedup_on=deduplication_options)
 
 
 # In[ ]:
@@ -2046,7 +1770,7 @@ dedup.write_to_log(f"{MEGADATA_NHS_DIGITAL_LOCATION}/nhs_d_merged_ICD10_log.txt"
 # In[ ]:
 
 
-july_2023_data = ProcessedDataset(path=f"{JULY_2023_OUTPUT_CLEAN_PATH}/ecds.arrow", 
+july_2023_data = hand_off.load(path=f"{JULY_2023_OUTPUT_CLEAN_PATH}/ecds.arrow", 
                                 coding_system=CodelistType.SNOMED.value, 
                                 dataset_type=DatasetType.NHS_DIGITAL.value, 
                                 log_path=f"{JULY_2023_OUTPUT_CLEAN_PATH}/ecds_log.txt")
@@ -2055,7 +1779,7 @@ july_2023_data = ProcessedDataset(path=f"{JULY_2023_OUTPUT_CLEAN_PATH}/ecds.arro
 # In[ ]:
 
 
-oct_2024_data = ProcessedDataset(path=f"{OCT_2024_OUTPUT_CLEAN_PATH}/ecds.arrow", 
+oct_2024_data = hand_off.load(path=f"{OCT_2024_OUTPUT_CLEAN_PATH}/ecds.arrow", 
                                 coding_system=CodelistType.SNOMED.value, 
                                 dataset_type=DatasetType.NHS_DIGITAL.value, 
                                 log_path=f"{OCT_2024_OUTPUT_CLEAN_PATH}/ecds_log.txt")
@@ -2064,7 +1788,7 @@ oct_2024_data = ProcessedDataset(path=f"{OCT_2024_OUTPUT_CLEAN_PATH}/ecds.arrow"
 # In[ ]:
 
 
-mar_2025_data = ProcessedDataset(path=f"{MAR_2025_OUTPUT_CLEAN_PATH}/ecds.arrow", 
+mar_2025_data = hand_off.load(path=f"{MAR_2025_OUTPUT_CLEAN_PATH}/ecds.arrow", 
                                 coding_system=CodelistType.SNOMED.value, 
                                 dataset_type=DatasetType.NHS_DIGITAL.value, 
                                 log_path=f"{MAR_2025_OUTPUT_CLEAN_PATH}/ecds_log.txt")
@@ -2073,31 +1797,7 @@ mar_2025_data = ProcessedDataset(path=f"{MAR_2025_OUTPUT_CLEAN_PATH}/ecds.arrow"
 # In[ ]:
 
 
-july_2023_data.merge_with_dataset(oct_2024_data)
-
-
-# In[ ]:
-
-
-july_2023_data.merge_with_dataset(mar_2025_data)
-
-
-# In[ ]:
-
-
-dedup = july_2023_data.deduplicate()
-
-
-# In[ ]:
-
-
-for log in oct_2024_data.log:
-    dedup.log.append(log)
-    
-for log in mar_2025_data.log:
-    dedup.log.append(log)
-    
-dedup.log.sort()
+dedup = merge_many([july_2023_data, oct_2024_data, mar_2025_data], dedup_on=deduplication_options)
 
 
 # In[ ]:
@@ -2139,13 +1839,8 @@ snomed_data = ProcessedDataset(
 # In[ ]:
 
 
-# Alas we need to recast snomed_data's code field as an Int64 to work with TRE tool's merging function
-snomed_data.data = (
-    snomed_data.data
-    .with_columns(
-        pl.col("code").cast(pl.Int64, strict=True)
-    )
-)
+# the codes are UInt64 (see bi_py/snomed.py) but tretools reads the mapping file as Int64
+snomed_data.data = tretools_snomed_codes(snomed_data.data)
 
 
 # In[ ]:
@@ -2206,26 +1901,7 @@ icd_data = ProcessedDataset(
 # In[ ]:
 
 
-icd_data.merge_with_dataset(final_dedup)
-
-
-# In[ ]:
-
-
-merged_dedup = icd_data.deduplicate()
-
-
-# In[ ]:
-
-
-for log in icd_data.log:
-    merged_dedup.log.append(log)
-
-
-# In[ ]:
-
-
-merged_dedup.log.sort()
+merged_dedup = merge_many([icd_data, final_dedup], dedup_on=deduplication_options)
 
 
 # In[ ]:
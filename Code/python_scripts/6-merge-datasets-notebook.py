@@ -3,7 +3,7 @@
 
 # # 6-merge-datasets-notebook - Plan
 # 
-# In this notebook, we are going to load all the data from file that was created in notebooks 2 to 5. We are aiming to get all the data of the same type together so we end up with:
+# In this notebook, we are going to write all the data created in notebooks 2 to 5 to a single event store, partitioned by coding system and source, from which we get all the data of the same type together:
 # 
 # 1) ICD10 dataset
 # 2) OPCS dataset
@@ -12,6 +12,8 @@
 # In addition to this, we have mapped the SNOMED datasets to ICD10 and we will merge these in as well so we end up with:
 # 
 # 4) SNOMED_MAPPED_AND_ICD dataset
+# 
+# Each of these is a lazy view of the event store rather than a merged copy.
 
 # # Locations/paths naming convention
 # 
@@ -52,6 +54,19 @@ from cloudpathlib import AnyPath
 
 ROOT_LOCATION = "/home/ivm/BI_PY"
 MEGADATA_LOCATION = f"{ROOT_LOCATION}/{VERSION}/megadata"
+EVENT_STORE_LOCATION = f"{MEGADATA_LOCATION}/event_store"
+
+
+# In[ ]:
+
+
+import sys
+sys.path.append(f"{ROOT_LOCATION}/{VERSION}/Code")
+
+from bi_py.event_store import PRODUCTS, product_log, scan_product, write_partition
+from bi_py.megadata import megadata_files
+from bi_py.person import decode, read_person_dictionary
+from bi_py.snomed import snomed_codes
 
 
 # In[ ]:
@@ -92,389 +107,67 @@ def redirect_to_next_notebook_in_pipeline(other_notebook):
     display(Javascript(js_code))
 
 
-# ### ICD10 Datasets \[Native\]
+# ### The event store
 # 
-# Datasets are Primary, Barts, Bradford, NHSD but there is no native ICD-10 data in Primary, hence only 3 native ICD datasets collected.
-
-# In[ ]:
-
-
-barts_icd = ProcessedDataset(path=f"{MEGADATA_LOCATION}/barts_health/merged_ICD.arrow", 
-                             dataset_type="MEGA", 
-                             coding_system=CodelistType.ICD10.value,
-                             log_path=f"{MEGADATA_LOCATION}/barts_health/merged_ICD_log.txt")
-
-
-# In[ ]:
-
-
-bradford_icd = ProcessedDataset(path=f"{MEGADATA_LOCATION}/bradford/icd.arrow", 
-                             dataset_type="MEGA", 
-                             coding_system=CodelistType.ICD10.value,
-                             log_path=f"{MEGADATA_LOCATION}/bradford/icd_log.txt")
-
-
-# In[ ]:
-
-
-nhs_d_icd = ProcessedDataset(path=f"{MEGADATA_LOCATION}/nhs_digital/nhs_d_merged_ICD10.arrow", 
-                             dataset_type="MEGA", 
-                             coding_system=CodelistType.ICD10.value,
-                             log_path=f"{MEGADATA_LOCATION}/nhs_digital/nhs_d_merged_ICD10_log.txt")
-
-
-# In[ ]:
-
-
-barts_icd.merge_with_dataset(bradford_icd)
-
-
-# In[ ]:
-
-
-barts_icd.merge_with_dataset(nhs_d_icd)
-
-
-# In[ ]:
-
-
-dedup = barts_icd.deduplicate()
-
-
-# In[ ]:
-
-
-for log in bradford_icd.log:
-    dedup.log.append(log)
-
-for log in nhs_d_icd.log:
-    dedup.log.append(log)
-dedup.log.sort()
-
-
-# In[ ]:
-
-
-dedup.write_to_feather(f"{MEGADATA_LOCATION}/icd_only.arrow")
-dedup.write_to_log(f"{MEGADATA_LOCATION}/icd_only_log.txt")
-
-
-# ### OPCS Datasets
+# Every per-source megadata file of notebooks 2 to 5 is written once to the event store, a partition per coding system and source (see `Code/bi_py/event_store.py`):
 # 
-# Only (hospital) secondary care sources use OPCS, i.e Bart and Bradford
-
-# In[ ]:
-
-
-barts_opcs = ProcessedDataset(path=f"{MEGADATA_LOCATION}/barts_health/merged_OPCS.arrow", 
-                             dataset_type="MEGA", 
-                             coding_system=CodelistType.OPCS.value,
-                             log_path=f"{MEGADATA_LOCATION}/barts_health/merged_OPCS_log.txt")
-
-
-# In[ ]:
-
-
-bradford_opcs = ProcessedDataset(path=f"{MEGADATA_LOCATION}/bradford/opcs.arrow", 
-                             dataset_type="MEGA", 
-                             coding_system=CodelistType.OPCS.value,
-                             log_path=f"{MEGADATA_LOCATION}/bradford/opcs_log.txt")
-
-
-# In[ ]:
-
-
-barts_opcs.merge_with_dataset(bradford_opcs)
-
-
-# In[ ]:
-
-
-dedup = barts_opcs.deduplicate()
-
-
-# In[ ]:
-
-
-for log in bradford_opcs.log:
-    dedup.log.append(log)
-
-dedup.log.sort()
-
-
-# In[ ]:
-
-
-dedup.write_to_feather(f"{MEGADATA_LOCATION}/opcs_only.arrow")
-dedup.write_to_log(f"{MEGADATA_LOCATION}/opcs_only_log.txt")
-
-
-# ### SNOMED Datasets
-
-# In[ ]:
-
-
-primary_snomed = ProcessedDataset(path=f"{MEGADATA_LOCATION}/primary_care/final_merged_data.arrow", 
-                             dataset_type="MEGA", 
-                             coding_system=CodelistType.SNOMED.value,
-                             log_path=f"{MEGADATA_LOCATION}/primary_care/final_log.txt")
-
-
-# In[ ]:
-
-
-barts_snomed = ProcessedDataset(path=f"{MEGADATA_LOCATION}/barts_health/merged_SNOMED.arrow", 
-                             dataset_type="MEGA", 
-                             coding_system=CodelistType.SNOMED.value,
-                             log_path=f"{MEGADATA_LOCATION}/barts_health/merged_SNOMED_log.txt")
-
-
-# In[ ]:
-
-
-bradford_snomed = ProcessedDataset(path=f"{MEGADATA_LOCATION}/bradford/snomed.arrow", 
-                             dataset_type="MEGA", 
-                             coding_system=CodelistType.SNOMED.value,
-                             log_path=f"{MEGADATA_LOCATION}/bradford/snomed_log.txt")
-
-
-# In[ ]:
-
-
-nhs_d_snomed = ProcessedDataset(path=f"{MEGADATA_LOCATION}/nhs_digital/nhs_d_merged_SNOMED.arrow", 
-                             dataset_type="MEGA", 
-                             coding_system=CodelistType.SNOMED.value,
-                             log_path=f"{MEGADATA_LOCATION}/nhs_digital/nhs_d_merged_SNOMED_log.txt")
-
-
-# In[ ]:
-
-
-primary_snomed.merge_with_dataset(barts_snomed)
-primary_snomed.merge_with_dataset(bradford_snomed)
-
-
-# In[ ]:
-
-
-nhs_d_snomed.data = (
-    # We have to do a little madness here to comply with expected tretools input
-    nhs_d_snomed.data
-    .with_columns(
-        pl.col("code")
-        .cast(pl.Int64, strict=False)
-    )
-    .filter(
-        pl.col("code").is_not_null()
-    )
-)
-primary_snomed.merge_with_dataset(nhs_d_snomed)
-
-
-# In[ ]:
-
-
-dedup = primary_snomed.deduplicate()
-
-
-# In[ ]:
-
-
-for log in barts_snomed.log:
-    dedup.log.append(log)
-
-for log in bradford_snomed.log:
-    dedup.log.append(log)
-
-for log in nhs_d_snomed.log:
-    dedup.log.append(log)
-    
-dedup.log.sort()
-
-
-# In[ ]:
-
-
-dedup.write_to_feather(f"{MEGADATA_LOCATION}/snomed_only.arrow")
-dedup.write_to_log(f"{MEGADATA_LOCATION}/snomed_log.txt")
-
-
-# ### Now we create the merged ICD dataset
-# #### This combines "native" ICD10 with SNOMED -> ICD10 mapped codes
+#     megadata/event_store/coding_system=<ICD10|OPCS4|SNOMED|ICD10_MAPPED>/source=<primary_care|barts_health|bradford|nhs_digital>/part.parquet
 # 
-# We first load the mapped dataset (that is the dataset that is mapped from SNOMED to ICD dataset). 
-
-# In[ ]:
-
-
-mapped_data_primary_icd = ProcessedDataset( # Notebook #2
-    path=f"{MEGADATA_LOCATION}/primary_care/final_mapped_data.arrow",
-    dataset_type="MEGA",
-    coding_system=CodelistType.ICD10.value,
-    log_path=f"{MEGADATA_LOCATION}/primary_care/final_mapped_log.txt"
-)
-
-
-# In[ ]:
-
-
-mapped_data_barts_icd = ProcessedDataset( # Notebook #3
-    path=f"{MEGADATA_LOCATION}/barts_health/final_mapped_snomed_to_icd.arrow",
-    dataset_type="MEGA",
-    coding_system=CodelistType.ICD10.value,
-    log_path=f"{MEGADATA_LOCATION}/barts_health/final_mapped_snomed_to_icd_log.txt"
-)
-
-
-# In[ ]:
-
-
-mapped_data_bradford_icd = ProcessedDataset( # Notebook #4
-    path=f"{MEGADATA_LOCATION}/bradford/final_mapped_snomed_to_icd.arrow",
-    dataset_type="MEGA",
-    coding_system=CodelistType.ICD10.value,
-    log_path=f"{MEGADATA_LOCATION}/bradford/final_mapped_snomed_to_icd_log.txt"
-)
-
-
-# In[ ]:
-
-
-mapped_data_nhs_digital_icd = ProcessedDataset( # Notebook #5
-    path=f"{MEGADATA_LOCATION}/nhs_digital/final_mapped_snomed_to_icd.arrow",
-    dataset_type="MEGA",
-    coding_system=CodelistType.ICD10.value,
-    log_path=f"{MEGADATA_LOCATION}/nhs_digital/final_mapped_snomed_to_icd_log.txt"
-)
-
-
-# Then we load the mega file of ICD 10 datas (i.e. the one we just made above)
-
-# In[ ]:
-
-
-icd_mega_file = ProcessedDataset(
-    path=f"{MEGADATA_LOCATION}/icd_only.arrow",
-    dataset_type="MEGA",
-    coding_system=CodelistType.ICD10.value,
-    log_path=f"{MEGADATA_LOCATION}/icd_only_log.txt"
-)
-
-
-# Now we merge everything together and deduplicate. We merge all the log files together and write to file. 
-
-# In[ ]:
-
-
-icd_mega_file.merge_with_dataset(mapped_data_primary_icd)
-
-
-# In[ ]:
-
-
-icd_mega_file.merge_with_dataset(mapped_data_barts_icd)
-
-
-# In[ ]:
-
-
-icd_mega_file.merge_with_dataset(mapped_data_bradford_icd)
-
-
-# In[ ]:
-
-
-icd_mega_file.merge_with_dataset(mapped_data_nhs_digital_icd)
-
-
-# In[ ]:
-
-
-dedup = icd_mega_file.deduplicate()
-
-
-# In[ ]:
-
-
-for log in mapped_data_primary_icd.log:
-    dedup.log.append(log)
-
-for log in mapped_data_barts_icd.log:
-    dedup.log.append(log)
-
-for log in mapped_data_bradford_icd.log:
-    dedup.log.append(log)
-
-for log in mapped_data_nhs_digital_icd.log:
-    dedup.log.append(log)
-
-dedup.log.sort()
-
+# `ICD10_MAPPED` holds the SNOMED codes mapped to ICD-10.  There is no native ICD-10 data in primary care, and only the (hospital) secondary care sources, Barts and Bradford, use OPCS.
 
 # In[ ]:
 
 
-dedup.write_to_feather(f"{MEGADATA_LOCATION}/icd_and_mapped_snomed.arrow")
-dedup.write_to_log(f"{MEGADATA_LOCATION}/icd_and_mapped_snomed_log.txt")
+# coding system, source, megadata file and its log (in MEGADATA_LOCATION)
+EVENT_STORE_PARTITIONS = [
+    ("ICD10", "barts_health", "barts_health/merged_ICD.arrow", "barts_health/merged_ICD_log.txt"),
+    ("ICD10", "bradford", "bradford/icd.arrow", "bradford/icd_log.txt"),
+    ("ICD10", "nhs_digital", "nhs_digital/nhs_d_merged_ICD10.arrow", "nhs_digital/nhs_d_merged_ICD10_log.txt"),
+    ("OPCS4", "barts_health", "barts_health/merged_OPCS.arrow", "barts_health/merged_OPCS_log.txt"),
+    ("OPCS4", "bradford", "bradford/opcs.arrow", "bradford/opcs_log.txt"),
+    ("SNOMED", "primary_care", "primary_care/final_merged_data.arrow", "primary_care/final_log.txt"),
+    ("SNOMED", "barts_health", "barts_health/merged_SNOMED.arrow", "barts_health/merged_SNOMED_log.txt"),
+    ("SNOMED", "bradford", "bradford/snomed.arrow", "bradford/snomed_log.txt"),
+    ("SNOMED", "nhs_digital", "nhs_digital/nhs_d_merged_SNOMED.arrow", "nhs_digital/nhs_d_merged_SNOMED_log.txt"),
+    ("ICD10_MAPPED", "primary_care", "primary_care/final_mapped_data.arrow", "primary_care/final_mapped_log.txt"),  # Notebook #2
+    ("ICD10_MAPPED", "barts_health", "barts_health/final_mapped_snomed_to_icd.arrow", "barts_health/final_mapped_snomed_to_icd_log.txt"),  # Notebook #3
+    ("ICD10_MAPPED", "bradford", "bradford/final_mapped_snomed_to_icd.arrow", "bradford/final_mapped_snomed_to_icd_log.txt"),  # Notebook #4
+    ("ICD10_MAPPED", "nhs_digital", "nhs_digital/final_mapped_snomed_to_icd.arrow", "nhs_digital/final_mapped_snomed_to_icd_log.txt"),  # Notebook #5
+]
 
 
 # In[ ]:
 
 
-dedup = ProcessedDataset(
-    path=f"{MEGADATA_LOCATION}/icd_and_mapped_snomed.arrow",
-    dataset_type="MEGA",
-    coding_system=CodelistType.ICD10.value,
-    log_path=f"{MEGADATA_LOCATION}/icd_and_mapped_snomed_log.txt"
-)
+for coding_system, source, megadata_file, log_file in EVENT_STORE_PARTITIONS:
+    # with the cuts appended to it since it was merged, if any (see bi_py/megadata.py)
+    data = pl.scan_ipc(megadata_files(f"{MEGADATA_LOCATION}/{megadata_file}"))
+    if coding_system == "SNOMED":
+        # all SNOMED datasets have the canonical code type (UInt64, see bi_py/snomed.py) from ingestion,
+        # so this is a no-op unless one of them predates it; as the NHS-D codes always were, the codes
+        # which are not SNOMED are dropped rather than stopping the merge
+        data = snomed_codes(data, strict=False)
+    log = [line for line in AnyPath(MEGADATA_LOCATION, log_file).read_text().splitlines() if line]
+    log.append(f"{datetime.now()}: Written to the event store as coding_system={coding_system}/source={source}")
+    print(write_partition(data, EVENT_STORE_LOCATION, coding_system, source, log=log))
 
 
-# We are now going to truncate all the ICD10 codes so they they only have 3 digits and save this as its own dataset. 
+# ### The merged datasets
 # 
-# This uses tretools' `truncate_icd_to_3_digits()` which literally just takes first 3 characters of the code field, i.e. does not do anything with `"NA"` or invalid codes (e.g. `"-1"`)
-
-# In[ ]:
-
-
-three_digit_only = dedup.truncate_icd_to_3_digits()
-
-
-# In[ ]:
-
-
-three_digit_only.write_to_feather(f"{MEGADATA_LOCATION}/icd_and_mapped_snomed_3_digit_only.arrow")
-three_digit_only.write_to_log(f"{MEGADATA_LOCATION}/icd_and_mapped_snomed_3_digit_only_log.txt")
-
-
-# Now we are going deduplicate this and save again. 
-
-# In[ ]:
-
-
-merged = ProcessedDataset(
-    path=f"{MEGADATA_LOCATION}/icd_and_mapped_snomed_3_digit_only.arrow",
-    dataset_type="MEGA",
-    coding_system=CodelistType.ICD10.value,
-    log_path=f"{MEGADATA_LOCATION}/icd_and_mapped_snomed_3_digit_only_log.txt"
-)
-
-
-# In[ ]:
-
-
-dedup_3_digit = merged.deduplicate()
-
-
-# In[ ]:
-
-
-dedup_3_digit.write_to_feather(f"{MEGADATA_LOCATION}/icd_and_mapped_snomed_3_digit_deduplication.arrow")
-
+# Each merged dataset is a lazy view of the event store (`scan_product()`): only the partitions of its coding systems and sources are read, and the events are deduplicated on (`nhs_number`, `code`, `date`) as they are.  Nothing is written out but the merged logs:
+# 
+# * `icd_only`: `ICD10` (Barts, Bradford, NHS-D)
+# * `opcs_only`: `OPCS4` (Barts, Bradford)
+# * `snomed_only`: `SNOMED` (primary care, Barts, Bradford, NHS-D)
+# * `icd_and_mapped_snomed`: `ICD10` + `ICD10_MAPPED`
+# * `icd_and_mapped_snomed_3_digit`: as `icd_and_mapped_snomed`, with the codes truncated to their first 3 characters (as tretools' `truncate_icd_to_3_digits()`, i.e. `"NA"` or invalid codes such as `"-1"` are left as they are)
+# * `icd_only_no_nhs_d`, `icd_with_mapped_snomed_no_nhs_d`: see "Data without NHS-D" below
 
 # In[ ]:
 
 
-dedup_3_digit.write_to_log(f"{MEGADATA_LOCATION}/icd_and_mapped_snomed_3_digit_deduplication_log.txt")
+for name in PRODUCTS:
+    AnyPath(MEGADATA_LOCATION, f"{name}_log.txt").write_text("\n".join(product_log(EVENT_STORE_LOCATION, name)) + "\n")
 
 
 # ### Run next cell to initiate next notebook
@@ -485,130 +178,32 @@ dedup_3_digit.write_to_log(f"{MEGADATA_LOCATION}/icd_and_mapped_snomed_3_digit_d
 redirect_to_next_notebook_in_pipeline("7-three-and-four-digit-ICD")
 
 
-# **THIS vvvvvvvv NOT RUN**
-
 # ## Data without NHS-D
 # 
-# One of the industry partners requested a clean dataset - merged - without the NHS-D data included as they do not have a current license. Below is the code run - 26th March 2024 - to produce this. 
-
-# In[ ]:
-
-
-from datetime import datetime
-from tretools.datasets.processed_dataset import ProcessedDataset
-from tretools.datasets.dataset_enums.dataset_types import DatasetType
-from tretools.codelists.codelist_types import CodelistType
-import pathlib
-
-
-# In[ ]:
-
-
-INPUT_PATH = "processed_datasets"
-OUTPUT_PATH = "merged_datasets"
-AnyPath(OUTPUT_PATH).mkdir(parents=True, exist_ok=True)
-
-
-# ### ICD10 Datasets
-
-# In[ ]:
-
-
-barts_icd = ProcessedDataset(path=f"{INPUT_PATH}/barts_health/megadata/merged_ICD.arrow", 
-                             dataset_type="MEGA", 
-                             coding_system=CodelistType.ICD10.value,
-                             log_path=f"{INPUT_PATH}/barts_health/megadata/merged_ICD_log.txt")
-
-
-# In[ ]:
-
-
-bradford_icd = ProcessedDataset(path=f"{INPUT_PATH}/bradford/megadata/icd.arrow", 
-                             dataset_type="MEGA", 
-                             coding_system=CodelistType.ICD10.value,
-                             log_path=f"{INPUT_PATH}/bradford/megadata/icd_log.txt")
-
-
-# In[ ]:
-
-
-barts_icd.merge_with_dataset(bradford_icd)
-
-
-# In[ ]:
-
-
-dedup = barts_icd.deduplicate()
-
-
-# In[ ]:
-
-
-for log in bradford_icd.log:
-    dedup.log.append(log)
-    
-dedup.log.sort()
-
-
-# In[ ]:
-
-
-dedup.write_to_feather(f"{OUTPUT_PATH}/icd_only_no_nhs_d.arrow")
-dedup.write_to_log(f"{OUTPUT_PATH}/icd_only_no_nhs_d_log.txt")
-
-
-# In[ ]:
-
-
-dedup.write_to_csv(f"{OUTPUT_PATH}/icd_only_no_nhs_d.csv")
-
-
-# ### Merging without NHS-D data
-
-# SNOMED mapped to ICD and merged with ICD10
-
-# In[ ]:
-
-
-snomed_mapped = ProcessedDataset(path=f"{INPUT_PATH}/primary_care/megadata/final_mapped_data.arrow", 
-                             dataset_type="MEGA", 
-                             coding_system=CodelistType.ICD10.value,
-                             log_path=f"{INPUT_PATH}/primary_care/megadata/final_mapped_log.txt")
-
-
-# In[ ]:
-
-
-snomed_mapped.merge_with_dataset(bradford_icd)
-
+# One of the industry partners requested a clean dataset - merged - without the NHS-D data included as they do not have a current license (first produced 26th March 2024).  Both datasets are views of the event store without its `source=nhs_digital` partitions (and, as then, `icd_with_mapped_snomed_no_nhs_d` only has the SNOMED codes of primary care mapped to ICD-10, with the ICD-10 codes of Barts and Bradford), so they are only written out when an export is requested, with the pseudo NHS numbers restored.
+# 
+# **Run the next cells only when an export is requested**
 
 # In[ ]:
 
 
-snomed_mapped.merge_with_dataset(barts_icd)
-
-
-# In[ ]:
-
+OUTPUT_LOCATION = f"{ROOT_LOCATION}/{VERSION}/merged_datasets"
+AnyPath(OUTPUT_LOCATION).mkdir(parents=True, exist_ok=True)
 
-dedup = snomed_mapped.deduplicate()
+person_dictionary = read_person_dictionary(f"{ROOT_LOCATION}/{VERSION}/processed_datasets/demographics/clean_demographics.arrow")
 
 
 # In[ ]:
 
 
-for log in bradford_icd.log:
-    dedup.log.append(log)
-
-for log in barts_icd.log:
-    dedup.log.append(log)    
-    
-dedup.log.sort()
-
-
-# In[ ]:
-
+# as first produced: Arrow files, and icd_only_no_nhs_d also as CSV
+for name in ("icd_only_no_nhs_d", "icd_with_mapped_snomed_no_nhs_d"):
+    (
+        scan_product(EVENT_STORE_LOCATION, name)
+        .pipe(decode, person_dictionary)
+        .sink_ipc(f"{OUTPUT_LOCATION}/{name}.arrow")
+    )
+    AnyPath(OUTPUT_LOCATION, f"{name}_log.txt").write_text("\n".join(product_log(EVENT_STORE_LOCATION, name)) + "\n")
 
-dedup.write_to_feather(f"{OUTPUT_PATH}/icd_with_mapped_snomed_no_nhs_d.arrow")
-dedup.write_to_log(f"{OUTPUT_PATH}/icd_with_mapped_snomed_no_nhs_d_log.txt")
+pl.scan_ipc(f"{OUTPUT_LOCATION}/icd_only_no_nhs_d.arrow").sink_csv(f"{OUTPUT_LOCATION}/icd_only_no_nhs_d.csv")
 
@@ -97,9 +97,23 @@ ROOT_LOCATION = "/home/ivm/BI_PY"
 # In[ ]:
 
 
+import sys
+sys.path.append(f"{ROOT_LOCATION}/{VERSION}/Code")
+
+from bi_py.event_store import scan_product
+from bi_py.icd10 import clean_icd10, generate_icd10_codes
+from bi_py.person import decode, read_person_dictionary
+from bi_py.profiling import profile
+from bi_py.tre_logging import TRETools  # the polars .TRE namespace, see bi_py/tre_logging.py
+
+
+# In[ ]:
+
+
 PROCESSED_DATASETS_LOCATION = f"{ROOT_LOCATION}/{VERSION}/processed_datasets"
 PREPROCESSED_FILES_LOCATION = f"{ROOT_LOCATION}/{VERSION}/preprocessed_files"
 MEGADATA_LOCATION = f"{ROOT_LOCATION}/{VERSION}/megadata"
+EVENT_STORE_LOCATION = f"{MEGADATA_LOCATION}/event_store"
 
 
 # In[ ]:
@@ -139,68 +153,6 @@ AnyPath(OUTPUTS_REGENIE_FILES_LOCATION).mkdir(parents=True, exist_ok=True)
 AnyPath(OUTPUTS_REGENIE_FILES_TEMP_LOCATION).mkdir(parents=True, exist_ok=True)
 
 
-# In[ ]:
-
-
-# polars namespace additions
-
-# In subsequent version this code may be integrated with the establisted TRE Tools package
-
-@pl.api.register_lazyframe_namespace("TRE")
-class TRETools:
-    def __init__(self, lzdf: pl.LazyFrame) -> None:
-        self._lzdf = lzdf
-        
-    def unique_with_logging(self, *args, label: str = "Unique", **kwargs) -> pl.LazyFrame:
-        before = self._lzdf.select(pl.first()).collect().height
-        filtered_lzdf = self._lzdf.unique(*args, **kwargs)
-        after = filtered_lzdf.select(pl.first()).collect().height
-        
-        if before > 0:
-            change = ((after - before) / before) * 100
-            change_str = f" ({'+' if change > 0 else ''}{change:.1f}%)"
-        
-        unchanged = " (row count unchanged)" if after == before else ""
-        
-        print(f"[{label}: on {args}] Before unique: {before} rows, After unique: {after} rows{unchanged}{change_str}")
-        return filtered_lzdf    
-    
-    def filter_with_logging(self, *args, label: str = "Filter", **kwargs) -> pl.LazyFrame:
-        before = self._lzdf.select(pl.first()).collect().height
-        filtered_lzdf = self._lzdf.filter(*args, **kwargs)
-        after = filtered_lzdf.select(pl.first()).collect().height
-        
-        if before > 0:
-            change = ((after - before) / before) * 100
-            change_str = f" ({'+' if change > 0 else ''}{change:.1f}%)"
-        
-        unchanged = " (row count unchanged)" if after == before else ""
-        print(f"[{label}] Before filter: {before} rows, After filter: {after} rows{unchanged}{change_str}")
-        return filtered_lzdf
-    
-    def join_with_logging(
-        self,
-        other: pl.LazyFrame,
-        *args,
-        how: str = "inner",
-        label: str = "Join",
-        **kwargs
-    ) -> pl.LazyFrame:
-        left_before = self._lzdf.select(pl.first()).collect().height
-        right_before = other.select(pl.first()).collect().height
-        joined_lzdf = self._lzdf.join(other, *args, how=how, **kwargs)
-        after = joined_lzdf.select(pl.first()).collect().height
-        
-        if left_before > 0:
-            change = ((after - left_before) / left_before) * 100
-            change_str = f" ({'+' if change > 0 else ''}{change:.1f}%)" if abs(change) > 1.00 else f" ({after - left_before} rows {' removed' if change < 0 else ' added'})"
-        
-        unchanged = " (row count unchanged)" if after == left_before else ""
-        print(f"[{label}] Join type: {how.upper()}")
-        print(f"[{label}] Left: {left_before} rows, Right: {right_before} rows -> After: {after} rows{unchanged}{change_str}")
-        return joined_lzdf
-
-
 # ### Load the ICD10 Data
 # 
 # Here we are loading the ICD10 data that has already been processed. The data has untruncated raw ICD codes that are from the data or mapped from SNOMED. 
@@ -208,10 +160,8 @@ class TRETools:
 # In[ ]:
 
 
-mapped_data = ProcessedDataset(path=f"{MEGADATA_LOCATION}/icd_and_mapped_snomed.arrow", 
-                               dataset_type="MERGED", 
-                               coding_system=CodelistType.ICD10.value, 
-                               log_path=f"{MEGADATA_LOCATION}/icd_and_mapped_snomed_log.txt")
+# a lazy view of the event store written by NB#6 (see bi_py/event_store.py)
+mapped_data = scan_product(EVENT_STORE_LOCATION, "icd_and_mapped_snomed")
 
 
 # ### `clean_icd10()` can be `.pipe`d into a polars LazyFrame to clean the ICD-10 codes column
@@ -236,81 +186,7 @@ mapped_data = ProcessedDataset(path=f"{MEGADATA_LOCATION}/icd_and_mapped_snomed.
 # 
 # We have some codes appended with "D" which seems to be invalid (alhtough appears in Google searches).  We could (and indeed should) simply remove terminal B-Z characters and if terminal character is A **delete the row** as this represents an "Excluded diagnosis".
 # 
-# 
-
-# In[ ]:
-
-
-def clean_icd10(lf: pl.LazyFrame, icd10_column: str = "code") -> pl.LazyFrame:
-    """
-    Cleans an ICD-10 column by:
-    - Removing all spaces
-    - Excluding icd10 = "NA" rows
-    - Excluding icd10 code <3 char length (minimum valid icd10 is 3 chars)
-    - Excluding icd10 codes not starting with a letter
-    - Excluding icd10 ending with an "A" rows; "A" suffixes represent "Excluded diagnosis"
-    - Removing B-Z characters at end of icd10 code
-    - Removing "X" and "." and "-"
-    - Formatting to "XXX.X" if dots=True
-    - Keeping up to 4 meaningful characters
-        
-    Args:
-        lzdf (pl.LazyFrame): The input LazyFrame containing the ICD-10 column to clean
-        icd10_column (str): Name of the column containing ICD-10 codes
-        [not longer has arguments dots as outputs a pl.LazyFrame with both dotted and undotted 4 digit ICD10]
-        
-    Returns:
-        pl.LazyFrame: the modified LazyFrame with cleaned ICD-10 codes
-    """
-    return (
-        lf
-        .with_columns(
-            pl.col(icd10_column)
-            .str.replace_all(" ","")
-        )
-        .filter( # eliminiate rows with inappropriate codes
-            pl.col(icd10_column).ne("NA"),
-            pl.col(icd10_column).ne("-1"),
-            pl.col(icd10_column).str.len_chars() >= 3,
-            pl.col(icd10_column).str.contains("^[A-Z]"),
-            ~pl.col(icd10_column).str.contains("A$"),
-        )
-        .with_columns( # create icd_10_new (invalid character processed code)
-            pl.col(icd10_column)
-            .str.replace(r"[B-Z]$", "")
-            .str.replace_all(r"[\.-]","")  # Remove any `.` and `-`
-            .str.replace(r"^(.+)X(.*)","$1$2") # Remove `X` somewhere other than in the first position
-            .alias(f"{icd10_column}_new")
-        )
-        .with_columns( # create 3-digit version of icd10_new
-            pl.col(f"{icd10_column}_new")
-            .str.slice(0,3)
-            .alias(f"{icd10_column}_new_3d")
-        )
-        .with_columns( # create both dotted and undotted version of icd10_new
-            pl.when(pl.col(f"{icd10_column}_new").str.slice(3, 1).ne("")) #  4 or more characters
-            .then(
-                pl.concat_str(
-                    pl.col(f"{icd10_column}_new").str.slice(0, 3),
-                    pl.lit("."),
-                    pl.col(f"{icd10_column}_new").str.slice(3, 1)
-                ).alias(f"{icd10_column}_new_4d")
-            ),
-            pl.when(pl.col(f"{icd10_column}_new").str.slice(3, 1).ne("")) #  4 or more characters
-            .then(
-                pl.col(f"{icd10_column}_new").str.slice(0, 4),
-            ).alias(f"{icd10_column}_new_4d_undotted")
-#             .fill_null(pl.col(f"{icd10_column}_new"))  # Ensure 3-char codes remain unchanged
-# #             .alias(icd10_column)
-#             .alias("cleaned_code")
-        )
-        
-        
-#         .pipe(lambda lzdf: print(lzdf.collect().height) or lzdf)  # before unique() 7581082 rows
-        .unique()
-#         .pipe(lambda lzdf: print(lzdf.collect().height) or lzdf)  # after unique() 7385200 rows
-    )
-
+# `clean_icd10()` is in `bi_py/icd10.py`, so that the benchmark on synthetic data (`bi_py/benchmark.py`) runs it too.
 
 # # Generate individual_trait_files and regenie files
 
@@ -321,6 +197,7 @@ def clean_icd10(lf: pl.LazyFrame, icd10_column: str = "code") -> pl.LazyFrame:
 
 demographic_file_path = f"{PROCESSED_DATASETS_LOCATION}/demographics/clean_demographics.arrow"
 demographics = DemographicDataset(path=demographic_file_path)
+person_dictionary = read_person_dictionary(demographic_file_path)
 
 
 # In[ ]:
@@ -339,6 +216,8 @@ def _calculate_demographics_standalone(lf: pl.LazyFrame, demographics: Demograph
                 on="nhs_number", 
                 how="inner"
             )
+            # the events are keyed on person ids (see bi_py/person.py); the outputs on pseudo NHS numbers
+            .pipe(decode, person_dictionary)
             .with_columns(
                 ((pl.col("date") - pl.col("dob")).dt.total_days() / 365.25)
                 .round(1)
@@ -370,36 +249,51 @@ def _calculate_demographics_standalone(lf: pl.LazyFrame, demographics: Demograph
 # ### Creating the codelists
 # 
 # We want to get every variation of A01 to Q99.9. This includes all 3 digit possibilities (such as A01, A02, B21 etc), and all 4 digit variations (such as A01.0, A01.1, A01.2).
+# 
+# `generate_icd10_codes()` is in `bi_py/icd10.py`.
 
 # In[ ]:
 
 
-from itertools import product
-
-def generate_icd10_codes(icd_length: int, with_dot=True) -> dict:
-    # Avoids the need for nested loops
-    
-    if icd_length == 3:
-        # 17 letter x 99 numbers (01-99) = 1683 codes
-        letters = [chr(c) for c in range(ord("A"), ord("Q") + 1)]
-        numbers = [f"{i:02d}" for i in range(1, 100)]
-
-        return [f"{l}{n}" for l, n in product(letters, numbers)]
-    elif icd_length == 4:
-        # 17 letter x 99 numbers (01-99) x 10 sub-digits (0-9) = 16830 codes
-        letters = [chr(c) for c in range(ord("A"), ord("Q") + 1)]
-        numbers = [f"{i:02d}" for i in range(1, 100)]
-        decimals = [*[f".{i}" for i in range(10)]] if with_dot else [""]
-        
-        return [f"{l}{n}{d}" for l, n, d in product(letters, numbers, decimals)]
+def generate_combo_icd10(icd_length: int) -> pl.LazyFrame:
+    if icd_length == 4:
+        code_column = "code_new_4d"
+    elif icd_length == 3:
+        code_column = "code_new_3d"
     else:
         raise ValueError(f"generate_combo_icd10: `icd_length` of {icd_length} not recognised.  Try 3 or 4.")
-
-
-# In[ ]:
-
-
-get_ipython().run_cell_magic('time', '', 'def generate_combo_icd10(icd_length: int) -> pl.LazyFrame:\n    if icd_length == 4:\n        code_column = "code_new_4d"\n    elif icd_length == 3:\n        code_column = "code_new_3d"\n    else:\n        raise ValueError(f"generate_combo_icd10: `icd_length` of {icd_length} not recognised.  Try 3 or 4.")\n    return (\n        mapped_data.data\n        .lazy()\n        .pipe(clean_icd10)\n        .join(\n            pl.LazyFrame({"code": generate_icd10_codes(icd_length=icd_length)}),\n            left_on=code_column,\n            right_on="code",\n            how="semi"\n        )\n        .group_by(\n            pl.col("nhs_number"),\n            pl.col(code_column).alias("code")\n        )\n        .agg(\n            pl.col("date").min()\n        )\n        .pipe(_calculate_demographics_standalone, demographics=demographics)\n        .with_columns(\n            pl.lit("merged").alias("dataset_type"),\n            pl.lit("ICD10").alias("codelist_type"),\n        )\n        .select(\n            pl.col("nhs_number"),\n            pl.col("date"),\n            pl.col("code"),\n            pl.col("age_at_event"),\n            pl.col("dataset_type"),\n            pl.col("codelist_type"),\n            pl.col("gender"),\n            pl.col("age_range"),\n        )\n    )\n')
+    return (
+        mapped_data
+        .pipe(clean_icd10)
+        .join(
+            pl.LazyFrame({"code": generate_icd10_codes(icd_length=icd_length)}),
+            left_on=code_column,
+            right_on="code",
+            how="semi"
+        )
+        .group_by(
+            pl.col("nhs_number"),
+            pl.col(code_column).alias("code")
+        )
+        .agg(
+            pl.col("date").min()
+        )
+        .pipe(_calculate_demographics_standalone, demographics=demographics)
+        .with_columns(
+            pl.lit("merged").alias("dataset_type"),
+            pl.lit("ICD10").alias("codelist_type"),
+        )
+        .select(
+            pl.col("nhs_number"),
+            pl.col("date"),
+            pl.col("code"),
+            pl.col("age_at_event"),
+            pl.col("dataset_type"),
+            pl.col("codelist_type"),
+            pl.col("gender"),
+            pl.col("age_range"),
+        )
+    )
 
 
 # ### Create per ICD-10 3 digit lists of individuals
@@ -413,7 +307,12 @@ combo_icd10_3d = generate_combo_icd10(icd_length=3)
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', 'phenotypes_3d_dict = (\n    combo_icd10_3d\n    .collect()\n    .partition_by("code", as_dict=True)\n)\n')
+with profile("NB7: partition the 3-digit traits"):
+    phenotypes_3d_dict = (
+        combo_icd10_3d
+        .collect()
+        .partition_by("code", as_dict=True)
+    )
 
 
 # ### Write individual_trait_files (ICD10 3-digit)
@@ -421,7 +320,20 @@ get_ipython().run_cell_magic('time', '', 'phenotypes_3d_dict = (\n    combo_icd1
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', '# sorted for clarity, not efficiency\nfor i, ((phenotype, ), df) in enumerate(sorted(phenotypes_3d_dict.items())):\n    print(f"{i+1}. {phenotype}", end=", ")\n    (\n        df\n        .lazy()\n        .sink_csv(\n            AnyPath(\n                OUTPUTS_3D_ICD_INDIVIDUAL_TRAIT_FILES_LOCATION,\n                f"{yr}_{mon}_{phenotype}_summary_report.csv"\n            ),\n        )\n    )\n        \n')
+with profile("NB7: write the 3-digit individual trait files"):
+    # sorted for clarity, not efficiency
+    for i, ((phenotype, ), df) in enumerate(sorted(phenotypes_3d_dict.items())):
+        print(f"{i+1}. {phenotype}", end=", ")
+        (
+            df
+            .lazy()
+            .sink_csv(
+                AnyPath(
+                    OUTPUTS_3D_ICD_INDIVIDUAL_TRAIT_FILES_LOCATION,
+                    f"{yr}_{mon}_{phenotype}_summary_report.csv"
+                ),
+            )
+        )
 
 
 # ### Create per ICD-10 4 digit lists of individuals
@@ -435,7 +347,12 @@ combo_icd10_4d = generate_combo_icd10(icd_length=4)
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', 'phenotypes_4d_dict = (\n    combo_icd10_4d\n    .collect()\n    .partition_by("code", as_dict=True)\n)\n')
+with profile("NB7: partition the 4-digit traits"):
+    phenotypes_4d_dict = (
+        combo_icd10_4d
+        .collect()
+        .partition_by("code", as_dict=True)
+    )
 
 
 # ### Write individual_trait_files (ICD10 4-digit)
@@ -443,7 +360,20 @@ get_ipython().run_cell_magic('time', '', 'phenotypes_4d_dict = (\n    combo_icd1
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', '# sorted for clarity, not efficiency\nfor i, ((phenotype, ), df) in enumerate(sorted(phenotypes_4d_dict.items())):\n    print(f"{i+1}. {phenotype}", end=", ")\n    (\n        df\n        .lazy()\n        .sink_csv(\n            AnyPath(\n                OUTPUTS_4D_ICD_INDIVIDUAL_TRAIT_FILES_LOCATION,\n                f"{yr}_{mon}_{phenotype}_summary_report.csv"\n            ),\n        )\n    )\n        \n')
+with profile("NB7: write the 4-digit individual trait files"):
+    # sorted for clarity, not efficiency
+    for i, ((phenotype, ), df) in enumerate(sorted(phenotypes_4d_dict.items())):
+        print(f"{i+1}. {phenotype}", end=", ")
+        (
+            df
+            .lazy()
+            .sink_csv(
+                AnyPath(
+                    OUTPUTS_4D_ICD_INDIVIDUAL_TRAIT_FILES_LOCATION,
+                    f"{yr}_{mon}_{phenotype}_summary_report.csv"
+                ),
+            )
+        )
 
 
 # # Now create regenie files
@@ -546,7 +476,41 @@ valid_regenie_51k = (
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', '\n## NB following join of combo_icd10_3d w/ valid_regenie_51k we lose 5 traits\n## Lost traits are \'A35\', \'A65\', \'F59\', \'H45\', \'J62\'\ncombo_icd10_3d_trait_51k_dict = (\n    combo_icd10_3d\n    .TRE\n    .join_with_logging(\n        valid_regenie_51k.select(\n            pl.col("pseudo_nhs_number"),\n            pl.col("gsa_id"),\n        ),\n        left_on="nhs_number",\n        right_on="pseudo_nhs_number",\n        how="inner",\n        label="restrict to pseudo_NHS_numbers with GWAS"\n    )\n    .with_columns(\n        pl.lit("1").alias("FID")\n    )\n    .select(\n        pl.col("FID"),\n        pl.col("gsa_id").alias("IID"),\n        pl.col("code"),\n        pl.col("age_at_event").round(1).alias("AgeAtFirstDiagnosis"),\n        pl.col("age_at_event").pow(2).round(1).alias("AgeAtFirstDiagnosis_Squared"),\n    )\n    .sort(by="IID")\n    .set_sorted("IID")\n    .collect()\n    .partition_by(\n        "code",\n        as_dict=True,\n        \n    )\n)\n')
+with profile("NB7: join the 3-digit traits to the 51k GWAS"):
+    ## NB following join of combo_icd10_3d w/ valid_regenie_51k we lose 5 traits
+    ## Lost traits are 'A35', 'A65', 'F59', 'H45', 'J62'
+    combo_icd10_3d_trait_51k_dict = (
+        combo_icd10_3d
+        .TRE
+        .join_with_logging(
+            valid_regenie_51k.select(
+                pl.col("pseudo_nhs_number"),
+                pl.col("gsa_id"),
+            ),
+            left_on="nhs_number",
+            right_on="pseudo_nhs_number",
+            how="inner",
+            label="restrict to pseudo_NHS_numbers with GWAS"
+        )
+        .with_columns(
+            pl.lit("1").alias("FID")
+        )
+        .select(
+            pl.col("FID"),
+            pl.col("gsa_id").alias("IID"),
+            pl.col("code"),
+            pl.col("age_at_event").round(1).alias("AgeAtFirstDiagnosis"),
+            pl.col("age_at_event").pow(2).round(1).alias("AgeAtFirstDiagnosis_Squared"),
+        )
+        .sort(by="IID")
+        .set_sorted("IID")
+        .collect()
+        .partition_by(
+            "code",
+            as_dict=True,
+
+        )
+    )
 
 
 # ## Process `combo_icd10_3d_51k_trait_dict` in batches
@@ -559,7 +523,41 @@ get_ipython().run_cell_magic('time', '', '\n## NB following join of combo_icd10_
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', 'batch_size = 48  # anything above ~90 causes a "deeper than 512 elements" warning; loose testing suggests 48 best\n\n# Split the dictionary items into batches\nnum_batches = (len(combo_icd10_3d_trait_51k_dict) + batch_size - 1) // batch_size  # Ceiling division\n\nfor batch_idx in range(num_batches):\n    # Get the current batch of items\n    batch_start = batch_idx * batch_size\n    batch_end = min((batch_idx + 1) * batch_size, len(combo_icd10_3d_trait_51k_dict))\n    current_batch = dict(itertools.islice(sorted(combo_icd10_3d_trait_51k_dict.items()), batch_start, batch_end))\n\n    # Process the current batch\n    pl.concat(\n        [\n            df\n            .lazy()\n            .with_columns(\n                pl.lit(1).alias(trait).cast(pl.Enum(["0", "1"]))\n            )\n            .select(\n                pl.col("FID"),\n                pl.col("IID"),\n                pl.col(trait)\n            )\n        for (trait, ), df in current_batch.items()\n        ],\n    how="align").sink_parquet(\n        AnyPath(\n            OUTPUTS_REGENIE_FILES_TEMP_LOCATION,\n            f"{yr}_{mon}_icd10_3d_regenie_51koct2024_65A_Topmed_batch{batch_idx+1}.parquet"\n        ),\n    )\n    \n    print(f"Processed batch {batch_idx+1}/{num_batches} ({len(current_batch)} items; Start: {batch_start}, End: {batch_end-1})")\n')
+with profile("NB7: write the 51k 3-digit regenie batches"):
+    batch_size = 48  # anything above ~90 causes a "deeper than 512 elements" warning; loose testing suggests 48 best
+
+    # Split the dictionary items into batches
+    num_batches = (len(combo_icd10_3d_trait_51k_dict) + batch_size - 1) // batch_size  # Ceiling division
+
+    for batch_idx in range(num_batches):
+        # Get the current batch of items
+        batch_start = batch_idx * batch_size
+        batch_end = min((batch_idx + 1) * batch_size, len(combo_icd10_3d_trait_51k_dict))
+        current_batch = dict(itertools.islice(sorted(combo_icd10_3d_trait_51k_dict.items()), batch_start, batch_end))
+
+        # Process the current batch
+        pl.concat(
+            [
+                df
+                .lazy()
+                .with_columns(
+                    pl.lit(1).alias(trait).cast(pl.Enum(["0", "1"]))
+                )
+                .select(
+                    pl.col("FID"),
+                    pl.col("IID"),
+                    pl.col(trait)
+                )
+            for (trait, ), df in current_batch.items()
+            ],
+        how="align").sink_parquet(
+            AnyPath(
+                OUTPUTS_REGENIE_FILES_TEMP_LOCATION,
+                f"{yr}_{mon}_icd10_3d_regenie_51koct2024_65A_Topmed_batch{batch_idx+1}.parquet"
+            ),
+        )
+
+        print(f"Processed batch {batch_idx+1}/{num_batches} ({len(current_batch)} items; Start: {batch_start}, End: {batch_end-1})")
 
 
 # In[ ]:
@@ -659,7 +657,41 @@ chart_51k
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', '\n## NB following join of combo_icd10_3d w/ valid_regenie_55k we lose no traits\n## Lost traits are: N/A\ncombo_icd10_3d_trait_55k_dict = (\n    combo_icd10_3d\n    .TRE\n    .join_with_logging(\n        valid_regenie_55k.select(\n            pl.col("pseudo_nhs_number"),\n            pl.col("exome_id"),\n        ),\n        left_on="nhs_number",\n        right_on="pseudo_nhs_number",\n        how="inner",\n        label="restrict to pseudo_NHS_numbers with ExWAS"\n    )\n    .with_columns(\n        pl.lit("1").alias("FID")\n    )\n    .select(\n        pl.col("FID"),\n        pl.col("exome_id").alias("IID"),\n        pl.col("code"),\n        pl.col("age_at_event").round(1).alias("AgeAtFirstDiagnosis"),\n        pl.col("age_at_event").pow(2).round(1).alias("AgeAtFirstDiagnosis_Squared"),\n    )    \n    .sort(by="IID")\n    .set_sorted("IID")\n    .collect()\n    .partition_by(\n        "code",\n        as_dict=True,\n        \n    )\n)\n')
+with profile("NB7: join the 3-digit traits to the 55k ExWAS"):
+    ## NB following join of combo_icd10_3d w/ valid_regenie_55k we lose no traits
+    ## Lost traits are: N/A
+    combo_icd10_3d_trait_55k_dict = (
+        combo_icd10_3d
+        .TRE
+        .join_with_logging(
+            valid_regenie_55k.select(
+                pl.col("pseudo_nhs_number"),
+                pl.col("exome_id"),
+            ),
+            left_on="nhs_number",
+            right_on="pseudo_nhs_number",
+            how="inner",
+            label="restrict to pseudo_NHS_numbers with ExWAS"
+        )
+        .with_columns(
+            pl.lit("1").alias("FID")
+        )
+        .select(
+            pl.col("FID"),
+            pl.col("exome_id").alias("IID"),
+            pl.col("code"),
+            pl.col("age_at_event").round(1).alias("AgeAtFirstDiagnosis"),
+            pl.col("age_at_event").pow(2).round(1).alias("AgeAtFirstDiagnosis_Squared"),
+        )    
+        .sort(by="IID")
+        .set_sorted("IID")
+        .collect()
+        .partition_by(
+            "code",
+            as_dict=True,
+
+        )
+    )
 
 
 # ## Process `combo_icd10_3d_55k_trait_dict` in batches
@@ -672,7 +704,41 @@ get_ipython().run_cell_magic('time', '', '\n## NB following join of combo_icd10_
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', 'batch_size = 48  # anything above ~90 causes a "deeper than 512 elements" warning\n\n# Split the dictionary items into batches\nnum_batches = (len(combo_icd10_3d_trait_55k_dict) + batch_size - 1) // batch_size  # Ceiling division\n\nfor batch_idx in range(num_batches):\n    # Get the current batch of items\n    batch_start = batch_idx * batch_size\n    batch_end = min((batch_idx + 1) * batch_size, len(combo_icd10_3d_trait_55k_dict))\n    current_batch = dict(itertools.islice(sorted(combo_icd10_3d_trait_55k_dict.items()), batch_start, batch_end))\n\n    # Process the current batch\n    pl.concat(\n        [\n            df\n            .lazy()\n            .with_columns(\n                pl.lit(1).alias(trait).cast(pl.Enum(["0", "1"]))\n            )\n            .select(\n                pl.col("FID"),\n                pl.col("IID"),\n                pl.col(trait)\n            )\n        for (trait, ), df in current_batch.items()\n        ],\n    how="align").sink_parquet(\n        AnyPath(\n            OUTPUTS_REGENIE_FILES_TEMP_LOCATION,\n            f"{yr}_{mon}_icd10_3d_regenie_55k_BroadExomeIDs_batch{batch_idx+1}.parquet"\n        ),\n    )\n    \n    print(f"Processed batch {batch_idx+1}/{num_batches} ({len(current_batch)} items; Start: {batch_start}, End: {batch_end-1})")\n')
+with profile("NB7: write the 55k 3-digit regenie batches"):
+    batch_size = 48  # anything above ~90 causes a "deeper than 512 elements" warning
+
+    # Split the dictionary items into batches
+    num_batches = (len(combo_icd10_3d_trait_55k_dict) + batch_size - 1) // batch_size  # Ceiling division
+
+    for batch_idx in range(num_batches):
+        # Get the current batch of items
+        batch_start = batch_idx * batch_size
+        batch_end = min((batch_idx + 1) * batch_size, len(combo_icd10_3d_trait_55k_dict))
+        current_batch = dict(itertools.islice(sorted(combo_icd10_3d_trait_55k_dict.items()), batch_start, batch_end))
+
+        # Process the current batch
+        pl.concat(
+            [
+                df
+                .lazy()
+                .with_columns(
+                    pl.lit(1).alias(trait).cast(pl.Enum(["0", "1"]))
+                )
+                .select(
+                    pl.col("FID"),
+                    pl.col("IID"),
+                    pl.col(trait)
+                )
+            for (trait, ), df in current_batch.items()
+            ],
+        how="align").sink_parquet(
+            AnyPath(
+                OUTPUTS_REGENIE_FILES_TEMP_LOCATION,
+                f"{yr}_{mon}_icd10_3d_regenie_55k_BroadExomeIDs_batch{batch_idx+1}.parquet"
+            ),
+        )
+
+        print(f"Processed batch {batch_idx+1}/{num_batches} ({len(current_batch)} items; Start: {batch_start}, End: {batch_end-1})")
 
 
 # In[ ]:
@@ -836,7 +902,41 @@ chart_51k_and_55k
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', 'batch_size = 16  # anything above ~90 causes a "deeper than 512 elements" warning\n\n# Split the dictionary items into batches\nnum_batches = (len(combo_icd10_3d_trait_51k_dict) + batch_size - 1) // batch_size  # Ceiling division\n\nfor batch_idx in range(num_batches):\n   # Get the current batch of items\n   batch_start = batch_idx * batch_size\n   batch_end = min((batch_idx + 1) * batch_size, len(combo_icd10_3d_trait_51k_dict))\n   current_batch = dict(itertools.islice(sorted(combo_icd10_3d_trait_51k_dict.items()), batch_start, batch_end))\n\n   # Process the current batch\n   (\n       pl.concat([\n           df\n           .lazy()\n           .group_by(["FID", "IID"])\n           .agg(\n               pl.col("AgeAtFirstDiagnosis").min().round(1).alias(f"AgeAtFirstDiagnosis.{phenotype}"),\n               pl.col("AgeAtFirstDiagnosis_Squared").min().round(1).alias(f"AgeAtFirstDiagnosis_Squared.{phenotype}"),\n           )\n\n           for (phenotype, ), df in sorted(current_batch.items())\n       ],\n       how="align")\n       .sink_parquet(\n           AnyPath(\n               OUTPUTS_REGENIE_FILES_TEMP_LOCATION, \n               f"{yr}_{mon}_regenie_51koct2024_65A_Topmed_Binary_3-digit_ICD-10_age_at_test_megawide_batch{batch_idx+1}.parquet"\n           ),\n       )\n   )\n   \n   print(f"Processed batch {batch_idx+1}/{num_batches} ({len(current_batch)} items; Start: {batch_start}, End: {batch_end-1})")\n      \n')
+with profile("NB7: write the 51k 3-digit covariate batches"):
+    batch_size = 16  # anything above ~90 causes a "deeper than 512 elements" warning
+
+    # Split the dictionary items into batches
+    num_batches = (len(combo_icd10_3d_trait_51k_dict) + batch_size - 1) // batch_size  # Ceiling division
+
+    for batch_idx in range(num_batches):
+        # Get the current batch of items
+        batch_start = batch_idx * batch_size
+        batch_end = min((batch_idx + 1) * batch_size, len(combo_icd10_3d_trait_51k_dict))
+        current_batch = dict(itertools.islice(sorted(combo_icd10_3d_trait_51k_dict.items()), batch_start, batch_end))
+
+        # Process the current batch
+        (
+            pl.concat([
+                df
+                .lazy()
+                .group_by(["FID", "IID"])
+                .agg(
+                    pl.col("AgeAtFirstDiagnosis").min().round(1).alias(f"AgeAtFirstDiagnosis.{phenotype}"),
+                    pl.col("AgeAtFirstDiagnosis_Squared").min().round(1).alias(f"AgeAtFirstDiagnosis_Squared.{phenotype}"),
+                )
+
+                for (phenotype, ), df in sorted(current_batch.items())
+            ],
+            how="align")
+            .sink_parquet(
+                AnyPath(
+                    OUTPUTS_REGENIE_FILES_TEMP_LOCATION, 
+                    f"{yr}_{mon}_regenie_51koct2024_65A_Topmed_Binary_3-digit_ICD-10_age_at_test_megawide_batch{batch_idx+1}.parquet"
+                ),
+            )
+        )
+
+        print(f"Processed batch {batch_idx+1}/{num_batches} ({len(current_batch)} items; Start: {batch_start}, End: {batch_end-1})")
 
 
 # In[ ]:
@@ -961,7 +1061,41 @@ concatenated_4d_51k_covariate_parquets.collect().write_parquet(
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', 'batch_size = 16  # anything above ~90 causes a "deeper than 512 elements" warning\n\n# Split the dictionary items into batches\nnum_batches = (len(combo_icd10_3d_trait_55k_dict) + batch_size - 1) // batch_size  # Ceiling division\n\nfor batch_idx in range(num_batches):\n   # Get the current batch of items\n   batch_start = batch_idx * batch_size\n   batch_end = min((batch_idx + 1) * batch_size, len(combo_icd10_3d_trait_55k_dict))\n   current_batch = dict(itertools.islice(sorted(combo_icd10_3d_trait_55k_dict.items()), batch_start, batch_end))\n\n   # Process the current batch\n   (\n       pl.concat([\n           df\n           .lazy()\n           .group_by(["FID", "IID"])\n           .agg(\n               pl.col("AgeAtFirstDiagnosis").min().round(1).alias(f"AgeAtFirstDiagnosis.{phenotype}"),\n               pl.col("AgeAtFirstDiagnosis_Squared").min().round(1).alias(f"AgeAtFirstDiagnosis_Squared.{phenotype}"),\n           )\n\n           for (phenotype, ), df in sorted(current_batch.items())\n       ],\n       how="align")\n       .sink_parquet(\n           AnyPath(\n               OUTPUTS_REGENIE_FILES_TEMP_LOCATION, \n               f"{yr}_{mon}_regenie_55k_BroadExomeIDs_Binary_3-digit_ICD-10_age_at_test_megawide_batch{batch_idx+1}.parquet"\n           ),\n       )\n   )\n   \n   print(f"Processed batch {batch_idx+1}/{num_batches} ({len(current_batch)} items; Start: {batch_start}, End: {batch_end-1})")\n      \n')
+with profile("NB7: write the 55k 3-digit covariate batches"):
+    batch_size = 16  # anything above ~90 causes a "deeper than 512 elements" warning
+
+    # Split the dictionary items into batches
+    num_batches = (len(combo_icd10_3d_trait_55k_dict) + batch_size - 1) // batch_size  # Ceiling division
+
+    for batch_idx in range(num_batches):
+        # Get the current batch of items
+        batch_start = batch_idx * batch_size
+        batch_end = min((batch_idx + 1) * batch_size, len(combo_icd10_3d_trait_55k_dict))
+        current_batch = dict(itertools.islice(sorted(combo_icd10_3d_trait_55k_dict.items()), batch_start, batch_end))
+
+        # Process the current batch
+        (
+            pl.concat([
+                df
+                .lazy()
+                .group_by(["FID", "IID"])
+                .agg(
+                    pl.col("AgeAtFirstDiagnosis").min().round(1).alias(f"AgeAtFirstDiagnosis.{phenotype}"),
+                    pl.col("AgeAtFirstDiagnosis_Squared").min().round(1).alias(f"AgeAtFirstDiagnosis_Squared.{phenotype}"),
+                )
+
+                for (phenotype, ), df in sorted(current_batch.items())
+            ],
+            how="align")
+            .sink_parquet(
+                AnyPath(
+                    OUTPUTS_REGENIE_FILES_TEMP_LOCATION, 
+                    f"{yr}_{mon}_regenie_55k_BroadExomeIDs_Binary_3-digit_ICD-10_age_at_test_megawide_batch{batch_idx+1}.parquet"
+                ),
+            )
+        )
+
+        print(f"Processed batch {batch_idx+1}/{num_batches} ({len(current_batch)} items; Start: {batch_start}, End: {batch_end-1})")
 
 
 # In[ ]:
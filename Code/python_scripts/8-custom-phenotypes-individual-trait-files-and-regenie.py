@@ -70,74 +70,25 @@ def redirect_to_next_notebook_in_pipeline(other_notebook):
     display(Javascript(js_code))
 
 
-# In[ ]:
-
+# **Paths to files**
 
-# polars namespace additions
+# In[ ]:
 
-# In subsequent version this code may be integrated with the establisted TRE Tools package
-
-@pl.api.register_lazyframe_namespace("TRE")
-class TRETools:
-    def __init__(self, lzdf: pl.LazyFrame) -> None:
-        self._lzdf = lzdf
-        
-    def unique_with_logging(self, *args, label: str = "Unique", **kwargs) -> pl.LazyFrame:
-        before = self._lzdf.select(pl.first()).collect().height
-        filtered_lzdf = self._lzdf.unique(*args, **kwargs)
-        after = filtered_lzdf.select(pl.first()).collect().height
-        
-        if before > 0:
-            change = ((after - before) / before) * 100
-            change_str = f" ({'+' if change > 0 else ''}{change:.1f}%)"
-        
-        unchanged = " (row count unchanged)" if after == before else ""
-        
-        print(f"[{label}: on {args}] Before unique: {before} rows, After unique: {after} rows{unchanged}{change_str}")
-        return filtered_lzdf    
-    
-    def filter_with_logging(self, *args, label: str = "Filter", **kwargs) -> pl.LazyFrame:
-        before = self._lzdf.select(pl.first()).collect().height
-        filtered_lzdf = self._lzdf.filter(*args, **kwargs)
-        after = filtered_lzdf.select(pl.first()).collect().height
-        
-        if before > 0:
-            change = ((after - before) / before) * 100
-            change_str = f" ({'+' if change > 0 else ''}{change:.1f}%)"
-        
-        unchanged = " (row count unchanged)" if after == before else ""
-        print(f"[{label}] Before filter: {before} rows, After filter: {after} rows{unchanged}{change_str}")
-        return filtered_lzdf
-    
-    def join_with_logging(
-        self,
-        other: pl.LazyFrame,
-        *args,
-        how: str = "inner",
-        label: str = "Join",
-        **kwargs
-    ) -> pl.LazyFrame:
-        left_before = self._lzdf.select(pl.first()).collect().height
-        right_before = other.select(pl.first()).collect().height
-        joined_lzdf = self._lzdf.join(other, *args, how=how, **kwargs)
-        after = joined_lzdf.select(pl.first()).collect().height
-        
-        if left_before > 0:
-            change = ((after - left_before) / left_before) * 100
-            change_str = f" ({'+' if change > 0 else ''}{change:.1f}%)" if abs(change) > 1.00 else f" ({after - left_before} rows {' removed' if change < 0 else ' added'})"
-        
-        unchanged = " (row count unchanged)" if after == left_before else ""
-        print(f"[{label}] Join type: {how.upper()}")
-        print(f"[{label}] Left: {left_before} rows, Right: {right_before} rows -> After: {after} rows{unchanged}{change_str}")
-        return joined_lzdf
 
+ROOT_LOCATION = "/home/ivm/BI_PY"
 
-# **Paths to files**
 
 # In[ ]:
 
 
-ROOT_LOCATION = "/home/ivm/BI_PY"
+import sys
+sys.path.append(f"{ROOT_LOCATION}/{VERSION}/Code")
+
+from bi_py.event_store import scan_product
+from bi_py.person import decode, read_person_dictionary
+from bi_py.profiling import profile
+from bi_py.snomed import snomed_codes
+from bi_py.tre_logging import TRETools  # the polars .TRE namespace, see bi_py/tre_logging.py
 
 
 # #### Data in
@@ -147,6 +98,7 @@ ROOT_LOCATION = "/home/ivm/BI_PY"
 
 INPUTS_LOCATION = f"{ROOT_LOCATION}/{VERSION}/inputs"
 MEGADATA_LOCATION = f"{ROOT_LOCATION}/{VERSION}/megadata"
+EVENT_STORE_LOCATION = f"{MEGADATA_LOCATION}/event_store"
 
 
 # In[ ]:
@@ -230,6 +182,33 @@ custom_phenotype_mapping = (
 )
 
 
+# In[ ]:
+
+
+# the SNOMED codes of the codelists as the canonical SNOMED code type (UInt64, see bi_py/snomed.py),
+# so that snomed_only.arrow is joined without casting its codes to text
+custom_phenotype_mapping_snomed = snomed_codes(
+    custom_phenotype_mapping.filter(pl.col("coding_system").eq("SNOMED_ConceptID")),
+    strict=False,
+)
+
+
+# In[ ]:
+
+
+# the codes of each coding system, with which the scans of the megadata skip the row groups
+# (of the event store, see bi_py/event_store.py) without any of them
+codelist_codes = (
+    custom_phenotype_mapping
+    .group_by(pl.col("coding_system").cast(pl.Utf8))
+    .agg(pl.col("code").unique())
+    .collect()
+)
+codelist_codes = dict(zip(codelist_codes["coding_system"], codelist_codes["code"]))
+# as joined, i.e. stripped and as UInt64
+codelist_codes["SNOMED_ConceptID"] = custom_phenotype_mapping_snomed.select(pl.col("code").unique()).collect()["code"]
+
+
 # **Note added by SB 2024-03-26**
 # 
 # There appears to be a problem with the ICD codelist for phenotype `MGH_MajorAdverseVascularLimbEvent`. It has unfeasible codes in it: `0Y6N0Z5` and others. For now, I have manually removed this (sic) lines from the codelist. 
@@ -267,6 +246,7 @@ demographic_file_path = f"{ROOT_LOCATION}/{VERSION}/processed_datasets/demograph
 
 
 demographics = DemographicDataset(path=demographic_file_path)
+person_dictionary = read_person_dictionary(demographic_file_path)
 
 
 # In[ ]:
@@ -285,6 +265,8 @@ def _calculate_demographics_standalone(lf: pl.LazyFrame, demographics: Demograph
                 on="nhs_number", 
                 how="inner"
             )
+            # the events are keyed on person ids (see bi_py/person.py); the outputs on pseudo NHS numbers
+            .pipe(decode, person_dictionary)
             .with_columns(
                 ((pl.col("date") - pl.col("dob")).dt.total_days() / 365.25)
                 .round(1)
@@ -337,33 +319,45 @@ custom_mapped_combo = (
 #                 )
 #             ),
             (
-                pl.scan_ipc(
-                    f"{MEGADATA_LOCATION}/icd_only.arrow",
-                )
+                scan_product(EVENT_STORE_LOCATION, "icd_only", codes=codelist_codes["ICD10"])
                 .with_columns(
                     pl.lit("ICD10")
                     .cast(coding_system_enum)
                     .alias("coding_system")
                 )
+                .join(
+                    custom_phenotype_mapping,
+                    on=["code", "coding_system"],
+                    how="inner",
+                )
             ),
             (
-                pl.scan_ipc(
-                    f"{MEGADATA_LOCATION}/opcs_only.arrow",
-                )
+                scan_product(EVENT_STORE_LOCATION, "opcs_only", codes=codelist_codes["OPCS4"])
                 .with_columns(
                     pl.lit("OPCS4")
                     .cast(coding_system_enum)
                     .alias("coding_system")
                 )
+                .join(
+                    custom_phenotype_mapping,
+                    on=["code", "coding_system"],
+                    how="inner",
+                )
             ),
             (
-                pl.scan_ipc(
-                    f"{MEGADATA_LOCATION}/snomed_only.arrow",
-                )
+                scan_product(EVENT_STORE_LOCATION, "snomed_only", codes=codelist_codes["SNOMED_ConceptID"])
                 .with_columns(
                     pl.lit("SNOMED_ConceptID")
                     .cast(coding_system_enum)
                     .alias("coding_system"),
+                )
+                # joined on the UInt64 codes, only the matched codes are then cast to text
+                .join(
+                    custom_phenotype_mapping_snomed,
+                    on=["code", "coding_system"],
+                    how="inner",
+                )
+                .with_columns(
                     pl.col("code").cast(pl.Utf8)
                 )
             )
@@ -372,11 +366,6 @@ custom_mapped_combo = (
 #     .with_columns(
 #         pl.len().over(["nhs_number", "code", "date"]).alias("dup_count")
 #     )
-    .join(
-        custom_phenotype_mapping,
-        on=["code", "coding_system"],
-        how="inner",
-    )
     .group_by(["nhs_number", "phenotype"])
     .agg(
         pl.col("date").min(),
@@ -412,7 +401,16 @@ custom_mapped_combo = (
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', '## Partition by custom_phenotype\ncustom_mapped_combo_phenotype_dict = (\n    custom_mapped_combo\n    .collect()\n    .partition_by(\n        "phenotype",\n        as_dict=True\n    )\n)\n')
+with profile("NB8: partition the custom phenotypes"):
+    ## Partition by custom_phenotype
+    custom_mapped_combo_phenotype_dict = (
+        custom_mapped_combo
+        .collect()
+        .partition_by(
+            "phenotype",
+            as_dict=True
+        )
+    )
 
 
 # ## Write individual custom phenotype (aka trait) files
@@ -420,7 +418,20 @@ get_ipython().run_cell_magic('time', '', '## Partition by custom_phenotype\ncust
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', '# sorted for clarity, not efficiency\nfor i, ((phenotype, ), df) in enumerate(sorted(custom_mapped_combo_phenotype_dict.items())):\n    print(f"{i+1}. {phenotype}", end=", ")\n    (\n        df\n        .lazy()\n        .sink_csv(\n            AnyPath(\n                OUTPUTS_INDIVIDUAL_TRAIT_FILES_LOCATION,\n                f"{yr}_{mon}_{phenotype}_summary_report.csv"\n            ),\n        )\n    )\n        \n')
+with profile("NB8: write the custom phenotype trait files"):
+    # sorted for clarity, not efficiency
+    for i, ((phenotype, ), df) in enumerate(sorted(custom_mapped_combo_phenotype_dict.items())):
+        print(f"{i+1}. {phenotype}", end=", ")
+        (
+            df
+            .lazy()
+            .sink_csv(
+                AnyPath(
+                    OUTPUTS_INDIVIDUAL_TRAIT_FILES_LOCATION,
+                    f"{yr}_{mon}_{phenotype}_summary_report.csv"
+                ),
+            )
+        )
 
 
 # ## Create phenotype reports
@@ -559,13 +570,113 @@ valid_regenie_55k = (
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', 'combo_custom_phenotypes_55k_dict = (\n    custom_mapped_combo\n    .TRE\n    .join_with_logging(\n        valid_regenie_55k.select(\n            pl.col("pseudo_nhs_number"),\n            pl.col("IID"),\n        ),\n        left_on="nhs_number",\n        right_on="pseudo_nhs_number",\n        how="inner",\n        label="restrict to pseudo_NHS_numbers with ExWAS"\n    )\n    .with_columns(\n        pl.lit("1").alias("FID")\n    )\n    .select( ## We use the AgeAtFirstDiagnosis columns for covariate file generation later in pipeline\n        pl.col("FID"),\n        pl.col("IID"),\n        pl.col("phenotype"),\n        pl.col("age_at_event").round(1).alias("AgeAtFirstDiagnosis"),\n        pl.col("age_at_event").pow(2).round(1).alias("AgeAtFirstDiagnosis_Squared"),\n    )\n    .sort(by="IID")\n    .set_sorted("IID")\n    .collect()\n    .partition_by(\n        "phenotype",\n        as_dict=True,\n        \n    )\n)\n')
+with profile("NB8: join the custom phenotypes to the 55k ExWAS"):
+    combo_custom_phenotypes_55k_dict = (
+        custom_mapped_combo
+        .TRE
+        .join_with_logging(
+            valid_regenie_55k.select(
+                pl.col("pseudo_nhs_number"),
+                pl.col("IID"),
+            ),
+            left_on="nhs_number",
+            right_on="pseudo_nhs_number",
+            how="inner",
+            label="restrict to pseudo_NHS_numbers with ExWAS"
+        )
+        .with_columns(
+            pl.lit("1").alias("FID")
+        )
+        .select( ## We use the AgeAtFirstDiagnosis columns for covariate file generation later in pipeline
+            pl.col("FID"),
+            pl.col("IID"),
+            pl.col("phenotype"),
+            pl.col("age_at_event").round(1).alias("AgeAtFirstDiagnosis"),
+            pl.col("age_at_event").pow(2).round(1).alias("AgeAtFirstDiagnosis_Squared"),
+        )
+        .sort(by="IID")
+        .set_sorted("IID")
+        .collect()
+        .partition_by(
+            "phenotype",
+            as_dict=True,
+
+        )
+    )
 
 
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', '# [UPDATE: Fixed in Polars 1.26]. We have identifed possible bug with .sink_csv where header line separator is not changed to specified separator\n# i.e. header remains comma-separated while non-header rows are tab-delimited\n# We have found that if we use .write_csv instead, we work around this issue  \n# until we update polars for permanent fix.\n\n(\n    pl.concat(\n        [\n            valid_regenie_55k\n            .with_columns(\n                pl.lit("1")\n                .alias("FID")\n            )\n            .select(\n                pl.col("FID"),\n                pl.col("IID")\n            ),\n            *[\n                valid_regenie_55k\n                .select(\n                    pl.col("IID")\n                )\n                .join(\n                    lf\n                    .lazy(), \n                    on="IID", \n                    how="left"\n                )\n                .with_columns(\n                     pl.col("phenotype")\n                    .is_not_null()\n                    .cast(pl.Int8)\n                    .cast(pl.Utf8)\n                    .alias(phenotype)\n                )\n                .select(\n                    pl.col("IID"),\n                    pl.col(phenotype)\n                )\n\n                for (phenotype, ), lf in sorted(combo_custom_phenotypes_55k_dict.items())\n            ]\n        ],\n    how="align"\n    )\n    .with_columns(\n        pl.sum_horizontal(\n            pl.all()\n            .exclude(["FID", "IID"])\n            .cast(pl.Int8, strict=False)\n        )\n        .alias("indv_pheno_count")\n    )\n    .filter(pl.col("indv_pheno_count")>0)\n    .select(\n        pl.exclude("indv_pheno_count")\n    )\n    .sort("IID")\n    .collect()  # see note above\n    .write_csv(  # see note above\n        AnyPath(\n            OUTPUTS_REGENIE_FILES_LOCATION,\n            f"{yr}_{mon}_custom_phenotypes_regenie_55k_BroadExomeIDs.tsv"\n        ),\n        separator="\\t",\n        null_value="0"\n    )\n)\n')
+with profile("NB8: write the 55k custom phenotypes regenie file"):
+    # [UPDATE: Fixed in Polars 1.26]. We have identifed possible bug with .sink_csv where header line separator is not changed to specified separator
+    # i.e. header remains comma-separated while non-header rows are tab-delimited
+    # We have found that if we use .write_csv instead, we work around this issue  
+    # until we update polars for permanent fix.
+
+    (
+        pl.concat(
+            [
+                valid_regenie_55k
+                .with_columns(
+                    pl.lit("1")
+                    .alias("FID")
+                )
+                .select(
+                    pl.col("FID"),
+                    pl.col("IID")
+                ),
+                *[
+                    valid_regenie_55k
+                    .select(
+                        pl.col("IID")
+                    )
+                    .join(
+                        lf
+                        .lazy(), 
+                        on="IID", 
+                        how="left"
+                    )
+                    .with_columns(
+                         pl.col("phenotype")
+                        .is_not_null()
+                        .cast(pl.Int8)
+                        .cast(pl.Utf8)
+                        .alias(phenotype)
+                    )
+                    .select(
+                        pl.col("IID"),
+                        pl.col(phenotype)
+                    )
+
+                    for (phenotype, ), lf in sorted(combo_custom_phenotypes_55k_dict.items())
+                ]
+            ],
+        how="align"
+        )
+        .with_columns(
+            pl.sum_horizontal(
+                pl.all()
+                .exclude(["FID", "IID"])
+                .cast(pl.Int8, strict=False)
+            )
+            .alias("indv_pheno_count")
+        )
+        .filter(pl.col("indv_pheno_count")>0)
+        .select(
+            pl.exclude("indv_pheno_count")
+        )
+        .sort("IID")
+        .collect()  # see note above
+        .write_csv(  # see note above
+            AnyPath(
+                OUTPUTS_REGENIE_FILES_LOCATION,
+                f"{yr}_{mon}_custom_phenotypes_regenie_55k_BroadExomeIDs.tsv"
+            ),
+            separator="\t",
+            null_value="0"
+        )
+    )
 
 
 # ## Generate 51k GWAS - regenie input file (i.e. not covariate file)
@@ -619,13 +730,113 @@ valid_regenie_51k = (
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', 'combo_custom_phenotypes_51k_dict = (\n    custom_mapped_combo\n    .TRE\n    .join_with_logging(\n        valid_regenie_51k.select(\n            pl.col("pseudo_nhs_number"),\n            pl.col("IID"),\n        ),\n        left_on="nhs_number",\n        right_on="pseudo_nhs_number",\n        how="inner",\n        label="restrict to pseudo_NHS_numbers with GWAS"\n    )\n    .with_columns(\n        pl.lit("1").alias("FID")\n    )\n    .select(\n        pl.col("FID"),\n        pl.col("IID"),\n        pl.col("phenotype"),\n        pl.col("age_at_event").round(1).alias("AgeAtFirstDiagnosis"),\n        pl.col("age_at_event").pow(2).round(1).alias("AgeAtFirstDiagnosis_Squared"),\n    )\n    .sort(by="IID")\n    .set_sorted("IID")\n    .collect()\n    .partition_by(\n        "phenotype",\n        as_dict=True,\n        \n    )\n)\n')
+with profile("NB8: join the custom phenotypes to the 51k GWAS"):
+    combo_custom_phenotypes_51k_dict = (
+        custom_mapped_combo
+        .TRE
+        .join_with_logging(
+            valid_regenie_51k.select(
+                pl.col("pseudo_nhs_number"),
+                pl.col("IID"),
+            ),
+            left_on="nhs_number",
+            right_on="pseudo_nhs_number",
+            how="inner",
+            label="restrict to pseudo_NHS_numbers with GWAS"
+        )
+        .with_columns(
+            pl.lit("1").alias("FID")
+        )
+        .select(
+            pl.col("FID"),
+            pl.col("IID"),
+            pl.col("phenotype"),
+            pl.col("age_at_event").round(1).alias("AgeAtFirstDiagnosis"),
+            pl.col("age_at_event").pow(2).round(1).alias("AgeAtFirstDiagnosis_Squared"),
+        )
+        .sort(by="IID")
+        .set_sorted("IID")
+        .collect()
+        .partition_by(
+            "phenotype",
+            as_dict=True,
+
+        )
+    )
 
 
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', '# [UPDATE: Fixed in Polars 1.26]. We have identifed possible bug with .sink_csv where header line separator is not changed to specified separator\n# i.e. header remains comma-separated while non-header rows are tab-delimited\n# We have found that if we use .write_csv instead, we work around this issue  \n# until we update polars for permanent fix.\n\n(\n    pl.concat(\n        [\n            valid_regenie_51k\n            .with_columns(\n                pl.lit("1")\n                .alias("FID")\n            )\n            .select(\n                pl.col("FID"),\n                pl.col("IID")\n            ),\n            *[\n                valid_regenie_51k\n                .select(\n                    pl.col("IID")\n                )\n                .join(\n                    lf\n                    .lazy(), \n                    on="IID", \n                    how="left"\n                )\n                .with_columns(\n                     pl.col("phenotype")\n                    .is_not_null()\n                    .cast(pl.Int8)\n                    .cast(pl.Utf8)\n                    .alias(phenotype)\n                )\n                .select(\n                    pl.col("IID"),\n                    pl.col(phenotype)\n                )\n\n                for (phenotype, ), lf in sorted(combo_custom_phenotypes_51k_dict.items())\n            ]\n        ],\n    how="align"\n    )\n    .with_columns(\n        pl.sum_horizontal(\n            pl.all()\n            .exclude(["FID", "IID"])\n            .cast(pl.Int8, strict=False)\n        )\n        .alias("indv_pheno_count")\n    )\n    .filter(pl.col("indv_pheno_count")>0)\n    .select(\n        pl.exclude("indv_pheno_count")\n    )\n    .sort("IID")\n    .collect()  # see note above\n    .write_csv(  # see note above\n        AnyPath(\n            OUTPUTS_REGENIE_FILES_LOCATION,\n            f"{yr}_{mon}_custom_phenotypes_regenie_51koct2024_65A_Topmed.tsv"\n        ),\n        separator="\\t",\n        null_value="0"\n    )\n)\n')
+with profile("NB8: write the 51k custom phenotypes regenie file"):
+    # [UPDATE: Fixed in Polars 1.26]. We have identifed possible bug with .sink_csv where header line separator is not changed to specified separator
+    # i.e. header remains comma-separated while non-header rows are tab-delimited
+    # We have found that if we use .write_csv instead, we work around this issue  
+    # until we update polars for permanent fix.
+
+    (
+        pl.concat(
+            [
+                valid_regenie_51k
+                .with_columns(
+                    pl.lit("1")
+                    .alias("FID")
+                )
+                .select(
+                    pl.col("FID"),
+                    pl.col("IID")
+                ),
+                *[
+                    valid_regenie_51k
+                    .select(
+                        pl.col("IID")
+                    )
+                    .join(
+                        lf
+                        .lazy(), 
+                        on="IID", 
+                        how="left"
+                    )
+                    .with_columns(
+                         pl.col("phenotype")
+                        .is_not_null()
+                        .cast(pl.Int8)
+                        .cast(pl.Utf8)
+                        .alias(phenotype)
+                    )
+                    .select(
+                        pl.col("IID"),
+                        pl.col(phenotype)
+                    )
+
+                    for (phenotype, ), lf in sorted(combo_custom_phenotypes_51k_dict.items())
+                ]
+            ],
+        how="align"
+        )
+        .with_columns(
+            pl.sum_horizontal(
+                pl.all()
+                .exclude(["FID", "IID"])
+                .cast(pl.Int8, strict=False)
+            )
+            .alias("indv_pheno_count")
+        )
+        .filter(pl.col("indv_pheno_count")>0)
+        .select(
+            pl.exclude("indv_pheno_count")
+        )
+        .sort("IID")
+        .collect()  # see note above
+        .write_csv(  # see note above
+            AnyPath(
+                OUTPUTS_REGENIE_FILES_LOCATION,
+                f"{yr}_{mon}_custom_phenotypes_regenie_51koct2024_65A_Topmed.tsv"
+            ),
+            separator="\t",
+            null_value="0"
+        )
+    )
 
 
 # ## Now generate covariate files (AgeAtFirstDiagnosis)
@@ -635,7 +846,72 @@ get_ipython().run_cell_magic('time', '', '# [UPDATE: Fixed in Polars 1.26]. We h
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', '# [UPDATE: Fixed in Polars 1.26]. We have identifed possible bug with .sink_csv where header line separator is not changed to specified separator\n# i.e. header remains comma-separated while non-header rows are tab-delimited\n# We have found that if we use .write_csv instead, we work around this issue  \n# until we update polars for permanent fix.\n\n# temp_cov_55k = (\n(\n    pl.concat(\n        [\n            valid_regenie_55k\n            .with_columns(\n                pl.lit("1")\n                .alias("FID")\n            )\n            .select(\n                pl.col("FID"),\n                pl.col("IID")\n            ),\n            *[\n                valid_regenie_55k\n                .select(\n                    pl.col("IID"),\n                )\n                .join(\n                    lf\n                    .lazy()\n                    .select(\n                        pl.col("IID"),\n                        pl.col("AgeAtFirstDiagnosis").alias(f"AgeAtFirstDiagnosis.{phenotype}"),\n                        pl.col("AgeAtFirstDiagnosis_Squared").alias(f"AgeAtFirstDiagnosis_Squared.{phenotype}")\n                    ), \n                    on="IID", \n                    how="left"\n                )\n\n                for (phenotype, ), lf in sorted(combo_custom_phenotypes_55k_dict.items())\n            ],\n        ],\n    how="align"\n    )\n    .with_columns(\n            (\n                pl.sum_horizontal(\n                    pl.all()\n                    .exclude(["FID", "IID"])\n                    .is_not_null()\n                )\n                .cast(pl.Boolean)\n                .alias("indv_has_ge_1_phenotypes")\n            )\n    )\n    .sort("IID")\n    .filter(\n        pl.col("indv_has_ge_1_phenotypes")\n    )\n    .collect()  # see note above\n    .write_csv(  # see note above\n        AnyPath(\n            OUTPUTS_REGENIE_FILES_LOCATION,\n            f"{yr}_{mon}_regenie_55k_BroadExomeIDs_Binary_custom_phenotypes_age_at_first_diagnosis_megawide.tsv"\n        ),\n        separator="\\t",\n        null_value="0"\n    )\n)\n')
+with profile("NB8: write the 55k covariate file"):
+    # [UPDATE: Fixed in Polars 1.26]. We have identifed possible bug with .sink_csv where header line separator is not changed to specified separator
+    # i.e. header remains comma-separated while non-header rows are tab-delimited
+    # We have found that if we use .write_csv instead, we work around this issue  
+    # until we update polars for permanent fix.
+
+    # temp_cov_55k = (
+    (
+        pl.concat(
+            [
+                valid_regenie_55k
+                .with_columns(
+                    pl.lit("1")
+                    .alias("FID")
+                )
+                .select(
+                    pl.col("FID"),
+                    pl.col("IID")
+                ),
+                *[
+                    valid_regenie_55k
+                    .select(
+                        pl.col("IID"),
+                    )
+                    .join(
+                        lf
+                        .lazy()
+                        .select(
+                            pl.col("IID"),
+                            pl.col("AgeAtFirstDiagnosis").alias(f"AgeAtFirstDiagnosis.{phenotype}"),
+                            pl.col("AgeAtFirstDiagnosis_Squared").alias(f"AgeAtFirstDiagnosis_Squared.{phenotype}")
+                        ), 
+                        on="IID", 
+                        how="left"
+                    )
+
+                    for (phenotype, ), lf in sorted(combo_custom_phenotypes_55k_dict.items())
+                ],
+            ],
+        how="align"
+        )
+        .with_columns(
+                (
+                    pl.sum_horizontal(
+                        pl.all()
+                        .exclude(["FID", "IID"])
+                        .is_not_null()
+                    )
+                    .cast(pl.Boolean)
+                    .alias("indv_has_ge_1_phenotypes")
+                )
+        )
+        .sort("IID")
+        .filter(
+            pl.col("indv_has_ge_1_phenotypes")
+        )
+        .collect()  # see note above
+        .write_csv(  # see note above
+            AnyPath(
+                OUTPUTS_REGENIE_FILES_LOCATION,
+                f"{yr}_{mon}_regenie_55k_BroadExomeIDs_Binary_custom_phenotypes_age_at_first_diagnosis_megawide.tsv"
+            ),
+            separator="\t",
+            null_value="0"
+        )
+    )
 
 
 # ## 51k GWAS covariate file
@@ -643,7 +919,72 @@ get_ipython().run_cell_magic('time', '', '# [UPDATE: Fixed in Polars 1.26]. We h
 # In[ ]:
 
 
-get_ipython().run_cell_magic('time', '', '# [UPDATE: Fixed in Polars 1.26]. We have identifed possible bug with .sink_csv where header line separator is not changed to specified separator\n# i.e. header remains comma-separated while non-header rows are tab-delimited\n# We have found that if we use .write_csv instead, we work around this issue  \n# until we update polars for permanent fix.\n\n# temp_cov_51k = (\n(\n    pl.concat(\n        [\n            valid_regenie_51k\n            .with_columns(\n                pl.lit("1")\n                .alias("FID")\n            )\n            .select(\n                pl.col("FID"),\n                pl.col("IID")\n            ),\n            *[\n                valid_regenie_51k\n                .select(\n                    pl.col("IID"),\n                )\n                .join(\n                    lf\n                    .lazy()\n                    .select(\n                        pl.col("IID"),\n                        pl.col("AgeAtFirstDiagnosis").alias(f"AgeAtFirstDiagnosis.{phenotype}"),\n                        pl.col("AgeAtFirstDiagnosis_Squared").alias(f"AgeAtFirstDiagnosis_Squared.{phenotype}")\n                    ), \n                    on="IID", \n                    how="left"\n                )\n\n                for (phenotype, ), lf in sorted(combo_custom_phenotypes_51k_dict.items())\n            ],\n        ],\n    how="align"\n    )\n    .with_columns(\n            (\n                pl.sum_horizontal(\n                    pl.all()\n                    .exclude(["FID", "IID"])\n                    .is_not_null()\n                )\n                .cast(pl.Boolean)\n                .alias("indv_has_ge_1_phenotypes")\n            )\n    )\n    .sort("IID")\n    .filter(\n        pl.col("indv_has_ge_1_phenotypes")\n    )\n    .collect()  # see note above\n    .write_csv(  # see note above\n        AnyPath(\n            OUTPUTS_REGENIE_FILES_LOCATION,\n            f"{yr}_{mon}_regenie_51koct2024_65A_Topmed_Binary_custom_phenotypes_age_at_first_diagnosis_megawide.tsv"\n        ),\n        separator="\\t",\n        null_value="0"\n    )\n)\n')
+with profile("NB8: write the 51k covariate file"):
+    # [UPDATE: Fixed in Polars 1.26]. We have identifed possible bug with .sink_csv where header line separator is not changed to specified separator
+    # i.e. header remains comma-separated while non-header rows are tab-delimited
+    # We have found that if we use .write_csv instead, we work around this issue  
+    # until we update polars for permanent fix.
+
+    # temp_cov_51k = (
+    (
+        pl.concat(
+            [
+                valid_regenie_51k
+                .with_columns(
+                    pl.lit("1")
+                    .alias("FID")
+                )
+                .select(
+                    pl.col("FID"),
+                    pl.col("IID")
+                ),
+                *[
+                    valid_regenie_51k
+                    .select(
+                        pl.col("IID"),
+                    )
+                    .join(
+                        lf
+                        .lazy()
+                        .select(
+                            pl.col("IID"),
+                            pl.col("AgeAtFirstDiagnosis").alias(f"AgeAtFirstDiagnosis.{phenotype}"),
+                            pl.col("AgeAtFirstDiagnosis_Squared").alias(f"AgeAtFirstDiagnosis_Squared.{phenotype}")
+                        ), 
+                        on="IID", 
+                        how="left"
+                    )
+
+                    for (phenotype, ), lf in sorted(combo_custom_phenotypes_51k_dict.items())
+                ],
+            ],
+        how="align"
+        )
+        .with_columns(
+                (
+                    pl.sum_horizontal(
+                        pl.all()
+                        .exclude(["FID", "IID"])
+                        .is_not_null()
+                    )
+                    .cast(pl.Boolean)
+                    .alias("indv_has_ge_1_phenotypes")
+                )
+        )
+        .sort("IID")
+        .filter(
+            pl.col("indv_has_ge_1_phenotypes")
+        )
+        .collect()  # see note above
+        .write_csv(  # see note above
+            AnyPath(
+                OUTPUTS_REGENIE_FILES_LOCATION,
+                f"{yr}_{mon}_regenie_51koct2024_65A_Topmed_Binary_custom_phenotypes_age_at_first_diagnosis_megawide.tsv"
+            ),
+            separator="\t",
+            null_value="0"
+        )
+    )
 
 
 # In[ ]:
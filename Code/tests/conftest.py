@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the tests import bi_py from the Code directory, as the notebooks do
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
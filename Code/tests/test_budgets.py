@@ -0,0 +1,51 @@
+import uuid
+from pathlib import Path
+
+import polars as pl
+
+from bi_py import budgets, run_log
+from bi_py.pipeline import Stage, run_pipeline
+from bi_py.profiling import scan_metrics, write_metrics
+
+
+def _run(runs_location: Path, name: str, started: str, merge_peak_mb: float, status: str = "ok", top: bool = True) -> None:
+    # a benchmark run with one merge, as bi_py.run_log records them
+    location = runs_location / name / "run_log.jsonl"
+    location.parent.mkdir(parents=True)
+    top_id = uuid.uuid4().hex
+    events = [{"stage": "merge_files", "parent_id": top_id, "status": "ok", "peak_rss_mb": merge_peak_mb, "details": {}}]
+    if top:
+        events.append({"stage": "benchmark", "parent_id": None, "event_id": top_id, "status": status, "peak_rss_mb": merge_peak_mb, "details": {"scale": "1x", "fraction": 0.01}})
+    for event in events:
+        run_log.write_event(
+            {"event_id": uuid.uuid4().hex, "started": started, "duration_s": 1.0, "cpu_s": 1.0, "polars_threads": 1, "inputs": [], "outputs": [], "pid": 1, **event},
+            str(location),
+        )
+    write_metrics(str(location))
+
+
+def test_only_the_runs_which_completed_are_a_baseline(tmp_path):
+    _run(tmp_path, "a", "2025-01-01T00:00:00", 100)
+    _run(tmp_path, "b", "2025-01-02T00:00:00", 1000, status="error")
+    _run(tmp_path, "c", "2025-01-03T00:00:00", 1000, top=False)  # killed before its top stage ended
+    _run(tmp_path, "d", "2025-01-04T00:00:00", 200)
+
+    scales = budgets.run_scales(scan_metrics(str(tmp_path))).sort("run")
+    assert scales["scale"].to_list() == ["1x_0.01", "1x_0.01", "release", "1x_0.01"]  # c never recorded its scale
+    assert scales["completed"].to_list() == [True, False, False, True]
+
+    report = budgets.check_run(str(tmp_path / "d")).filter(pl.col("stage") == "merge_files").row(0, named=True)
+    assert (report["history_runs"], report["baseline_peak_rss_mb"]) == (1, 100)
+    assert report["flags"] == "memory regression"
+    assert (tmp_path / "d" / budgets.REPORT_FILE).exists()
+
+
+def test_a_pipeline_with_a_failed_notebook_did_not_complete(tmp_path, monkeypatch):
+    run_location = tmp_path / "runs" / "run"
+    monkeypatch.setenv(run_log.RUN_LOG_ENV, str(run_location / "run_log.jsonl"))
+
+    status = run_pipeline({"NB1": Stage("missing"), "NB2": Stage("missing", depends_on=("NB1",))}, run_location, notebooks_location=tmp_path, max_workers=1)
+    write_metrics(str(run_location / "run_log.jsonl"))
+
+    assert status == {"NB1": "failed", "NB2": "skipped"}
+    assert budgets.run_scales(scan_metrics(str(tmp_path / "runs")))["completed"].to_list() == [False]
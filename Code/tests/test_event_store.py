@@ -0,0 +1,42 @@
+from datetime import date
+
+import polars as pl
+
+from bi_py.event_store import benchmark_formats, scan_product, write_partition
+
+
+def test_no_nhs_d_product_only_maps_primary_care(tmp_path):
+    store_location = str(tmp_path / "event_store")
+    for coding_system, source, code in [
+        ("ICD10", "barts_health", "I10"),
+        ("ICD10", "bradford", "E11"),
+        ("ICD10", "nhs_digital", "J45"),
+        ("ICD10_MAPPED", "primary_care", "K21"),
+        ("ICD10_MAPPED", "barts_health", "L40"),
+        ("ICD10_MAPPED", "nhs_digital", "M54"),
+    ]:
+        data = pl.DataFrame({"nhs_number": [1], "code": [code], "date": [date(2020, 1, 1)]})
+        write_partition(data, store_location, coding_system, source)
+
+    products = {name: sorted(scan_product(store_location, name).collect()["code"]) for name in
+                ("icd_with_mapped_snomed_no_nhs_d", "icd_only_no_nhs_d", "icd_and_mapped_snomed")}
+    assert products == {
+        "icd_with_mapped_snomed_no_nhs_d": ["E11", "I10", "K21"],
+        "icd_only_no_nhs_d": ["E11", "I10"],
+        "icd_and_mapped_snomed": ["E11", "I10", "J45", "K21", "L40", "M54"],
+    }
+
+
+def test_benchmark_formats_reads_the_same_events_from_both(tmp_path):
+    megadata_location = tmp_path / "merged_ICD.arrow"
+    pl.DataFrame({
+        "nhs_number": [1, 1, 2, 3],
+        "code": ["I10", "E11", "I10", "J45"],
+        "date": [date(2020, 1, 1), date(2021, 1, 1), date(2022, 1, 1), date(2023, 1, 1)],
+    }).write_ipc(megadata_location)
+    write_partition(pl.scan_ipc(megadata_location), str(tmp_path / "event_store"), "ICD10", "barts_health")
+
+    report = benchmark_formats(str(tmp_path / "event_store"), "ICD10", "barts_health", str(megadata_location), ["I10", "X99"], repeat=1)
+
+    rows = {(row["format"], row["query"]): row["rows"] for row in report.iter_rows(named=True)}
+    assert rows == {("arrow", "full scan"): 4, ("arrow", "codes"): 2, ("parquet", "full scan"): 4, ("parquet", "codes"): 2}
@@ -0,0 +1,65 @@
+from datetime import date, datetime
+
+import polars as pl
+import pytest
+
+from bi_py.excel import convert_xlsx, read_xlsx
+
+openpyxl = pytest.importorskip("openpyxl")
+
+
+def _workbook(location, rows):
+    workbook = openpyxl.Workbook()
+    for row in rows:
+        workbook.active.append(row)
+    workbook.save(location)
+    return str(location)
+
+
+ROWS = [
+    ["pseudonhs", "icd10_code", "admission_date", "episode_count"],
+    ["A", "I10", datetime(2020, 1, 2), 1],
+    ["B", 1234.0, datetime(2021, 3, 4, 10, 30), 2],
+    ["C", None, None, None],
+    [None, None, None, None],  # a formatted but empty row
+]
+
+
+def test_the_columns_are_text_unless_typed_by_the_schema(tmp_path):
+    xlsx_location = _workbook(tmp_path / "bradford.xlsx", ROWS)
+
+    data = read_xlsx(xlsx_location, schema={"admission_date": pl.Date, "episode_count": pl.Int64})
+
+    assert dict(data.schema) == {"pseudonhs": pl.Utf8, "icd10_code": pl.Utf8, "admission_date": pl.Date, "episode_count": pl.Int64}
+    assert data.rows() == [
+        ("A", "I10", date(2020, 1, 2), 1),
+        ("B", "1234", date(2021, 3, 4), 2),  # a code stored as a number
+        ("C", None, None, None),
+    ]
+
+
+def test_a_column_of_the_schema_not_in_the_sheet_raises(tmp_path):
+    xlsx_location = _workbook(tmp_path / "bradford.xlsx", ROWS)
+
+    with pytest.raises(ValueError, match="discharge_date"):
+        read_xlsx(xlsx_location, schema={"discharge_date": pl.Date})
+
+
+def test_the_conversion_is_reused_until_the_workbook_changes(tmp_path, monkeypatch):
+    xlsx_location = _workbook(tmp_path / "bradford.xlsx", ROWS)
+    schema = {"admission_date": pl.Date}
+
+    arrow_location = convert_xlsx(xlsx_location, str(tmp_path / "cache"), schema=schema)
+    assert pl.read_ipc(arrow_location).height == 3
+
+    # unchanged: the workbook is not read again
+    monkeypatch.setattr("bi_py.excel.read_xlsx", lambda *args, **kwargs: pytest.fail("workbook read again"))
+    assert convert_xlsx(xlsx_location, str(tmp_path / "cache"), schema=schema) == arrow_location
+    monkeypatch.undo()
+
+    # another schema, or another workbook: converted again
+    assert convert_xlsx(xlsx_location, str(tmp_path / "cache")) != arrow_location
+    _workbook(tmp_path / "bradford.xlsx", ROWS[:2])
+    changed_location = convert_xlsx(xlsx_location, str(tmp_path / "cache"), schema=schema)
+    assert changed_location != arrow_location
+    assert pl.read_ipc(changed_location).height == 1
@@ -0,0 +1,83 @@
+import json
+import os
+from datetime import date
+
+import polars as pl
+import pytest
+
+from bi_py import handoff, run_log
+from bi_py.handoff import HandOff, fingerprint
+
+
+class Dataset:
+    # the attributes and methods of a tretools ProcessedDataset which HandOff uses
+    def __init__(self, data, dataset_type="BARTS_HEALTH", coding_system="ICD10", log=None):
+        self.data, self.dataset_type, self.coding_system, self.log = data, dataset_type, coding_system, log or []
+
+    def write_to_feather(self, path):
+        self.data.write_ipc(path)
+
+    def write_to_log(self, path):
+        with open(path, "w") as f:
+            f.write("\n".join(self.log) + "\n")
+
+
+def _read(path, dataset_type, coding_system, log_path):
+    return Dataset(pl.read_ipc(path), dataset_type, coding_system, open(log_path).read().splitlines())
+
+
+def _data(codes):
+    return pl.DataFrame({"nhs_number": [1, 2], "code": codes, "date": [date(2020, 1, 1), date(2021, 1, 1)]})
+
+
+def _events(location):
+    return {event["stage"]: {**event, "details": json.loads(event["details"])} for event in run_log.read_run_log(str(location)).iter_rows(named=True)}
+
+
+@pytest.fixture
+def run_log_location(tmp_path, monkeypatch):
+    monkeypatch.setenv(run_log.RUN_LOG_ENV, str(tmp_path / "run_log.jsonl"))
+    monkeypatch.setattr(handoff, "_read", _read)
+    return tmp_path / "run_log.jsonl"
+
+
+def test_a_written_dataset_is_handed_off_from_memory(tmp_path, run_log_location):
+    hand_off = HandOff()
+    dataset = Dataset(_data(["I10", "E11"]))
+
+    written = hand_off.write(dataset, str(tmp_path / "apc.arrow"), str(tmp_path / "apc_log.txt"))
+    loaded = hand_off.load(str(tmp_path / "apc.arrow"), "BARTS_HEALTH", "ICD10", str(tmp_path / "apc_log.txt"))
+
+    assert loaded.data is dataset.data and loaded.log is not dataset.log
+    events = _events(run_log_location)
+    assert events["hand_off_write"]["details"]["fingerprint"] == written == fingerprint(dataset.data)
+    assert events["hand_off_load"]["details"]["source"] == "memory"
+    assert events["hand_off_load"]["details"]["fingerprint"] == written
+
+
+def test_a_dataset_modified_since_it_was_written_is_read_from_file(tmp_path, run_log_location):
+    hand_off = HandOff()
+    dataset = Dataset(_data(["I10", "E11"]))
+    hand_off.write(dataset, str(tmp_path / "apc.arrow"), str(tmp_path / "apc_log.txt"))
+    dataset.data = _data(["I10", "J45"])  # e.g. a cell re-run
+
+    loaded = hand_off.load(str(tmp_path / "apc.arrow"), "BARTS_HEALTH", "ICD10", str(tmp_path / "apc_log.txt"))
+
+    assert loaded.data["code"].to_list() == ["I10", "E11"]
+    assert _events(run_log_location)["hand_off_load"]["details"]["source"] == "file"
+
+
+def test_a_file_which_does_not_hold_the_written_dataset_raises(tmp_path, run_log_location):
+    hand_off = HandOff()
+    dataset = Dataset(_data(["I10", "E11"]))
+    hand_off.write(dataset, str(tmp_path / "apc.arrow"), str(tmp_path / "apc_log.txt"))
+    dataset.data = _data(["I10", "J45"])
+    # the file replaced by other data of the same size and modification time
+    state = os.stat(tmp_path / "apc.arrow")
+    dataset.write_to_feather(str(tmp_path / "apc.arrow"))
+    os.utime(tmp_path / "apc.arrow", ns=(state.st_atime_ns, state.st_mtime_ns))
+    assert os.stat(tmp_path / "apc.arrow").st_size == state.st_size
+
+    with pytest.raises(ValueError, match="does not hold the dataset written to it"):
+        hand_off.load(str(tmp_path / "apc.arrow"), "BARTS_HEALTH", "ICD10", str(tmp_path / "apc_log.txt"))
+    assert _events(run_log_location)["hand_off_load"]["status"] == "error"
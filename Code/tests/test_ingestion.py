@@ -0,0 +1,98 @@
+from datetime import date, datetime
+
+import polars as pl
+
+from bi_py.ingestion import date_rejects_location, ingest_and_clean_csv
+
+COLUMN_MAPS = {"nhs_number": "nhs_number", "snomed_code": "code", "clinical_effective_date": "date"}
+
+
+def test_unparseable_dates_are_quarantined_and_counted(tmp_path):
+    raw_location = tmp_path / "GNH_observations.csv"
+    raw_location.write_text(
+        "nhs_number,snomed_code,clinical_effective_date,result_value\n"
+        "A,22298006,2019-01-01 00:00:00,1\n"
+        "A,22298006,2019-01-01,2\n"
+        "B,73211009,01/02/2020,3\n"
+        "B,73211009,,4\n"
+        "C,38341003,2021-03-04,5\n"
+    )
+    demographics_location = tmp_path / "clean_demographics.arrow"
+    pl.DataFrame({"nhs_number": ["A", "B", "C"], "dob": [date(1970, 1, 1)] * 3}).write_ipc(demographics_location)
+    clean_location = tmp_path / "clean_processed_data" / "GNH_observations.arrow"
+
+    ingested = ingest_and_clean_csv(
+        str(raw_location),
+        str(clean_location),
+        str(tmp_path / "clean_processed_data" / "GNH_observations_log.txt"),
+        COLUMN_MAPS,
+        ["nhs_number", "code", "date"],
+        str(demographics_location),
+        datetime(1910, 1, 1),
+        datetime(2025, 1, 1),
+    )
+
+    assert (ingested.rows_in, ingested.rows_out, ingested.date_rejects) == (5, 2, 1)
+    rejects = pl.read_csv(date_rejects_location(str(clean_location)), infer_schema=False)
+    assert rejects.rows() == [("B", "73211009", "01/02/2020")]
+    assert any("1 rows with a date which is not %Y-%m-%d quarantined" in line for line in ingested.log)
+
+
+def test_columns_are_read_as_text_whatever_their_first_rows(tmp_path):
+    # a code column whose first (inferred) rows look numeric, a Bradford code further down
+    raw_location = tmp_path / "icd10.csv"
+    raw_location.write_text(
+        "pseudonhs,icd10_code,episode_start_date\n"
+        + "".join(f"A,{i},2019-01-01\n" for i in range(200))
+        + "A,I10,2020-06-30\n"
+    )
+    demographics_location = tmp_path / "clean_demographics.arrow"
+    pl.DataFrame({"nhs_number": ["A"], "dob": [date(1970, 1, 1)]}).write_ipc(demographics_location)
+    clean_location = tmp_path / "clean_processed_data" / "icd10.arrow"
+
+    ingested = ingest_and_clean_csv(
+        str(raw_location),
+        str(clean_location),
+        str(tmp_path / "clean_processed_data" / "icd10_log.txt"),
+        {"pseudonhs": "nhs_number", "icd10_code": "code", "episode_start_date": "date"},
+        ["nhs_number", "code", "date"],
+        str(demographics_location),
+        datetime(1910, 1, 1),
+        datetime(2025, 1, 1),
+        processed_location=str(tmp_path / "processed_data" / "icd10.arrow"),
+        processed_log_location=str(tmp_path / "processed_data" / "icd10_log.txt"),
+    )
+
+    assert (ingested.rows_in, ingested.rows_out, ingested.date_rejects, ingested.max_event_date) == (201, 201, 0, date(2020, 6, 30))
+    assert pl.read_ipc(clean_location).filter(pl.col("date") == date(2020, 6, 30))["code"].to_list() == ["I10"]
+    assert pl.read_ipc(tmp_path / "processed_data" / "icd10.arrow").height == 201
+    assert not list(tmp_path.glob("**/*_date_rejects.csv"))
+
+
+def test_codes_which_are_not_snomed_are_dropped_and_counted(tmp_path):
+    raw_location = tmp_path / "GNH_observations.csv"
+    raw_location.write_text(
+        "nhs_number,snomed_code,clinical_effective_date\n"
+        "A,22298006 ,2019-01-01\n"
+        "B,XaIkW,2020-01-01\n"
+        "C,38341003,2021-03-04\n"
+    )
+    demographics_location = tmp_path / "clean_demographics.arrow"
+    pl.DataFrame({"nhs_number": ["A", "B", "C"], "dob": [date(1970, 1, 1)] * 3}).write_ipc(demographics_location)
+    clean_location = tmp_path / "clean_processed_data" / "GNH_observations.arrow"
+
+    ingested = ingest_and_clean_csv(
+        str(raw_location),
+        str(clean_location),
+        str(tmp_path / "clean_processed_data" / "GNH_observations_log.txt"),
+        COLUMN_MAPS,
+        ["nhs_number", "code", "date"],
+        str(demographics_location),
+        datetime(1910, 1, 1),
+        datetime(2025, 1, 1),
+        snomed_code=True,
+    )
+
+    assert (ingested.rows_in, ingested.rows_out, ingested.code_rejects) == (3, 2, 1)
+    assert pl.read_ipc(clean_location)["code"].to_list() == [22298006, 38341003]
+    assert any("1 rows without a SNOMED code dropped" in line for line in ingested.log)
@@ -0,0 +1,27 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import polars as pl
+
+from bi_py import manifest
+from bi_py.manifest import active_cuts
+
+
+def test_the_workers_start_with_the_polars_threads_they_are_given(monkeypatch):
+    monkeypatch.delenv("POLARS_MAX_THREADS", raising=False)
+
+    # not the default, whatever the number of CPUs
+    threads = (os.cpu_count() or 1) + 1
+
+    with manifest._polars_max_threads(threads), ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        assert pool.submit(pl.thread_pool_size).result() == threads
+
+    assert "POLARS_MAX_THREADS" not in os.environ
+
+
+def test_active_cuts_leave_out_the_skipped_cuts():
+    cuts = {"cuts": [{"cut": "april_2022", "files": []}, {"cut": "jan_2023", "skip": True, "files": []}, {"cut": "dec_2023", "files": []}]}
+
+    assert [cut["cut"] for cut in active_cuts(cuts)] == ["april_2022", "dec_2023"]
+    assert [cut["cut"] for cut in active_cuts(cuts, ["dec_2023"])] == ["dec_2023"]
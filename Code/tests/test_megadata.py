@@ -0,0 +1,81 @@
+import os
+from datetime import date
+
+import polars as pl
+
+from bi_py.megadata import DEDUPLICATION_OPTIONS, append_cut, appended_location, clear_appended, keys_location, megadata_files
+from bi_py.sorted_merge import sink_sorted, sorted_by
+
+
+def _megadata(location, rows):
+    data = pl.DataFrame(rows, schema={"nhs_number": pl.UInt32, "code": pl.UInt64, "date": pl.Date, "term": pl.Utf8}, orient="row")
+    sink_sorted(data.lazy(), str(location))
+    return str(location)
+
+
+def test_append_cut_writes_only_the_new_rows_of_the_cut(tmp_path):
+    megadata = _megadata(tmp_path / "final_merged_data.arrow", [(1, 22298006, date(2020, 1, 1), "a"), (2, 73211009, date(2021, 1, 1), "b")])
+    before = tmp_path.joinpath("final_merged_data.arrow").stat().st_mtime_ns
+    dec_2024 = _megadata(tmp_path / "dec_24.arrow", [(1, 22298006, date(2020, 1, 1), "a"), (3, 38341003, date(2024, 1, 1), "c")])
+    mar_2025 = _megadata(tmp_path / "mar_25.arrow", [(3, 38341003, date(2024, 1, 1), "c"), (4, 38341003, date(2025, 1, 1), "d")])
+    log_location = tmp_path / "final_log.txt"
+
+    assert append_cut(megadata, dec_2024, "dec_2024", str(log_location)) == 1
+    assert append_cut(megadata, mar_2025, "mar_2025", str(log_location)) == 1
+    # appended again, e.g. on re-running the cell
+    assert append_cut(megadata, dec_2024, "dec_2024", str(log_location)) == 1
+
+    files = megadata_files(megadata)
+    assert files[0] == megadata and len(files) == 3
+    assert tmp_path.joinpath("final_merged_data.arrow").stat().st_mtime_ns == before
+    merged = pl.read_ipc(files).sort("nhs_number")
+    assert merged["nhs_number"].to_list() == [1, 2, 3, 4]
+    assert len(log_location.read_text().splitlines()) == 3
+
+
+def test_megadata_files_without_appended_cuts(tmp_path):
+    megadata = _megadata(tmp_path / "final_merged_data.arrow", [(1, 22298006, date(2020, 1, 1), "a")])
+
+    assert megadata_files(megadata) == [megadata]
+
+
+def test_megadata_files_are_in_the_order_the_cuts_were_appended(tmp_path):
+    megadata = _megadata(tmp_path / "final_merged_data.arrow", [(1, 22298006, date(2020, 1, 1), "a")])
+    appended = appended_location(megadata)
+    appended.mkdir()
+    # appended in the opposite order to that of their names
+    for i, cut in enumerate(["mar_2025", "dec_2024", "apr_2024"]):
+        _megadata(appended / f"{cut}.arrow", [(i, 22298006, date(2020, 1, 1), cut)])
+        os.utime(appended / f"{cut}.arrow", ns=(1_000_000_000 * (i + 1),) * 2)
+
+    assert megadata_files(megadata) == [megadata] + [str(appended / f"{cut}.arrow") for cut in ["mar_2025", "dec_2024", "apr_2024"]]
+
+
+def test_append_cut_deduplicates_the_cut_and_takes_the_schema_of_the_megadata(tmp_path):
+    megadata = _megadata(tmp_path / "final_merged_data.arrow", [(1, 22298006, date(2020, 1, 1), "a")])
+    # the columns in another order, the codes and person ids of other integer types, a row twice
+    cut = tmp_path / "dec_24.arrow"
+    pl.DataFrame(
+        {"term": ["c", "c", "a"], "date": [date(2024, 1, 1)] * 2 + [date(2020, 1, 1)], "code": [38341003, 38341003, 22298006], "nhs_number": [3, 3, 1]},
+        schema={"term": pl.Utf8, "date": pl.Date, "code": pl.Int64, "nhs_number": pl.Int64},
+    ).write_ipc(cut)
+
+    assert append_cut(megadata, str(cut), "dec_2024") == 1
+
+    appended = megadata_files(megadata)[1]
+    assert pl.read_ipc(appended).schema == pl.read_ipc(megadata).schema
+    assert sorted_by(appended) == DEDUPLICATION_OPTIONS
+
+
+def test_clear_appended_removes_the_cuts_and_the_key_index(tmp_path):
+    megadata = _megadata(tmp_path / "final_merged_data.arrow", [(1, 22298006, date(2020, 1, 1), "a")])
+    dec_2024 = _megadata(tmp_path / "dec_24.arrow", [(3, 38341003, date(2024, 1, 1), "c")])
+    append_cut(megadata, dec_2024, "dec_2024")
+
+    clear_appended(megadata)
+
+    assert megadata_files(megadata) == [megadata]
+    assert not keys_location(megadata).exists()
+    # the megadata now has the rows of the cut (e.g. merged again with every cut): the key index is rebuilt from it
+    _megadata(tmp_path / "final_merged_data.arrow", [(1, 22298006, date(2020, 1, 1), "a"), (3, 38341003, date(2024, 1, 1), "c")])
+    assert append_cut(megadata, dec_2024, "dec_2024") == 0
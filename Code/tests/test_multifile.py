@@ -0,0 +1,43 @@
+import polars as pl
+import pytest
+
+from bi_py.multifile import expand_sources, scan_csvs
+
+
+def _write(location, text):
+    location.write_text(text)
+    return str(location)
+
+
+def test_the_files_of_a_glob_are_unioned_as_text(tmp_path):
+    _write(tmp_path / "ECDS_2021.txt", "STUDY_ID,ARRIVAL_DATE,DIAGNOSIS_CODE_1\nA,2021-01-01,22298006\n")
+    _write(tmp_path / "ECDS_2022.txt", "STUDY_ID,ARRIVAL_DATE,DIAGNOSIS_CODE_1,DIAGNOSIS_CODE_2\nB,2022-01-01,73211009,38341003\n")
+    _write(tmp_path / "ECDS_2023.txt", "STUDY_ID,ARRIVAL_DATE,DIAGNOSIS_CODE_1\nC,2023-01-01,0123\n")
+
+    data = scan_csvs(str(tmp_path / "ECDS_*.txt"), columns=["STUDY_ID", "DIAGNOSIS_CODE_1", "DIAGNOSIS_CODE_2"]).collect()
+
+    assert data.schema == {"STUDY_ID": pl.Utf8, "DIAGNOSIS_CODE_1": pl.Utf8, "DIAGNOSIS_CODE_2": pl.Utf8}
+    assert data.rows() == [("A", "22298006", None), ("B", "73211009", "38341003"), ("C", "0123", None)]
+
+
+def test_integral_floats_are_normalised_in_the_files_read_as_float_only(tmp_path):
+    files = [
+        _write(tmp_path / "a.txt", "STUDY_ID,CODE\nA,22298006.0\n"),
+        _write(tmp_path / "b.txt", "STUDY_ID,CODE\nB,A01.0\n"),
+    ]
+
+    data = scan_csvs(files).collect()
+
+    assert data["CODE"].to_list() == ["22298006", "A01.0"]
+
+
+def test_a_column_in_none_of_the_files_raises(tmp_path):
+    files = [_write(tmp_path / "a.txt", "STUDY_ID,CODE\nA,1\n")]
+
+    with pytest.raises(ValueError, match="MISSING"):
+        scan_csvs(files, columns=["STUDY_ID", "MISSING"])
+
+
+def test_a_glob_without_files_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        expand_sources(str(tmp_path / "*.txt"))
@@ -0,0 +1,40 @@
+from datetime import date
+
+import polars as pl
+
+from bi_py.partitioned_dedup import partitioned_unique
+from bi_py.sorted_merge import sorted_by
+
+
+def _unsorted_file(location, rows):
+    pl.DataFrame(
+        rows,
+        schema={"nhs_number": pl.Utf8, "code": pl.Utf8, "date": pl.Date, "term": pl.Utf8, "source": pl.Utf8},
+        orient="row",
+    ).write_ipc(location)
+    return str(location)
+
+
+def test_partitioned_unique_on_more_columns_than_the_sort_key(tmp_path):
+    locations = [
+        _unsorted_file(tmp_path / "first.arrow", [
+            ("2", "A01", date(2021, 1, 1), "a", "barts"),
+            ("1", "A01", date(2020, 1, 1), "a", "barts"),
+            ("1", "A01", date(2020, 1, 1), "a", "bradford"),
+        ]),
+        _unsorted_file(tmp_path / "second.arrow", [
+            ("1", "A01", date(2020, 1, 1), "a, again", "bradford"),
+            ("3", "B02", date(2022, 1, 1), "b", "barts"),
+        ]),
+    ]
+    dedup_on = ["nhs_number", "code", "date", "source"]
+    output = tmp_path / "merged.arrow"
+
+    rows = partitioned_unique(locations, str(output), dedup_on, n_partitions=2, batch_rows=2)
+
+    merged = pl.read_ipc(output)
+    # the same event from two sources is two rows
+    assert rows == merged.height == 4
+    assert merged.columns == ["nhs_number", "code", "date", "term", "source"]
+    assert merged.select(dedup_on).rows() == sorted(merged.select(dedup_on).rows())
+    assert sorted_by(str(output)) == dedup_on
@@ -0,0 +1,17 @@
+import polars as pl
+
+from bi_py.person import encode, update_person_dictionary
+
+
+def test_person_dictionary_is_append_only(tmp_path):
+    location = tmp_path / "person_dictionary.arrow"
+    first = update_person_dictionary(pl.Series(["C", "A", None, "A"]), location)
+    # B joins, A leaves the demographics
+    second = update_person_dictionary(pl.Series(["D", "C", "B"]), location)
+
+    assert first.rows() == [("A", 0), ("C", 1)]
+    assert second.rows() == [("A", 0), ("C", 1), ("B", 2), ("D", 3)]
+    assert pl.read_ipc(location).equals(second)
+
+    events = pl.DataFrame({"nhs_number": ["C", "E"], "code": ["I10", "E11"]})
+    assert encode(events, first).equals(encode(events, second))
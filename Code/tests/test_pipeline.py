@@ -0,0 +1,25 @@
+import json
+
+import pytest
+
+from bi_py.pipeline import NOTEBOOKS_LOCATION, PIPELINE_STAGES, _cells_up_to_hand_off
+
+
+def _cells(notebook: str) -> list:
+    # the cells as nbformat reads them, i.e. with their source as one string
+    cells = json.loads((NOTEBOOKS_LOCATION / f"{notebook}.ipynb").read_text())["cells"]
+    return [{**cell, "source": "".join(cell["source"])} for cell in cells]
+
+
+@pytest.mark.parametrize("name", list(PIPELINE_STAGES))
+def test_a_headless_run_stops_at_the_hand_off_call(name):
+    cells = _cells(PIPELINE_STAGES[name].notebook)
+
+    run = _cells_up_to_hand_off(cells)
+
+    if name == "NB8":
+        # the last notebook hands off to no other, its call is commented out
+        assert run == cells
+    else:
+        assert run[-1]["source"].lstrip().startswith("redirect_to_next_notebook_in_pipeline(")
+        assert any(cell["source"].lstrip().startswith("def redirect_to_next_notebook_in_pipeline(") for cell in run[:-1])
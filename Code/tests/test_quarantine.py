@@ -0,0 +1,41 @@
+import polars as pl
+
+from bi_py.quarantine import read_csv_quarantine, scan_csv_quarantine
+
+RAGGED = (
+    "nhs_number,code,date\n"
+    "A,22298006,2019-01-01\n"
+    "B,73211009,2020-01-01,extra\n"
+    'C,"38341003\n(continued)",2021-03-04\n'
+    "D,2021-03-04\n"
+    "\n"
+    "E,44054006,2022-05-06"
+)
+
+
+def test_the_records_which_are_not_as_wide_as_the_header_are_quarantined(tmp_path):
+    raw_location = tmp_path / "problems.csv"
+    raw_location.write_text(RAGGED)
+    rejects_location = tmp_path / "processed_data" / "problems_rejects.csv"
+
+    data = read_csv_quarantine(str(raw_location), str(rejects_location), infer_schema=False)
+
+    assert data["nhs_number"].to_list() == ["A", "C", "E"]
+    assert data["code"][1] == "38341003\n(continued)"
+    rejects = pl.read_csv(rejects_location)
+    assert rejects.select("line_number", "fields_expected", "fields_found").rows() == [(3, 3, 4), (6, 3, 2)]
+    assert rejects["line"].to_list() == ["B,73211009,2020-01-01,extra", "D,2021-03-04"]
+    # the good records went through a temporary file, since removed
+    assert sorted(path.name for path in rejects_location.parent.iterdir()) == ["problems_rejects.csv"]
+
+
+def test_the_good_records_are_streamed_to_a_file_and_scanned(tmp_path):
+    raw_location = tmp_path / "problems.csv"
+    raw_location.write_text(RAGGED)
+    good_location = tmp_path / "processed_data" / "problems_good.csv"
+
+    data = scan_csv_quarantine(str(raw_location), str(tmp_path / "problems_rejects.csv"), str(good_location), schema_overrides={"code": pl.Utf8})
+
+    assert isinstance(data, pl.LazyFrame)
+    assert good_location.read_text() == 'nhs_number,code,date\nA,22298006,2019-01-01\nC,"38341003\n(continued)",2021-03-04\nE,44054006,2022-05-06\n'
+    assert data.select("nhs_number").collect()["nhs_number"].to_list() == ["A", "C", "E"]
@@ -0,0 +1,38 @@
+import pytest
+
+from bi_py import run_log
+
+
+def _allocate(mb: int) -> bytearray:
+    block = bytearray(mb * 1024 * 1024)
+    block[::4096] = b"\x01" * len(block[::4096])  # touch every page, so that it is resident
+    return block
+
+
+def test_each_stage_records_its_own_peak(tmp_path, monkeypatch):
+    if not run_log.reset_peak_rss():
+        pytest.skip("the high-water mark cannot be reset here")
+    monkeypatch.setenv(run_log.RUN_LOG_ENV, str(tmp_path / "run_log.jsonl"))
+
+    with run_log.stage("outer"):
+        with run_log.stage("big") as big:
+            block = _allocate(200)
+            del block
+        with run_log.stage("small") as small:
+            pass
+    events = {event["stage"]: event for event in run_log.read_run_log(str(tmp_path / "run_log.jsonl")).iter_rows(named=True)}
+
+    assert small["peak_rss_mb"] < big["peak_rss_mb"] - 150
+    assert events["outer"]["peak_rss_mb"] >= big["peak_rss_mb"]
+    assert run_log.descendants_peak_rss_mb(events["outer"]["event_id"]) == big["peak_rss_mb"]
+
+
+def test_the_peak_a_stage_sets_is_that_of_its_parents(tmp_path, monkeypatch):
+    monkeypatch.setenv(run_log.RUN_LOG_ENV, str(tmp_path / "run_log.jsonl"))
+
+    with run_log.stage("outer"):
+        with run_log.stage("workers") as workers:
+            workers["peak_rss_mb"] = 1e6  # e.g. the highest of its worker processes
+    events = {event["stage"]: event for event in run_log.read_run_log(str(tmp_path / "run_log.jsonl")).iter_rows(named=True)}
+
+    assert events["workers"]["peak_rss_mb"] == events["outer"]["peak_rss_mb"] == 1e6
@@ -0,0 +1,80 @@
+import json
+from datetime import date
+
+import polars as pl
+import pytest
+
+from bi_py.schema_registry import file_schema, scan_with_schema
+
+REGISTRY = {
+    "source": "barts_health",
+    "null_values": ["", "NULL"],
+    "families": {
+        "RDE_PC_DIAGNOSIS": [
+            {
+                "version": 1,
+                "cuts": ["2024_09"],
+                "separator": "\t",
+                "columns": {
+                    "PseudoNHS": {"dtype": "Utf8"},
+                    "Confirmation": {"dtype": "Categorical"},
+                    "DiagDt": {"dtype": "Date", "format": "%d/%m/%Y %H:%M"},
+                    "ActivityDt": {"dtype": "Date"},
+                    "Procedure_date": {"dtype": "Date", "format": "%Y-%m-%d %H:%M", "null_values": ["1899-12-30 00:00"]},
+                },
+            },
+            {"version": 2, "cuts": ["2025_03"], "columns": {"PseudoNHS": {"dtype": "Utf8"}}},
+        ]
+    },
+}
+
+
+@pytest.fixture
+def schemas_location(tmp_path):
+    (tmp_path / "barts_health.json").write_text(json.dumps(REGISTRY))
+    return str(tmp_path)
+
+
+def test_the_file_is_typed_at_scan_time(tmp_path, schemas_location):
+    raw_location = tmp_path / "RDE_PC_DIAGNOSIS.tab"
+    raw_location.write_text(
+        "PseudoNHS\tConfirmation\tDiagDt\tActivityDt\tProcedure_date\tDiagCode\n"
+        "A\tConfirmed\t04/03/2021 10:30\t2021-03-04\t2021-03-04 10:30\tI10\n"
+        "NULL\tNULL\t\t\t1899-12-30 00:00\t0123\n"
+    )
+
+    data = scan_with_schema(raw_location, "barts_health", "RDE_PC_DIAGNOSIS", "2024_09", schemas_location).collect()
+
+    assert dict(data.schema) == {
+        "PseudoNHS": pl.Utf8, "Confirmation": pl.Categorical, "DiagDt": pl.Date, "ActivityDt": pl.Date, "Procedure_date": pl.Date,
+        "DiagCode": pl.Utf8,  # not in the registry: text, as read
+    }
+    assert data.row(0) == ("A", "Confirmed", date(2021, 3, 4), date(2021, 3, 4), date(2021, 3, 4), "I10")
+    # the null tokens of the source, and those of the column
+    assert data.row(1) == (None, None, None, None, None, "0123")
+
+
+def test_a_date_which_is_not_in_the_format_raises(tmp_path, schemas_location):
+    raw_location = tmp_path / "RDE_PC_DIAGNOSIS.tab"
+    raw_location.write_text(
+        "PseudoNHS\tConfirmation\tDiagDt\tActivityDt\tProcedure_date\n"
+        "A\tConfirmed\t2021-03-04 10:30\t2021-03-04\t\n"
+    )
+
+    with pytest.raises(pl.exceptions.InvalidOperationError):
+        scan_with_schema(raw_location, "barts_health", "RDE_PC_DIAGNOSIS", "2024_09", schemas_location).collect()
+
+
+def test_each_cut_has_its_version_of_the_schema(schemas_location):
+    assert file_schema("barts_health", "RDE_PC_DIAGNOSIS", "2025_03", schemas_location).version == 2
+    assert file_schema("barts_health", "RDE_PC_DIAGNOSIS", "2025_03", schemas_location).separator == ","
+    with pytest.raises(ValueError, match="0 schema versions"):
+        file_schema("barts_health", "RDE_PC_DIAGNOSIS", "2022_03", schemas_location)
+
+
+def test_a_column_of_the_schema_missing_from_the_file_raises(tmp_path, schemas_location):
+    raw_location = tmp_path / "RDE_PC_DIAGNOSIS.tab"
+    raw_location.write_text("PseudoNHS\tConfirmation\nA\tConfirmed\n")
+
+    with pytest.raises(ValueError, match="DiagDt"):
+        scan_with_schema(raw_location, "barts_health", "RDE_PC_DIAGNOSIS", "2024_09", schemas_location)
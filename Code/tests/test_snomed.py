@@ -0,0 +1,27 @@
+import polars as pl
+import pytest
+
+from bi_py.snomed import SNOMED_CODE_DTYPE, snomed_codes
+
+
+def test_strings_and_integral_floats():
+    codes = pl.DataFrame({"code": [" 22298006 ", "73211009"], "conceptId": [2.2298006e7, 7.3211009e7]})
+
+    assert snomed_codes(codes)["code"].to_list() == [22298006, 73211009]
+    assert snomed_codes(codes.lazy(), column="conceptId").collect()["conceptId"].dtype == SNOMED_CODE_DTYPE
+
+
+def test_fractional_floats():
+    codes = pl.DataFrame({"code": [22298006.0, 1.5, None]})
+
+    with pytest.raises(Exception, match="not integral"):
+        snomed_codes(codes.lazy()).collect()
+    assert snomed_codes(codes, strict=False)["code"].to_list() == [22298006]
+
+
+def test_not_strict_drops_codes_which_are_not_snomed():
+    codes = pl.DataFrame({"code": ["22298006", "I21.9", None]})
+
+    with pytest.raises(pl.exceptions.InvalidOperationError):
+        snomed_codes(codes)
+    assert snomed_codes(codes, strict=False)["code"].to_list() == [22298006]
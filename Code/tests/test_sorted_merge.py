@@ -0,0 +1,50 @@
+from datetime import date
+
+import polars as pl
+
+from bi_py.sorted_merge import SORT_KEY, merge_files, merge_sorted_unique, sink_sorted, sorted_by
+
+
+def _clean_file(location, rows):
+    # a clean processed file, with a column which is not part of the sort key (as Discovery's `term`)
+    data = pl.DataFrame(rows, schema={"nhs_number": pl.Utf8, "code": pl.Utf8, "date": pl.Date, "term": pl.Utf8}, orient="row")
+    sink_sorted(data.lazy(), str(location))
+    return str(location)
+
+
+def test_merge_sorted_unique_with_extra_columns(tmp_path):
+    first = _clean_file(tmp_path / "first.arrow", [
+        ("1", "A01", date(2020, 1, 1), "a"),
+        ("1", "B02", date(2020, 1, 2), "b"),
+        ("2", "A01", date(2021, 1, 1), "a"),
+        ("3", "C03", date(2022, 1, 1), "c"),
+    ])
+    second = _clean_file(tmp_path / "second.arrow", [
+        ("1", "B02", date(2020, 1, 2), "b, again"),
+        ("2", "A01", date(2020, 6, 1), "a"),
+        ("3", "C03", date(2022, 1, 1), "c"),
+        ("4", "D04", date(2023, 1, 1), "d"),
+    ])
+    output = tmp_path / "merged.arrow"
+
+    # one row per batch, so that duplicates span the batches of the inputs
+    rows = merge_sorted_unique([first, second], str(output), batch_rows=1)
+
+    merged = pl.read_ipc(output)
+    assert rows == merged.height == 6
+    assert merged.columns == ["nhs_number", "code", "date", "term"]
+    assert merged.select(SORT_KEY).rows() == sorted(set(
+        pl.concat([pl.read_ipc(first), pl.read_ipc(second)]).select(SORT_KEY).rows()
+    ))
+    assert sorted_by(str(output)) == SORT_KEY
+
+
+def test_merge_files_sort_merge(tmp_path):
+    locations = [
+        _clean_file(tmp_path / f"cut_{i}.arrow", [(str(n), "A01", date(2020, 1, 1 + n % 2), "a") for n in range(i, i + 10)])
+        for i in range(3)
+    ]
+    log = merge_files(locations, str(tmp_path / "final_merged_data.arrow"), batch_rows=4)
+
+    assert pl.read_ipc(tmp_path / "final_merged_data.arrow").height == 12
+    assert "sort-merge" in log[-1]
@@ -0,0 +1,104 @@
+import os
+from datetime import date
+
+import polars as pl
+
+from bi_py import stage_cache
+from bi_py.sorted_merge import sink_sorted, sorted_by
+from bi_py.stage_cache import StageCache, transform_version
+
+DEDUPLICATION_OPTIONS = ["nhs_number", "code", "date"]
+
+
+def _inputs(tmp_path):
+    raw_location, demographics_location = tmp_path / "raw.csv", tmp_path / "clean_demographics.arrow"
+    raw_location.write_text("nhs_number,code,date\n")
+    demographics_location.write_bytes(b"demographics")
+    return raw_location, demographics_location
+
+
+def _stored(tmp_path, date_end="2025-01-01", max_event_date="2024-06-30"):
+    cache = StageCache(tmp_path / "stage_cache")
+    output = tmp_path / "release_1" / "GNH_observations.arrow"
+    output.parent.mkdir()
+    sink_sorted(pl.LazyFrame({"nhs_number": [1], "code": [22298006], "date": [date(2020, 1, 1)]}), str(output), DEDUPLICATION_OPTIONS)
+    cache.store("key", date_end, max_event_date, {"clean": output})
+    return cache, output
+
+
+def test_key_changes_with_the_transform_modules(tmp_path, monkeypatch):
+    raw_location, demographics_location = _inputs(tmp_path)
+    cache = StageCache(tmp_path / "stage_cache")
+
+    def key():
+        return cache.key([raw_location], {"code": "code"}, DEDUPLICATION_OPTIONS, "1910-01-01", demographics_location)
+
+    before = key()
+    monkeypatch.setattr(stage_cache, "TRANSFORM_MODULES", stage_cache.TRANSFORM_MODULES + ("bi_py.megadata",))
+    assert key() != before
+
+
+def test_transform_version_changes_with_the_source_of_the_modules(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    module = tmp_path / "transforms_under_test.py"
+    module.write_text("def transform(data):\n    return data\n")
+    before = transform_version(["transforms_under_test"])
+
+    module.write_text("def transform(data):\n    return data.unique()\n")
+
+    assert transform_version(["transforms_under_test"]) != before
+
+
+def test_lookup_misses_without_an_entry(tmp_path):
+    cache = StageCache(tmp_path / "stage_cache")
+
+    assert not cache.lookup("key", "2025-01-01", {"clean": tmp_path / "GNH_observations.arrow"})
+
+
+def test_lookup_hits_in_place_and_in_a_new_location(tmp_path):
+    cache, output = _stored(tmp_path)
+    new_output = tmp_path / "release_2" / "GNH_observations.arrow"
+
+    assert cache.lookup("key", "2025-01-01", {"clean": output})
+    assert cache.lookup("key", "2025-01-01", {"clean": new_output})
+    assert new_output.read_bytes() == output.read_bytes()
+    assert sorted_by(str(new_output)) == DEDUPLICATION_OPTIONS
+
+
+def test_lookup_misses_when_the_cached_output_was_overwritten(tmp_path):
+    cache, output = _stored(tmp_path)
+    output.write_bytes(b"something else")
+
+    assert not cache.lookup("key", "2025-01-01", {"clean": output})
+
+
+def test_an_entry_is_reused_for_another_date_end_after_the_latest_event(tmp_path):
+    cache, output = _stored(tmp_path, date_end="2025-01-01", max_event_date="2024-06-30")
+
+    assert cache.lookup("key", date(2025, 3, 1), {"clean": output})
+    # the new date_end would remove events the entry has
+    assert not cache.lookup("key", date(2024, 1, 1), {"clean": output})
+
+
+def test_an_entry_whose_date_end_removed_events_is_only_reused_for_that_date_end(tmp_path):
+    # events up to date_end: some after it may have been removed
+    cache, output = _stored(tmp_path, date_end="2025-01-01", max_event_date="2025-01-01")
+
+    assert cache.lookup("key", "2025-01-01", {"clean": output})
+    assert not cache.lookup("key", "2025-03-01", {"clean": output})
+
+
+def test_file_digest_is_memoised_on_size_and_modification_time(tmp_path):
+    cache = StageCache(tmp_path / "stage_cache")
+    raw_location = tmp_path / "raw.csv"
+    raw_location.write_text("nhs_number,code,date\nA,1,2020-01-01\n")
+    digest = cache.file_digest(raw_location)
+    state = os.stat(raw_location)
+
+    # same size and modification time: the memo is used, the file not read again
+    raw_location.write_text("nhs_number,code,date\nB,2,2021-02-02\n")
+    os.utime(raw_location, ns=(state.st_atime_ns, state.st_mtime_ns))
+    assert cache.file_digest(raw_location) == digest
+
+    os.utime(raw_location, ns=(state.st_atime_ns, state.st_mtime_ns + 1))
+    assert cache.file_digest(raw_location) != digest
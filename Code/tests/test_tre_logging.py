@@ -0,0 +1,43 @@
+import polars as pl
+
+import bi_py.tre_logging  # noqa: F401 registers the TRE namespace
+
+ROWS = 100_000
+
+
+def _query(strict=None):
+    events = pl.LazyFrame({"nhs_number": list(range(ROWS)), "code": [i % 7 for i in range(ROWS)]})
+    codes = pl.LazyFrame({"code": [0, 1], "term": ["a", "b"]})
+    return (
+        events
+        .TRE.filter_with_logging(pl.col("nhs_number") % 2 == 0, label="Even", strict=strict)
+        .TRE.unique_with_logging(["code"], label="Codes", strict=strict)
+        .TRE.join_with_logging(codes, on="code", label="Terms", strict=strict)
+    )
+
+
+EXPECTED = [
+    "[Even] Before filter: 100000 rows, After filter: 50000 rows (-50.0%)",
+    "[Codes: on (['code'],)] Before unique: 50000 rows, After unique: 7 rows (-100.0%)",
+    "[Terms] Join type: INNER",
+    "[Terms] Left: 7 rows, Right: 2 rows -> After: 2 rows (-71.4%)",
+]
+
+
+def test_the_counts_are_logged_once_per_streaming_execution(capsys):
+    query = _query()
+    assert capsys.readouterr().out == ""  # nothing is collected as the steps are defined
+
+    # many batches per step
+    with pl.Config(streaming_chunk_size=1000):
+        assert query.collect(engine="streaming").height == 2
+
+    assert capsys.readouterr().out.splitlines() == EXPECTED
+
+
+def test_the_counts_are_those_of_the_strict_mode(capsys):
+    query = _query(strict=True)
+    assert capsys.readouterr().out.splitlines() == EXPECTED
+
+    query.collect()
+    assert capsys.readouterr().out == ""